@@ -449,7 +449,8 @@ export default function LocalizacaoScreen() {
           
           if (location) {
             try {
-              const address = await getAddressFromCoordinates(location.latitude, location.longitude);
+              // O gateway já grava o endereço no fix; a API externa fica para fixes sem ele
+              const address = location.address || await getAddressFromCoordinates(location.latitude, location.longitude);
               
               if (auth.currentUser) {
                 setLocationData({
@@ -23,7 +23,10 @@ const int LED_STATUS = 13; // LED interno para debug
 bool releState = false;  // false = desligado, true = ligado
 unsigned long lastSend = 0;
 unsigned long lastHeartbeat = 0;
-const unsigned long SEND_INTERVAL = 5000;  // 5 segundos
+const unsigned long SEND_INTERVAL = 5000;  // 5 segundos (padrão ao ligar)
+const unsigned long MIN_SEND_INTERVAL = 1000;
+const unsigned long MAX_SEND_INTERVAL = 300000;
+unsigned long sendInterval = SEND_INTERVAL;  // ajustado pelo gateway com SET_INTERVAL:<ms>
 const unsigned long HEARTBEAT_INTERVAL = 30000; // 30 segundos
 
 
@@ -32,6 +35,11 @@ unsigned long lastValidGPS = 0;
 bool gpsInitialized = false;
 
 
+// Enquadramento das mensagens: JSON (padrão) ou CSV compacto,
+// ativado pelo gateway com FRAMING_CSV após o TRACKCAR_READY
+bool csvFraming = false;
+
+
 // Contadores para debug
 int validGPSCount = 0;
 int commandsReceived = 0;
@@ -96,7 +104,7 @@ void loop() {
   }
   
   // Envia dados GPS periodicamente
-  if (millis() - lastSend >= SEND_INTERVAL) {
+  if (millis() - lastSend >= sendInterval) {
     lastSend = millis();
     enviarDadosGPS();
   }
@@ -135,6 +143,32 @@ void enviarDadosGPS() {
     lastValidGPS = millis();
   }
   
+  int year;
+  byte month, day, hour, minute, second, hundredths;
+  unsigned long dateAge;
+  gps.crack_datetime(&year, &month, &day, &hour, &minute, &second, &hundredths, &dateAge);
+  
+  // CSV: G,lat,lon,sats,age,ign,valid,uptime,validCount,totalReads,gpsInit[,gpsTime]
+  if (csvFraming) {
+    Serial.print("G,");
+    Serial.print(lat, 6); Serial.print(",");
+    Serial.print(lon, 6); Serial.print(",");
+    Serial.print(sats); Serial.print(",");
+    Serial.print(age); Serial.print(",");
+    Serial.print(releState ? "1" : "0"); Serial.print(",");
+    Serial.print(isValid ? "1" : "0"); Serial.print(",");
+    Serial.print(millis()); Serial.print(",");
+    Serial.print(validGPSCount); Serial.print(",");
+    Serial.print(totalGPSReads); Serial.print(",");
+    Serial.print(gpsInitialized ? "1" : "0");
+    if (year > 2000) {
+      Serial.print(",");
+      imprimirDataGPS(year, month, day, hour, minute, second);
+    }
+    Serial.println();
+    return;
+  }
+  
   Serial.print("{");
   Serial.print("\"type\":\"gps\",");
   Serial.print("\"lat\":");
@@ -158,19 +192,9 @@ void enviarDadosGPS() {
   Serial.print(",\"gpsInit\":");
   Serial.print(gpsInitialized ? "true" : "false");
   
-  int year;
-  byte month, day, hour, minute, second, hundredths;
-  unsigned long dateAge;
-  gps.crack_datetime(&year, &month, &day, &hour, &minute, &second, &hundredths, &dateAge);
-  
   if (year > 2000) {
     Serial.print(",\"gpsTime\":\"");
-    Serial.print(year); Serial.print("-");
-    if (month < 10) Serial.print("0"); Serial.print(month); Serial.print("-");
-    if (day < 10) Serial.print("0"); Serial.print(day); Serial.print(" ");
-    if (hour < 10) Serial.print("0"); Serial.print(hour); Serial.print(":");
-    if (minute < 10) Serial.print("0"); Serial.print(minute); Serial.print(":");
-    if (second < 10) Serial.print("0"); Serial.print(second);
+    imprimirDataGPS(year, month, day, hour, minute, second);
     Serial.print("\"");
   }
   
@@ -178,7 +202,30 @@ void enviarDadosGPS() {
 }
 
 
+void imprimirDataGPS(int year, byte month, byte day, byte hour, byte minute, byte second) {
+  Serial.print(year); Serial.print("-");
+  if (month < 10) Serial.print("0"); Serial.print(month); Serial.print("-");
+  if (day < 10) Serial.print("0"); Serial.print(day); Serial.print(" ");
+  if (hour < 10) Serial.print("0"); Serial.print(hour); Serial.print(":");
+  if (minute < 10) Serial.print("0"); Serial.print(minute); Serial.print(":");
+  if (second < 10) Serial.print("0"); Serial.print(second);
+}
+
+
 void enviarHeartbeat() {
+  // CSV: H,uptime,commands,rele,freeRam,gpsInit,validGPS,lastValid
+  if (csvFraming) {
+    Serial.print("H,");
+    Serial.print(millis()); Serial.print(",");
+    Serial.print(commandsReceived); Serial.print(",");
+    Serial.print(releState ? "1" : "0"); Serial.print(",");
+    Serial.print(getFreeRAM()); Serial.print(",");
+    Serial.print(gpsInitialized ? "1" : "0"); Serial.print(",");
+    Serial.print(validGPSCount); Serial.print(",");
+    Serial.println(lastValidGPS > 0 ? (millis() - lastValidGPS) / 1000 : 999);
+    return;
+  }
+  
   Serial.print("{");
   Serial.print("\"type\":\"heartbeat\",");
   Serial.print("\"uptime\":");
@@ -206,6 +253,14 @@ void processarComando() {
   cmd.trim();
   commandsReceived++;
   
+  // Número de sequência opcional (COMANDO#123), devolvido no ack
+  long seq = 0;
+  int sep = cmd.indexOf('#');
+  if (sep >= 0) {
+    seq = cmd.substring(sep + 1).toInt();
+    cmd = cmd.substring(0, sep);
+  }
+  
   Serial.print("{\"type\":\"debug\",\"received\":\"");
   Serial.print(cmd);
   Serial.println("\"}");
@@ -214,13 +269,13 @@ void processarComando() {
   if (cmd == "IGNITION_ON" || cmd == "RELE_ON") {
     digitalWrite(RELE_PIN, LOW);   // ✅ LOW = Relé LIGADO (Active Low)
     releState = true;
-    Serial.println("{\"type\":\"ack\",\"ignitionState\":\"on\",\"command\":\"executed\"}");
+    enviarAck("on", seq);
     Serial.println("{\"type\":\"system\",\"message\":\"Relé LIGADO - LED aceso (Active Low)\"}");
   } 
   else if (cmd == "IGNITION_OFF" || cmd == "RELE_OFF") {
     digitalWrite(RELE_PIN, HIGH);  // ✅ HIGH = Relé DESLIGADO (Active Low)
     releState = false;
-    Serial.println("{\"type\":\"ack\",\"ignitionState\":\"off\",\"command\":\"executed\"}");
+    enviarAck("off", seq);
     Serial.println("{\"type\":\"system\",\"message\":\"Relé DESLIGADO - LED apagado (Active Low)\"}");
   }
   else if (cmd == "STATUS") {
@@ -232,6 +287,27 @@ void processarComando() {
     totalGPSReads = 0;
     Serial.println("{\"type\":\"system\",\"message\":\"GPS resetado - aguardando novo fix\"}");
   }
+  else if (cmd.startsWith("SET_INTERVAL:")) {
+    unsigned long intervalo = cmd.substring(13).toInt();
+    if (intervalo < MIN_SEND_INTERVAL) intervalo = MIN_SEND_INTERVAL;
+    if (intervalo > MAX_SEND_INTERVAL) intervalo = MAX_SEND_INTERVAL;
+    sendInterval = intervalo;
+    Serial.print("{\"type\":\"ack\",\"interval\":");
+    Serial.print(sendInterval);
+    if (seq > 0) {
+      Serial.print(",\"seq\":");
+      Serial.print(seq);
+    }
+    Serial.println("}");
+  }
+  else if (cmd == "FRAMING_CSV") {
+    csvFraming = true;
+    Serial.println("{\"type\":\"system\",\"message\":\"Enquadramento CSV ativado\"}");
+  }
+  else if (cmd == "FRAMING_JSON") {
+    csvFraming = false;
+    Serial.println("{\"type\":\"system\",\"message\":\"Enquadramento JSON ativado\"}");
+  }
   else if (cmd == "RESET") {
     Serial.println("{\"type\":\"ack\",\"message\":\"Reiniciando Arduino...\"}");
     delay(1000);
@@ -254,6 +330,18 @@ void processarComando() {
 }
 
 
+void enviarAck(const char* ignitionState, long seq) {
+  Serial.print("{\"type\":\"ack\",\"ignitionState\":\"");
+  Serial.print(ignitionState);
+  Serial.print("\",\"command\":\"executed\"");
+  if (seq > 0) {
+    Serial.print(",\"seq\":");
+    Serial.print(seq);
+  }
+  Serial.println("}");
+}
+
+
 void enviarStatus() {
   Serial.print("{");
   Serial.print("\"type\":\"status\",");
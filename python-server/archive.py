@@ -0,0 +1,401 @@
+# python-server/archive.py
+"""
+Arquivo local colunar da telemetria (gps e heartbeat).
+
+Cada fix só existia como documento em gps_locations; qualquer análise
+(distância por dia, fixes válidos ao longo do tempo, satélites por hora)
+exigia paginar milhares de documentos. O gateway também grava os registros
+em colunas binárias de largura fixa, particionadas por veículo e dia (UTC):
+
+    archive/<carId>/<AAAA-MM-DD>/gps/<coluna>.bin
+    archive/<carId>/<AAAA-MM-DD>/heartbeat/<coluna>.bin
+
+Uma coluna é um arquivo com os valores em little-endian, um após o outro
+(os tipos estão em SCHEMA). A escrita só usa o módulo `array` da biblioteca
+padrão: o gateway não depende do NumPy. As consultas abrem as colunas com
+numpy.memmap e calculam tudo vetorizado; um mês a 1 Hz (~2,6 milhões de
+linhas) cabe em bem menos de um segundo.
+
+Uma queda no meio de um flush pode deixar colunas de um dia com tamanhos
+diferentes. Antes da primeira escrita numa partição, cada processo corta
+todas as colunas no número de linhas completas (align_partition); sem
+isso as linhas novas seriam acrescentadas a colunas desalinhadas. Até lá a
+leitura usa o menor comprimento.
+
+Consultas e exportação (requer numpy):
+    python archive.py listar
+    python archive.py resumo --car ID --from 2026-10-01 --to 2026-10-31
+    python archive.py por-hora --car ID --from 2026-10-01
+    python archive.py exportar --car ID --from 2026-10-01 --to 2026-10-07 saida.csv
+"""
+
+import math
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from gps_thinning import EARTH_RADIUS_M
+
+# coluna → (typecode do array, dtype do NumPy)
+SCHEMA = {
+    'gps': {
+        't': ('d', '<f8'),         # unix, segundos (recepção no gateway)
+        'lat': ('d', '<f8'),
+        'lon': ('d', '<f8'),
+        'sats': ('B', 'u1'),
+        'age': ('I', '<u4'),       # ms
+        'valid': ('B', 'u1'),      # flag do firmware
+        'accepted': ('B', 'u1'),   # passou pela sessão (válido, não 0,0, nota e saltos)
+        'ignition': ('b', 'i1'),   # 1 on, 0 off, -1 desconhecida
+        'speed': ('f', '<f4'),     # km/h (NaN sem fix anterior)
+        'quality': ('f', '<f4'),   # nota do FixQualityFilter (NaN sem nota)
+    },
+    'heartbeat': {
+        't': ('d', '<f8'),
+        'uptime': ('I', '<u4'),    # ms
+        'commands': ('I', '<u4'),
+        'rele': ('B', 'u1'),
+        'free_ram': ('I', '<u4'),
+        'gps_fixed': ('B', 'u1'),
+        'valid_gps': ('I', '<u4'),
+        'last_valid': ('I', '<u4'),  # s desde o último fix válido
+    },
+}
+
+_NAN = float('nan')
+_M_PER_DEG = math.radians(1) * EARTH_RADIUS_M
+_IGNITION = {'on': 1, 'off': 0}
+
+
+def _u32(value):
+    return min(max(int(value), 0), 0xFFFFFFFF)
+
+
+def _gps_row(fix, accepted):
+    return (fix.received_at or time.time(), fix.lat, fix.lon, min(fix.sats, 255), _u32(fix.age),
+            int(fix.valid), int(accepted), _IGNITION.get(fix.ignition_state, -1),
+            _NAN if fix.speed is None else fix.speed, _NAN if fix.quality is None else fix.quality)
+
+
+def _heartbeat_row(record, t):
+    return (t, _u32(record.uptime), _u32(record.commands), int(record.rele == 'ligado'),
+            _u32(record.free_ram), int(record.gps_status == 'fixed'), _u32(record.valid_gps),
+            _u32(record.last_valid))
+
+
+class TelemetryArchive:
+    """Acumula registros em memória e acrescenta às colunas no flush()"""
+
+    def __init__(self, root):
+        self.root = os.fspath(root)
+        self._lock = Lock()
+        self._flush_lock = Lock()  # dois flushes intercalados desalinhariam as colunas
+        self._buffers = {}  # (car, dia, tipo) → [linha, ...]
+        self._aligned = set()  # partições já conferidas por este processo
+        self._released = set()  # veículos entregues a outro processo (release → claim)
+        self._day = (None, None)  # (dia unix, 'AAAA-MM-DD') do último registro
+        self.stats = {'gps': 0, 'heartbeat': 0, 'flushes': 0, 'bytes': 0, 'truncated': 0, 'late': 0}
+
+    def gps(self, car_id, fix, accepted):
+        """Registro gps (válido ou não) já processado pela sessão"""
+        row = _gps_row(fix, accepted)
+        self._append(car_id, row[0], 'gps', row)
+
+    def heartbeat(self, car_id, record, t=None):
+        t = time.time() if t is None else t
+        self._append(car_id, t, 'heartbeat', _heartbeat_row(record, t))
+
+    def flush(self):
+        """
+        Grava os buffers nas colunas; devolve quantas linhas saíram. Se a
+        gravação falhar, o que não foi gravado volta para os buffers.
+        """
+        with self._flush_lock:
+            with self._lock:
+                # Veículos liberados só ficam aqui se o release() falhou: não
+                # podem mais ser gravados por este processo fora de ordem
+                buffers = {key: rows for key, rows in self._buffers.items() if key[0] not in self._released}
+                self._buffers = {key: rows for key, rows in self._buffers.items() if key[0] in self._released}
+            return self._write(buffers)
+
+    def release(self, car_ids):
+        """
+        Grava já os buffers dos veículos que vão para outro processo e esquece
+        as partições deles: o outro passa a acrescentar às mesmas colunas, e
+        se o veículo voltar a partição é conferida de novo. Linhas que ainda
+        chegarem deles (uma leitura que terminou depois do stop) são
+        descartadas até claim().
+        """
+        car_ids = set(car_ids)
+        with self._flush_lock:
+            with self._lock:
+                self._released |= car_ids
+                keys = [key for key in self._buffers if key[0] in car_ids]
+                buffers = {key: self._buffers.pop(key) for key in keys}
+            written = self._write(buffers)
+            prefixes = tuple(os.path.join(self.root, car_id) + os.sep for car_id in car_ids)
+            self._aligned = {folder for folder in self._aligned if not folder.startswith(prefixes)}
+            return written
+
+    def claim(self, car_ids):
+        """Volta a aceitar linhas de veículos adotados por este processo"""
+        with self._lock:
+            self._released -= set(car_ids)
+
+    def _write(self, buffers):
+        written = 0
+        pending = list(buffers.items())
+        while pending:
+            (car_id, day, kind), rows = pending[0]
+            folder = os.path.join(self.root, car_id, day, kind)
+            try:
+                if folder not in self._aligned:
+                    os.makedirs(folder, exist_ok=True)
+                    cut = align_partition(folder, kind)
+                    if cut:
+                        self.stats['truncated'] += cut
+                    self._aligned.add(folder)
+                for (column, (typecode, _)), values in zip(SCHEMA[kind].items(), zip(*rows)):
+                    values = array(typecode, values)
+                    if sys.byteorder == 'big':
+                        values.byteswap()
+                    with open(os.path.join(folder, f"{column}.bin"), 'ab') as f:
+                        values.tofile(f)
+                    self.stats['bytes'] += len(values) * values.itemsize
+            except OSError:
+                self._aligned.discard(folder)  # flush pela metade: o próximo realinha
+                self._restore(pending)
+                raise
+            pending.pop(0)
+            written += len(rows)
+        if written:
+            self.stats['flushes'] += 1
+        return written
+
+    def _restore(self, pending):
+        """Devolve aos buffers as partições não gravadas, antes das linhas novas"""
+        with self._lock:
+            for key, rows in pending:
+                self._buffers[key] = rows + self._buffers.get(key, [])
+
+    def _append(self, car_id, t, kind, row):
+        with self._lock:
+            if car_id in self._released:
+                self.stats['late'] += 1
+                return
+            number, day = self._day
+            if number != t // 86400:
+                day = datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%d')
+                self._day = (t // 86400, day)
+            self._buffers.setdefault((car_id, day, kind), []).append(row)
+            self.stats[kind] += 1
+
+
+def align_partition(folder, kind):
+    """
+    Corta as colunas de uma partição no número de linhas que todas têm
+    (restos de um flush interrompido); devolve quantos bytes saíram.
+    """
+    sizes = {}
+    for column, (typecode, _) in SCHEMA[kind].items():
+        path = os.path.join(folder, f"{column}.bin")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        sizes[path] = (size, array(typecode).itemsize)
+    rows = min(size // itemsize for size, itemsize in sizes.values())
+    cut = 0
+    for path, (size, itemsize) in sizes.items():
+        if size > rows * itemsize:
+            os.truncate(path, rows * itemsize)
+            cut += size - rows * itemsize
+    return cut
+
+
+# ==============================================================================
+# Leitura e consultas (numpy)
+# ==============================================================================
+
+def _days(start, end):
+    day = datetime.strptime(start, '%Y-%m-%d').date()
+    last = datetime.strptime(end, '%Y-%m-%d').date() if end else day
+    while day <= last:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def load(root, car_id, kind, start, end=None, columns=None):
+    """Colunas de `kind` de um veículo entre dois dias (inclusive) → dict de arrays"""
+    import numpy as np
+
+    columns = columns or list(SCHEMA[kind])
+    parts = {c: [] for c in columns}
+    for day in _days(start, end):
+        folder = os.path.join(root, car_id, day, kind)
+        if not os.path.isdir(folder):
+            continue
+        maps = {}
+        for column in columns:
+            path = os.path.join(folder, f"{column}.bin")
+            dtype = np.dtype(SCHEMA[kind][column][1])
+            size = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+            maps[column] = np.memmap(path, dtype=dtype, mode='r', shape=(size,)) if size else np.empty(0, dtype)
+        n = min(len(m) for m in maps.values())  # colunas de um flush interrompido
+        for column in columns:
+            parts[column].append(maps[column][:n])
+    return {c: (np.concatenate(p) if p else np.empty(0, SCHEMA[kind][c][1])) for c, p in parts.items()}
+
+
+def segment_distances_m(lat, lon, t, max_gap_s=60.0, max_speed_kmh=250.0):
+    """
+    Distância entre fixes consecutivos (0 em lacunas e saltos impossíveis).
+    Segmentos de no máximo alguns km: a projeção equirretangular na latitude
+    média do segmento fica a centímetros do haversine e custa um cosseno.
+    """
+    import numpy as np
+
+    dy = np.diff(lat)
+    dx = np.diff(lon)
+    dx *= np.cos(np.radians(lat[:-1] + dy / 2))
+    d = np.hypot(dx, dy)
+    d *= _M_PER_DEG
+    dt = np.diff(t)
+    ok = (dt > 0) & (dt <= max_gap_s) & (d <= max_speed_kmh / 3.6 * np.maximum(dt, 1.0))
+    return np.where(ok, d, 0.0)
+
+
+def daily_summary(root, car_id, start, end=None):
+    """Por dia: fixes, % válidos, km, velocidade máxima, satélites médios, heartbeats"""
+    import numpy as np
+
+    gps = load(root, car_id, 'gps', start, end, ['t', 'lat', 'lon', 'sats', 'valid', 'accepted', 'speed'])
+    hb = load(root, car_id, 'heartbeat', start, end, ['t'])
+    if not len(gps['t']):
+        return []
+    # As partições são lidas em ordem de dia e cada uma cresce em ordem de chegada
+    day = (gps['t'] // 86400).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    days = day[starts]
+    counts = np.diff(np.r_[starts, len(day)])
+    valid = np.add.reduceat(gps['valid'], starts, dtype=np.int64)
+    sats = np.add.reduceat(gps['sats'], starts, dtype=np.int64)
+    speed = np.maximum.reduceat(np.nan_to_num(gps['speed']), starts)
+
+    # Distância só entre fixes aceitos consecutivos do mesmo dia
+    ok = gps['accepted'].astype(bool)
+    aday = day[ok]
+    dist = segment_distances_m(gps['lat'][ok], gps['lon'][ok], gps['t'][ok])
+    same = aday[1:] == aday[:-1]
+    km = np.bincount(np.searchsorted(days, aday[1:][same]), weights=dist[same], minlength=len(days)) / 1000
+    hb_day = (hb['t'] // 86400).astype(np.int64)
+    hb_day = hb_day[np.isin(hb_day, days)]
+    heartbeats = np.bincount(np.searchsorted(days, hb_day), minlength=len(days))
+
+    return [{
+        'day': datetime.fromtimestamp(int(d) * 86400, timezone.utc).strftime('%Y-%m-%d'),
+        'fixes': int(counts[i]),
+        'valid_pct': 100.0 * valid[i] / counts[i],
+        'km': float(km[i]),
+        'max_speed_kmh': float(speed[i]),
+        'avg_sats': sats[i] / counts[i],
+        'heartbeats': int(heartbeats[i]),
+    } for i, d in enumerate(days)]
+
+
+def hourly_profile(root, car_id, start, end=None, utc_offset_h=-3):
+    """Por hora do dia (fuso local): fixes, % válidos e satélites médios"""
+    import numpy as np
+
+    gps = load(root, car_id, 'gps', start, end, ['t', 'sats', 'valid'])
+    hour = (((gps['t'] + utc_offset_h * 3600) // 3600) % 24).astype(np.int64)
+    counts = np.bincount(hour, minlength=24)
+    valid = np.bincount(hour, weights=gps['valid'], minlength=24)
+    sats = np.bincount(hour, weights=gps['sats'], minlength=24)
+    safe = np.maximum(counts, 1)
+    return [{'hour': h, 'fixes': int(counts[h]), 'valid_pct': 100.0 * valid[h] / safe[h],
+             'avg_sats': sats[h] / safe[h]} for h in range(24)]
+
+
+def export(root, car_id, start, end, target, kind='gps'):
+    """Exporta um intervalo para .csv ou .npz; devolve quantas linhas"""
+    import numpy as np
+
+    data = load(root, car_id, kind, start, end)
+    n = len(data['t'])
+    if target.endswith('.npz'):
+        np.savez(target, **data)
+        return n
+    columns = list(SCHEMA[kind])
+    row = ','.join('%.3f' if c == 't' else '%.7f' if c in ('lat', 'lon') else
+                   '%.2f' if SCHEMA[kind][c][0] in 'fd' else '%d' for c in columns) + '\n'
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(','.join(columns) + '\n')
+        step = 100000
+        for i in range(0, n, step):
+            chunk = zip(*(data[c][i:i + step].tolist() for c in columns))
+            f.writelines(row % values for values in chunk)
+    return n
+
+
+def list_partitions(root):
+    """{carId: [dias]} do arquivo"""
+    out = {}
+    if not os.path.isdir(root):
+        return out
+    for car_id in sorted(os.listdir(root)):
+        folder = os.path.join(root, car_id)
+        if os.path.isdir(folder):
+            out[car_id] = sorted(os.listdir(folder))
+    return out
+
+
+def main():
+    import argparse
+
+    from config import ARCHIVE_DIR
+
+    parser = argparse.ArgumentParser(description="Consultas no arquivo local de telemetria (requer numpy)")
+    parser.add_argument('--root', default=str(ARCHIVE_DIR), help=f"pasta do arquivo (padrão: {ARCHIVE_DIR})")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('listar', help="veículos e dias arquivados")
+    for name, ajuda in (('resumo', "fixes, km, velocidade e satélites por dia"),
+                        ('por-hora', "fixes válidos e satélites por hora do dia"),
+                        ('exportar', "exporta gps (ou heartbeat) para .csv ou .npz")):
+        p = sub.add_parser(name, help=ajuda)
+        p.add_argument('--car', required=True)
+        p.add_argument('--from', dest='start', required=True, help="AAAA-MM-DD (UTC)")
+        p.add_argument('--to', dest='end', help="AAAA-MM-DD, inclusive (padrão: só o --from)")
+        if name == 'por-hora':
+            p.add_argument('--utc-offset', type=int, default=-3, help="fuso das horas (padrão: -3)")
+        if name == 'exportar':
+            p.add_argument('--kind', choices=tuple(SCHEMA), default='gps')
+            p.add_argument('target', help="arquivo .csv ou .npz")
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        sys.exit("❌ As consultas precisam do numpy: pip install numpy")
+
+    t0 = time.perf_counter()
+    if args.command == 'listar':
+        for car_id, days in list_partitions(args.root).items():
+            print(f"{car_id}: {len(days)} dias ({days[0]} a {days[-1]})" if days else f"{car_id}: vazio")
+    elif args.command == 'resumo':
+        print(f"{'dia':10s} {'fixes':>8s} {'válidos':>8s} {'km':>8s} {'máx km/h':>9s} {'sats':>5s} {'heartbeats':>10s}")
+        for r in daily_summary(args.root, args.car, args.start, args.end):
+            print(f"{r['day']:10s} {r['fixes']:8d} {r['valid_pct']:7.1f}% {r['km']:8.1f} "
+                  f"{r['max_speed_kmh']:9.1f} {r['avg_sats']:5.1f} {r['heartbeats']:10d}")
+    elif args.command == 'por-hora':
+        print(f"{'hora':>4s} {'fixes':>9s} {'válidos':>8s} {'sats':>5s}")
+        for r in hourly_profile(args.root, args.car, args.start, args.end, args.utc_offset):
+            print(f"{r['hour']:4d} {r['fixes']:9d} {r['valid_pct']:7.1f}% {r['avg_sats']:5.1f}")
+    else:
+        n = export(args.root, args.car, args.start, args.end, args.target, args.kind)
+        print(f"✅ {n} linhas exportadas para {args.target}")
+    print(f"⏱️  {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
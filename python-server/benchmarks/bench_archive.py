@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark: consultas no arquivo local de telemetria (um mês a 1 Hz).
+
+Grava `--days` dias de fixes a cada segundo (e um heartbeat a cada 30 s)
+de um carro que roda algumas horas por dia, passando pelo mesmo
+TelemetryArchive do gateway em lotes de `--flush` s. Depois mede o resumo
+por dia, o perfil por hora e a exportação .npz/.csv do intervalo inteiro.
+A pasta é temporária, a menos que `--root` seja passado.
+
+Antes, confere a recuperação de um flush interrompido: só 3 das 10 colunas
+gps recebem um lote, um TelemetryArchive novo continua gravando no mesmo
+dia e todas as colunas precisam continuar alinhadas (sai com código 1 se
+não estiverem).
+
+Uso:
+    python benchmarks/bench_archive.py --days 30
+    python benchmarks/bench_archive.py --days 30 --csv
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from archive import SCHEMA, TelemetryArchive, daily_summary, export, hourly_profile, load  # noqa: E402
+from line_parser import GpsRecord, HeartbeatRecord  # noqa: E402
+
+INICIO = datetime(2026, 9, 1, tzinfo=timezone.utc).timestamp()
+
+
+def gravar(archive, dias, flush):
+    """Gera e grava os registros; devolve (fixes, segundos de escrita)"""
+    rng = random.Random(5)
+    lat, lon, heading = -23.55, -46.63, 0.0
+    gasto = 0.0
+    lote = []
+
+    def descarregar():
+        t0 = time.perf_counter()
+        for r in lote:
+            if r.type == 'gps':
+                archive.gps('carro-1', r, r.valid)
+            else:
+                archive.heartbeat('carro-1', r, INICIO + r.uptime / 1000)
+        archive.flush()
+        lote.clear()
+        return time.perf_counter() - t0
+
+    for s in range(dias * 86400):
+        t = INICIO + s
+        hora = (s // 3600 + 21) % 24  # UTC-3
+        rodando = hora in (7, 8, 12, 18, 19)
+        speed = max(0.0, rng.gauss(40, 15)) if rodando else 0.0
+        heading += rng.gauss(0, 0.05)
+        lat += speed / 3.6 * math.cos(heading) / 111320
+        lon += speed / 3.6 * math.sin(heading) / 101000
+        sats = rng.randint(3, 6) if hora in (0, 1, 2, 3) else rng.randint(6, 11)
+        valid = sats >= 4
+        fix = GpsRecord(lat=lat, lon=lon, sats=sats, age=rng.randint(50, 900), valid=valid,
+                        ignition_state='on' if rodando else 'off', gps_init=True)
+        fix.received_at = t
+        fix.speed = speed
+        fix.quality = 1.0 if valid else 0.0
+        lote.append(fix)
+        if s % 30 == 0:
+            lote.append(HeartbeatRecord(uptime=s * 1000, commands=3, rele='ligado', free_ram=900,
+                                        gps_status='fixed', valid_gps=s, last_valid=1))
+        if len(lote) >= flush:
+            gasto += descarregar()
+    gasto += descarregar()
+    return archive.stats['gps'], gasto
+
+
+def verificar_queda(root):
+    """Flush interrompido após 3 colunas; o processo seguinte precisa realinhar antes de gravar"""
+    def fix(n):
+        r = GpsRecord(lat=-23.55 + n * 1e-5, lon=-46.63, sats=8, age=n, valid=True,
+                      ignition_state='on', gps_init=True)
+        r.received_at = INICIO + n
+        return r
+
+    archive = TelemetryArchive(root)
+    for n in range(100):
+        archive.gps('queda', fix(n), True)
+    archive.flush()
+    # Queda no meio do flush seguinte: 50 linhas chegaram só às 3 primeiras colunas
+    dia = datetime.fromtimestamp(INICIO, timezone.utc).strftime('%Y-%m-%d')
+    pasta = os.path.join(root, 'queda', dia, 'gps')
+    for column, (typecode, _) in list(SCHEMA['gps'].items())[:3]:
+        with open(os.path.join(pasta, f"{column}.bin"), 'ab') as f:
+            array(typecode, [0] * 50).tofile(f)
+
+    archive = TelemetryArchive(root)  # gateway reiniciado
+    for n in range(100, 150):
+        archive.gps('queda', fix(n), True)
+    archive.flush()
+    data = load(root, 'queda', 'gps', dia)
+    esperado = list(range(150))
+    ok = (data['age'].tolist() == esperado and (data['t'] - INICIO).tolist() == esperado
+          and all(len(v) == 150 for v in data.values()))
+    print(f"flush interrompido: {len(data['t'])} linhas, {archive.stats['truncated']} bytes cortados, "
+          f"colunas {'alinhadas' if ok else 'DESALINHADAS'}")
+    return ok
+
+
+def cronometrar(fn, repeticoes=5):
+    """Melhor de algumas execuções (a primeira paga a leitura do disco)"""
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = fn()
+        tempos.append(time.perf_counter() - t0)
+    return resultado, tempos[0], min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--flush', type=int, default=10, help='registros por flush (o gateway usa 10 s)')
+    parser.add_argument('--root', help='pasta do arquivo (padrão: temporária)')
+    parser.add_argument('--csv', action='store_true', help='mede também a exportação .csv (lenta)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not verificar_queda(os.path.join(tmp, 'queda')):
+            print("❌ FALHOU: colunas desalinhadas após o flush interrompido")
+            sys.exit(1)
+        root = args.root or os.path.join(tmp, 'archive')
+        archive = TelemetryArchive(root)
+        fixes, escrita = gravar(archive, args.days, args.flush)
+        print(f"{fixes} fixes e {archive.stats['heartbeat']} heartbeats em {args.days} dias | "
+              f"{archive.stats['bytes'] / 1e6:.0f} MB | escrita {escrita / fixes * 1e6:.1f} µs/fix")
+
+        inicio = datetime.fromtimestamp(INICIO, timezone.utc).strftime('%Y-%m-%d')
+        fim = datetime.fromtimestamp(INICIO + (args.days - 1) * 86400, timezone.utc).strftime('%Y-%m-%d')
+        dias, frio, quente = cronometrar(lambda: daily_summary(root, 'carro-1', inicio, fim))
+        km = sum(d['km'] for d in dias)
+        print(f"resumo por dia:  {frio * 1000:7.1f} ms (1ª) {quente * 1000:7.1f} ms | "
+              f"{len(dias)} dias, {km:.0f} km, {sum(d['heartbeats'] for d in dias)} heartbeats")
+        horas, frio, quente = cronometrar(lambda: hourly_profile(root, 'carro-1', inicio, fim))
+        pior = min(horas, key=lambda h: h['valid_pct'])
+        print(f"perfil por hora: {frio * 1000:7.1f} ms (1ª) {quente * 1000:7.1f} ms | "
+              f"pior hora {pior['hour']}h: {pior['valid_pct']:.0f}% válidos, {pior['avg_sats']:.1f} sats")
+        alvo = os.path.join(tmp, 'mes.npz')
+        n, frio, _ = cronometrar(lambda: export(root, 'carro-1', inicio, fim, alvo), 1)
+        print(f"exportar .npz:   {frio * 1000:7.1f} ms | {n} linhas, {os.path.getsize(alvo) / 1e6:.0f} MB")
+        if args.csv:
+            alvo = os.path.join(tmp, 'mes.csv')
+            n, frio, _ = cronometrar(lambda: export(root, 'carro-1', inicio, fim, alvo), 1)
+            print(f"exportar .csv:   {frio * 1000:7.1f} ms | {n} linhas, {os.path.getsize(alvo) / 1e6:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latência do comando de ignição (app → relé confirmado).
+
+Um Arduino falso num pty manda GPS a `--rate` linhas/s e responde aos
+comandos IGNITION_ON/OFF#seq com o ack (após `--ack-delay`), podendo perder
+uma fração dos comandos (`--loss`) para exercitar os reenvios. O benchmark
+alterna ignitionState no Firestore em memória e mede o tempo até
+relayCommand.status == 'confirmed' no documento do carro. Com `--app` faz
+como o services/carService.ts (documento em car_commands + update do carro)
+e mede até o comando ficar 'executed'.
+
+Uso (Linux/macOS):
+    python benchmarks/bench_command_latency.py --toggles 20 --rate 10 --loss 0.2
+    python benchmarks/bench_command_latency.py --toggles 20 --app
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pty
+import random
+import statistics
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from car_commands import CommandQueueListener  # noqa: E402
+from firestore_writer import FirestoreWriter  # noqa: E402
+from memory_firestore import MemoryFirestore  # noqa: E402
+from vehicle_session import VehicleSession  # noqa: E402
+
+
+def arduino_falso(master, rate, ack_delay, loss, parar):
+    """GPS periódico + ack com o seq de cada comando recebido"""
+    interval = 1.0 / rate
+    buffer = b''
+    n = 0
+    proximo = time.monotonic()
+    os.set_blocking(master, False)
+    while not parar.is_set():
+        try:
+            buffer += os.read(master, 1024)
+        except BlockingIOError:
+            pass
+        while b'\n' in buffer:
+            linha, buffer = buffer.split(b'\n', 1)
+            cmd, _, seq = linha.decode().strip().partition('#')
+            if cmd in ('IGNITION_ON', 'IGNITION_OFF') and random.random() >= loss:
+                time.sleep(ack_delay)
+                ack = {'type': 'ack', 'ignitionState': 'on' if cmd == 'IGNITION_ON' else 'off',
+                       'command': 'executed'}
+                if seq:
+                    ack['seq'] = int(seq)
+                os.write(master, (json.dumps(ack) + '\n').encode())
+
+        if time.monotonic() >= proximo:
+            line = json.dumps({
+                'type': 'gps', 'lat': -23.55 + n * 1e-4, 'lon': -46.63, 'sats': 8, 'age': 120,
+                'ignitionState': 'on', 'valid': True, 'uptime': n * 100, 'validCount': n,
+                'totalReads': n, 'gpsInit': True
+            }, separators=(',', ':'))
+            os.write(master, (line + '\n').encode())
+            n += 1
+            proximo += interval
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--toggles', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=10.0, help='linhas GPS por segundo')
+    parser.add_argument('--ack-delay', type=float, default=0.01, help='tempo do Arduino até o ack (s)')
+    parser.add_argument('--loss', type=float, default=0.0, help='fração de comandos perdidos')
+    parser.add_argument('--latency', type=float, default=0.02, help='round trip simulado do Firestore (s)')
+    parser.add_argument('--app', action='store_true', help='comandos via car_commands, como o app')
+    args = parser.parse_args()
+
+    db = MemoryFirestore(latency=args.latency)
+    writer = FirestoreWriter(db, batch_size=50, max_age=0.2).start()
+    car_ref = db.collection('cars').document('car000')
+    car_ref.set({'ignitionState': 'off'})
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    session = VehicleSession(db, writer, 'car000', 'user', port=os.ttyname(slave), car_update_interval=0.5,
+                             adaptive_rate=False)
+    session.ser = serial.Serial(session.port, 9600, timeout=1)
+
+    parar = threading.Event()
+    latencias, falhas = [], 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        session.load_initial_state()
+        session.start()
+        listener = CommandQueueListener(db, [session]).start() if args.app else None
+        threading.Thread(target=arduino_falso, args=(master, args.rate, args.ack_delay, args.loss, parar),
+                         daemon=True).start()
+        time.sleep(0.5)
+
+        estado = 'off'
+        for i in range(args.toggles):
+            estado = 'on' if estado == 'off' else 'off'
+            t0 = time.monotonic()
+            if args.app:
+                _, command_ref = db.collection('car_commands').add({
+                    'carId': 'car000', 'command': 'unlock' if estado == 'on' else 'lock',
+                    'timestamp': int(time.time() * 1000), 'status': 'pending'
+                })
+            car_ref.update({'ignitionState': estado})
+            limite = t0 + 10
+            while time.monotonic() < limite:
+                if args.app:
+                    pronto = db.docs.get(command_ref.path, {}).get('status') == 'executed'
+                else:
+                    doc = db.docs.get(car_ref.path, {})
+                    pronto = (doc.get('relayState') == estado and
+                              doc.get('relayCommand', {}).get('status') == 'confirmed')
+                if pronto:
+                    latencias.append((time.monotonic() - t0) * 1000)
+                    break
+                time.sleep(0.002)
+            else:
+                falhas += 1
+            time.sleep(0.3)
+
+        parar.set()
+        if listener:
+            listener.stop()
+        session.stop()
+        writer.stop()
+    os.close(master)
+    os.close(slave)
+
+    stats = session.commands.stats
+    snaps = session.snapshot_stats
+    print(f"toggles {args.toggles} | confirmados {len(latencias)} | falhas {falhas} | "
+          f"comandos enviados {stats['sent']} | reenvios {stats['retries']} | sem ack {stats['timeouts']}")
+    print(f"snapshots de cars/car000: {snaps['received']} recebidos, {snaps['ignored']} ignorados "
+          f"(escritas do próprio gateway)")
+    if latencias:
+        latencias.sort()
+        alvo = 'car_commands executed' if args.app else 'relé confirmado no Firestore'
+        print(f"{alvo} (ms): p50 {statistics.median(latencias):.1f} | "
+              f"p95 {latencias[int(0.95 * (len(latencias) - 1))]:.1f} | máx {latencias[-1]:.1f}")
+        print(f"ida e volta serial (ms): médio {session.commands.avg_rtt_ms():.1f} | "
+              f"máx {stats['max_rtt_ms']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
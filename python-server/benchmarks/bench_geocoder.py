@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: geocodificação reversa offline num trajeto repetido.
+
+Sem `--csv`, gera `--points` pontos de endereço numa malha de ruas de
+~30 x 30 km (lotes a cada ~20 m, como um extrato do OSM de uma capital).
+O trajeto simula `--days` dias de casa → trabalho → casa pelas mesmas
+ruas, com o carro parado na garagem e no estacionamento, fixes a cada
+`--interval` s e ruído de ~4 m. Mede o carregamento, buscas por segundo
+com e sem o LRU e a taxa de acerto do cache.
+
+Uso:
+    python benchmarks/bench_geocoder.py --points 300000 --days 5
+    python benchmarks/bench_geocoder.py --csv geodata/addresses.csv
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from reverse_geocoder import ReverseGeocoder  # noqa: E402
+
+LAT0, LON0 = -23.70, -46.80
+SPAN_DEG = 0.27  # ~30 km
+
+
+def malha(n):
+    """Quantidade de ruas em cada sentido e distância entre elas (graus) para `n` lotes"""
+    ruas = max(2, int(n / (2 * SPAN_DEG / 0.0002)))
+    return ruas, SPAN_DEG / ruas
+
+
+def enderecos(rng, n):
+    """Lotes a cada ~20 m ao longo de ruas norte-sul e leste-oeste"""
+    ruas, passo = malha(n)
+    i = 0
+    while i < n:
+        rua = rng.randrange(ruas)
+        ao_longo = rng.uniform(0, SPAN_DEG)
+        numero = int(ao_longo / SPAN_DEG * 5000) * 2
+        if rng.random() < 0.5:
+            lat, lon, nome = LAT0 + rua * passo, LON0 + ao_longo, f"Rua {rua}"
+        else:
+            lat, lon, nome = LAT0 + ao_longo, LON0 + rua * passo, f"Avenida {rua}"
+        yield {'lat': lat + rng.gauss(0, 0.00005), 'lon': lon + rng.gauss(0, 0.00005), 'street': nome,
+               'number': str(numero), 'district': f"Bairro {int((lat - LAT0) / 0.03)}-{int((lon - LON0) / 0.03)}",
+               'city': 'São Paulo', 'state': 'SP'}
+        i += 1
+
+
+def trajeto(rng, dias, interval, passo):
+    """(lat, lon) de um carro que faz sempre o mesmo caminho pelas ruas da malha"""
+    casa = (LAT0 + 20 * passo, LON0 + 0.05)
+    trabalho = (LAT0 + 0.20, LON0 + 70 * passo)
+    rota = [casa, (casa[0], trabalho[1]), trabalho]
+
+    def ruido(p):
+        return p[0] + rng.gauss(0, 4) / 111320, p[1] + rng.gauss(0, 4) / 101000
+
+    for _ in range(dias):
+        for origem, parada in ((rota, casa), (rota[::-1], trabalho)):
+            for _ in range(int(3600 / interval)):  # 1 h estacionado
+                yield ruido(parada)
+            for a, b in zip(origem, origem[1:]):
+                dist = math.hypot((b[0] - a[0]) * 111320, (b[1] - a[1]) * 101000)
+                passos = int(dist / (12 * interval))  # ~43 km/h
+                for k in range(passos):
+                    f = k / passos
+                    yield ruido((a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f))
+
+
+def medir(geocoder, fixes):
+    t0 = time.perf_counter()
+    achados = sum(1 for lat, lon in fixes if geocoder.lookup(lat, lon) is not None)
+    return len(fixes) / (time.perf_counter() - t0), achados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=300000)
+    parser.add_argument('--csv', help='CSV de endereços real (lat,lon,street,...)')
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=5.0, help='segundos entre fixes')
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    if args.csv:
+        linhas = None
+    else:
+        linhas = list(enderecos(rng, args.points))
+
+    def carregar(**kwargs):
+        t0 = time.perf_counter()
+        geo = ReverseGeocoder.load(args.csv, **kwargs) if args.csv else ReverseGeocoder(linhas, **kwargs)
+        return geo, time.perf_counter() - t0
+
+    geocoder, carga = carregar()
+    print(f"{len(geocoder)} pontos carregados em {carga:.2f}s | {len(geocoder.cells)} células")
+
+    fixes = list(trajeto(rng, args.days, args.interval, malha(args.points)[1]))
+    sem_cache, _ = carregar(cache_size=0)
+    taxa_sem, achados = medir(sem_cache, fixes)
+    taxa_com, _ = medir(geocoder, fixes)
+    stats = geocoder.stats()
+    print(f"trajeto: {len(fixes)} fixes em {args.days} dias (a cada {args.interval:g}s) | "
+          f"com endereço: {achados / len(fixes):.1%}")
+    print(f"sem cache: {taxa_sem:10.0f} buscas/s")
+    print(f"com LRU:   {taxa_com:10.0f} buscas/s | acertos {stats['hits'] / len(fixes):.1%} "
+          f"({stats['cached']} chaves em cache)")
+    amostra = geocoder.lookup(*fixes[len(fixes) // 3])
+    if amostra:
+        print(f"exemplo: {amostra['address']} ({amostra['distanceM']} m)")
+
+
+if __name__ == '__main__':
+    main()
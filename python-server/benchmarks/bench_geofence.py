@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fixes/s do GeofenceEngine em função do número de cercas.
+
+Espalha N cercas (metade círculos de 50-500 m, metade polígonos de 5-8
+vértices) numa região de ~55 x 55 km e passa um trajeto aleatório pela
+região. Compara o índice em grade com a varredura linear de todas as
+cercas (o que seria feito sem índice) e confere que os dois dão o mesmo
+resultado.
+
+Uso:
+    python benchmarks/bench_geofence.py --fixes 20000 --fences 10 100 1000 10000
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from geofence import CircleFence, GeofenceEngine, PolygonFence  # noqa: E402
+
+LAT0, LON0 = -23.80, -46.90
+SPAN_DEG = 0.5
+
+
+def gerar_cercas(n, rng):
+    fences = []
+    for i in range(n):
+        lat = LAT0 + rng.random() * SPAN_DEG
+        lon = LON0 + rng.random() * SPAN_DEG
+        if i % 2:
+            fences.append(CircleFence(f"c{i}", f"c{i}", lat, lon, rng.uniform(50, 500)))
+        else:
+            vertices = rng.randint(5, 8)
+            raio = rng.uniform(200, 1000) / 111320
+            pontos = [(lat + raio * rng.uniform(0.5, 1) * math.sin(2 * math.pi * k / vertices),
+                       lon + raio * rng.uniform(0.5, 1) * math.cos(2 * math.pi * k / vertices))
+                      for k in range(vertices)]
+            fences.append(PolygonFence(f"p{i}", f"p{i}", pontos))
+    return fences
+
+
+def gerar_trajeto(n, rng):
+    lat, lon = LAT0 + SPAN_DEG / 2, LON0 + SPAN_DEG / 2
+    heading = 0.0
+    pontos = []
+    for _ in range(n):
+        heading += rng.gauss(0, 0.3)
+        lat = min(max(lat + 70 * math.cos(heading) / 111320, LAT0), LAT0 + SPAN_DEG)
+        lon = min(max(lon + 70 * math.sin(heading) / 101000, LON0), LON0 + SPAN_DEG)
+        pontos.append((lat, lon))
+    return pontos
+
+
+def linear(fences, trajeto):
+    """Sem índice: testa todas as cercas em todo fix"""
+    return [frozenset(f.id for f in fences if f.contains(lat, lon)) for lat, lon in trajeto]
+
+
+def indexado(engine, trajeto):
+    resultado = []
+    for lat, lon in trajeto:
+        engine.check(lat, lon)
+        resultado.append(frozenset(engine.inside))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fixes', type=int, default=20000)
+    parser.add_argument('--fences', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--linear-max', type=int, default=1000,
+                        help='maior número de cercas medido também na varredura linear')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    trajeto = gerar_trajeto(args.fixes, rng)
+    print(f"{'cercas':>7s} {'índice fixes/s':>15s} {'µs/fix':>8s} {'testes/fix':>11s} "
+          f"{'linear fixes/s':>15s} {'eventos':>8s}")
+    for n in args.fences:
+        fences = gerar_cercas(n, rng)
+        t0 = time.perf_counter()
+        engine = GeofenceEngine(fences, confirm=1)
+        montagem = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        obtido = indexado(engine, trajeto)
+        dt = time.perf_counter() - t0
+        eventos = engine.stats['enter'] + engine.stats['exit']
+
+        linear_txt = '-'
+        if n <= args.linear_max:
+            t0 = time.perf_counter()
+            esperado = linear(fences, trajeto)
+            linear_txt = f"{len(trajeto) / (time.perf_counter() - t0):15.0f}"
+            if obtido != esperado:
+                print(f"⚠️  {n} cercas: índice e varredura linear divergem")
+        print(f"{n:7d} {len(trajeto) / dt:15.0f} {dt / len(trajeto) * 1e6:8.2f} "
+              f"{engine.stats['tests'] / engine.stats['checks']:11.2f} {linear_txt:>15s} {eventos:8d}"
+              f"   (índice montado em {montagem * 1000:.0f} ms, {len(engine.index.cells)} células)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark: carga no stream do estado ao vivo com centenas de assinantes.
+
+Sobe um LiveState + LiveServer local e publica `--cars` carros a `--rate`
+fixes/s cada (o caminho do gateway com o thinning fora do circuito). Os
+assinantes ficam em `--procs` processos filhos, cada um lendo dezenas de
+sockets com selectors:
+
+- rápidos: leem tudo assim que chega (latência da publicação ao cliente);
+- lentos (`--slow`): leem no máximo 4 KB a cada 0,5 s (metade do fluxo
+  padrão), e recebem o estado coalescido;
+- parados (`--stalled`): conectam e nunca leem, até o servidor desistir
+  deles após WRITE_TIMEOUT.
+
+Mede o custo do update() no publicador, latência, eventos por cliente,
+coalescência e o GET /cars sob carga.
+
+Uso:
+    python benchmarks/bench_live_push.py --clients 300 --cars 5 --rate 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import live_state  # noqa: E402
+from live_state import LiveServer, LiveState  # noqa: E402
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def conectar(port, tipo, rcvbuf=None):
+    sock = socket.socket()
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.connect(('127.0.0.1', port))
+    sock.sendall(b'GET /stream HTTP/1.1\r\nHost: local\r\n\r\n')
+    sock.setblocking(False)
+    return sock
+
+
+def assinantes(port, rapidos, lentos, parados, duracao, largada, fila):
+    """Processo filho: mantém os sockets e devolve latências e contagens"""
+    sel = selectors.DefaultSelector()
+    clientes = []
+    for tipo, n in (('rapido', rapidos), ('lento', lentos), ('parado', parados)):
+        for _ in range(n):
+            sock = conectar(port, tipo, rcvbuf=None if tipo == 'rapido' else 4096)
+            c = {'tipo': tipo, 'sock': sock, 'buf': b'', 'eventos': 0, 'fechado': False, 'lido': 0.0}
+            clientes.append(c)
+            if tipo == 'rapido':
+                sel.register(sock, selectors.EVENT_READ, c)
+    latencias = []
+    fim = None
+
+    def ler(c, limite=1 << 16):
+        try:
+            dados = c['sock'].recv(limite)
+        except BlockingIOError:
+            return
+        except OSError:
+            dados = b''
+        if not dados:
+            c['fechado'] = True
+            if c['tipo'] == 'rapido':
+                sel.unregister(c['sock'])
+            return
+        agora = time.time()
+        c['buf'] += dados
+        *eventos, c['buf'] = c['buf'].split(b'\n\n')
+        for ev in eventos:
+            i = ev.find(b'data: ')
+            if i < 0 or b'"position"' not in ev:  # ping ou estado inicial
+                continue
+            c['eventos'] += 1
+            if c['tipo'] == 'rapido' and len(latencias) < 200000:
+                latencias.append(agora - json.loads(ev[i + 6:])['updatedAt'])
+
+    while fim is None or time.monotonic() < fim:
+        if fim is None and largada.is_set():
+            fim = time.monotonic() + duracao  # conta a partir do início da publicação
+        for key, _ in sel.select(timeout=0.1):
+            ler(key.data)
+        agora = time.monotonic()
+        for c in clientes:
+            if c['tipo'] == 'lento' and agora - c['lido'] >= 0.5 and not c['fechado']:
+                c['lido'] = agora
+                ler(c, 4096)
+    resumo = {}
+    for c in clientes:
+        r = resumo.setdefault(c['tipo'], {'eventos': [], 'fechados': 0})
+        r['eventos'].append(c['eventos'])
+        r['fechados'] += c['fechado']
+        c['sock'].close()
+    fila.put((latencias, resumo))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=300, help='assinantes no total')
+    parser.add_argument('--slow', type=float, default=0.1, help='fração de clientes lentos')
+    parser.add_argument('--stalled', type=float, default=0.05, help='fração de clientes parados')
+    parser.add_argument('--cars', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=10.0, help='fixes por segundo por carro')
+    parser.add_argument('--seconds', type=float, default=15.0)
+    parser.add_argument('--procs', type=int, default=2, help='processos de assinantes')
+    parser.add_argument('--write-timeout', type=float, default=3.0, help='WRITE_TIMEOUT do servidor')
+    args = parser.parse_args()
+
+    live_state.WRITE_TIMEOUT = args.write_timeout
+    live = LiveState()
+    servidor = LiveServer(live, port=0, max_clients=args.clients + 10).start()
+    for i in range(args.cars):
+        live.update(f"carro-{i}", {'connected': True})
+
+    parados = int(args.clients * args.stalled)
+    lentos = int(args.clients * args.slow)
+    rapidos = args.clients - parados - lentos
+    fila = multiprocessing.Queue()
+    largada = multiprocessing.Event()
+    ctx_procs = []
+    for k in range(args.procs):
+        parte = lambda n: n // args.procs + (1 if k < n % args.procs else 0)  # noqa: E731
+        p = multiprocessing.Process(target=assinantes, daemon=True,
+                                    args=(servidor.port, parte(rapidos), parte(lentos), parte(parados),
+                                          args.seconds + 2, largada, fila))
+        p.start()
+        ctx_procs.append(p)
+    while live.stats['connected'] < args.clients:
+        time.sleep(0.05)
+    print(f"{args.clients} assinantes ({rapidos} rápidos, {lentos} lentos, {parados} parados) | "
+          f"{args.cars} carros a {args.rate:g} fixes/s | {threading.active_count()} threads no servidor")
+
+    # Publicador: um fix por carro a cada 1/rate s, como as sessões
+    largada.set()
+    custos = []
+    inicio = time.monotonic()
+    passo = 1 / args.rate
+    n = 0
+    while time.monotonic() - inicio < args.seconds:
+        for i in range(args.cars):
+            t0 = time.perf_counter()
+            live.update(f"carro-{i}", {'position': {'lat': -23.55 + n * 1e-5, 'lon': -46.63, 'speed': 42.0,
+                                                    'heading': 90.0, 'quality': 1.0, 'receivedAt': time.time()},
+                                       'gpsStatus': {'valid': True, 'accepted': True, 'satellites': 8, 'age': 300}})
+            custos.append(time.perf_counter() - t0)
+        n += 1
+        time.sleep(max(0.0, inicio + n * passo - time.monotonic()))
+    publicados = n
+    derrubados = live.stats['dropped']  # antes dos assinantes fecharem os sockets
+
+    # Snapshot sob carga
+    url = f"http://127.0.0.1:{servidor.port}/cars"
+    snaps = []
+    for _ in range(100):
+        t0 = time.perf_counter()
+        with urllib.request.urlopen(url) as resp:
+            json.loads(resp.read())
+        snaps.append(time.perf_counter() - t0)
+
+    latencias, resumo = [], {}
+    for _ in ctx_procs:
+        lat, parcial = fila.get()
+        latencias += lat
+        for tipo, r in parcial.items():
+            total = resumo.setdefault(tipo, {'eventos': [], 'fechados': 0})
+            total['eventos'] += r['eventos']
+            total['fechados'] += r['fechados']
+    for p in ctx_procs:
+        p.join()
+    servidor.stop()
+
+    print(f"update(): p50 {percentil(custos, 0.5) * 1e6:.0f} µs p99 {percentil(custos, 0.99) * 1e6:.0f} µs | "
+          f"{publicados * args.cars} atualizações publicadas")
+    print(f"latência (rápidos): p50 {percentil(latencias, 0.5) * 1000:.1f} ms "
+          f"p99 {percentil(latencias, 0.99) * 1000:.1f} ms máx {max(latencias) * 1000:.1f} ms")
+    for tipo, nome in (('rapido', 'rápidos'), ('lento', 'lentos'), ('parado', 'parados')):
+        r = resumo.get(tipo)
+        if not r or not r['eventos']:
+            continue
+        media = sum(r['eventos']) / len(r['eventos'])
+        print(f"{nome:8s} eventos/cliente p50 {percentil(r['eventos'], 0.5):6.0f} (média {media:6.0f}, "
+              f"{media / max(1, publicados * args.cars):5.1%} das atualizações) | "
+              f"viram o fim do stream: {r['fechados']}")
+    print(f"GET /cars sob carga: p50 {percentil(snaps, 0.5) * 1000:.1f} ms p99 {percentil(snaps, 0.99) * 1000:.1f} ms | "
+          f"eventos enviados {live.stats['events']} | streams derrubados durante a carga {derrubados}")
+
+
+if __name__ == '__main__':
+    main()
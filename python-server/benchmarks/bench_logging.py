@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: custo de log na thread que processa a serial.
+
+Compara o print síncrono antigo com o log em fila (setup_logging) quando o
+console é lento; `--console-us` simula o tempo de cada escrita no terminal
+(o console do Windows costuma levar centenas de µs por linha).
+
+Uso:
+    python benchmarks/bench_logging.py --lines 5000 --console-us 200
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from gateway_log import log_info, log_warning, setup_logging, stop_logging, suppressed_count  # noqa: E402
+
+
+class ConsoleLento:
+    """Stream que demora `atraso` segundos por escrita"""
+
+    def __init__(self, atraso):
+        self.atraso = atraso
+        self.linhas = 0
+
+    def write(self, texto):
+        self.linhas += texto.count('\n')
+        time.sleep(self.atraso)
+        return len(texto)
+
+    def flush(self):
+        pass
+
+
+def medir(modo, lines, atraso):
+    console = ConsoleLento(atraso)
+    with contextlib.redirect_stdout(console):
+        if modo == 'fila':
+            setup_logging()
+        t0 = time.perf_counter()
+        for i in range(lines):
+            mensagem = f"✅ GPS salvo: {-23.55 + i * 1e-5:.6f}, -46.633308 (8 sats, 120ms)"
+            if modo == 'print':
+                print(f"[INFO] {datetime.now().strftime('%H:%M:%S')} - {mensagem}")
+            else:
+                log_info(mensagem)
+            if i % 10 == 0:
+                log_warning(f"⏳ GPS procurando satélites... ({i % 4} sats encontrados)")
+        chamador = time.perf_counter() - t0
+        stop_logging()
+        total = time.perf_counter() - t0
+    return chamador, total, console.linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--console-us', type=float, default=200.0)
+    args = parser.parse_args()
+
+    print(f"{'modo':>6} {'µs/linha (thread serial)':>25} {'tempo até esvaziar':>19} {'linhas no console':>18}")
+    for modo in ('print', 'fila'):
+        chamador, total, linhas = medir(modo, args.lines, args.console_us / 1e6)
+        print(f"{modo:>6} {chamador / args.lines * 1e6:>25.1f} {total:>18.2f}s {linhas:>18}")
+    print(f"avisos repetidos suprimidos: {suppressed_count()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Teste de carga: um processo gateway servindo N Arduinos falsos (pty).
+
+Cada veículo tem sua VehicleSession e seu pty; o Firestore em memória e a
+fila de gravação são compartilhados. Reporta vazão por veículo e custo de
+CPU do processo.
+
+Uso (Linux/macOS):
+    python benchmarks/bench_multi_vehicle.py --vehicles 10 20 50 --rate 10 --seconds 5
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from firestore_writer import FirestoreWriter  # noqa: E402
+from memory_firestore import MemoryFirestore  # noqa: E402
+from vehicle_session import VehicleSession  # noqa: E402
+
+
+def arduino_falso(master, rate, seconds, idx, parar):
+    """Escreve registros GPS no pty até o tempo acabar"""
+    interval = 1.0 / rate
+    deadline = time.monotonic() + seconds
+    n = 0
+    proximo = time.monotonic()
+    while time.monotonic() < deadline and not parar.is_set():
+        line = json.dumps({
+            'type': 'gps', 'lat': -23.55 + idx * 0.01 + n * 1e-5, 'lon': -46.63 + n * 1e-5,
+            'sats': 8, 'age': 120, 'ignitionState': 'on', 'valid': True,
+            'uptime': n * 1000, 'validCount': n, 'totalReads': n, 'gpsInit': True
+        })
+        os.write(master, (line + '\n').encode())
+        n += 1
+        proximo += interval
+        time.sleep(max(0, proximo - time.monotonic()))
+    return n
+
+
+def rodar(n_vehicles, rate, seconds, latency):
+    db = MemoryFirestore(latency=latency)
+    writer = FirestoreWriter(db, max_queue=100000, batch_size=200, max_age=0.5).start()
+
+    sessions, ptys = [], []
+    for i in range(n_vehicles):
+        car_id = f"car{i:03d}"
+        db.collection('cars').document(car_id).set({'ignitionState': 'off'})
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        session = VehicleSession(db, writer, car_id, 'user', port=os.ttyname(slave), label=f"[{car_id}] ",
+                                 adaptive_rate=False)
+        session.ser = serial.Serial(session.port, 9600, timeout=1)
+        sessions.append(session)
+        ptys.append((master, slave))
+
+    parar = threading.Event()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for s in sessions:
+            s.start()
+        cpu0, t0 = time.process_time(), time.monotonic()
+        produtores = [
+            threading.Thread(target=arduino_falso, args=(m, rate, seconds, i, parar), daemon=True)
+            for i, (m, _) in enumerate(ptys)
+        ]
+        for p in produtores:
+            p.start()
+        for p in produtores:
+            p.join()
+        time.sleep(0.5)  # drena as últimas linhas
+        cpu, elapsed = time.process_time() - cpu0, time.monotonic() - t0
+        writer.flush(30)
+        for s in sessions:
+            s.stop()
+        writer.stop()
+
+    for master, slave in ptys:
+        os.close(master)
+        os.close(slave)
+
+    lidos = [s.gps_status['total_reads'] for s in sessions]
+    total = sum(lidos)
+    return {
+        'vehicles': n_vehicles,
+        'lines': total,
+        'per_vehicle_min': min(lidos) / seconds,
+        'per_vehicle_avg': total / n_vehicles / seconds,
+        'cpu_pct': cpu / elapsed * 100,
+        'cpu_us_line': cpu / total * 1e6 if total else 0,
+        'cpu_pct_vehicle': cpu / elapsed * 100 / n_vehicles,
+        'saved': db.count('gps_locations'),
+        'commits': db.commits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, nargs='+', default=[1, 10, 25, 50])
+    parser.add_argument('--rate', type=float, default=10.0, help='fixes por segundo por veículo')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--latency', type=float, default=0.05, help='round trip simulado do Firestore (s)')
+    args = parser.parse_args()
+
+    print(f"{'veículos':>8} {'linhas':>7} {'fix/s/veíc (mín/média)':>24} {'CPU %':>7} "
+          f"{'CPU/veíc':>9} {'µs/linha':>9} {'docs':>7} {'commits':>8}")
+    for n in args.vehicles:
+        r = rodar(n, args.rate, args.seconds, args.latency)
+        print(f"{r['vehicles']:>8} {r['lines']:>7} {r['per_vehicle_min']:>11.1f} / {r['per_vehicle_avg']:<10.1f} "
+              f"{r['cpu_pct']:>6.1f}% {r['cpu_pct_vehicle']:>8.2f}% {r['cpu_us_line']:>9.0f} "
+              f"{r['saved']:>7} {r['commits']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do parser de linhas do Arduino (linhas/s em um núcleo).
+
+Compara, para registros gps e heartbeat:
+  - legado: json.loads + cadeia de data.get (processar_linha_arduino antigo)
+  - json:   LineParser sem caminho rápido (json.loads → registro com __slots__)
+  - rápido: LineParser com o caminho especializado para o formato do firmware
+  - csv:    LineParser com o enquadramento compacto G,/H,
+
+Uso:
+    python benchmarks/bench_parser.py --lines 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from line_parser import LineParser  # noqa: E402
+
+GPS_JSON = ('{"type":"gps","lat":-23.550520,"lon":-46.633308,"sats":8,"age":120,'
+            '"ignitionState":"on","valid":true,"uptime":123456,"validCount":20,'
+            '"totalReads":12345,"gpsInit":true,"gpsTime":"2025-01-02 10:11:12"}')
+GPS_CSV = 'G,-23.550520,-46.633308,8,120,1,1,123456,20,12345,1,2025-01-02 10:11:12'
+HEARTBEAT_JSON = ('{"type":"heartbeat","uptime":123456,"commands":3,"rele":"ligado",'
+                  '"releLED":"aceso","freeRam":812,"gpsStatus":"fixed","validGPS":20,"lastValid":1}')
+HEARTBEAT_CSV = 'H,123456,3,1,812,1,20,1'
+
+
+def legado(line):
+    data = json.loads(line)
+    if data.get('type', 'unknown') == 'gps':
+        return (data.get('lat', 0), data.get('lon', 0), data.get('sats', 0), data.get('age', 999999),
+                data.get('valid', False), data.get('gpsInit', False), data.get('ignitionState'))
+    return (data.get('uptime', 0), data.get('commands', 0), data.get('rele', 'unknown'),
+            data.get('gpsStatus', 'unknown'), data.get('validGPS', 0))
+
+
+def medir(func, line, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        func(line)
+    return n / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    args = parser.parse_args()
+
+    rapido = LineParser(fast=True).parse
+    completo = LineParser(fast=False).parse
+    casos = [
+        ('gps', [('legado', legado, GPS_JSON), ('json', completo, GPS_JSON),
+                 ('rápido', rapido, GPS_JSON), ('csv', rapido, GPS_CSV)]),
+        ('heartbeat', [('legado', legado, HEARTBEAT_JSON), ('json', completo, HEARTBEAT_JSON),
+                       ('rápido', rapido, HEARTBEAT_JSON), ('csv', rapido, HEARTBEAT_CSV)]),
+    ]
+
+    print(f"{'registro':<10} {'parser':<8} {'linhas/s':>12} {'µs/linha':>9} {'vs legado':>10}")
+    for registro, parsers in casos:
+        base = None
+        for nome, func, line in parsers:
+            rate = medir(func, line, args.lines)
+            base = base or rate
+            print(f"{registro:<10} {nome:<8} {rate:>12,.0f} {1e6 / rate:>9.2f} {rate / base:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
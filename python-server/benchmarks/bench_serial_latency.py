@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latência linha → despacho da leitura serial.
+
+Um Arduino falso escreve registros GPS num pty; o gateway lê pelo lado
+escravo com o loop antigo (in_waiting + sleep de 100 ms) e com a thread
+SerialReader. Cada linha leva o instante de envio, medido no despacho.
+
+Uso (Linux/macOS):
+    python benchmarks/bench_serial_latency.py --lines 200 --rate 20
+"""
+
+import argparse
+import json
+import os
+import pty
+import statistics
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from serial_reader import SerialReader  # noqa: E402
+
+
+def abrir_pty():
+    """Cria um par pty; devolve (fd mestre, caminho do escravo)"""
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave), slave
+
+
+def arduino_falso(master, lines, rate):
+    """Escreve `lines` registros GPS a `rate` linhas/s no lado mestre"""
+    interval = 1.0 / rate if rate else 0
+    for i in range(lines):
+        record = {
+            'type': 'gps', 'lat': -23.550520, 'lon': -46.633308, 'sats': 8,
+            'age': 120, 'ignitionState': 'off', 'valid': True, 'uptime': i,
+            'sent': time.perf_counter()
+        }
+        os.write(master, (json.dumps(record) + '\n').encode())
+        if interval:
+            time.sleep(interval)
+
+
+def medir(modo, lines, rate):
+    master, slave_path, slave_fd = abrir_pty()
+    ser = serial.Serial(slave_path, 9600, timeout=1)
+    latencias = []
+    pronto = threading.Event()
+
+    def despachar(line):
+        recebido = time.perf_counter()
+        latencias.append(recebido - json.loads(line)['sent'])
+        if len(latencias) >= lines:
+            pronto.set()
+
+    wakeups = 0
+    started = time.perf_counter()
+    produtor = threading.Thread(target=arduino_falso, args=(master, lines, rate), daemon=True)
+
+    if modo == 'polling':
+        produtor.start()
+        # Loop original do main(): in_waiting + sleep(0.1)
+        while not pronto.is_set():
+            wakeups += 1
+            if ser.in_waiting > 0:
+                line = ser.readline().decode('utf-8', errors='ignore').strip()
+                despachar(line)
+            time.sleep(0.1)
+    else:
+        reader = SerialReader(ser, despachar).start()
+        produtor.start()
+        pronto.wait()
+        reader.stop()
+
+    elapsed = time.perf_counter() - started
+    ser.close()
+    os.close(master)
+    os.close(slave_fd)
+
+    ms = sorted(l * 1000 for l in latencias)
+    return {
+        'modo': modo,
+        'linhas': len(ms),
+        'linhas_s': len(ms) / elapsed,
+        'media_ms': statistics.mean(ms),
+        'p50_ms': ms[len(ms) // 2],
+        'p99_ms': ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+        'max_ms': ms[-1],
+        'wakeups': wakeups,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20.0, help='linhas por segundo (0 = máximo)')
+    args = parser.parse_args()
+
+    print(f"{'modo':<8} {'linhas':>6} {'linhas/s':>9} {'média':>9} {'p50':>9} {'p99':>9} {'máx':>9} {'wakeups':>8}")
+    for modo in ('polling', 'reader'):
+        r = medir(modo, args.lines, args.rate)
+        print(f"{r['modo']:<8} {r['linhas']:>6} {r['linhas_s']:>9.1f} {r['media_ms']:>7.2f}ms "
+              f"{r['p50_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms {r['max_ms']:>7.2f}ms {r['wakeups']:>8}")
+
+
+if __name__ == '__main__':
+    main()
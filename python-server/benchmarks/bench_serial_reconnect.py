@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Benchmark: queda do USB e reconexão da serial sem reiniciar o gateway.
+
+O Arduino falso fica num pty acessado por um link simbólico (como os
+/dev/serial/by-id/... do udev). Em cada ciclo o pty é fechado (a leitura
+recebe EIO, como num USB arrancado), o app pede para ligar a ignição com o
+Arduino fora do ar e, após `--down` segundos, um pty novo aparece mandando
+o TRACKCAR_READY. Três cenários:
+
+- mesmo-caminho: o pty novo volta no mesmo link;
+- vid-pid: o link some e o pty novo só aparece na lista de portas USB
+  (list_ports, simulada) com o VID:PID configurado no veículo;
+- banner: idem, sem VID:PID no veículo; só o TRACKCAR_READY o identifica.
+
+Nos dois últimos a lista tem antes uma porta USB de outro dispositivo, que
+fica calada: a busca precisa pulá-la. Mede o tempo da volta do dispositivo
+até a serial reaberta (inclui a espera do reset do Arduino) e até o relé
+confirmado pelo comando reenviado, além dos fixes perdidos. Sai com código
+1 se alguma volta falhar.
+
+Uso (Linux/macOS):
+    python benchmarks/bench_serial_reconnect.py --outages 3 --down 3
+    python benchmarks/bench_serial_reconnect.py --scenarios vid-pid banner
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import pty
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import threading
+import time
+import tty
+
+from serial.tools import list_ports
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from firestore_writer import FirestoreWriter  # noqa: E402
+from memory_firestore import MemoryFirestore  # noqa: E402
+from serial_reader import open_port  # noqa: E402
+from vehicle_session import VehicleSession  # noqa: E402
+
+USB_ID = '1a86:7523'  # CH340 dos Nanos
+CENARIOS = ('mesmo-caminho', 'vid-pid', 'banner')
+
+
+class PortaUsb:
+    """Entrada do list_ports.comports() para um pty"""
+
+    def __init__(self, device, vid, pid):
+        self.device = device
+        self.vid = vid
+        self.pid = pid
+
+
+class ArduinoFalso:
+    """
+    Um pty por 'conexão USB': GPS a `rate` linhas/s e ack com o seq. Abrir a
+    porta reinicia o Nano (DTR) e o banner vem depois; o pyserial descarta o
+    que chegou antes do open, então o falso só manda o banner ao ver o flush
+    da abertura (modo pacote do pty, TIOCPKT_FLUSHREAD).
+    """
+
+    def __init__(self, link, rate):
+        self.link = link
+        self.rate = rate
+        self.enviados = 0
+        self._parar = None
+
+    def conectar(self, link=True):
+        """Pty novo; com link=False só aparece na lista de portas USB"""
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        fcntl.ioctl(self.master, termios.TIOCPKT, struct.pack('i', 1))
+        self.device = os.ttyname(self.slave)
+        if link:
+            tmp = self.link + '.tmp'
+            os.symlink(self.device, tmp)
+            os.replace(tmp, self.link)
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self.master, self._parar), daemon=True)
+        self._thread.start()
+
+    def desconectar(self):
+        self._parar.set()
+        self._thread.join()
+        if os.path.lexists(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    @staticmethod
+    def _escrever(master, data):
+        try:
+            os.write(master, data)
+        except BlockingIOError:
+            pass  # ninguém lendo a porta e o buffer do pty cheio: a linha se perde, como no USB
+
+    def _run(self, master, parar):
+        os.set_blocking(master, False)
+        buffer = b''
+        proximo = time.monotonic()
+        while not parar.is_set():
+            try:
+                pacote = os.read(master, 1024)
+            except (BlockingIOError, OSError):
+                pacote = b''
+            if pacote[:1] == b'\0':
+                buffer += pacote[1:]
+            elif pacote and pacote[0] & termios.TIOCPKT_FLUSHREAD:
+                self._escrever(master, b'TRACKCAR_READY_V2.3_INVERTED\n')
+            while b'\n' in buffer:
+                linha, buffer = buffer.split(b'\n', 1)
+                cmd, _, seq = linha.decode().strip().partition('#')
+                if cmd in ('IGNITION_ON', 'IGNITION_OFF') and seq:
+                    ack = {'type': 'ack', 'ignitionState': 'on' if cmd == 'IGNITION_ON' else 'off',
+                           'command': 'executed', 'seq': int(seq)}
+                    self._escrever(master, (json.dumps(ack) + '\n').encode())
+            if time.monotonic() >= proximo:
+                n = self.enviados
+                line = json.dumps({'type': 'gps', 'lat': -23.55 + n * 1e-4, 'lon': -46.63, 'sats': 8,
+                                   'age': 120, 'ignitionState': 'off', 'valid': True, 'gpsInit': True},
+                                  separators=(',', ':'))
+                self._escrever(master, (line + '\n').encode())
+                self.enviados += 1
+                proximo += 1.0 / self.rate
+            time.sleep(0.002)
+
+
+def esperar(condicao, limite):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if condicao():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def rodar(cenario, args):
+    """Um cenário inteiro; devolve (session, arduino, voltas, confirmações, falhas, leitura viva)"""
+    db = MemoryFirestore(latency=0.01)
+    writer = FirestoreWriter(db, batch_size=50, max_age=0.2).start()
+    car_ref = db.collection('cars').document('car000')
+    car_ref.set({'ignitionState': 'off'})
+
+    pasta = tempfile.mkdtemp()
+    arduino = ArduinoFalso(os.path.join(pasta, 'trackcar-car000'), args.rate)
+    arduino.conectar()
+    # Outro adaptador USB ligado na máquina, que nunca manda o banner
+    outro_master, outro_slave = pty.openpty()
+    tty.setraw(outro_slave)
+    outro = PortaUsb(os.ttyname(outro_slave), 0x0403, 0x6001)
+    usb = [int(x, 16) for x in USB_ID.split(':')]
+    list_ports.comports = lambda: [outro, PortaUsb(arduino.device, *usb)]
+
+    session = VehicleSession(db, writer, 'car000', 'user', port=arduino.link, car_update_interval=0.2,
+                             adaptive_rate=False, geofences=False, trips=False,
+                             usb_id=USB_ID if cenario == 'vid-pid' else None)
+
+    volta, confirmacao, falhas = [], [], 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        session.ser = open_port(arduino.link, 9600, read_timeout=1)
+        session.load_initial_state()
+        session.start()
+        estado = 'off'
+        for _ in range(args.outages):
+            time.sleep(args.up)
+            arduino.desconectar()
+            esperar(lambda: not session.reader.connected, 5)
+
+            # Comando do app com o Arduino fora do ar: fica na fila até a serial voltar
+            estado = 'on' if estado == 'off' else 'off'
+            car_ref.update({'ignitionState': estado})
+            time.sleep(args.down)
+
+            t0 = time.monotonic()
+            arduino.conectar(link=cenario == 'mesmo-caminho')
+            if not esperar(lambda: session.reader.connected, 60):
+                falhas += 1
+                continue
+            if session.ser.port not in (arduino.link, arduino.device):
+                falhas += 1  # abriu a porta errada
+                continue
+            volta.append(time.monotonic() - t0)
+            if esperar(lambda: db.docs.get(car_ref.path, {}).get('relayState') == estado, 10):
+                confirmacao.append(time.monotonic() - t0)
+            else:
+                falhas += 1
+        time.sleep(args.up)
+        viva = session.reader.is_alive()
+        session.stop()
+        writer.stop()
+    arduino.desconectar()
+    os.close(outro_master)
+    os.close(outro_slave)
+    os.rmdir(pasta)
+    return session, arduino, volta, confirmacao, falhas, viva
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--outages', type=int, default=3)
+    parser.add_argument('--down', type=float, default=3.0, help='segundos com o USB desconectado')
+    parser.add_argument('--up', type=float, default=2.0, help='segundos conectado entre as quedas')
+    parser.add_argument('--rate', type=float, default=5.0, help='linhas GPS por segundo')
+    parser.add_argument('--scenarios', nargs='+', choices=CENARIOS, default=list(CENARIOS))
+    args = parser.parse_args()
+
+    total_falhas = 0
+    for cenario in args.scenarios:
+        session, arduino, volta, confirmacao, falhas, viva = rodar(cenario, args)
+        total_falhas += falhas
+        serial = session.reader.stats
+        cmds = session.commands.stats
+        print(f"[{cenario}]")
+        print(f"quedas {serial['outages']} | reconexões {serial['reconnects']} | tentativas {serial['attempts']} | "
+              f"falhas {falhas} | leitura viva: {'sim' if viva else 'não'}")
+        if volta:
+            print(f"USB de volta → serial reaberta (s): mediana {statistics.median(volta):.2f} | máx {max(volta):.2f}")
+        if confirmacao:
+            print(f"USB de volta → relé confirmado (s): mediana {statistics.median(confirmacao):.2f} | "
+                  f"máx {max(confirmacao):.2f}")
+        print(f"fora do ar: total {serial['total_outage_s']:.1f}s | máx {serial['max_outage_s']:.1f}s")
+        print(f"comandos: enviados {cmds['sent']} | reenviados na volta {cmds['replayed']} | "
+              f"confirmados {cmds['confirmed']} | sem ack {cmds['timeouts']}")
+        print(f"fixes GPS: enviados pelo Arduino {arduino.enviados} | recebidos {session.thinner.stats['received']}")
+        print()
+    if total_falhas:
+        print(f"❌ FALHOU: {total_falhas} volta(s) sem serial reaberta ou sem relé confirmado")
+        sys.exit(1)
+    print("✅ OK: todas as voltas reabriram a serial e confirmaram o relé")
+
+
+if __name__ == '__main__':
+    main()
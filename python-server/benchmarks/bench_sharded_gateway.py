@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vazão do gateway dividido em 1, 2, 4... processos (--workers).
+
+Cada worker roda o ShardWorker de verdade (sessões, parser, filtros, fila
+de gravação, arquivo local e tabela de estado), trocando o Firestore por um
+MemoryFirestore próprio e a serial por uma thread que entrega registros gps
+sintéticos aos veículos do shard o mais rápido que puder.
+A vazão da frota sai dos contadores da StateTable, lidos pelo supervisor
+sem falar com os workers; também mede o custo dessa leitura (dicts com
+seqlock e arrays do numpy sem cópia).
+
+Com --kill, o último cenário mata um worker com SIGKILL e mede quanto tempo
+a frota leva para voltar a ter todos os veículos com dono e contando linhas,
+e depois até o worker recriado receber veículos de volta (liberar → adotar).
+
+No fim de cada cenário o arquivo local (pasta temporária, compartilhada
+pelos workers como no gateway) é conferido: colunas do mesmo tamanho, `age`
+de cada linha igual ao passo da latitude (os registros sintéticos repetem o
+passo nos dois campos) e `t` sem voltar no tempo. Sai com código 1 se alguma
+partição estiver inconsistente.
+
+Sem núcleos livres a vazão não escala: com N workers num núcleo só o
+resultado mostra o custo extra dos processos, não o ganho.
+
+Uso:
+    python benchmarks/bench_sharded_gateway.py --vehicles 16 --workers 1 2 4 --seconds 5 --kill
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import shard_supervisor  # noqa: E402
+import trackcar_server as gateway  # noqa: E402
+from archive import SCHEMA, TelemetryArchive, list_partitions, load  # noqa: E402
+from firestore_writer import FirestoreWriter  # noqa: E402
+from memory_firestore import MemoryFirestore  # noqa: E402
+from shard_worker import ShardWorker  # noqa: E402
+from state_table import FLAG_ASSIGNED  # noqa: E402
+
+LAT0 = -23.55
+PASSO = 1e-5  # graus de latitude por registro; o `age` repete o número do passo
+
+
+def linhas(n=1000):
+    """Registros gps em que lat e age guardam o mesmo contador"""
+    return [json.dumps({'type': 'gps', 'lat': round(LAT0 + k * PASSO, 6), 'lon': -46.63, 'sats': 8,
+                        'age': k, 'ignitionState': 'on', 'valid': True, 'uptime': k * 100,
+                        'validCount': k + 1, 'totalReads': k + 1, 'gpsInit': True}, separators=(',', ':'))
+            for k in range(n)]
+
+
+class BenchWorker(ShardWorker):
+    """ShardWorker com Firestore em memória e linhas sintéticas no lugar da serial"""
+
+    def conectar(self):
+        sys.stdout = open(os.devnull, 'w')  # logs das sessões não medem nada aqui
+        gateway.db = MemoryFirestore(latency=self.options['latency'])
+        gateway.writer = FirestoreWriter(gateway.db, max_queue=100000, batch_size=200, max_age=0.5).start()
+        self.archive = TelemetryArchive(self.options['archive'])
+        threading.Thread(target=self.alimentar, args=(linhas(),), name='feeder', daemon=True).start()
+
+    def abrir_serial(self, pool, vehicle):
+        return None
+
+    def adotar(self, assignments):
+        # load_initial_state lê cars/{carId}: cada worker tem o próprio Firestore
+        for vehicle, _ in assignments:
+            gateway.db.collection('cars').document(vehicle['carId']).set({'ignitionState': 'on'})
+        return super().adotar(assignments)
+
+    def alimentar(self, lines):
+        """Uma linha por veículo do shard por volta, sem parar"""
+        n = 0
+        while not self._stop.is_set():
+            sessions = gateway.sessions
+            if not sessions:
+                time.sleep(0.01)
+                continue
+            line = lines[n % len(lines)]
+            for session in sessions:
+                session.processar_linha_arduino(line)
+            n += 1
+
+
+def linhas_da_frota(table):
+    cars, _ = table.arrays()
+    return int(cars['lines'][(cars['flags'] & FLAG_ASSIGNED) != 0].sum())
+
+
+def esperar(supervisor, condicao, timeout):
+    deadline = time.monotonic() + timeout
+    while not condicao():
+        if time.monotonic() > deadline:
+            raise SystemExit("tempo esgotado esperando os workers")
+        supervisor.poll(0.05)
+
+
+def medir_leitura(table, vezes=200):
+    t0 = time.perf_counter()
+    for _ in range(vezes):
+        table.cars()
+    dicts = (time.perf_counter() - t0) / vezes
+    t0 = time.perf_counter()
+    for _ in range(vezes):
+        linhas_da_frota(table)
+    arrays = (time.perf_counter() - t0) / vezes
+    return dicts, arrays
+
+
+def recuperar(supervisor):
+    """
+    SIGKILL num worker; devolve (veículos, segundos até terem outro dono e
+    contarem linhas de novo, veículos devolvidos ao worker recriado, segundos
+    até ele contar linhas de todos eles)
+    """
+    table = supervisor.table
+    vitima = next(s for s in supervisor.slots if s.vehicles)
+    pid = vitima.process.pid
+    rows = [supervisor.rows[c] for c in vitima.vehicles]
+    t0 = time.monotonic()
+    os.kill(pid, signal.SIGKILL)
+
+    def adotados():
+        cars = [table.read_car(row) for row in rows]
+        return all(c is not None and c['worker'] >= 0 and c['pid'] not in (0, pid) for c in cars)
+
+    def linhas_lidas():
+        cars = [table.read_car(row) for row in rows]
+        return None if None in cars else [c['lines'] for c in cars]
+
+    esperar(supervisor, lambda: adotados() and linhas_lidas() is not None, 60)
+    antes = linhas_lidas()
+
+    def contando_de_novo():
+        agora = linhas_lidas()
+        return agora is not None and all(n > n0 for n, n0 in zip(agora, antes))
+
+    esperar(supervisor, contando_de_novo, 60)
+    recuperado = time.monotonic() - t0
+
+    # Worker recriado: recebe veículos dos outros por liberar → adotar
+    esperar(supervisor, lambda: supervisor.ready() and vitima.vehicles and not supervisor.moving, 60)
+    devolvidos = [supervisor.rows[c] for c in vitima.vehicles]
+    novo = vitima.process.pid
+
+    def contando():
+        cars = [table.read_car(row) for row in devolvidos]
+        return all(c is not None and c['pid'] == novo and c['lines'] > 0 for c in cars)
+
+    esperar(supervisor, contando, 60)
+    return len(rows), recuperado, len(devolvidos), time.monotonic() - t0
+
+
+def verificar_arquivo(root):
+    """(linhas, partições, [problemas]) do arquivo local gravado pelos workers"""
+    import numpy as np
+
+    total, particoes, problemas = 0, 0, []
+    for car_id, days in list_partitions(root).items():
+        for day in days:
+            folder = os.path.join(root, car_id, day, 'gps')
+            # load() corta no menor comprimento: o tamanho dos arquivos diz se estão alinhados
+            tamanhos = {os.path.getsize(os.path.join(folder, f"{column}.bin")) / np.dtype(dtype).itemsize
+                        for column, (_, dtype) in SCHEMA['gps'].items()}
+            data = load(root, car_id, 'gps', day)
+            particoes += 1
+            total += len(data['t'])
+            if len(tamanhos) != 1:
+                problemas.append(f"{car_id}/{day}: colunas com tamanhos diferentes")
+            elif not np.array_equal(np.rint((data['lat'] - LAT0) / PASSO), data['age']):
+                problemas.append(f"{car_id}/{day}: lat e age desalinhados")
+            elif np.any(np.diff(data['t']) < 0):
+                problemas.append(f"{car_id}/{day}: t volta no tempo")
+    return total, particoes, problemas
+
+
+def rodar(vehicles, workers, seconds, latency, kill, pasta):
+    options = {'latency': latency, 'archive': pasta}
+    supervisor = shard_supervisor.ShardSupervisor(vehicles, workers, options=options, worker_cls=BenchWorker)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        supervisor.start()
+        try:
+            esperar(supervisor, supervisor.ready, 120)
+            esperar(supervisor, lambda: linhas_da_frota(supervisor.table) > 0, 30)
+            time.sleep(2.0)  # aquecimento
+            l0, t0 = linhas_da_frota(supervisor.table), time.monotonic()
+            _, w0 = supervisor.table.arrays()
+            cpu0 = float(w0['cpu_s'].sum())
+            while time.monotonic() - t0 < seconds:
+                supervisor.poll()
+            l1, t1 = linhas_da_frota(supervisor.table), time.monotonic()
+            _, w1 = supervisor.table.arrays()
+            cpu = float(w1['cpu_s'].sum()) - cpu0
+            leitura = medir_leitura(supervisor.table)
+            recuperacao = recuperar(supervisor) if kill else None
+        finally:
+            supervisor.stop()
+    return {
+        'workers': workers,
+        'lines_s': (l1 - l0) / (t1 - t0),
+        'cpu_us_line': cpu / (l1 - l0) * 1e6 if l1 > l0 else 0,
+        'read_dicts': leitura[0],
+        'read_arrays': leitura[1],
+        'recovery': recuperacao,
+        'stats': dict(supervisor.stats),
+        'archive': verificar_arquivo(pasta),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=5.0, help='janela de medição por cenário')
+    parser.add_argument('--latency', type=float, default=0.05, help='round trip simulado do Firestore (s)')
+    parser.add_argument('--kill', action='store_true', help='mata um worker no último cenário')
+    args = parser.parse_args()
+
+    vehicles = [{'carId': f"sim{i:03d}", 'userId': 'bench', 'port': f"sim{i:03d}"} for i in range(args.vehicles)]
+    print(f"{args.vehicles} veículos | {os.cpu_count()} núcleos | janela de {args.seconds:g}s")
+    print(f"{'workers':>7} {'linhas/s':>10} {'escala':>7} {'CPU µs/linha':>13} {'cars() µs':>10} {'arrays µs':>10}")
+    base = None
+    problemas = []
+    for i, workers in enumerate(args.workers):
+        kill = args.kill and i == len(args.workers) - 1 and workers > 1
+        with tempfile.TemporaryDirectory() as pasta:
+            r = rodar(vehicles, workers, args.seconds, args.latency, kill, pasta)
+        base = base or r['lines_s']
+        print(f"{r['workers']:>7} {r['lines_s']:>10.0f} {r['lines_s'] / base:>6.2f}x {r['cpu_us_line']:>13.1f} "
+              f"{r['read_dicts'] * 1e6:>10.0f} {r['read_arrays'] * 1e6:>10.1f}")
+        if r['recovery'] is not None:
+            perdidos, recuperado, devolvidos, rebalanceado = r['recovery']
+            print(f"        SIGKILL num worker: {perdidos} veículos de volta em {recuperado:.1f}s | "
+                  f"{devolvidos} devolvidos ao worker recriado em {rebalanceado:.1f}s | "
+                  f"mortes {r['stats']['deaths']} | iniciados {r['stats']['spawned']} | "
+                  f"movidos {r['stats']['moves']}")
+        linhas_arquivo, particoes, erros = r['archive']
+        print(f"        arquivo local: {linhas_arquivo} linhas em {particoes} partições | "
+              f"{'consistente' if not erros else f'{len(erros)} partições inconsistentes'}")
+        problemas += erros
+    if problemas:
+        for problema in problemas:
+            print(f"❌ {problema}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
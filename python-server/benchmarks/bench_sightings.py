@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: correlação de avistamentos com o histórico de fixes.
+
+Gera `--hours` horas de fixes a cada `--interval` s para `--cars` veículos
+rodando pela cidade (~30 km/h com paradas) e `--sightings` avistamentos:
+metade verdadeiros (o carro estava ali, com erro de posição de até ~60 m e
+hora informada com até 2 min de diferença) e metade falsos (outro carro
+parecido, em outro ponto da cidade). Mede o custo do add_fix(), a
+latência de cada correlate() e quantos verdadeiros e falsos passam de
+`confirm_score`.
+
+Uso:
+    python benchmarks/bench_sightings.py --cars 50 --hours 6 --sightings 20000
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sightings import SightingCorrelator  # noqa: E402
+
+LAT0, LON0 = -23.55, -46.63
+
+
+def trajeto(rng, segundos, interval):
+    """(t, lat, lon) de um carro que alterna trechos rodando e parado"""
+    lat = LAT0 + rng.uniform(-0.1, 0.1)
+    lon = LON0 + rng.uniform(-0.1, 0.1)
+    heading = rng.uniform(0, 2 * math.pi)
+    t, parado_ate = 0.0, 0.0
+    while t < segundos:
+        if t >= parado_ate and rng.random() < 0.002 * interval:
+            parado_ate = t + rng.uniform(60, 1200)
+        if t >= parado_ate:
+            speed = max(0.0, rng.gauss(8.5, 3))
+            heading += rng.gauss(0, 0.15)
+            lat += speed * interval * math.cos(heading) / 111320
+            lon += speed * interval * math.sin(heading) / 101000
+        yield t, lat, lon
+        t += interval
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cars', type=int, default=50)
+    parser.add_argument('--hours', type=float, default=6.0)
+    parser.add_argument('--interval', type=float, default=1.0, help='segundos entre fixes')
+    parser.add_argument('--sightings', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(21)
+    correlator = SightingCorrelator(window_s=args.hours * 3600)
+    segundos = args.hours * 3600
+    trilhas = {}
+    custo_fix = 0.0
+    total = 0
+    for c in range(args.cars):
+        car_id = f"carro-{c}"
+        pontos = list(trajeto(rng, segundos, args.interval))
+        trilhas[car_id] = pontos
+        t0 = time.perf_counter()
+        for t, lat, lon in pontos:
+            correlator.add_fix(car_id, t, lat, lon)
+        custo_fix += time.perf_counter() - t0
+        total += len(pontos)
+    print(f"{args.cars} carros, {total} fixes em {args.hours:g} h | add_fix {custo_fix / total * 1e6:.1f} µs/fix")
+
+    # Avistamentos até 15 min antes do último fix: nenhum fica pendente
+    latencias = []
+    confirmados = {True: 0, False: 0}
+    quantos = {True: 0, False: 0}
+    ids = list(trilhas)
+    for i in range(args.sightings):
+        car_id = rng.choice(ids)
+        verdadeiro = i % 2 == 0
+        pontos = trilhas[car_id]
+        _, lat, lon = pontos[rng.randrange(len(pontos))]
+        t = rng.uniform(0, segundos - 900)
+        if verdadeiro:
+            real = pontos[min(len(pontos) - 1, int(t / args.interval))]
+            erro = rng.uniform(0, 60)
+            ang = rng.uniform(0, 2 * math.pi)
+            lat = real[1] + erro * math.cos(ang) / 111320
+            lon = real[2] + erro * math.sin(ang) / 101000
+            t += rng.uniform(-120, 120)
+        else:
+            outro = trilhas[rng.choice(ids)]
+            _, lat, lon = outro[rng.randrange(len(outro))]
+        t0 = time.perf_counter()
+        match = correlator.correlate(car_id, f"av-{i}", t, lat, lon, accuracy=20)
+        latencias.append(time.perf_counter() - t0)
+        quantos[verdadeiro] += 1
+        confirmados[verdadeiro] += match is not None and match['confidence'] >= correlator.config['confirm_score']
+
+    print(f"correlate(): p50 {percentil(latencias, 0.5) * 1e6:.0f} µs p99 {percentil(latencias, 0.99) * 1e6:.0f} µs "
+          f"máx {max(latencias) * 1e6:.0f} µs")
+    print(f"verdadeiros confirmados: {confirmados[True] / quantos[True]:.1%} | "
+          f"falsos confirmados: {confirmados[False] / quantos[False]:.2%} | "
+          f"pendentes: {correlator.pending_count()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Queda do Firestore no meio do fluxo: o spool não perde nem duplica fixes.
+
+Cenário (Firestore em memória):
+  1. produz fixes enquanto o backend cai e volta;
+  2. reinicia o escritor com o backend fora do ar (linhas ficam no disco);
+  3. simula commit aplicado cujo ack se perdeu (reenvio do mesmo lote);
+  4. religa o backend e mede o tempo para drenar o backlog.
+
+Uso:
+    python benchmarks/bench_spool_outage.py --fixes 5000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from firestore_writer import FirestoreWriter  # noqa: E402
+from memory_firestore import MemoryFirestore, MemoryBatch  # noqa: E402
+from spool import SqliteSpool  # noqa: E402
+
+
+def novo_writer(db, path):
+    return FirestoreWriter(db, batch_size=50, max_age=0.05, spool=SqliteSpool(path)).start()
+
+
+def verificar(db, total):
+    vistos = [doc.to_dict()['seq'] for doc in db.collection('gps_locations').stream()]
+    faltando = set(range(total)) - set(vistos)
+    duplicados = len(vistos) - len(set(vistos))
+    return faltando, duplicados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fixes', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    db = MemoryFirestore(latency=args.latency)
+    path = os.path.join(tempfile.mkdtemp(), 'spool.db')
+    writer = novo_writer(db, path)
+    total = args.fixes
+    terco = total // 3
+
+    # 1. queda e retorno no meio do fluxo
+    for i in range(terco):
+        writer.add('gps_locations', {'seq': i})
+    db.offline = True
+    for i in range(terco, 2 * terco):
+        writer.add('gps_locations', {'seq': i})
+    time.sleep(0.5)
+    db.offline = False
+    writer.flush(60)
+
+    # 2. reinício com o backend fora do ar
+    db.offline = True
+    for i in range(2 * terco, total):
+        writer.add('gps_locations', {'seq': i})
+    writer.stop(timeout=2)
+    pendentes = len(SqliteSpool(path))
+    print(f"Reinício com backend fora: {pendentes} operações preservadas no spool")
+
+    # 3. commit aplicado mas ack perdido: o primeiro lote após o reinício é reenviado
+    commit_original = MemoryBatch.commit
+    perdeu = threading.Event()
+
+    def commit_sem_ack(batch):
+        commit_original(batch)
+        if not perdeu.is_set():
+            perdeu.set()
+            raise ConnectionError("conexão caiu depois do commit (simulado)")
+    MemoryBatch.commit = commit_sem_ack
+
+    # 4. volta o backend e drena
+    db.offline = False
+    started = time.monotonic()
+    writer = novo_writer(db, path)
+    writer.flush(120)
+    drain = time.monotonic() - started
+    writer.stop()
+    MemoryBatch.commit = commit_original
+
+    stats = writer.stats()
+    faltando, duplicados = verificar(db, total)
+    print(f"Backlog de {pendentes} drenado em {drain:.2f}s "
+          f"({pendentes / drain:.0f} ops/s, {stats['batches']} lotes, maior {stats['max_batch_size']})")
+    print(f"Fixes: {total} | no Firestore: {db.count('gps_locations')} | "
+          f"faltando: {len(faltando)} | duplicados: {duplicados}")
+    if faltando or duplicados or db.count('gps_locations') != total:
+        print("❌ FALHOU")
+        sys.exit(1)
+    print("✅ OK: nenhum fix perdido ou duplicado")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tempo do início do processo até o primeiro fix enviado à fila.
+
+Cada medição roda num processo novo (o import do SDK do Firestore entra na
+conta) com Arduinos falsos em ptys mandando um fix por segundo e o
+Firestore em memória (`--latency` por round trip) no lugar do Firebase:
+
+  sequencial: ordem antiga do main() - SDK importado no topo, Firebase,
+              e para cada carro o get() do documento e a abertura da serial
+              (com a espera de 2 s do reset do Arduino);
+  paralelo:   trackcar_server.inicializar() - seriais abrindo enquanto o SDK
+              é importado e os documentos são lidos em paralelo.
+
+Uso (Linux/macOS):
+    python benchmarks/bench_startup.py --vehicles 3 --runs 3
+"""
+
+import argparse
+import json
+import os
+import pty
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def arduino_falso(master, parar):
+    n = 0
+    while not parar.wait(1.0):
+        line = json.dumps({'type': 'gps', 'lat': -23.55 + n * 1e-3, 'lon': -46.63, 'sats': 8, 'age': 120,
+                           'ignitionState': 'off', 'valid': True, 'gpsInit': True}, separators=(',', ':'))
+        try:
+            os.write(master, (line + '\n').encode())
+        except OSError:
+            return
+        n += 1
+
+
+def filho(variant, vehicles, latency):
+    """Uma medição: segundos até o gateway pronto e até o primeiro fix"""
+    import trackcar_server as ts  # marca STARTED_AT
+    from memory_firestore import MemoryFirestore
+
+    parar = threading.Event()
+    config = []
+    for i in range(vehicles):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        threading.Thread(target=arduino_falso, args=(master, parar), daemon=True).start()
+        config.append({'carId': f'car{i:03d}', 'userId': 'user', 'port': os.ttyname(slave)})
+
+    def firebase_em_memoria():
+        import firebase_admin.firestore  # noqa: F401  (custo real do import do SDK)
+        ts.db = MemoryFirestore(latency=latency)
+        for v in config:
+            ts.db.docs[f"cars/{v['carId']}"] = {'ignitionState': 'off'}
+        return ts.db
+
+    ts.init_firebase = firebase_em_memoria
+    ts.WRITER_SPOOL = None
+
+    if variant == 'sequencial':
+        import firebase_admin.firestore  # noqa: F401  (import no topo, como antes)
+        ts.db = firebase_em_memoria()
+        ts.init_writer()
+        sessions = ts.criar_sessoes(config)
+        for session in sessions:
+            session.load_initial_state()
+            session.open_serial(ts.SERIAL_READ_TIMEOUT)
+    else:
+        sessions = ts.inicializar(config, service=True)
+    pronto = time.monotonic() - ts.STARTED_AT
+
+    for session in sessions:
+        session.start()
+    limite = time.monotonic() + 15
+    while time.monotonic() < limite and not all(s.first_fix_at for s in sessions):
+        time.sleep(0.005)
+    primeiro = max(s.first_fix_at for s in sessions) - ts.STARTED_AT
+
+    parar.set()
+    for session in sessions:
+        session.stop()
+    ts.writer.stop()
+    return {'pronto': pronto, 'primeiro_fix': primeiro}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=3)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.1, help='round trip simulado do Firestore (s)')
+    parser.add_argument('--child', choices=('sequencial', 'paralelo'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                resultado = filho(args.child, args.vehicles, args.latency)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(resultado))
+        return
+
+    print(f"{args.vehicles} veículos, Firestore com {args.latency * 1000:.0f}ms de round trip, {args.runs} execuções")
+    for variant in ('sequencial', 'paralelo'):
+        medidas = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, __file__, '--child', variant, '--vehicles', str(args.vehicles),
+                                  '--latency', str(args.latency)], capture_output=True, text=True, check=True)
+            medidas.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        pronto = statistics.median(m['pronto'] for m in medidas)
+        primeiro = statistics.median(m['primeiro_fix'] for m in medidas)
+        print(f"{variant:10s} pronto {pronto:5.2f}s | primeiro fix enviado {primeiro:5.2f}s (mediana)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: leituras para desenhar as rotas de um dia (gps_locations vs trips).
+
+Simula um dia com `--trips` viagens urbanas (ignição liga, anda, para no
+semáforo, desliga) e uma parada longa com o motor ligado, com fixes a cada
+5 s e ruído de ~3 m. Conta os documentos de gps_locations que o thinning
+padrão gravaria (uma leitura cada no app) e os documentos de trips, com o
+tamanho do maior documento, o erro do polyline e o custo de codificar.
+
+Uso:
+    python benchmarks/bench_trips.py --trips 6 --minutes 25
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from gps_thinning import GpsThinner, haversine_m  # noqa: E402
+from line_parser import GpsRecord  # noqa: E402
+from trips import TripSegmenter, EVENT_CLOSED, TRIP_ACTIVE, TRIP_CLOSED, decode_polyline  # noqa: E402
+
+INTERVAL = 5
+
+
+def dia(rng, viagens, minutos):
+    """Gera (t, lat, lon, ignição) de um dia"""
+    lat, lon, heading = -23.55, -46.63, 0.0
+    t = 6 * 3600
+    for i in range(viagens):
+        # Estacionado até a próxima viagem
+        for _ in range(rng.randint(30, 120) * 60 // INTERVAL):
+            yield t, lat, lon, 'off'
+            t += INTERVAL
+        for k in range(minutos * 60 // INTERVAL):
+            parado = (k * INTERVAL) % 180 >= 150  # 30 s de semáforo a cada 3 min
+            if not parado:
+                heading += rng.gauss(0, 0.2)
+                passo = rng.uniform(30, 60) / 3.6 * INTERVAL
+                lat += passo * math.cos(heading) / 111320
+                lon += passo * math.sin(heading) / 101000
+            yield t, lat, lon, 'on'
+            t += INTERVAL
+        if i == viagens // 2:
+            # Motor ligado parado por 20 min (fecha a viagem por ociosidade)
+            for _ in range(20 * 60 // INTERVAL):
+                yield t, lat, lon, 'on'
+                t += INTERVAL
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trips', type=int, default=6)
+    parser.add_argument('--minutes', type=int, default=25, help='duração de cada viagem')
+    parser.add_argument('--jitter', type=float, default=3.0)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    thinner = GpsThinner()
+    segmenter = TripSegmenter('car000')
+    fixes = gravados = escritas_trips = 0
+    fechadas = []
+    tempo_codificar = 0.0
+    maior_doc = 0
+    erro_max = 0.0
+
+    for t, lat, lon, ignition in dia(rng, args.trips, args.minutes):
+        lat += rng.gauss(0, args.jitter) / 111320
+        lon += rng.gauss(0, args.jitter) / 101000
+        fixes += 1
+        fix = GpsRecord(lat=lat, lon=lon, sats=8, age=500, ignition_state=ignition, valid=True)
+        gravados += len(thinner.offer(fix, t))
+        for event, trip in segmenter.offer(lat, lon, t, ignition):
+            escritas_trips += 1
+            t0 = time.perf_counter()
+            doc = trip.to_document('car000', 'user', TRIP_CLOSED if event == EVENT_CLOSED else TRIP_ACTIVE)
+            tempo_codificar += time.perf_counter() - t0
+            maior_doc = max(maior_doc, len(json.dumps(doc, default=str)))
+            if event == EVENT_CLOSED:
+                fechadas.append((trip, doc))
+                pontos = decode_polyline(doc['polyline'])
+                erro_max = max(erro_max, max(haversine_m(a, b, c, d) for (a, b, _), (c, d)
+                                             in zip(trip.points, pontos)))
+    for event, trip in segmenter.close():
+        fechadas.append((trip, trip.to_document('car000', 'user', TRIP_CLOSED)))
+
+    print(f"fixes recebidos: {fixes} | gps_locations (thinning padrão): {gravados}")
+    print(f"viagens: {len(fechadas)} gravadas, {segmenter.stats['discarded']} descartadas | "
+          f"escritas em trips (checkpoints + encerramento): {escritas_trips}")
+    for trip, doc in fechadas:
+        print(f"  {doc['startReason']:>11s} → {doc['endReason']:<12s} {doc['distanceM'] / 1000:5.1f} km "
+              f"{doc['durationS'] / 60:5.1f} min  máx {doc['maxSpeedKmh']:5.1f} km/h  "
+              f"{doc['pointCount']:4d} pontos  polyline {len(doc['polyline'])} B")
+    print(f"leituras para as rotas do dia: gps_locations {gravados} → trips {len(fechadas)}")
+    print(f"maior documento: {maior_doc / 1024:.1f} KiB | erro máx. do polyline: {erro_max:.2f} m | "
+          f"to_document médio: {tempo_codificar / max(1, escritas_trips) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
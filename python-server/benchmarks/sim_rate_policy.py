@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Simulação: escritas por hora em cada modo da taxa de envio adaptativa.
+
+Roda, em tempo simulado, o mesmo caminho de um fix no gateway (GpsThinner
+→ gps_locations, CarDocumentMirror → cars/{id}) com o RateController
+mudando o intervalo do Arduino e os parâmetros do thinning/espelho, e
+compara com o comportamento fixo (Arduino a cada 5 s, thinning padrão,
+espelho a cada 2 s). Cada cenário é uma lista de trechos (duração,
+ignição, velocidade, roubado) com ruído de posição de ~3 m. Só conta as
+escritas geradas pelos fixes (o status do heartbeat é igual nos dois casos).
+
+Uso:
+    python benchmarks/sim_rate_policy.py
+    python benchmarks/sim_rate_policy.py --jitter 5 --policies '{"parked": {"send_interval_s": 120}}'
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from car_document import CarDocumentMirror  # noqa: E402
+from gps_thinning import GpsThinner  # noqa: E402
+from line_parser import GpsRecord  # noqa: E402
+from rate_control import RateController, merge_policies  # noqa: E402
+
+FIXED_SEND_INTERVAL = 5
+FIXED_CAR_UPDATE_INTERVAL = 2.0
+
+# (segundos, ignição, km/h, roubado); trechos urbanos alternam andar e parar
+URBANO = [(90, 'on', 40, False), (30, 'on', 0, False)]
+CENARIOS = {
+    'parked': [(3600, 'off', 0, False)],
+    'idle': [(3600, 'on', 0, False)],
+    'moving': URBANO * 30,
+    'stolen': [(3600, 'on', 50, True)],
+    # 1 h de trajetos e 30 min de motor ligado parado no dia; o resto estacionado
+    'dia': ([(3600 * 11, 'off', 0, False)] + URBANO * 15 + [(1800, 'on', 0, False)] +
+            [(3600 * 11, 'off', 0, False)] + URBANO * 15),
+}
+
+
+class WriterContador:
+    """Conta os updates do espelho em vez de enviá-los"""
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, ref, payload, urgent=False):
+        self.updates += 1
+
+
+class Relogio:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def simular(trechos, adaptive, policies=None, jitter_m=3.0, seed=1):
+    """Devolve (horas, linhas do Arduino, gps_locations, cars, segundos por modo)"""
+    rng = random.Random(seed)
+    relogio = Relogio()
+    writer = WriterContador()
+    mirror = CarDocumentMirror('cars/sim', writer, min_interval=FIXED_CAR_UPDATE_INTERVAL, clock=relogio)
+    thinner = GpsThinner()
+    rate = RateController(policies) if adaptive else None
+    send_interval = FIXED_SEND_INTERVAL
+
+    lat, lon, heading = -23.55, -46.63, 0.0
+    linhas = gravados = 0
+    tempo_modo = {}
+    proximo_envio = 0
+    last_ignition = None
+    t = 0
+
+    for duracao, ignition, kmh, roubado in trechos:
+        for _ in range(duracao):
+            relogio.t = t
+            # Movimento do carro (curva de 90° a cada minuto)
+            if kmh:
+                if t % 60 == 0:
+                    heading = (heading + 90) % 360
+                passo = kmh / 3.6
+                lat += passo * math.cos(math.radians(heading)) / 111320
+                lon += passo * math.sin(math.radians(heading)) / (111320 * math.cos(math.radians(lat)))
+
+            if t >= proximo_envio:
+                proximo_envio = t + send_interval
+                linhas += 1
+                fix = GpsRecord(lat=lat + rng.gauss(0, jitter_m) / 111320,
+                                lon=lon + rng.gauss(0, jitter_m) / 101000,
+                                sats=8, age=500, ignition_state=ignition, valid=True, gps_init=True)
+                # Mesmas regras de save_gps_location
+                force = roubado or ignition != last_ignition
+                last_ignition = ignition
+                fixes = thinner.offer(fix, t, force=force)
+                gravados += len(fixes)
+                if fixes:
+                    mirror.update({'lastLatitude': fixes[-1].lat, 'lastLongitude': fixes[-1].lon},
+                                  touch=('lastLocationUpdate',))
+
+                if rate is not None:
+                    mode = rate.update(ignition, fix.speed, roubado, t)
+                    if mode is not None:
+                        policy = rate.policy(mode)
+                        thinner.config.update(policy['thinning'])
+                        mirror.min_interval = policy['car_update_interval_s']
+                        send_interval = policy['send_interval_s']
+                        proximo_envio = t + send_interval
+                        mirror.update({'reportingMode': mode})
+
+            mirror.flush_if_due()
+            if rate is not None:
+                tempo_modo[rate.mode] = tempo_modo.get(rate.mode, 0) + 1
+            t += 1
+
+    mirror.flush()
+    return t / 3600, linhas, gravados, writer.updates, tempo_modo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jitter', type=float, default=3.0, help='ruído de posição do GPS (m)')
+    parser.add_argument('--policies', type=json.loads, default=None,
+                        help='substituições da RATE_POLICIES em JSON, como ratePolicies do vehicles.json')
+    args = parser.parse_args()
+
+    print("Política:")
+    for mode, policy in merge_policies(args.policies).items():
+        print(f"  {mode:7s} Arduino {policy['send_interval_s']:>3}s | thinning {policy['thinning']} | "
+              f"cars/{{id}} a cada {policy['car_update_interval_s']}s")
+    print()
+    print(f"{'cenário':8s} {'':11s} {'linhas/h':>9s} {'gps/h':>8s} {'cars/h':>8s} {'escritas/h':>11s}  modos")
+    for nome, trechos in CENARIOS.items():
+        for adaptive in (False, True):
+            horas, linhas, gravados, cars, tempo_modo = simular(
+                trechos, adaptive, args.policies, args.jitter)
+            modos = ', '.join(f"{m} {s / 3600 / horas:.0%}" for m, s in
+                              sorted(tempo_modo.items(), key=lambda kv: -kv[1]))
+            print(f"{nome:8s} {'adaptativo' if adaptive else 'fixo':11s} {linhas / horas:9.0f} "
+                  f"{gravados / horas:8.0f} {cars / horas:8.0f} {(gravados + cars) / horas:11.0f}  {modos}")
+
+
+if __name__ == '__main__':
+    main()
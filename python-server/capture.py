@@ -0,0 +1,116 @@
+# python-server/capture.py
+"""
+Gravação e leitura de capturas da serial.
+
+Formato texto, uma linha por linha recebida do Arduino:
+
+    <segundos desde o início>\t<carId>\t<linha crua>
+
+Linhas começando com '#' são comentários (cabeçalho). O --record acrescenta
+ao arquivo: cada gravação começa com o cabeçalho e o tempo volta a 0, e a
+leitura emenda cada seção logo após a anterior. O replay.py reinjeta essas
+capturas no pipeline real; synthetic_stream() gera o mesmo formato
+para testes de carga sem hardware.
+"""
+
+import json
+import math
+import time
+from datetime import datetime
+from threading import Lock
+
+CAPTURE_VERSION = 1
+CAPTURE_HEADER = '# trackcar capture'
+
+
+class CaptureRecorder:
+    """Copia (tee) as linhas da serial para um arquivo de captura"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = 0
+        self._lock = Lock()
+        self._t0 = time.monotonic()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file.write(f"{CAPTURE_HEADER} v{CAPTURE_VERSION} {datetime.now().isoformat()}\n")
+        self._file.flush()
+
+    def write(self, car_id, line):
+        """Registra uma linha com o instante relativo ao início da gravação"""
+        t = time.monotonic() - self._t0
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(f"{t:.6f}\t{car_id}\t{line}\n")
+            self._file.flush()
+            self.lines += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(path):
+    """
+    Gera (t, car_id, line) de um arquivo de captura; com várias gravações no
+    mesmo arquivo, o tempo de cada uma continua de onde a anterior parou
+    """
+    offset = last = 0.0
+    with open(path, encoding='utf-8') as f:
+        for numero, raw in enumerate(f, 1):
+            raw = raw.rstrip('\r\n')
+            if raw.startswith(CAPTURE_HEADER):
+                offset = last  # nova gravação: t recomeça em 0
+                continue
+            if not raw or raw.startswith('#'):
+                continue
+            try:
+                t, car_id, line = raw.split('\t', 2)
+                t = float(t) + offset
+            except ValueError:
+                raise ValueError(f"{path}:{numero}: linha de captura inválida") from None
+            last = max(last, t)
+            yield t, car_id, line
+
+
+def synthetic_stream(vehicles=1, rate=10.0, seconds=10.0, speed_ms=15.0,
+                     heartbeat_every=10.0, framing='json'):
+    """
+    Gera (t, car_id, line) como se `vehicles` Arduinos mandassem `rate`
+    fixes por segundo, andando em linha reta a `speed_ms` m/s.
+    """
+    interval = 1.0 / rate
+    total = int(seconds * rate)
+    hb_step = max(1, int(heartbeat_every * rate)) if heartbeat_every else 0
+    # Graus de latitude por passo (1° ≈ 111,32 km)
+    step_deg = speed_ms * interval / 111320.0
+
+    for n in range(total):
+        t = n * interval
+        uptime = int(t * 1000)
+        for v in range(vehicles):
+            car_id = f"sim{v:03d}"
+            lat = -23.55 + v * 0.01 + n * step_deg
+            lon = -46.63 + 0.0005 * math.sin(n / 50.0)
+            if framing == 'csv':
+                line = f"G,{lat:.6f},{lon:.6f},8,120,1,1,{uptime},{n + 1},{n + 1},1"
+            else:
+                line = json.dumps({
+                    'type': 'gps', 'lat': round(lat, 6), 'lon': round(lon, 6), 'sats': 8,
+                    'age': 120, 'ignitionState': 'on', 'valid': True, 'uptime': uptime,
+                    'validCount': n + 1, 'totalReads': n + 1, 'gpsInit': True
+                }, separators=(',', ':'))
+            yield t, car_id, line
+
+            if hb_step and n % hb_step == hb_step - 1:
+                if framing == 'csv':
+                    line = f"H,{uptime},0,1,900,1,{n + 1},0"
+                else:
+                    line = json.dumps({
+                        'type': 'heartbeat', 'uptime': uptime, 'commands': 0, 'rele': 'ligado',
+                        'releLED': 'aceso', 'freeRam': 900, 'gpsStatus': 'fixed',
+                        'validGPS': n + 1, 'lastValid': 0
+                    }, separators=(',', ':'))
+                yield t, car_id, line
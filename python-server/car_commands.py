@@ -0,0 +1,85 @@
+# python-server/car_commands.py
+"""
+Fila de comandos do app (coleção car_commands).
+
+O app grava {carId, command: 'unlock'|'lock', timestamp (ms), status:
+'pending'} em car_commands (services/carService.ts). O gateway mantém uma
+única consulta com listener por grupo de até 30 veículos (carId in [...],
+status == 'pending') e entrega cada comando novo à VehicleSession dona do
+carro; a sessão marca o documento como executed/failed/expired. Como o
+documento sai do filtro ao deixar de ser 'pending', o listener só recebe
+comandos ainda não tratados, inclusive os que chegaram com o gateway
+desligado.
+"""
+
+from threading import Lock
+
+try:
+    from google.cloud.firestore_v1.base_query import FieldFilter
+except ImportError:  # SDK antigo: where() posicional
+    FieldFilter = None
+
+COMMANDS_COLLECTION = 'car_commands'
+STATUS_PENDING = 'pending'
+MAX_IN_VALUES = 30  # limite do operador 'in' do Firestore
+
+
+def where_filter(query, field, op, value):
+    if FieldFilter is not None:
+        return query.where(filter=FieldFilter(field, op, value))
+    return query.where(field, op, value)
+
+
+class CommandQueueListener:
+    """Listener de car_commands pendentes para todas as sessões do gateway"""
+
+    def __init__(self, db, sessions, on_error=None):
+        self.db = db
+        self.sessions = {s.car_id: s for s in sessions}
+        self.on_error = on_error
+        self.watches = []
+        self.stats = {'received': 0, 'duplicates': 0, 'unknown_car': 0}
+        self._seen = set()  # IDs entregues e ainda pendentes (o doc pode reaparecer antes do status mudar)
+        self._lock = Lock()
+
+    def start(self):
+        """Abre um listener por grupo de até MAX_IN_VALUES veículos"""
+        car_ids = list(self.sessions)
+        for i in range(0, len(car_ids), MAX_IN_VALUES):
+            query = where_filter(self.db.collection(COMMANDS_COLLECTION), 'carId', 'in', car_ids[i:i + MAX_IN_VALUES])
+            query = where_filter(query, 'status', '==', STATUS_PENDING)
+            self.watches.append(query.on_snapshot(self._on_snapshot))
+        return self
+
+    def stop(self):
+        for watch in self.watches:
+            watch.unsubscribe()
+        self.watches = []
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            doc = change.document
+            if change.type.name == 'REMOVED':
+                # Saiu da consulta de pendentes (status mudou): não volta mais como o mesmo pedido
+                with self._lock:
+                    self._seen.discard(doc.id)
+                continue
+            if change.type.name != 'ADDED':
+                continue  # MODIFIED: campos do pedido ainda pendente
+            with self._lock:
+                if doc.id in self._seen:
+                    self.stats['duplicates'] += 1
+                    continue
+                self._seen.add(doc.id)
+                self.stats['received'] += 1
+
+            data = doc.to_dict() or {}
+            session = self.sessions.get(data.get('carId'))
+            if session is None:
+                self.stats['unknown_car'] += 1
+                continue
+            try:
+                session.executar_comando_app(doc.id, data)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"❌ Erro ao executar comando {doc.id}: {e}")
@@ -0,0 +1,109 @@
+# python-server/car_document.py
+"""
+Espelho em memória do documento cars/{id}.
+
+Todas as escritas do gateway no documento do carro (posição, gpsStatus,
+status na tela, confirmações de ignição) passam por aqui. Cada campo é
+comparado com o último valor conhecido; só os campos que mudaram ficam
+"sujos", e um único update mesclado é enviado no máximo a cada
+`min_interval` segundos. Menos escritas também significam menos snapshots
+(e leituras) nos celulares que escutam o documento.
+"""
+
+import time
+from threading import Lock
+
+from firebase_admin import firestore
+
+
+def flatten(data, prefix=''):
+    """{'a': {'b': 1}} → {'a.b': 1} (caminhos de campo do Firestore)"""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, path + '.'))
+        else:
+            flat[path] = value
+    return flat
+
+
+class CarDocumentMirror:
+    """Rastreamento de campos sujos + flush mesclado com taxa limitada"""
+
+    def __init__(self, car_ref, writer, min_interval=2.0, clock=time.monotonic):
+        self.car_ref = car_ref
+        self.writer = writer
+        self.min_interval = min_interval
+        self.clock = clock  # relógio injetável (simulações com tempo acelerado)
+        self.urgent = False  # updates na via prioritária do FirestoreWriter
+
+        self._known = {}     # caminho → último valor gravado/observado
+        self._dirty = {}     # caminho → valor pendente
+        self._lock = Lock()
+        self._last_flush = float('-inf')
+        self.stats = {
+            'updates': 0,         # chamadas a update()
+            'fields_skipped': 0,  # campos iguais ao valor conhecido
+            'flushes': 0,         # writes realmente enviados
+        }
+
+    def observe(self, data):
+        """Registra o estado remoto (get/snapshot) para campos não pendentes"""
+        with self._lock:
+            for path, value in flatten(data).items():
+                if path not in self._dirty:
+                    self._known[path] = value
+
+    def update(self, fields, touch=()):
+        """
+        Agenda a escrita de `fields` (mapas aninhados viram caminhos).
+        Campos de `touch` (ex.: 'lastLocationUpdate') recebem SERVER_TIMESTAMP
+        apenas se algum campo de `fields` realmente mudou.
+        """
+        changed = False
+        with self._lock:
+            self.stats['updates'] += 1
+            for path, value in flatten(fields).items():
+                source = self._dirty if path in self._dirty else self._known
+                if path in source and source[path] == value:
+                    self.stats['fields_skipped'] += 1
+                    continue
+                self._dirty[path] = value
+                changed = True
+            if changed:
+                for path in touch:
+                    self._dirty[path] = firestore.SERVER_TIMESTAMP
+        if changed:
+            self.flush_if_due()
+        return changed
+
+    def pending(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush_if_due(self):
+        """Envia os campos sujos se o intervalo mínimo já passou"""
+        if self.clock() - self._last_flush >= self.min_interval:
+            return self.flush()
+        return False
+
+    def flush(self):
+        """Envia um único update com todos os campos sujos"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            payload = dict(self._dirty)
+            payload['updatedAt'] = firestore.SERVER_TIMESTAMP
+            for path, value in self._dirty.items():
+                self._known[path] = value
+            self._dirty.clear()
+            self._last_flush = self.clock()
+            self.stats['flushes'] += 1
+        self.writer.update(self.car_ref, payload, urgent=self.urgent)
+        return True
+
+    def coalesced(self):
+        """Updates solicitados que não viraram uma escrita própria"""
+        return self.stats['updates'] - self.stats['flushes']
+
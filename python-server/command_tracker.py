@@ -0,0 +1,257 @@
+# python-server/command_tracker.py
+"""
+Comandos para o Arduino com número de sequência e confirmação assíncrona.
+
+Cada comando sai como `COMANDO#<seq>` e o firmware devolve o mesmo seq no
+`{"type":"ack",...}`. O ack chega pela thread de leitura serial, que só
+chama on_ack(); ninguém espera pela resposta segurando a serial. Uma thread
+própria cuida dos prazos: reenvia o comando (mesmo seq) até `max_attempts`
+e então desiste. O resultado de cada comando, com a latência de ida e volta,
+vai para o callback `on_result`.
+
+Com a serial caída, pause() congela os prazos e os comandos novos ficam
+na fila; resume() reenvia tudo o que estava pendente quando ela volta.
+"""
+
+import time
+from threading import Thread, Condition
+
+SEQ_MAX = 32767  # o firmware lê o seq com String.toInt()
+
+RESULT_CONFIRMED = 'confirmed'
+RESULT_TIMEOUT = 'timeout'
+RESULT_SUPERSEDED = 'superseded'
+
+
+class PendingCommand:
+    """Comando enviado que ainda espera o ack"""
+    __slots__ = ('seq', 'command', 'expect', 'key', 'timeout', 'max_attempts',
+                 'attempts', 'first_sent', 'deadline', 'callbacks')
+
+    def __init__(self, seq, command, expect, key, timeout, max_attempts):
+        self.seq = seq
+        self.command = command
+        self.expect = expect  # ignitionState esperado no ack (firmware sem seq)
+        self.key = key        # comandos com a mesma chave se substituem
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.first_sent = 0.0
+        self.deadline = 0.0
+        self.callbacks = []  # on_done(cmd, status, rtt_ms) de quem pediu o comando
+
+
+class CommandTracker:
+    """Numera, envia, reenvia e casa comandos com os acks do Arduino"""
+
+    def __init__(self, send, on_result=None, timeout=2.0, max_attempts=3,
+                 on_error=None, name='command-tracker'):
+        self.send = send  # send(linha) → bool; só escreve na serial
+        self.on_result = on_result
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.on_error = on_error
+        self.name = name
+
+        self._pending = {}  # seq → PendingCommand
+        self._seq = 0
+        self._cond = Condition()
+        self._thread = None
+        self._running = False
+        self._paused = False
+        self.stats = {
+            'sent': 0,
+            'confirmed': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'superseded': 0,
+            'replayed': 0,
+            'unmatched_acks': 0,
+            'last_rtt_ms': 0.0,
+            'max_rtt_ms': 0.0,
+            'total_rtt_ms': 0.0,
+        }
+
+    # --------------------------------------------------------------------------
+    # API pública
+    # --------------------------------------------------------------------------
+
+    def start(self):
+        """Inicia a thread de prazos"""
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """Encerra a thread; comandos pendentes são abandonados"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, command, expect=None, key=None, timeout=None, max_attempts=None, on_done=None):
+        """
+        Envia `command` com um novo seq e devolve o seq (None se o envio falhar).
+        Se o mesmo comando (mesma chave) já aguarda ack, só acompanha o pendente.
+        """
+        superseded = []
+        with self._cond:
+            if key is not None:
+                for other in self._pending.values():
+                    if other.key == key and other.command == command:
+                        if on_done is not None:
+                            other.callbacks.append(on_done)
+                        return other.seq
+            self._seq = self._seq % SEQ_MAX + 1
+            cmd = PendingCommand(self._seq, command, expect, key,
+                                 self.timeout if timeout is None else timeout,
+                                 self.max_attempts if max_attempts is None else max_attempts)
+            if key is not None:
+                for seq, other in list(self._pending.items()):
+                    if other.key == key:
+                        del self._pending[seq]
+                        superseded.append(other)
+                        self.stats['superseded'] += 1
+            cmd.attempts = 1
+            cmd.first_sent = time.monotonic()
+            cmd.deadline = cmd.first_sent + cmd.timeout
+            self.stats['sent'] += 1
+            if on_done is not None:
+                cmd.callbacks.append(on_done)
+            self._pending[cmd.seq] = cmd
+            self._cond.notify_all()
+            paused = self._paused
+
+        for other in superseded:
+            self._result(other, RESULT_SUPERSEDED, None)
+
+        if paused:
+            return cmd.seq  # sai no resume()
+        if not self.send(f"{cmd.command}#{cmd.seq}"):
+            with self._cond:
+                self._pending.pop(cmd.seq, None)
+            return None
+        return cmd.seq
+
+    def pause(self):
+        """Serial fora do ar: prazos congelados, envios esperam o resume()"""
+        with self._cond:
+            self._paused = True
+            self._cond.notify_all()
+
+    def resume(self):
+        """Serial de volta: reenvia os pendentes (em ordem de seq) com prazos novos"""
+        with self._cond:
+            self._paused = False
+            now = time.monotonic()
+            replay = sorted(self._pending.values(), key=lambda c: c.seq)
+            for cmd in replay:
+                # Tentativas e ida e volta recomeçam: a queda não conta contra o comando
+                cmd.attempts = 1
+                cmd.first_sent = now
+                cmd.deadline = now + cmd.timeout
+            self.stats['replayed'] += len(replay)
+            self._cond.notify_all()
+        for cmd in replay:
+            self.send(f"{cmd.command}#{cmd.seq}")
+        return len(replay)
+
+    def is_pending(self, command):
+        """True se `command` já foi enviado e aguarda ack"""
+        with self._cond:
+            return any(c.command == command for c in self._pending.values())
+
+    def on_ack(self, record):
+        """Casa um registro ack com o comando pendente; devolve o comando ou None"""
+        now = time.monotonic()
+        seq = record.get('seq')
+        with self._cond:
+            if seq is not None:
+                cmd = self._pending.pop(seq, None)
+            elif record.get('ignitionState') is None:
+                cmd = None  # ex.: ack do RESET
+            else:
+                # Firmware antigo (ack sem seq): o pendente mais antigo com o mesmo estado
+                state = record.get('ignitionState')
+                cmd = next((c for c in self._pending.values() if c.expect == state), None)
+                if cmd is not None:
+                    del self._pending[cmd.seq]
+            if cmd is None:
+                self.stats['unmatched_acks'] += 1
+                return None
+
+            rtt_ms = (now - cmd.first_sent) * 1000
+            self.stats['confirmed'] += 1
+            self.stats['last_rtt_ms'] = rtt_ms
+            self.stats['max_rtt_ms'] = max(self.stats['max_rtt_ms'], rtt_ms)
+            self.stats['total_rtt_ms'] += rtt_ms
+            self._cond.notify_all()
+
+        self._result(cmd, RESULT_CONFIRMED, rtt_ms)
+        return cmd
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def avg_rtt_ms(self):
+        confirmed = self.stats['confirmed']
+        return self.stats['total_rtt_ms'] / confirmed if confirmed else 0.0
+
+    # --------------------------------------------------------------------------
+    # Internos
+    # --------------------------------------------------------------------------
+
+    def _retransmit(self, cmd):
+        with self._cond:
+            if cmd.seq not in self._pending:
+                return  # o ack chegou enquanto isso
+            cmd.attempts += 1
+            cmd.deadline = time.monotonic() + cmd.timeout
+            self.stats['retries'] += 1
+        self.send(f"{cmd.command}#{cmd.seq}")
+
+    def _result(self, cmd, status, rtt_ms):
+        callbacks = ([self.on_result] if self.on_result else []) + cmd.callbacks
+        for callback in callbacks:
+            try:
+                callback(cmd, status, rtt_ms)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"❌ Erro ao tratar resultado do comando {cmd.command}: {e}")
+
+    def _run(self):
+        while True:
+            retry, expired = [], []
+            with self._cond:
+                if not self._running:
+                    return
+                if self._paused:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                for seq, cmd in list(self._pending.items()):
+                    if cmd.deadline > now:
+                        continue
+                    if cmd.attempts >= cmd.max_attempts:
+                        del self._pending[seq]
+                        self.stats['timeouts'] += 1
+                        expired.append(cmd)
+                    else:
+                        retry.append(cmd)
+                if not retry and not expired:
+                    nearest = min((c.deadline for c in self._pending.values()), default=None)
+                    self._cond.wait(None if nearest is None else max(0.0, nearest - now))
+                    continue
+
+            # Fora do lock: a escrita na serial e os callbacks podem demorar
+            for cmd in retry:
+                self._retransmit(cmd)
+            for cmd in expired:
+                self._result(cmd, RESULT_TIMEOUT, None)
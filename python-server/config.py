@@ -1,10 +1,11 @@
 # python-server/config.py
+import json
 import os
 from pathlib import Path
 
 # Caminho seguro para credenciais
 CREDENTIALS_DIR = Path(__file__).parent / "credentials"
-FIREBASE_CREDENTIALS = CREDENTIALS_DIR / "firebase-adminsdk.json"
+FIREBASE_CREDENTIALS = Path(os.environ.get("TRACKCAR_CREDENTIALS", CREDENTIALS_DIR / "firebase-adminsdk.json"))
 
 def get_firebase_credentials():
     if not FIREBASE_CREDENTIALS.exists():
@@ -14,3 +15,52 @@ def get_firebase_credentials():
         )
     
     return str(FIREBASE_CREDENTIALS)
+
+# Spool local (SQLite WAL) das escritas pendentes no Firestore
+SPOOL_FILE = Path(os.environ.get("TRACKCAR_SPOOL", Path(__file__).parent / "spool" / "trackcar_spool.db"))
+
+# Logs: nível mínimo e janela de supressão de mensagens repetidas (segundos)
+LOG_LEVEL = os.environ.get("TRACKCAR_LOG_LEVEL", "INFO").upper()
+LOG_REPEAT_WINDOW = float(os.environ.get("TRACKCAR_LOG_REPEAT_WINDOW", "30"))
+
+# Métricas Prometheus em http://METRICS_HOST:METRICS_PORT/metrics (0 = desligado)
+METRICS_HOST = os.environ.get("TRACKCAR_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("TRACKCAR_METRICS_PORT", "9108"))
+
+# Estado ao vivo dos veículos em http://LIVE_HOST:LIVE_PORT/cars e /stream (0 = desligado)
+LIVE_HOST = os.environ.get("TRACKCAR_LIVE_HOST", "127.0.0.1")
+LIVE_PORT = int(os.environ.get("TRACKCAR_LIVE_PORT", "9109"))
+
+# Pontos de endereço para a geocodificação reversa offline (veja reverse_geocoder.py);
+# sem o arquivo os fixes vão sem endereço
+GEOCODER_FILE = Path(os.environ.get("TRACKCAR_GEOCODER", Path(__file__).parent / "geodata" / "addresses.csv"))
+
+# Arquivo local colunar de gps/heartbeat para consultas offline (veja archive.py)
+ARCHIVE_DIR = Path(os.environ.get("TRACKCAR_ARCHIVE", Path(__file__).parent / "archive"))
+
+# Gateway em vários processos (veja shard_supervisor.py): workers e nome da
+# tabela de estado em memória compartilhada lida por state_table.py
+GATEWAY_WORKERS = int(os.environ.get("TRACKCAR_WORKERS", "1"))
+STATE_TABLE_NAME = os.environ.get("TRACKCAR_STATE", "trackcar-state")
+
+# Mapa porta serial → veículo (gateway com vários carros)
+VEHICLES_FILE = Path(os.environ.get("TRACKCAR_VEHICLES", Path(__file__).parent / "vehicles.json"))
+
+def load_vehicles(path=None):
+    """
+    Lê o arquivo de veículos. Formato:
+        {"vehicles": [{"carId": "...", "userId": "...", "port": "COM8", "baud": 9600}]}
+    Retorna lista vazia se o arquivo não existir.
+    """
+    path = Path(path) if path else VEHICLES_FILE
+    if not path.exists():
+        return []
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    vehicles = data.get("vehicles", data) if isinstance(data, dict) else data
+    for v in vehicles:
+        if not v.get("carId") or not v.get("port"):
+            raise ValueError(f"Veículo inválido em {path}: {v} (carId e port são obrigatórios)")
+    return vehicles
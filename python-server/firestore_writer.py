@@ -0,0 +1,323 @@
+# python-server/firestore_writer.py
+"""
+Escritor assíncrono do Firestore.
+
+As gravações entram numa fila limitada e uma thread de fundo agrupa as
+operações pendentes em commits de WriteBatch, disparados por tamanho do lote
+ou pela idade da operação mais antiga. Assim a thread que lê a serial nunca
+espera por um round trip do Firestore. Uma operação `urgent` (veículo
+roubado, avistamento confirmado) não espera o `max_age`: o lote sai na
+hora, com ela e tudo o que estava antes na fila, sem furar a ordem.
+
+Com um `spool` (veja spool.py) a fila fica em disco: nada é descartado, as
+operações sobrevivem a quedas do Firestore e a reinícios do gateway, e o
+backlog é drenado em ordem com lotes do tamanho máximo permitido.
+"""
+
+import time
+from collections import deque
+from threading import Thread, Condition
+
+# Limite do Firestore para operações em um único WriteBatch
+FIRESTORE_BATCH_LIMIT = 500
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_BLOCK = 'block'
+
+# Espera máxima entre tentativas enquanto o Firestore está fora do ar
+MAX_BACKOFF = 30.0
+
+
+def is_permanent_error(exc):
+    """Erros que não somem com retry (documento inexistente, dado inválido)"""
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return False
+    return isinstance(exc, (gexc.NotFound, gexc.InvalidArgument,
+                            gexc.FailedPrecondition, gexc.AlreadyExists))
+
+
+class FirestoreWriter:
+    """Fila limitada (ou spool em disco) + thread que grava em lotes no Firestore"""
+
+    def __init__(self, db, max_queue=1000, batch_size=100, max_age=1.0,
+                 overflow=OVERFLOW_DROP_OLDEST, max_retries=3, on_error=None,
+                 spool=None, on_commit=None):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK):
+            raise ValueError(f"Política de overflow inválida: {overflow}")
+
+        self.db = db
+        self.max_queue = max_queue
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.max_age = max_age
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.on_error = on_error
+        self.spool = spool
+        self.on_commit = on_commit  # on_commit(operações, segundos) após cada lote gravado
+
+        self._queue = deque()
+        self._cond = Condition()
+        self._thread = None
+        self._running = False
+        self._inflight = 0
+        self._urgent = False  # há operação urgente na fila: commit sem esperar o max_age
+        self._idle = False  # thread esperando sem prazo (fila vazia)
+
+        self._stats = {
+            'enqueued': 0,
+            'committed': 0,
+            'dropped': 0,
+            'failed': 0,
+            'rejected': 0,
+            'retries': 0,
+            'urgent': 0,
+            'batches': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+
+    # --------------------------------------------------------------------------
+    # API pública
+    # --------------------------------------------------------------------------
+
+    def start(self):
+        """Inicia a thread de gravação"""
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = Thread(target=self._run, name='firestore-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Grava o que estiver pendente, encerra a thread e fecha o spool"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        stuck = self._thread.is_alive()
+        self._thread = None
+        if self.spool is not None:
+            if self.on_error and len(self.spool):
+                self.on_error(f"💾 {len(self.spool)} operações ficaram no spool para o próximo início")
+            if not stuck:
+                # Fechar a última conexão faz o checkpoint do WAL no arquivo principal
+                self.spool.close()
+
+    def add(self, collection, data, timeout=None, urgent=False):
+        """Equivalente a collection.add(data), com ID gerado no cliente"""
+        # O ID nasce aqui: reenvios do mesmo lote não duplicam o documento
+        doc_ref = self.db.collection(collection).document()
+        return self._put(('set', doc_ref, data, None), timeout, urgent)
+
+    def set(self, doc_ref, data, merge=False, timeout=None, urgent=False):
+        """Enfileira um doc_ref.set(data)"""
+        return self._put(('set', doc_ref, data, merge), timeout, urgent)
+
+    def update(self, doc_ref, data, timeout=None, urgent=False):
+        """Enfileira um doc_ref.update(data)"""
+        return self._put(('update', doc_ref, data, None), timeout, urgent)
+
+    def flush(self, timeout=10.0):
+        """Bloqueia até a fila esvaziar (ou estourar o timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._depth() or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """Retorna uma cópia dos contadores do escritor"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._depth()
+        batches = stats['batches']
+        stats['avg_batch_size'] = stats['committed'] / batches if batches else 0.0
+        stats['avg_commit_ms'] = stats['total_commit_ms'] / batches if batches else 0.0
+        return stats
+
+    # --------------------------------------------------------------------------
+    # Internos
+    # --------------------------------------------------------------------------
+
+    def _depth(self):
+        return len(self.spool) if self.spool is not None else len(self._queue)
+
+    def _oldest_age(self):
+        if self.spool is not None:
+            created = self.spool.oldest_created()
+            return time.time() - created if created is not None else 0.0
+        return time.monotonic() - self._queue[0][0]
+
+    def _put(self, op, timeout, urgent=False):
+        if self.spool is not None:
+            # INSERT fora do _cond: disco lento não trava stats(), o commit nem os outros produtores
+            kind, doc_ref, data, merge = op
+            try:
+                self.spool.append(kind, doc_ref.path, data, bool(merge))
+            except ValueError as e:
+                # Recusa aqui: a exceção não pode chegar à thread da serial
+                with self._cond:
+                    self._stats['rejected'] += 1
+                if self.on_error:
+                    self.on_error(f"❌ Operação em {doc_ref.path} recusada: {e}")
+                return False
+
+        with self._cond:
+            if self.spool is None:
+                if len(self._queue) >= self.max_queue and not self._make_room(timeout):
+                    return False
+                self._queue.append((time.monotonic(), op))
+
+            self._stats['enqueued'] += 1
+            depth = self._depth()
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+            if urgent:
+                self._urgent = True
+                self._stats['urgent'] += 1
+            # Thread ociosa precisa armar o prazo do max_age (com spool, dois
+            # produtores podem gravar antes de qualquer um ver depth == 1)
+            if urgent or self._idle or depth >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _make_room(self, timeout):
+        """Fila em memória cheia: descarta a mais antiga ou aplica backpressure"""
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            self._queue.popleft()
+            self._stats['dropped'] += 1
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._queue) >= self.max_queue:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self._stats['dropped'] += 1
+                return False
+            self._cond.wait(remaining)
+        return True
+
+    def _take_batch(self):
+        """Espera até ter um lote cheio ou a operação mais antiga vencer"""
+        with self._cond:
+            while True:
+                depth = self._depth()
+                if depth:
+                    age = self._oldest_age()
+                    if depth >= self.batch_size or age >= self.max_age or self._urgent or not self._running:
+                        # Backlog (ex.: depois de uma queda): lotes do tamanho máximo
+                        limit = FIRESTORE_BATCH_LIMIT if depth > self.batch_size else self.batch_size
+                        count = min(limit, depth)
+                        if count == depth:
+                            self._urgent = False
+                        if self.spool is not None:
+                            ops = [(seq, kind, self.db.document(path), data, merge)
+                                   for seq, kind, path, data, merge in self.spool.peek(count)]
+                        else:
+                            ops = [(None,) + self._queue.popleft()[1] for _ in range(count)]
+                        self._inflight = count
+                        # Libera produtores bloqueados por backpressure
+                        self._cond.notify_all()
+                        return ops
+                    self._cond.wait(max(0.0, self.max_age - age))
+                elif not self._running:
+                    return None
+                else:
+                    self._idle = True
+                    self._cond.wait()
+                    self._idle = False
+
+    def _commit(self, ops):
+        batch = self.db.batch()
+        for _, kind, doc_ref, data, merge in ops:
+            if kind == 'update':
+                batch.update(doc_ref, data)
+            elif merge:
+                batch.set(doc_ref, data, merge=True)
+            else:
+                batch.set(doc_ref, data)
+        batch.commit()
+
+    def _commit_individually(self, ops):
+        """Um lote com operação inválida: grava uma a uma e descarta só a ruim"""
+        failed = 0
+        for op in ops:
+            try:
+                self._commit([op])
+            except Exception as e:
+                if not is_permanent_error(e):
+                    raise
+                failed += 1
+                if self.on_error:
+                    self.on_error(f"❌ Operação descartada ({op[2].path}): {e}")
+        return failed
+
+    def _run(self):
+        while True:
+            ops = self._take_batch()
+            if ops is None:
+                return
+
+            committed, failed = False, 0
+            tentativa = 0
+            while True:
+                started = time.monotonic()
+                try:
+                    self._commit(ops)
+                    committed = True
+                    break
+                except Exception as e:
+                    if is_permanent_error(e):
+                        try:
+                            failed = self._commit_individually(ops)
+                            committed = True
+                            break
+                        except Exception as e2:
+                            e = e2
+                    tentativa += 1
+                    self._stats['retries'] += 1
+                    if self.on_error:
+                        self.on_error(f"❌ Erro no commit do lote (tentativa {tentativa}): {e}")
+                    # Sem spool desiste após max_retries; com spool tenta até o Firestore voltar
+                    if self.spool is None and tentativa >= self.max_retries:
+                        break
+                    if self.spool is not None and not self._running:
+                        break  # encerrando: o lote continua no spool
+                    time.sleep(min(2 ** (tentativa - 1) * 0.5, MAX_BACKOFF))
+
+            elapsed_ms = (time.monotonic() - started) * 1000
+            if committed and self.spool is not None:
+                self.spool.ack([op[0] for op in ops])
+            if committed and self.on_commit:
+                self.on_commit(len(ops), elapsed_ms / 1000)
+
+            with self._cond:
+                self._inflight = 0
+                if committed:
+                    self._stats['committed'] += len(ops) - failed
+                    self._stats['failed'] += failed
+                    self._stats['batches'] += 1
+                    self._stats['last_batch_size'] = len(ops)
+                    self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(ops))
+                    self._stats['last_commit_ms'] = elapsed_ms
+                    self._stats['max_commit_ms'] = max(self._stats['max_commit_ms'], elapsed_ms)
+                    self._stats['total_commit_ms'] += elapsed_ms
+                elif self.spool is None:
+                    self._stats['failed'] += len(ops)
+                self._cond.notify_all()
+
+            if not committed and self.spool is not None:
+                return  # encerrando com o Firestore fora do ar
@@ -0,0 +1,191 @@
+# python-server/fix_quality.py
+"""
+Qualidade dos fixes GPS antes do thinning.
+
+O firmware só marca `valid`; saltos de centenas de metros do NEO-6M
+(multipath perto de prédios) passavam como fixes bons e viravam gravações e
+redesenhos do mapa. O FixQualityFilter dá a cada fix uma nota de 0 a 1
+(satélites, idade, HDOP quando o registro traz `hdop`) e rejeita:
+
+- fixes com nota abaixo de `min_score` (poucos satélites, dado velho, HDOP alto);
+- saltos: distância até o último fix aceito maior do que o carro percorreria a
+  `max_speed_kmh` no intervalo, ou desvio da posição prevista pela velocidade
+  atual maior do que `max_accel_ms2` explicaria (ambos com folga de
+  `jump_slack_m` para o ruído dos dois fixes).
+
+Um deslocamento real (carro rebocado, GPS que voltou depois de muito tempo)
+também parece salto; quando `reanchor_after` fixes rejeitados seguidos
+concordam entre si, o filtro aceita a nova posição. Com fixes espaçados um
+salto pequeno pode caber no envelope físico do intervalo e passar.
+
+Com `smoothing` os fixes aceitos passam por um Kalman de velocidade
+constante por eixo (metros em projeção local), com o ruído de medição
+tirado da nota. Tudo em aritmética escalar: alguns microssegundos por fix.
+"""
+
+import math
+
+from gps_thinning import EARTH_RADIUS_M
+
+DEFAULT_QUALITY = {
+    'min_sats': 4,             # abaixo disso a posição 2D não é confiável
+    'max_age_ms': 5000,        # fix mais velho que isso é descartado
+    'max_hdop': 5.0,           # HDOP (se o firmware mandar) acima disso é descartado
+    'min_score': 0.1,          # nota mínima para aceitar
+    'max_speed_kmh': 200.0,    # velocidade implícita acima disso = salto
+    'max_accel_ms2': 4.0,      # desvio da previsão acima de a·dt²/2 = salto
+    'jump_slack_m': 30.0,      # folga do teste de salto (ruído dos dois fixes)
+    'reanchor_after': 3,       # rejeitados seguidos e coerentes → nova posição
+    'smoothing': False,        # Kalman nos fixes aceitos
+    'sigma_m': 5.0,            # desvio do GPS com nota 1 (HDOP 1)
+    'accel_ms2': 2.0,          # ruído de processo do Kalman (aceleração)
+}
+
+REJECT_REASONS = ('sats', 'age', 'hdop', 'jump')
+
+_M_PER_DEG = math.radians(1) * EARTH_RADIUS_M
+_VELOCITY_BASELINE_S = 2.0  # velocidade medida entre fixes ao menos tão distantes
+_VELOCITY_ERROR_MS = 2.0    # incerteza dessa velocidade (ruído / baseline)
+
+
+class _Axis:
+    """Kalman de velocidade constante em um eixo (posição, velocidade)"""
+    __slots__ = ('p', 'v', 'p00', 'p01', 'p11')
+
+    def __init__(self, p, var):
+        self.p = p
+        self.v = 0.0
+        self.p00 = var
+        self.p01 = 0.0
+        self.p11 = 100.0  # velocidade inicial desconhecida (~10 m/s)
+
+    def step(self, z, r, dt, q):
+        if dt > 0:
+            self.p += self.v * dt
+            dt2 = dt * dt
+            self.p00 += 2 * dt * self.p01 + dt2 * self.p11 + q * dt2 * dt / 3
+            self.p01 += dt * self.p11 + q * dt2 / 2
+            self.p11 += q * dt
+        s = self.p00 + r
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        y = z - self.p
+        self.p += k0 * y
+        self.v += k1 * y
+        self.p11 -= k1 * self.p01
+        self.p01 -= k0 * self.p01
+        self.p00 -= k0 * self.p00
+        return self.p
+
+
+class FixQualityFilter:
+    """Nota, rejeição de outliers e suavização opcional; offer() devolve True se aceitou"""
+
+    def __init__(self, **config):
+        unknown = set(config) - set(DEFAULT_QUALITY)
+        if unknown:
+            raise ValueError(f"Parâmetros de qualidade desconhecidos: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULT_QUALITY, **config)
+
+        self.origin = None     # (lat0, lon0, metros por grau de longitude)
+        self.last = None       # (x, y, t) do último fix aceito (posição medida)
+        self.velocity = None   # (vx, vy) em m/s entre aceitos a ≥ 2 s
+        self._vref = None      # (x, y, t) de onde a velocidade é medida
+        self.candidate = None  # (x, y, t, n) de rejeições seguidas coerentes entre si
+        self.kx = self.ky = None
+        self.stats = {'accepted': 0, 'rejected': 0, 'reanchored': 0, 'smoothed': 0}
+        for reason in REJECT_REASONS:
+            self.stats[f'rejected_{reason}'] = 0
+        self.last_reason = None
+
+    def score(self, fix):
+        """Nota 0..1 do fix e o motivo do fator mais baixo"""
+        cfg = self.config
+        if fix.sats < cfg['min_sats']:
+            return 0.0, 'sats'
+        s_sats = min(1.0, (fix.sats - 3) / 5)  # 8+ satélites = 1
+        s_age = 1.0 if fix.age <= 1000 else max(0.0, 1 - (fix.age - 1000) / max(1, cfg['max_age_ms'] - 1000))
+        hdop = fix.hdop
+        if hdop is None or hdop <= 1.5:
+            s_hdop = 1.0
+        else:
+            s_hdop = max(0.0, 1 - (hdop - 1.5) / max(0.1, cfg['max_hdop'] - 1.5))
+        reason = min((s_sats, 'sats'), (s_age, 'age'), (s_hdop, 'hdop'))[1]
+        return s_sats * s_age * s_hdop, reason
+
+    def offer(self, fix, t):
+        """
+        Avalia um fix válido recebido no instante `t`. Preenche fix.quality;
+        com smoothing troca lat/lon pela posição suavizada.
+        """
+        cfg = self.config
+        quality, reason = self.score(fix)
+        fix.quality = round(quality, 2)
+        if quality < cfg['min_score']:
+            return self._reject(reason)
+
+        if self.origin is None:
+            self.origin = (fix.lat, fix.lon, _M_PER_DEG * math.cos(math.radians(fix.lat)))
+        lat0, lon0, m_lon = self.origin
+        x = (fix.lon - lon0) * m_lon
+        y = (fix.lat - lat0) * _M_PER_DEG
+        t -= fix.age / 1000  # instante da medição, não da recepção
+
+        if self.last is not None and self._jump(self.last, x, y, t, self.velocity):
+            c = self.candidate
+            if c is not None and not self._jump(c, x, y, t):
+                self.candidate = (x, y, t, c[3] + 1)
+            else:
+                self.candidate = (x, y, t, 1)
+            if self.candidate[3] < cfg['reanchor_after']:
+                return self._reject('jump')
+            # Vários fixes concordam com a posição nova: o carro está mesmo lá
+            self.stats['reanchored'] += 1
+            self.kx = self.ky = None
+            self.velocity = self._vref = None
+            self.last = None
+
+        dt = t - self.last[2] if self.last is not None else 0.0
+        self.last = (x, y, t)
+        vref = self._vref
+        if vref is None:
+            self._vref = self.last
+        elif t - vref[2] >= _VELOCITY_BASELINE_S:
+            self.velocity = ((x - vref[0]) / (t - vref[2]), (y - vref[1]) / (t - vref[2]))
+            self._vref = self.last
+        self.candidate = None
+        self.stats['accepted'] += 1
+        self.last_reason = None
+
+        if cfg['smoothing']:
+            sigma = cfg['sigma_m'] / max(quality, 0.2)
+            r = sigma * sigma
+            if self.kx is None:
+                self.kx, self.ky = _Axis(x, r), _Axis(y, r)
+            else:
+                q = cfg['accel_ms2'] ** 2
+                x = self.kx.step(x, r, dt, q)
+                y = self.ky.step(y, r, dt, q)
+                fix.lat = lat0 + y / _M_PER_DEG
+                fix.lon = lon0 + x / m_lon
+                self.stats['smoothed'] += 1
+        return True
+
+    def _jump(self, ref, x, y, t, velocity=None):
+        cfg = self.config
+        dt = max(0.0, t - ref[2])
+        dx, dy = x - ref[0], y - ref[1]
+        allowed = cfg['max_speed_kmh'] / 3.6 * dt + cfg['jump_slack_m']
+        if dx * dx + dy * dy > allowed * allowed:
+            return True
+        if velocity is None:
+            return False
+        ex, ey = dx - velocity[0] * dt, dy - velocity[1] * dt
+        allowed = (_VELOCITY_ERROR_MS + cfg['max_accel_ms2'] * dt / 2) * dt + cfg['jump_slack_m']
+        return ex * ex + ey * ey > allowed * allowed
+
+    def _reject(self, reason):
+        self.stats['rejected'] += 1
+        self.stats[f'rejected_{reason}'] += 1
+        self.last_reason = reason
+        return False
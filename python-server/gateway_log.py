@@ -0,0 +1,168 @@
+# python-server/gateway_log.py
+"""
+Funções de log do gateway (apenas console).
+
+log_info/log_warning/log_error/log_debug passam pelo logger `trackcar` do
+módulo logging. Sem configuração o handler escreve direto no stdout (útil
+em benchmarks); setup_logging() liga o modo do gateway: um QueueHandler
+entrega os registros a uma thread que formata e imprime, então a thread da
+serial nunca espera pelo console. Mensagens repetidas (mesmo texto a menos
+dos números, ex.: "GPS procurando satélites... (3 sats)") aparecem no
+máximo uma vez por janela, com a contagem das suprimidas (só WARN/ERROR).
+"""
+
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+from threading import Lock
+
+from config import LOG_LEVEL, LOG_REPEAT_WINDOW
+
+logger = logging.getLogger('trackcar')
+logger.propagate = False
+
+_listener = None
+_NUMBERS = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Formato histórico do gateway: [NÍVEL] HH:MM:SS - mensagem"""
+
+    TAGS = {logging.WARNING: 'WARN'}
+
+    def format(self, record):
+        tag = self.TAGS.get(record.levelno, record.levelname)
+        return f"[{tag}] {self.formatTime(record, '%H:%M:%S')} - {record.getMessage()}"
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Escreve no sys.stdout do momento (respeita contextlib.redirect_stdout)"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Deixa passar uma mensagem por chave (texto sem números) a cada `window`
+    segundos. Só avisos e erros: os INFO por fix ("GPS salvo") são o registro
+    do que foi gravado e nunca são suprimidos.
+    """
+
+    MAX_KEYS = 1000
+
+    def __init__(self, window=30.0, min_level=logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.min_level = min_level
+        self.suppressed = 0
+        self._seen = {}  # chave → [instante da última emitida, suprimidas desde então]
+        self._lock = Lock()
+
+    def filter(self, record):
+        if self.window <= 0 or record.levelno < self.min_level:
+            return True
+        message = record.getMessage()
+        key = (record.levelno, _NUMBERS.sub('#', message))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed += 1
+                return False
+            if len(self._seen) >= self.MAX_KEYS:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+            self._seen[key] = [now, 0]
+        if entry is not None and entry[1]:
+            record.msg = f"{message} (+{entry[1]} repetidas suprimidas)"
+            record.args = ()
+        return True
+
+
+class FastQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler sem format/cópia do registro na thread que loga"""
+
+    def prepare(self, record):
+        # As mensagens do gateway já chegam prontas (f-strings, sem args nem exc_info)
+        return record
+
+
+# Uma instância só: a contagem de suprimidas sobrevive a setup/stop_logging
+_repeat = RepeatFilter(LOG_REPEAT_WINDOW)
+
+
+def _configure(handler, level, repeat_window):
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    _repeat.window = repeat_window
+    handler.addFilter(_repeat)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def setup_logging(level=LOG_LEVEL, repeat_window=LOG_REPEAT_WINDOW):
+    """Modo do gateway: fila + thread de saída para o console"""
+    global _listener
+    stop_logging()
+    console = StdoutHandler()
+    console.setFormatter(ConsoleFormatter())
+    _listener = logging.handlers.QueueListener(queue.SimpleQueue(), console)
+    _configure(FastQueueHandler(_listener.queue), level, repeat_window)
+    _listener.start()
+
+
+def stop_logging():
+    """Esvazia a fila de logs e volta para a saída síncrona"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    console = StdoutHandler()
+    console.setFormatter(ConsoleFormatter())
+    _configure(console, logger.level or LOG_LEVEL, _repeat.window)
+
+
+def suppressed_count():
+    """Mensagens descartadas pelo filtro de repetição"""
+    return _repeat.suppressed
+
+
+# Saída síncrona até alguém chamar setup_logging()
+stop_logging()
+
+# ==============================================================================
+# FUNÇÕES DE LOG PERSONALIZADAS (sem arquivo)
+# ==============================================================================
+
+def _emit(level, message):
+    # Sem findCaller: o registro não usa arquivo/linha de origem
+    if logger.isEnabledFor(level):
+        logger.handle(logger.makeRecord(logger.name, level, '', 0, message, None, None))
+
+def log_info(message):
+    """Log de informações (apenas console)"""
+    _emit(logging.INFO, message)
+
+def log_warning(message):
+    """Log de avisos (apenas console)"""
+    _emit(logging.WARNING, message)
+
+def log_error(message):
+    """Log de erros (apenas console)"""
+    _emit(logging.ERROR, message)
+
+def log_debug(message):
+    """Log de debug (apenas console)"""
+    _emit(logging.DEBUG, message)
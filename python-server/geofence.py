@@ -0,0 +1,216 @@
+# python-server/geofence.py
+"""
+Cercas virtuais (geofences) avaliadas no gateway.
+
+Cada veículo tem uma lista de cercas (círculos e polígonos) no
+vehicles.json. As caixas envolventes das cercas são registradas numa grade
+regular de latitude/longitude (células de `cell_deg` graus); um fix só é
+testado contra as cercas da sua célula, então o custo por fix depende de
+quantas cercas se sobrepõem ali e não do total de cercas do veículo.
+
+O GeofenceEngine guarda em quais cercas o carro está e só devolve as
+transições (enter/exit), confirmadas por `confirm` fixes seguidos para o
+ruído do GPS na borda não gerar eventos em série.
+
+Além das cercas do vehicles.json, a sessão escuta a coleção `geofences`
+criada pelo app (services/tkService.ts: círculos com isActive e
+alertOnEnter/alertOnExit); replace() troca o conjunto sem perder o estado.
+"""
+
+import math
+from threading import Lock
+
+from gps_thinning import EARTH_RADIUS_M
+
+DEFAULT_CELL_DEG = 0.01  # ~1,1 km de latitude
+EVENT_ENTER = 'enter'
+EVENT_EXIT = 'exit'
+
+_M_PER_DEG = math.radians(1) * EARTH_RADIUS_M
+
+
+class CircleFence:
+    """Cerca circular: centro (lat, lon) e raio em metros"""
+    __slots__ = ('id', 'name', 'lat', 'lon', 'radius_m', 'bbox', 'alert_enter', 'alert_exit', '_k', '_r2')
+    kind = 'circle'
+
+    def __init__(self, id, name, lat, lon, radius_m, alert_enter=True, alert_exit=True):
+        if radius_m <= 0:
+            raise ValueError(f"Cerca {id}: raio deve ser positivo")
+        self.id = id
+        self.name = name
+        self.alert_enter = alert_enter
+        self.alert_exit = alert_exit
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_m
+        self._k = math.cos(math.radians(lat))
+        self._r2 = radius_m * radius_m
+        dlat = radius_m / _M_PER_DEG
+        dlon = radius_m / (_M_PER_DEG * max(self._k, 1e-6))
+        self.bbox = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+    def contains(self, lat, lon):
+        # Equiretangular local: erro desprezível na escala de uma cerca
+        dy = (lat - self.lat) * _M_PER_DEG
+        dx = (lon - self.lon) * _M_PER_DEG * self._k
+        return dx * dx + dy * dy <= self._r2
+
+
+class PolygonFence:
+    """Cerca poligonal: lista de vértices [(lat, lon), ...] (fechamento implícito)"""
+    __slots__ = ('id', 'name', 'points', 'bbox', 'alert_enter', 'alert_exit')
+    kind = 'polygon'
+
+    def __init__(self, id, name, points, alert_enter=True, alert_exit=True):
+        points = [(float(lat), float(lon)) for lat, lon in points]
+        if len(points) < 3:
+            raise ValueError(f"Cerca {id}: polígono precisa de pelo menos 3 pontos")
+        self.id = id
+        self.name = name
+        self.alert_enter = alert_enter
+        self.alert_exit = alert_exit
+        self.points = points
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, lat, lon):
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        # Ray casting (lon = x, lat = y)
+        inside = False
+        points = self.points
+        lat_j, lon_j = points[-1]
+        for lat_i, lon_i in points:
+            if (lat_i > lat) != (lat_j > lat):
+                x = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+                if lon < x:
+                    inside = not inside
+            lat_j, lon_j = lat_i, lon_i
+        return inside
+
+
+def load_fences(specs):
+    """
+    Cercas a partir da configuração do veículo:
+        {"id": "casa", "name": "Garagem", "lat": -23.55, "lon": -46.63, "radius_m": 50}
+        {"id": "bairro", "points": [[-23.55, -46.63], [-23.56, -46.63], [-23.56, -46.64]]}
+    """
+    fences = []
+    seen = set()
+    for spec in specs or []:
+        fence_id = spec.get('id')
+        if not fence_id or fence_id in seen:
+            raise ValueError(f"Cerca sem id ou com id repetido: {spec}")
+        seen.add(fence_id)
+        name = spec.get('name', fence_id)
+        alerts = {'alert_enter': spec.get('alertOnEnter', True), 'alert_exit': spec.get('alertOnExit', True)}
+        if 'points' in spec:
+            fences.append(PolygonFence(fence_id, name, spec['points'], **alerts))
+        elif 'radius_m' in spec:
+            fences.append(CircleFence(fence_id, name, float(spec['lat']), float(spec['lon']),
+                                      float(spec['radius_m']), **alerts))
+        else:
+            raise ValueError(f"Cerca {fence_id}: informe 'points' ou 'lat'/'lon'/'radius_m'")
+    return fences
+
+
+def fence_from_app(doc_id, data):
+    """Documento da coleção geofences do app → CircleFence (None se inativa/incompleta)"""
+    if not data.get('isActive', True):
+        return None
+    try:
+        return CircleFence(doc_id, data.get('name') or doc_id, float(data['latitude']),
+                           float(data['longitude']), float(data['radius']),
+                           alert_enter=data.get('alertOnEnter', True),
+                           alert_exit=data.get('alertOnExit', True))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class GridIndex:
+    """Grade lat/lon → cercas cuja caixa envolvente toca a célula"""
+
+    def __init__(self, fences, cell_deg=DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        for fence in fences:
+            min_lat, min_lon, max_lat, max_lon = fence.bbox
+            for iy in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for ix in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                    self.cells.setdefault((iy, ix), []).append(fence)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_deg)
+
+    def candidates(self, lat, lon):
+        return self.cells.get((self._cell(lat), self._cell(lon)), ())
+
+
+class GeofenceEngine:
+    """Estado dentro/fora por cerca de um veículo; check() devolve as transições"""
+
+    def __init__(self, fences, cell_deg=DEFAULT_CELL_DEG, confirm=2):
+        self.cell_deg = cell_deg
+        self.fences = {f.id: f for f in fences}
+        self.index = GridIndex(fences, cell_deg)
+        self.confirm = max(1, confirm)
+        self.inside = set()
+        self.initialized = False
+        self._pending = {}  # id → fixes seguidos no estado oposto ao atual
+        self._lock = Lock()  # replace() vem da thread do listener, check() da serial
+        self.stats = {'checks': 0, 'tests': 0, 'enter': 0, 'exit': 0}
+
+    def replace(self, fences):
+        """Troca o conjunto de cercas; cercas removidas saem do estado sem evento"""
+        index = GridIndex(fences, self.cell_deg)
+        with self._lock:
+            self.fences = {f.id: f for f in fences}
+            self.index = index
+            self.inside &= set(self.fences)
+            self._pending = {i: n for i, n in self._pending.items() if i in self.fences}
+
+    def restore(self, inside_ids):
+        """Estado salvo (cars/{id}.insideGeofences): transições após reiniciar o gateway"""
+        with self._lock:
+            self.inside = {i for i in inside_ids if i in self.fences}
+            self._pending.clear()
+            self.initialized = True
+
+    def check(self, lat, lon):
+        """Avalia um fix; devolve [(EVENT_ENTER|EVENT_EXIT, cerca), ...]"""
+        with self._lock:
+            return self._check(lat, lon)
+
+    def _check(self, lat, lon):
+        self.stats['checks'] += 1
+        candidates = self.index.candidates(lat, lon)
+        self.stats['tests'] += len(candidates)
+        current = {f.id for f in candidates if f.contains(lat, lon)}
+
+        if not self.initialized:
+            # Sem estado salvo: o primeiro fix define onde o carro está, sem eventos
+            self.inside = current
+            self.initialized = True
+            return []
+
+        events = []
+        for fence_id in current ^ self.inside:
+            count = self._pending.get(fence_id, 0) + 1
+            if count < self.confirm:
+                self._pending[fence_id] = count
+                continue
+            self._pending.pop(fence_id, None)
+            if fence_id in current:
+                self.inside.add(fence_id)
+                events.append((EVENT_ENTER, self.fences[fence_id]))
+            else:
+                self.inside.discard(fence_id)
+                events.append((EVENT_EXIT, self.fences[fence_id]))
+            self.stats[events[-1][0]] += 1
+        # Voltou ao estado atual antes de confirmar: zera a contagem
+        for fence_id in [i for i in self._pending if (i in current) == (i in self.inside)]:
+            del self._pending[fence_id]
+        return events
@@ -0,0 +1,208 @@
+# python-server/gps_thinning.py
+"""
+Afinamento (thinning) dos fixes GPS antes do upload.
+
+Com o carro parado o NEO-6M continua mandando fixes que só variam na sexta
+casa decimal; cada um virava um documento em gps_locations. O GpsThinner
+decide quais fixes valem uma gravação:
+
+- dead-band: descarta fixes a menos de `dead_band_m` metros do último gravado
+  (com um keepalive a cada `max_interval_s` para o carro parado);
+- intervalo mínimo: no máximo um fix a cada `min_interval_s`, exceto quando
+  a direção muda mais que `heading_change_deg`;
+- Douglas-Peucker: com `dp_tolerance_m > 0` os fixes aprovados ficam num
+  segmento e só os pontos que definem a forma do trajeto são gravados.
+
+Fixes forçados (primeiro fix, mudança de ignição, modo roubado) ignoram
+todos os filtros e esvaziam o segmento pendente.
+"""
+
+import math
+
+EARTH_RADIUS_M = 6371000.0
+
+DEFAULT_THINNING = {
+    'dead_band_m': 15.0,       # distância mínima do último fix gravado
+    'min_interval_s': 0.0,     # intervalo mínimo entre gravações (0 = desligado)
+    'max_interval_s': 300.0,   # keepalive: grava mesmo parado após esse tempo
+    'heading_change_deg': 30.0,  # curva que fura o intervalo mínimo
+    'dp_tolerance_m': 0.0,     # tolerância Douglas-Peucker (0 = sem buffer)
+    'dp_max_points': 20,       # tamanho máximo do segmento antes de simplificar
+    'dp_max_age_s': 60.0,      # idade máxima do segmento antes de simplificar
+}
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distância em metros entre duas coordenadas"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    """Direção (0-360°) de (lat1, lon1) para (lat2, lon2)"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dl = math.radians(lon2 - lon1)
+    x = math.sin(dl) * math.cos(p2)
+    y = math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dl)
+    return (math.degrees(math.atan2(x, y)) + 360.0) % 360.0
+
+
+def heading_delta(h1, h2):
+    """Menor diferença angular entre duas direções"""
+    d = abs(h1 - h2) % 360.0
+    return 360.0 - d if d > 180.0 else d
+
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Índices dos pontos mantidos pelo Douglas-Peucker.
+    `points` é uma lista de (lat, lon); usa projeção equiretangular local.
+    """
+    n = len(points)
+    if n <= 2 or tolerance_m <= 0:
+        return list(range(n))
+
+    lat0 = math.radians(points[0][0])
+    k = math.cos(lat0)
+    xy = [(math.radians(lon) * k * EARTH_RADIUS_M, math.radians(lat) * EARTH_RADIUS_M)
+          for lat, lon in points]
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = xy[first]
+        x2, y2 = xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        seg_len2 = dx * dx + dy * dy
+
+        max_dist, index = 0.0, first
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if seg_len2 == 0:
+                dist = math.hypot(px - x1, py - y1)
+            else:
+                t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / seg_len2))
+                dist = math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+            if dist > max_dist:
+                max_dist, index = dist, i
+
+        if max_dist > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [i for i in range(n) if keep[i]]
+
+
+class GpsThinner:
+    """Filtro de fixes por veículo; offer() devolve os fixes a gravar agora"""
+
+    def __init__(self, **config):
+        unknown = set(config) - set(DEFAULT_THINNING)
+        if unknown:
+            raise ValueError(f"Parâmetros de thinning desconhecidos: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULT_THINNING, **config)
+
+        self.last_kept = None      # (lat, lon, t) do último fix aprovado
+        self.last_heading = None
+        self.last_raw = None       # (lat, lon, t) do último fix recebido
+        self.segment = []          # fixes aprovados aguardando Douglas-Peucker
+        self.stats = {
+            'received': 0,
+            'kept': 0,
+            'forced': 0,
+            'dropped_dead_band': 0,
+            'dropped_interval': 0,
+            'dropped_douglas_peucker': 0,
+        }
+
+    def dropped(self):
+        """Total de fixes descartados pelo filtro"""
+        s = self.stats
+        return s['dropped_dead_band'] + s['dropped_interval'] + s['dropped_douglas_peucker']
+
+    def offer(self, fix, t, force=False):
+        """
+        Recebe um fix válido (GpsRecord) recebido no instante `t`.
+        Preenche speed (km/h) e heading (graus) e devolve a lista de fixes
+        que devem ser gravados agora (pode ser vazia).
+        """
+        cfg = self.config
+        lat, lon = fix.lat, fix.lon
+        self.stats['received'] += 1
+
+        # Velocidade e direção em relação ao fix anterior
+        if self.last_raw is not None:
+            plat, plon, pt = self.last_raw
+            dist = haversine_m(plat, plon, lat, lon)
+            if t > pt:
+                fix.speed = round(dist / (t - pt) * 3.6, 1)
+            if dist > 0:
+                fix.heading = round(bearing_deg(plat, plon, lat, lon), 1)
+        self.last_raw = (lat, lon, t)
+
+        if force or self.last_kept is None:
+            self.stats['forced'] += 1
+            out = self._flush_segment()
+            self._accept(fix, t)
+            out.append(fix)
+            return out
+
+        klat, klon, kt = self.last_kept
+        elapsed = t - kt
+        moved = haversine_m(klat, klon, lat, lon)
+
+        if moved < cfg['dead_band_m'] and elapsed < cfg['max_interval_s']:
+            self.stats['dropped_dead_band'] += 1
+            return self._maybe_flush(t)
+
+        heading = bearing_deg(klat, klon, lat, lon) if moved > 0 else self.last_heading
+        if elapsed < cfg['min_interval_s']:
+            turned = (heading is not None and self.last_heading is not None and
+                      heading_delta(heading, self.last_heading) >= cfg['heading_change_deg'])
+            if not turned:
+                self.stats['dropped_interval'] += 1
+                return self._maybe_flush(t)
+
+        self._accept(fix, t, heading)
+
+        if cfg['dp_tolerance_m'] <= 0:
+            self.stats['kept'] += 1
+            return [fix]
+
+        self.segment.append((fix, t))
+        return self._maybe_flush(t)
+
+    def flush(self):
+        """Esvazia o segmento pendente (ex.: ao encerrar o gateway)"""
+        return self._flush_segment()
+
+    # Internos ----------------------------------------------------------------
+
+    def _accept(self, fix, t, heading=None):
+        self.last_kept = (fix.lat, fix.lon, t)
+        if heading is not None:
+            self.last_heading = heading
+
+    def _maybe_flush(self, t):
+        cfg = self.config
+        if self.segment and (len(self.segment) >= cfg['dp_max_points'] or
+                             t - self.segment[0][1] >= cfg['dp_max_age_s']):
+            return self._flush_segment()
+        return []
+
+    def _flush_segment(self):
+        if not self.segment:
+            return []
+        points = [(f.lat, f.lon) for f, _ in self.segment]
+        keep = douglas_peucker(points, self.config['dp_tolerance_m'])
+        out = [self.segment[i][0] for i in keep]
+        self.stats['kept'] += len(out)
+        self.stats['dropped_douglas_peucker'] += len(self.segment) - len(out)
+        self.segment = []
+        return out
@@ -0,0 +1,228 @@
+# python-server/health.py
+"""
+Rollups de saúde do dispositivo a partir dos heartbeats e registros gps.
+
+O heartbeat só aparecia no console e reescrevia o status do GPS; reinícios
+do Arduino, relé oscilando ou GPS piorando passavam despercebidos. O
+DeviceHealth mantém, para cada resolução (minuto, hora, dia, em UTC), o
+balde em andamento com contadores somados a cada registro, O(1):
+
+- heartbeats, reinícios (uptime voltou para trás), comandos recebidos pelo
+  Arduino no balde (diferença do contador `commands`, que zera no reinício),
+  trocas do relé, heartbeats com o relé ligado e com o GPS fixado, menor
+  RAM livre, maior intervalo entre heartbeats e maior uptime;
+- leituras gps, fixes válidos e aceitos (fixRatio = válidos / leituras) e a
+  distribuição de satélites (0..12, o último é 12 ou mais).
+
+Quando um registro cai no balde seguinte (ou o timer vê a hora passar do
+fim do balde), o balde fechado sai uma única vez e vira um documento em
+device_health/{carId}_{resolução}_{início}. Ao parar, os baldes abertos
+são gravados com complete=False; ao iniciar no mesmo balde, o gateway lê
+esse documento e continua a contagem de onde parou (restore()).
+"""
+
+from datetime import datetime, timezone
+from threading import Lock
+
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+_LABELS = {'minute': '%Y-%m-%dT%H:%M', 'hour': '%Y-%m-%dT%H', 'day': '%Y-%m-%d'}
+MAX_SATS = 12
+UPTIME_WRAP_MS = 2 ** 32  # millis() do Arduino volta a zero em ~49,7 dias
+
+_ON = ('ligado', '1')      # rele no JSON / CSV
+_FIXED = ('fixed', '1')    # gpsStatus no JSON / CSV
+
+
+def bucket_start(resolution, t):
+    width = RESOLUTIONS[resolution]
+    return int(t // width) * width
+
+
+def bucket_id(car_id, resolution, start):
+    label = datetime.fromtimestamp(start, timezone.utc).strftime(_LABELS[resolution])
+    return f"{car_id}_{resolution}_{label}"
+
+
+class HealthBucket:
+    """Contadores de um intervalo [start, end) de uma resolução"""
+    __slots__ = ('resolution', 'start', 'end', 'complete', 'heartbeats', 'reboots', 'commands',
+                 'relay_changes', 'relay_on', 'gps_fixed', 'free_ram_min', 'gap_max', 'uptime_max',
+                 'gps_reads', 'valid', 'accepted', 'sat_sum', 'sats')
+
+    def __init__(self, resolution, start):
+        self.resolution = resolution
+        self.start = start
+        self.end = start + RESOLUTIONS[resolution]
+        self.complete = True
+        self.heartbeats = 0
+        self.reboots = 0
+        self.commands = 0
+        self.relay_changes = 0
+        self.relay_on = 0
+        self.gps_fixed = 0
+        self.free_ram_min = None
+        self.gap_max = 0.0
+        self.uptime_max = 0.0
+        self.gps_reads = 0
+        self.valid = 0
+        self.accepted = 0
+        self.sat_sum = 0
+        self.sats = [0] * (MAX_SATS + 1)
+
+    def to_document(self, car_id, user_id, last):
+        reads = self.gps_reads
+        return {
+            'carId': car_id,
+            'userId': user_id,
+            'resolution': self.resolution,
+            'start': datetime.fromtimestamp(self.start, timezone.utc),
+            'end': datetime.fromtimestamp(self.end, timezone.utc),
+            'complete': self.complete,
+            'heartbeats': self.heartbeats,
+            'reboots': self.reboots,
+            'commands': self.commands,
+            'relayChanges': self.relay_changes,
+            'relayOnHeartbeats': self.relay_on,
+            'gpsFixedHeartbeats': self.gps_fixed,
+            'freeRamMin': self.free_ram_min,
+            'heartbeatGapMaxS': round(self.gap_max, 1),
+            'uptimeMaxS': round(self.uptime_max),
+            'gpsReads': reads,
+            'validFixes': self.valid,
+            'acceptedFixes': self.accepted,
+            'fixRatio': round(self.valid / reads, 3) if reads else None,
+            'satellitesAvg': round(self.sat_sum / reads, 2) if reads else None,
+            'satellites': list(self.sats),
+            # Último heartbeat visto: detecta reinícios ocorridos com o gateway parado
+            'last': dict(last) if last else None,
+        }
+
+    @classmethod
+    def from_document(cls, resolution, start, data):
+        bucket = cls(resolution, start)
+        bucket.heartbeats = data.get('heartbeats', 0)
+        bucket.reboots = data.get('reboots', 0)
+        bucket.commands = data.get('commands', 0)
+        bucket.relay_changes = data.get('relayChanges', 0)
+        bucket.relay_on = data.get('relayOnHeartbeats', 0)
+        bucket.gps_fixed = data.get('gpsFixedHeartbeats', 0)
+        bucket.free_ram_min = data.get('freeRamMin')
+        bucket.gap_max = data.get('heartbeatGapMaxS', 0.0)
+        bucket.uptime_max = data.get('uptimeMaxS', 0.0)
+        bucket.gps_reads = data.get('gpsReads', 0)
+        bucket.valid = data.get('validFixes', 0)
+        bucket.accepted = data.get('acceptedFixes', 0)
+        bucket.sat_sum = round((data.get('satellitesAvg') or 0) * bucket.gps_reads)
+        sats = data.get('satellites') or []
+        bucket.sats = [int(sats[i]) if i < len(sats) else 0 for i in range(MAX_SATS + 1)]
+        return bucket
+
+
+class DeviceHealth:
+    """Baldes abertos de um veículo; gps()/heartbeat()/expire() devolvem os fechados"""
+
+    def __init__(self, car_id, resolutions=('minute', 'hour', 'day')):
+        unknown = set(resolutions) - set(RESOLUTIONS)
+        if unknown:
+            raise ValueError(f"Resoluções de saúde desconhecidas: {', '.join(sorted(unknown))}")
+        self.car_id = car_id
+        self.resolutions = tuple(resolutions)
+        self.buckets = dict.fromkeys(self.resolutions)
+        self.last = None  # {'t', 'uptimeMs', 'commands', 'rele'} do último heartbeat
+        self._lock = Lock()
+        self.stats = {'heartbeats': 0, 'gps': 0, 'reboots': 0, 'restored': 0}
+        self.stats.update((f'closed_{r}', 0) for r in self.resolutions)
+
+    def gps(self, t, sats, valid, accepted):
+        """Registro gps recebido no instante `t`"""
+        with self._lock:
+            self.stats['gps'] += 1
+            closed = self._advance(t)
+            sat = min(max(int(sats), 0), MAX_SATS)
+            for bucket in self.buckets.values():
+                bucket.gps_reads += 1
+                bucket.valid += bool(valid)
+                bucket.accepted += bool(accepted)
+                bucket.sat_sum += sats
+                bucket.sats[sat] += 1
+            return closed
+
+    def heartbeat(self, t, record):
+        """HeartbeatRecord recebido no instante `t`"""
+        with self._lock:
+            self.stats['heartbeats'] += 1
+            closed = self._advance(t)
+            last = self.last
+            uptime, commands = record.uptime, record.commands
+            rebooted = False
+            gap = 0.0
+            command_delta = 0
+            relay_changed = False
+            if last is not None:
+                gap = t - last['t']
+                # Uptime para trás é reinício, a não ser que seja a volta do millis()
+                rebooted = uptime < last['uptimeMs'] and last['uptimeMs'] - uptime < UPTIME_WRAP_MS - 86400000
+                command_delta = commands if rebooted else max(0, commands - last['commands'])
+                relay_changed = record.rele != last['rele']
+            self.stats['reboots'] += rebooted
+            relay_on = record.rele in _ON
+            gps_fixed = record.gps_status in _FIXED
+            for bucket in self.buckets.values():
+                bucket.heartbeats += 1
+                bucket.reboots += rebooted
+                bucket.commands += command_delta
+                bucket.relay_changes += relay_changed
+                bucket.relay_on += relay_on
+                bucket.gps_fixed += gps_fixed
+                if bucket.free_ram_min is None or record.free_ram < bucket.free_ram_min:
+                    bucket.free_ram_min = record.free_ram
+                if gap > bucket.gap_max:
+                    bucket.gap_max = gap
+                if uptime / 1000 > bucket.uptime_max:
+                    bucket.uptime_max = uptime / 1000
+            self.last = {'t': t, 'uptimeMs': uptime, 'commands': commands, 'rele': record.rele}
+            return closed
+
+    def expire(self, now):
+        """Fecha os baldes cujo fim já passou (o veículo parou de mandar registros)"""
+        with self._lock:
+            closed = []
+            for resolution, bucket in self.buckets.items():
+                if bucket is not None and now >= bucket.end:
+                    closed.append(bucket)
+                    self.buckets[resolution] = None
+                    self.stats[f'closed_{resolution}'] += 1
+            return closed
+
+    def close(self):
+        """Baldes abertos, marcados como incompletos (ex.: ao parar o gateway)"""
+        with self._lock:
+            open_buckets = [b for b in self.buckets.values() if b is not None]
+            for bucket in open_buckets:
+                bucket.complete = False
+            self.buckets = dict.fromkeys(self.resolutions)
+            return open_buckets
+
+    def restore(self, resolution, start, data):
+        """Retoma um balde gravado incompleto (mesmo intervalo) e o último heartbeat"""
+        with self._lock:
+            if self.buckets.get(resolution, False) is not None or data.get('complete', True):
+                return False
+            self.buckets[resolution] = HealthBucket.from_document(resolution, start, data)
+            last = data.get('last')
+            if last and (self.last is None or last.get('t', 0) > self.last['t']):
+                self.last = last
+            self.stats['restored'] += 1
+            return True
+
+    def _advance(self, t):
+        """Abre o balde de `t` em cada resolução; devolve os que fecharam"""
+        closed = []
+        for resolution, bucket in self.buckets.items():
+            if bucket is not None and t < bucket.end:
+                continue  # registro atrasado de um balde anterior conta no atual
+            if bucket is not None:
+                closed.append(bucket)
+                self.stats[f'closed_{resolution}'] += 1
+            self.buckets[resolution] = HealthBucket(resolution, bucket_start(resolution, t))
+        return closed
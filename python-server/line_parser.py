@@ -0,0 +1,248 @@
+# python-server/line_parser.py
+"""
+Parser do protocolo de linhas do Arduino.
+
+O Nano sempre envia `gps` e `heartbeat` com as mesmas chaves na mesma ordem
+(veja enviarDadosGPS/enviarHeartbeat em arduino/codigo_base_nano.cpp). Para
+esses formatos há um caminho rápido: uma regex ancorada confere o formato e
+captura os valores pela posição; qualquer linha fora do formato cai no
+json.loads completo.
+
+Os registros saem como objetos com __slots__ (GpsRecord, HeartbeatRecord,
+Record) em vez de dicts. Também existe o enquadramento CSV compacto
+(`G,...` / `H,...`), ativado pelo gateway com o comando FRAMING_CSV logo após
+o TRACKCAR_READY.
+"""
+
+import json
+import re
+
+FRAMING_JSON = 'json'
+FRAMING_CSV = 'csv'
+
+
+class GpsRecord:
+    """Registro `gps` do Arduino (+ campos calculados pelo gateway)"""
+    __slots__ = ('lat', 'lon', 'sats', 'age', 'ignition_state', 'valid', 'uptime',
+                 'valid_count', 'total_reads', 'gps_init', 'gps_time',
+                 'hdop', 'received_at', 'speed', 'heading', 'quality')
+    type = 'gps'
+
+    def __init__(self, lat=0.0, lon=0.0, sats=0, age=999999, ignition_state=None,
+                 valid=False, uptime=0, valid_count=0, total_reads=0, gps_init=False,
+                 gps_time=None, hdop=None):
+        self.lat = lat
+        self.lon = lon
+        self.sats = sats
+        self.age = age
+        self.ignition_state = ignition_state
+        self.valid = valid
+        self.uptime = uptime
+        self.valid_count = valid_count
+        self.total_reads = total_reads
+        self.gps_init = gps_init
+        self.gps_time = gps_time
+        self.hdop = hdop  # só no JSON completo (o firmware atual não manda)
+        self.received_at = 0.0
+        self.speed = None
+        self.heading = None
+        self.quality = None  # nota 0..1 do FixQualityFilter
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            lat=data.get('lat', 0), lon=data.get('lon', 0), sats=data.get('sats', 0),
+            age=data.get('age', 999999), ignition_state=data.get('ignitionState'),
+            valid=data.get('valid', False), uptime=data.get('uptime', 0),
+            valid_count=data.get('validCount', 0), total_reads=data.get('totalReads', 0),
+            gps_init=data.get('gpsInit', False), gps_time=data.get('gpsTime'),
+            hdop=data.get('hdop')
+        )
+
+
+class HeartbeatRecord:
+    """Registro `heartbeat` do Arduino"""
+    __slots__ = ('uptime', 'commands', 'rele', 'rele_led', 'free_ram', 'gps_status',
+                 'valid_gps', 'last_valid')
+    type = 'heartbeat'
+
+    def __init__(self, uptime=0, commands=0, rele='unknown', rele_led=None, free_ram=0,
+                 gps_status='unknown', valid_gps=0, last_valid=999):
+        self.uptime = uptime
+        self.commands = commands
+        self.rele = rele
+        self.rele_led = rele_led
+        self.free_ram = free_ram
+        self.gps_status = gps_status
+        self.valid_gps = valid_gps
+        self.last_valid = last_valid
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            uptime=data.get('uptime', 0), commands=data.get('commands', 0),
+            rele=data.get('rele', 'unknown'), rele_led=data.get('releLED'),
+            free_ram=data.get('freeRam', 0), gps_status=data.get('gpsStatus', 'unknown'),
+            valid_gps=data.get('validGPS', 0), last_valid=data.get('lastValid', 999)
+        )
+
+
+class Record:
+    """Demais tipos (ack, debug, error, system, status...) com o dict original"""
+    __slots__ = ('type', 'data')
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class ReadyRecord:
+    """Banner TRACKCAR_READY enviado pelo Arduino ao iniciar"""
+    __slots__ = ('banner',)
+    type = 'ready'
+
+    def __init__(self, banner):
+        self.banner = banner
+
+
+class ParseError(ValueError):
+    """Linha que não é JSON nem CSV conhecido"""
+
+
+# ==============================================================================
+# CAMINHO RÁPIDO (formato fixo do firmware)
+# ==============================================================================
+
+# Uma regex ancorada confere o formato inteiro e captura os valores de uma vez
+_GPS_RE = re.compile(
+    r'\{"type":"gps","lat":(-?[0-9.]+),"lon":(-?[0-9.]+),"sats":(\d+),"age":(\d+),'
+    r'"ignitionState":"(\w*)","valid":(true|false),"uptime":(\d+),"validCount":(\d+),'
+    r'"totalReads":(\d+),"gpsInit":(true|false)(?:,"gpsTime":"([^"]*)")?\}'
+).fullmatch
+_HEARTBEAT_RE = re.compile(
+    r'\{"type":"heartbeat","uptime":(\d+),"commands":(\d+),"rele":"(\w*)","releLED":"(\w*)",'
+    r'"freeRam":(\d+),"gpsStatus":"(\w*)","validGPS":(\d+),"lastValid":(\d+)\}'
+).fullmatch
+
+
+def parse_gps_fast(line):
+    """Registro gps no formato exato do firmware, ou None"""
+    m = _GPS_RE(line)
+    if m is None:
+        return None
+    lat, lon, sats, age, ign, valid, uptime, valid_count, total_reads, gps_init, gps_time = m.groups()
+    try:
+        return GpsRecord(
+            float(lat), float(lon), int(sats), int(age), ign, valid == 'true', int(uptime),
+            int(valid_count), int(total_reads), gps_init == 'true', gps_time
+        )
+    except ValueError:  # ex.: "1.2.3" passa na regex mas não é float
+        return None
+
+
+def parse_heartbeat_fast(line):
+    """Registro heartbeat no formato exato do firmware, ou None"""
+    m = _HEARTBEAT_RE(line)
+    if m is None:
+        return None
+    uptime, commands, rele, rele_led, free_ram, gps_status, valid_gps, last_valid = m.groups()
+    return HeartbeatRecord(
+        int(uptime), int(commands), rele, rele_led, int(free_ram),
+        gps_status, int(valid_gps), int(last_valid)
+    )
+
+
+def parse_csv(line):
+    """
+    Enquadramento compacto:
+        G,lat,lon,sats,age,ign(1/0),valid(1/0),uptime,validCount,totalReads,gpsInit(1/0)[,gpsTime]
+        H,uptime,commands,rele(1/0),freeRam,gpsInit(1/0),validGPS,lastValid
+    """
+    p = line.split(',')
+    try:
+        if p[0] == 'G' and len(p) in (11, 12):
+            return GpsRecord(
+                float(p[1]), float(p[2]), int(p[3]), int(p[4]),
+                'on' if p[5] == '1' else 'off', p[6] == '1', int(p[7]), int(p[8]),
+                int(p[9]), p[10] == '1', p[11] if len(p) == 12 else None
+            )
+        if p[0] == 'H' and len(p) == 8:
+            rele = p[3] == '1'
+            return HeartbeatRecord(
+                int(p[1]), int(p[2]), 'ligado' if rele else 'desligado',
+                'aceso' if rele else 'apagado', int(p[4]),
+                'fixed' if p[5] == '1' else 'searching', int(p[6]), int(p[7])
+            )
+    except ValueError:
+        pass
+    raise ParseError(f"Linha CSV inválida: {line}")
+
+
+def parse_json(line):
+    """Caminho completo: json.loads e conversão para registro"""
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ParseError(str(e)) from e
+    if not isinstance(data, dict):
+        raise ParseError(f"JSON não é objeto: {line}")
+    data_type = data.get('type', 'unknown')
+    if data_type == 'gps':
+        return GpsRecord.from_dict(data)
+    if data_type == 'heartbeat':
+        return HeartbeatRecord.from_dict(data)
+    return Record(data_type, data)
+
+
+class LineParser:
+    """
+    Parser plugável: caminho rápido para gps/heartbeat, CSV quando negociado,
+    e json.loads como fallback. Conta quantas linhas usaram cada caminho.
+    """
+
+    def __init__(self, fast=True):
+        self.fast = fast
+        self.stats = {'fast': 0, 'csv': 0, 'json': 0, 'errors': 0}
+
+    def parse(self, line):
+        """Converte uma linha em registro; None para linha vazia"""
+        if not line:
+            return None
+
+        first = line[0]
+        if first == '{':
+            if self.fast:
+                if line.startswith('{"type":"gps"'):
+                    record = parse_gps_fast(line)
+                elif line.startswith('{"type":"heartbeat"'):
+                    record = parse_heartbeat_fast(line)
+                else:
+                    record = None
+                if record is not None:
+                    self.stats['fast'] += 1
+                    return record
+            try:
+                record = parse_json(line)
+            except ParseError:
+                self.stats['errors'] += 1
+                raise
+            self.stats['json'] += 1
+            return record
+
+        if (first == 'G' or first == 'H') and line[1:2] == ',':
+            try:
+                record = parse_csv(line)
+            except ParseError:
+                self.stats['errors'] += 1
+                raise
+            self.stats['csv'] += 1
+            return record
+
+        if line.startswith("TRACKCAR_READY"):
+            return ReadyRecord(line)
+
+        self.stats['errors'] += 1
+        raise ParseError(f"Linha não reconhecida: {line}")
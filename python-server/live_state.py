@@ -0,0 +1,238 @@
+# python-server/live_state.py
+"""
+Estado mais recente de cada veículo, servido localmente (HTTP + SSE).
+
+A posição ao vivo só chegava aos painéis por listeners em cars/{id}: uma
+leitura do Firestore por atualização e por espectador, mais a ida e volta
+à nuvem. O LiveState guarda na memória do gateway o último estado de cada
+carro (posição, gpsStatus, ignição, relé, serial), atualizado pelas
+sessões a cada registro, e o LiveServer expõe:
+
+    GET /cars              {"seq": N, "cars": {carId: estado}}
+    GET /cars/<carId>      estado de um carro (404 se ainda não há)
+    GET /stream            Server-Sent Events; ?car=ID (repetível) filtra e
+                           ?interval=0.5 junta as atualizações em lotes de
+                           0,5 s (padrão 0,1 s; 0 = cada atualização)
+
+Não há fila por cliente. Cada atualização troca o estado do carro por um
+novo (com `seq` global crescente e o JSON já codificado uma única vez) e
+acorda os clientes; cada um envia só os carros com `seq` maior que o último
+que ele viu. Um cliente lento recebe menos eventos, sempre os mais novos
+(coalescência), e a memória não cresce com ele. O lote padrão de 0,1 s
+mantém todos os fixes até 10 Hz por carro e poupa acordar centenas de
+threads a cada registro; quem não consome nada por
+`WRITE_TIMEOUT` segundos é desconectado sem atrasar os outros.
+"""
+
+import json
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from urllib.parse import parse_qs, urlsplit
+
+KEEPALIVE_INTERVAL = 15  # comentário SSE para detectar clientes mortos
+WRITE_TIMEOUT = 10       # cliente que não lê por esse tempo é desconectado
+MAX_CLIENTS = 500        # além disso o /stream responde 503
+DEFAULT_INTERVAL = 0.1   # janela de lote padrão do /stream (s)
+STREAM_SNDBUF = 65536    # buffer do kernel por cliente: além disso o atraso vira coalescência
+LISTEN_BACKLOG = 128     # conexões esperando accept() (rajada de painéis reconectando)
+
+
+class _Entry:
+    """Estado publicado de um carro: imutável depois de criado"""
+    __slots__ = ('seq', 'state', 'event')
+
+    def __init__(self, seq, state):
+        self.seq = seq
+        self.state = state
+        # Evento SSE pronto: codificado uma vez, enviado a todos os clientes
+        payload = json.dumps(state, separators=(',', ':'), default=str).encode('utf-8')
+        self.event = b'id: %d\nevent: state\ndata: %s\n\n' % (seq, payload)
+
+
+class LiveState:
+    """Tabela carId → último estado; update() é chamado pelas sessões"""
+
+    def __init__(self):
+        self._cond = Condition()
+        self._cars = {}
+        self.seq = 0
+        self.closed = False
+        self.stats = {'updates': 0, 'clients': 0, 'connected': 0, 'events': 0, 'dropped': 0, 'rejected': 0}
+
+    def update(self, car_id, fields):
+        """Mescla `fields` no estado do carro e acorda os assinantes"""
+        with self._cond:
+            previous = self._cars.get(car_id)
+            state = dict(previous.state) if previous is not None else {'carId': car_id}
+            state.update(fields)
+            self.seq += 1
+            state['seq'] = self.seq
+            state['updatedAt'] = time.time()
+            self._cars[car_id] = _Entry(self.seq, state)
+            self.stats['updates'] += 1
+            self._cond.notify_all()
+
+    def snapshot(self, car_id=None):
+        """Cópia do estado de um carro (ou None) ou de todos: {'seq', 'cars'}"""
+        with self._cond:
+            if car_id is not None:
+                entry = self._cars.get(car_id)
+                return dict(entry.state) if entry is not None else None
+            return {'seq': self.seq, 'cars': {c: dict(e.state) for c, e in self._cars.items()}}
+
+    def wait_changes(self, since, cars=None, timeout=None):
+        """
+        Bloqueia até haver estado com seq > `since` (dos `cars`, se dado) ou
+        até o timeout. Devolve (seq visto, [evento SSE]) em ordem de seq;
+        mudanças de outros carros não acordam um stream filtrado.
+        """
+        def entries():
+            return self._cars.values() if cars is None else (self._cars.get(c) for c in cars)
+
+        def ready():
+            if self.closed:
+                return True
+            if self.seq <= since:
+                return False
+            return cars is None or any(e is not None and e.seq > since for e in entries())
+
+        with self._cond:
+            self._cond.wait_for(ready, timeout)
+            seq = self.seq
+            changed = sorted((e for e in entries() if e is not None and e.seq > since), key=lambda e: e.seq)
+            self.stats['events'] += len(changed)
+        return seq, [e.event for e in changed]
+
+    def connect(self, max_clients):
+        """Reserva uma vaga de stream; False se já há `max_clients`"""
+        with self._cond:
+            if self.stats['connected'] >= max_clients:
+                self.stats['rejected'] += 1
+                return False
+            self.stats['connected'] += 1
+            self.stats['clients'] += 1
+            return True
+
+    def disconnect(self, dropped=False):
+        with self._cond:
+            self.stats['connected'] -= 1
+            self.stats['dropped'] += dropped
+
+    def close(self):
+        """Encerra os streams abertos"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Lidos no construtor (listen() em server_activate): atribuir depois não tem efeito
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class LiveServer:
+    """Servidor HTTP local do LiveState (snapshot e SSE)"""
+
+    def __init__(self, live, host='127.0.0.1', port=9109, max_clients=MAX_CLIENTS):
+        self.live = live
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        live = self.live
+        max_clients = self.max_clients
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                if url.path == '/cars':
+                    self._json(live.snapshot())
+                elif url.path.startswith('/cars/'):
+                    state = live.snapshot(url.path[len('/cars/'):])
+                    if state is None:
+                        self.send_error(404)
+                    else:
+                        self._json(state)
+                elif url.path == '/stream':
+                    self._stream(query.get('car') or None, query)
+                else:
+                    self.send_error(404)
+
+            def _json(self, data):
+                body = json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, cars, query):
+                try:
+                    interval = max(0.0, float(query.get('interval', [DEFAULT_INTERVAL])[0]))
+                except ValueError:
+                    self.send_error(400, "interval inválido")
+                    return
+                if not live.connect(max_clients):
+                    self.send_error(503, "Limite de clientes do stream atingido")
+                    return
+                self.close_connection = True
+                self.connection.settimeout(WRITE_TIMEOUT)
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_SNDBUF)
+                dropped = False
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.send_header('Access-Control-Allow-Origin', '*')
+                    self.end_headers()
+                    self._follow(cars, interval)
+                except OSError:  # cliente saiu ou parou de ler (timeout)
+                    dropped = True
+                finally:
+                    live.disconnect(dropped)
+
+            def _follow(self, cars, interval):
+                since = 0  # primeiro lote: estado atual de todos os carros
+                written = time.monotonic()
+                while not live.closed:
+                    started = time.monotonic()
+                    seq, changed = live.wait_changes(since, cars, max(0.0, written + KEEPALIVE_INTERVAL - started))
+                    if changed:
+                        self.wfile.write(b''.join(changed))
+                    elif time.monotonic() - written >= KEEPALIVE_INTERVAL:
+                        # Só uma escrita descobre que o cliente foi embora
+                        self.wfile.write(b': ping\n\n')
+                    else:
+                        since = seq
+                        continue
+                    self.wfile.flush()
+                    written = time.monotonic()
+                    since = seq
+                    if interval:
+                        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+            def log_message(self, format, *args):
+                pass  # sem log de acesso no console do gateway
+
+        self._httpd = _HTTPServer((self.host, self.port), Handler)
+        self.port = self._httpd.server_address[1]
+        self._thread = Thread(target=self._httpd.serve_forever, name='live-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.live.close()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
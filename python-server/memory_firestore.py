@@ -0,0 +1,381 @@
+# python-server/memory_firestore.py
+"""
+Firestore em memória para benchmarks e simulações sem rede.
+
+Implementa apenas o subconjunto da API do firebase_admin usado pelo gateway:
+collection/document, get/set/update/add, WriteBatch, consultas com where()
+e on_snapshot (documento ou consulta). Pode simular latência de round trip e
+queda do backend (atributo `offline`).
+"""
+
+import itertools
+import operator
+import time
+import uuid
+from collections import deque
+from enum import Enum
+from datetime import datetime, timezone
+from threading import Condition, Lock, Thread
+
+
+class BackendOffline(ConnectionError):
+    """Levantada em qualquer operação enquanto o backend está 'fora do ar'"""
+
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:  # SDK ausente: o benchmark ainda roda
+    NotFound = KeyError
+
+
+def _is_sentinel(value):
+    # firestore.SERVER_TIMESTAMP, sem importar o SDK
+    return type(value).__name__ == 'Sentinel'
+
+
+def _resolve(value):
+    if _is_sentinel(value):
+        return datetime.now(timezone.utc)
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    return value
+
+
+class ChangeType(Enum):
+    """Mesmos nomes do google.cloud.firestore_v1.watch.ChangeType"""
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class MemoryChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda field, values: field in values,
+    'not-in': lambda field, values: field not in values,
+    'array-contains': lambda field, value: isinstance(field, list) and value in field,
+}
+
+
+def _field(data, path):
+    value = data
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+class MemorySnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return _field(self._data or {}, field)
+
+
+class MemoryWatch:
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+
+    def unsubscribe(self):
+        self._store._unwatch(self._key, self)
+
+
+class MemoryDocumentRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return MemoryCollection(self._store, f"{self.path}/{name}")
+
+    def get(self):
+        self._store._round_trip()
+        return MemorySnapshot(self, self._store._read(self.path))
+
+    def set(self, data, merge=False):
+        self._store._round_trip()
+        self._store._apply([('set', self.path, data, merge)])
+
+    def update(self, data):
+        self._store._round_trip()
+        self._store._apply([('update', self.path, data, None)])
+
+    def delete(self):
+        self._store._round_trip()
+        self._store._apply([('delete', self.path, None, None)])
+
+    def on_snapshot(self, callback):
+        return self._store._watch(self.path, callback)
+
+
+class MemoryCollection:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id=None):
+        return MemoryDocumentRef(self._store, f"{self.path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        return MemoryQuery(self._store, self.path).where(field_path, op_string, value, filter=filter)
+
+    def stream(self):
+        return MemoryQuery(self._store, self.path).stream()
+
+    def on_snapshot(self, callback):
+        return MemoryQuery(self._store, self.path).on_snapshot(callback)
+
+
+class MemoryQuery:
+    """Consulta com filtros de igualdade/comparação numa coleção"""
+
+    def __init__(self, store, path, filters=()):
+        self._store = store
+        self.path = path
+        self._filters = filters
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:  # FieldFilter do SDK
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return MemoryQuery(self._store, self.path,
+                           self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def contains(self, path):
+        prefix = self.path + '/'
+        return path.startswith(prefix) and '/' not in path[len(prefix):]
+
+    def matches(self, data):
+        for field_path, op, value in self._filters:
+            field = _field(data, field_path)
+            if field is None or not op(field, value):
+                return False
+        return True
+
+    def stream(self):
+        with self._store._lock:
+            items = [(p, dict(d)) for p, d in self._store.docs.items()
+                     if self.contains(p) and self.matches(d)]
+        for path, data in items:
+            yield MemorySnapshot(MemoryDocumentRef(self._store, path), data)
+
+    def get(self):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._store._watch_query(self, callback)
+
+
+class MemoryBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(('update', ref.path, data, None))
+
+    def delete(self, ref):
+        self._ops.append(('delete', ref.path, None, None))
+
+    def commit(self):
+        self._store._round_trip()
+        self._store._apply(self._ops)
+        self._store.commits += 1
+
+
+class MemoryFirestore:
+    """Cliente Firestore falso, thread-safe, com latência configurável"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.offline = False
+        self.docs = {}
+        self.applied_at = {}  # path → time.time() da última escrita (latência no replay)
+        self.writes = 0
+        self.commits = 0
+        self.round_trips = 0
+        self._lock = Lock()
+        self._watchers = {}
+        self._query_watchers = {}  # MemoryWatch → [consulta, callback, {path: dados}]
+        self._events = deque()
+        self._events_cond = Condition()
+        self._dispatcher = None
+
+    # API pública -------------------------------------------------------------
+
+    def collection(self, name):
+        return MemoryCollection(self, name)
+
+    def document(self, path):
+        return MemoryDocumentRef(self, path)
+
+    def batch(self):
+        return MemoryBatch(self)
+
+    def count(self, collection):
+        prefix = collection + '/'
+        with self._lock:
+            return sum(1 for p in self.docs
+                       if p.startswith(prefix) and '/' not in p[len(prefix):])
+
+    # Internos ----------------------------------------------------------------
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.offline:
+            raise BackendOffline("Firestore indisponível (simulado)")
+        self.round_trips += 1
+
+    def _read(self, path):
+        with self._lock:
+            data = self.docs.get(path)
+            return dict(data) if data is not None else None
+
+    def _apply(self, ops):
+        changed = []
+        now = time.time()
+        with self._lock:
+            # Lote atômico: valida antes de aplicar qualquer operação
+            existing = set()
+            for kind, path, data, merge in ops:
+                if kind == 'set':
+                    existing.add(path)
+                elif kind == 'update' and path not in self.docs and path not in existing:
+                    raise NotFound(f"No document to update: {path}")
+            for kind, path, data, merge in ops:
+                if kind == 'delete':
+                    self.docs.pop(path, None)
+                    self.applied_at.pop(path, None)
+                elif kind == 'set':
+                    base = dict(self.docs.get(path) or {}) if merge else {}
+                    base.update(_resolve(data))
+                    self.docs[path] = base
+                else:
+                    doc = self.docs[path]
+                    for key, value in data.items():
+                        # Campos com ponto atualizam mapas aninhados
+                        target = doc
+                        parts = key.split('.')
+                        for part in parts[:-1]:
+                            target = target.setdefault(part, {})
+                        target[parts[-1]] = _resolve(value)
+                if kind != 'delete':
+                    self.applied_at[path] = now
+                self.writes += 1
+                changed.append(path)
+        for path in changed:
+            self._notify(path)
+
+    def _watch(self, path, callback):
+        watch = MemoryWatch(self, path)
+        with self._lock:
+            self._watchers.setdefault(path, []).append((watch, callback))
+        self._ensure_dispatcher()
+        # Snapshot inicial, como o SDK real
+        self._post(callback, [MemorySnapshot(MemoryDocumentRef(self, path), self._read(path))], [])
+        return watch
+
+    def _watch_query(self, query, callback):
+        watch = MemoryWatch(self, None)
+        with self._lock:
+            known = {p: dict(d) for p, d in self.docs.items() if query.contains(p) and query.matches(d)}
+            self._query_watchers[watch] = [query, callback, known]
+            docs, changes = self._query_result(known, [(p, ChangeType.ADDED) for p in known])
+        self._ensure_dispatcher()
+        self._post(callback, docs, changes)  # resultado inicial, tudo como ADDED
+        return watch
+
+    def _unwatch(self, path, watch):
+        with self._lock:
+            if watch in self._query_watchers:
+                del self._query_watchers[watch]
+                return
+            self._watchers[path] = [w for w in self._watchers.get(path, []) if w[0] is not watch]
+
+    def _query_result(self, known, changed):
+        docs = [MemorySnapshot(MemoryDocumentRef(self, p), dict(d)) for p, d in known.items()]
+        changes = [MemoryChange(kind, MemorySnapshot(MemoryDocumentRef(self, p), known.get(p)))
+                   for p, kind in changed]
+        return docs, changes
+
+    def _notify(self, path):
+        events = []
+        with self._lock:
+            callbacks = [cb for _, cb in self._watchers.get(path, [])]
+            if callbacks:
+                data = self.docs.get(path)
+                snapshot = MemorySnapshot(MemoryDocumentRef(self, path), dict(data) if data is not None else None)
+                events.extend((cb, [snapshot], []) for cb in callbacks)
+
+            for query, callback, known in self._query_watchers.values():
+                if not query.contains(path):
+                    continue
+                data = self.docs.get(path)
+                matches = data is not None and query.matches(data)
+                if matches:
+                    kind = ChangeType.MODIFIED if path in known else ChangeType.ADDED
+                    known[path] = dict(data)
+                elif path in known:
+                    kind = ChangeType.REMOVED
+                    removed = known.pop(path)
+                else:
+                    continue
+                docs, changes = self._query_result(known, [(path, kind)])
+                if kind == ChangeType.REMOVED:
+                    changes[0].document = MemorySnapshot(MemoryDocumentRef(self, path), removed)
+                events.append((callback, docs, changes))
+
+        for callback, docs, changes in events:
+            self._post(callback, docs, changes)
+
+    def _post(self, callback, docs, changes):
+        with self._events_cond:
+            self._events.append((callback, docs, changes))
+            self._events_cond.notify()
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = Thread(target=self._dispatch, name='memory-firestore-watch', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        # Callbacks rodam numa thread própria, como os listeners do SDK
+        ticks = itertools.count()
+        while True:
+            with self._events_cond:
+                while not self._events:
+                    self._events_cond.wait()
+                cb, docs, changes = self._events.popleft()
+            try:
+                cb(docs, changes, next(ticks))
+            except Exception:
+                pass
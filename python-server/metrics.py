@@ -0,0 +1,252 @@
+# python-server/metrics.py
+"""
+Registro de métricas do gateway no formato texto do Prometheus.
+
+Contadores, gauges e histogramas com labels, mais "coletores": funções
+chamadas só na hora do scrape, que transformam os dicts de stats que os
+componentes já mantêm (parser, thinning, fila, comandos) em amostras sem
+custo nenhum no caminho quente. O MetricsServer expõe tudo em
+http://host:porta/metrics numa thread própria.
+"""
+
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Segundos: de 1 ms a 30 s (commits do Firestore, round trips de comando)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pares = ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+    return '{' + pares + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base: uma família de séries com o mesmo nome e conjunto de labels"""
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, **labels):
+        """Série com os valores de label dados (criada na primeira vez)"""
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield from child.samples(self.name, tuple(zip(self.labelnames, key)))
+
+    # Atalhos para métricas sem labels
+    def inc(self, value=1):
+        self._children[()].inc(value)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, value=1):
+        with self._lock:
+            self.value += value
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Counter(Metric):
+    type = COUNTER
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(Metric):
+    type = GAUGE
+
+    def _new_child(self):
+        return _Value()
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if i < len(self.counts):
+                self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        acumulado = 0
+        for bound, n in zip(self.buckets, counts):
+            acumulado += n
+            yield f"{name}_bucket", labels + (('le', _format_value(float(bound))),), acumulado
+        yield f"{name}_bucket", labels + (('le', '+Inf'),), count
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, count
+
+
+class Histogram(Metric):
+    type = HISTOGRAM
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+
+class MetricsRegistry:
+    """Conjunto de métricas e coletores renderizado em texto do Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """
+        `collector()` devolve tuplas (nome, tipo, ajuda, labels, valor), com
+        labels como dict; é chamado a cada scrape.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        linhas = []
+        for metric in metrics:
+            linhas.append(f"# HELP {metric.name} {metric.help}")
+            linhas.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                linhas.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        familias = {}
+        for collector in collectors:
+            for name, type, help, labels, value in collector():
+                familia = familias.setdefault(name, (type, help, []))
+                familia[2].append((tuple(labels.items()), value))
+        for name, (type, help, samples) in familias.items():
+            linhas.append(f"# HELP {name} {help}")
+            linhas.append(f"# TYPE {name} {type}")
+            for labels, value in samples:
+                linhas.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(linhas) + '\n'
+
+
+class MetricsServer:
+    """Servidor HTTP local que responde GET /metrics"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # sem log de acesso no console do gateway
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = Thread(target=self._httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
@@ -0,0 +1,104 @@
+# python-server/rate_control.py
+"""
+Taxa de envio adaptativa por veículo.
+
+O RateController classifica o carro em um modo a partir da ignição, da
+velocidade calculada entre fixes e do isStolen, e cada modo tem uma linha
+na tabela RATE_POLICIES:
+
+- send_interval_s: intervalo de envio do Arduino (comando SET_INTERVAL);
+- thinning: parâmetros do GpsThinner aplicados no gateway;
+- car_update_interval_s: intervalo mínimo de escrita em cars/{id};
+- urgent: gravações do veículo furam a espera de lote do FirestoreWriter.
+
+O bloco `thinning` do veículo (vehicles.json) vale em todos os modos por
+cima da tabela; `ratePolicies.<modo>.thinning` vence os dois naquele modo:
+
+    RATE_POLICIES  <  thinning do veículo  <  ratePolicies.<modo>.thinning
+
+Entrar em 'stolen' ou 'moving' é imediato; sair de 'moving' espera
+`stop_after_s` parado, para um semáforo não derrubar a taxa.
+"""
+
+MODE_STOLEN = 'stolen'
+MODE_MOVING = 'moving'
+MODE_IDLE = 'idle'      # ignição ligada, parado
+MODE_PARKED = 'parked'  # ignição desligada, parado
+
+RATE_POLICIES = {
+    MODE_STOLEN: {
+        'send_interval_s': 2,
+        'thinning': {'dead_band_m': 0, 'min_interval_s': 0, 'max_interval_s': 60},
+        'car_update_interval_s': 1,
+        'urgent': True,
+    },
+    MODE_MOVING: {
+        'send_interval_s': 5,
+        'thinning': {'dead_band_m': 15, 'min_interval_s': 10, 'max_interval_s': 120},
+        'car_update_interval_s': 2,
+        'urgent': False,
+    },
+    MODE_IDLE: {
+        'send_interval_s': 15,
+        'thinning': {'dead_band_m': 20, 'min_interval_s': 30, 'max_interval_s': 300},
+        'car_update_interval_s': 10,
+        'urgent': False,
+    },
+    MODE_PARKED: {
+        'send_interval_s': 60,
+        'thinning': {'dead_band_m': 30, 'min_interval_s': 60, 'max_interval_s': 900},
+        'car_update_interval_s': 60,
+        'urgent': False,
+    },
+}
+
+
+def merge_policies(overrides=None, thinning=None):
+    """RATE_POLICIES com o thinning e as substituições de um veículo ({modo: {campo: valor}})"""
+    policies = {mode: dict(policy, thinning=dict(policy['thinning'], **(thinning or {})))
+                for mode, policy in RATE_POLICIES.items()}
+    for mode, override in (overrides or {}).items():
+        if mode not in policies:
+            raise ValueError(f"Modo de taxa desconhecido: {mode}")
+        override = dict(override)
+        policies[mode]['thinning'].update(override.pop('thinning', {}))
+        policies[mode].update(override)
+    return policies
+
+
+class RateController:
+    """Máquina de estados do modo de envio de um veículo"""
+
+    def __init__(self, policies=None, moving_speed_kmh=5.0, stop_after_s=60.0, thinning=None):
+        self.policies = merge_policies(policies, thinning)
+        self.moving_speed_kmh = moving_speed_kmh
+        self.stop_after_s = stop_after_s
+        self.mode = None
+        self.last_moving = None  # instante do último fix acima da velocidade de movimento
+        self.changes = 0
+
+    def policy(self, mode=None):
+        return self.policies[mode or self.mode]
+
+    def update(self, ignition, speed_kmh, is_stolen, t):
+        """
+        Reavalia o modo no instante `t`. `speed_kmh` pode ser None (sem fix
+        novo). Devolve o novo modo quando mudou, senão None.
+        """
+        if speed_kmh is not None and speed_kmh >= self.moving_speed_kmh:
+            self.last_moving = t
+
+        if is_stolen:
+            mode = MODE_STOLEN
+        elif self.last_moving is not None and t - self.last_moving < self.stop_after_s:
+            mode = MODE_MOVING
+        elif ignition == 'on':
+            mode = MODE_IDLE
+        else:
+            mode = MODE_PARKED
+
+        if mode == self.mode:
+            return None
+        self.mode = mode
+        self.changes += 1
+        return mode
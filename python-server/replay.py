@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Replay de capturas da serial no pipeline real do gateway, sem rede.
+
+As linhas (de uma captura gravada com `trackcar_server.py --record` ou de um
+fluxo sintético) passam por VehicleSession → thinning → FirestoreWriter →
+Firestore em memória, exatamente como as linhas vindas da serial. No fim
+mostra vazão, custo de CPU e latência ingestão → commit dos gps_locations.
+
+Uso:
+    python replay.py captura.tsv                 # tempo real
+    python replay.py captura.tsv --speed 10      # 10x o tempo real
+    python replay.py captura.tsv --speed 0       # o mais rápido possível
+    python replay.py --synthetic --vehicles 20 --rate 10 --seconds 60 --speed 0
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import time
+
+from capture import read_capture, synthetic_stream
+from firestore_writer import FirestoreWriter, OVERFLOW_BLOCK
+from gateway_log import setup_logging, stop_logging
+from line_parser import FRAMING_JSON, FRAMING_CSV
+from memory_firestore import MemoryFirestore
+from spool import SqliteSpool
+from vehicle_session import VehicleSession
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por vizinho mais próximo; 0.0 para lista vazia"""
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))]
+
+
+class ReplayEngine:
+    """Alimenta VehicleSessions com linhas (t, carId, linha) respeitando a escala de tempo"""
+
+    def __init__(self, db, writer, thinning=None, framing=FRAMING_JSON, car_update_interval=2.0):
+        self.db = db
+        self.writer = writer
+        self.thinning = thinning
+        self.framing = framing
+        self.car_update_interval = car_update_interval
+        self.sessions = {}
+        self.lines = 0
+        self.setup_s = 0.0  # tempo gasto criando sessões
+
+    def session(self, car_id):
+        """Sessão do veículo, criada (com documento cars/{id}) na primeira linha"""
+        session = self.sessions.get(car_id)
+        if session is None:
+            car_ref = self.db.collection('cars').document(car_id)
+            if not car_ref.get().exists:
+                car_ref.set({'brand': 'Replay', 'model': car_id, 'ignitionState': 'on'})
+            session = VehicleSession(
+                self.db, self.writer, car_id, 'replay', label=f"[{car_id}] ",
+                thinning=self.thinning, car_update_interval=self.car_update_interval,
+                framing=self.framing,
+                # O modo de envio usa o relógio real, não o da captura acelerada
+                adaptive_rate=False
+            )
+            session.load_initial_state()
+            self.sessions[car_id] = session.start()
+        return session
+
+    def run(self, events, speed=1.0):
+        """
+        Reinjeta os eventos. speed=1 é tempo real, speed=N é N vezes mais
+        rápido e speed=0 não espera entre linhas.
+        """
+        inicio = time.monotonic()
+        for t, car_id, line in events:
+            session = self.sessions.get(car_id)
+            if session is None:
+                # Criar a sessão custa round trips; não entra na escala de tempo
+                criada = time.monotonic()
+                session = self.session(car_id)
+                self.setup_s += time.monotonic() - criada
+                inicio += time.monotonic() - criada
+            if speed > 0:
+                atraso = inicio + t / speed - time.monotonic()
+                if atraso > 0:
+                    time.sleep(atraso)
+            session.processar_linha_arduino(line)
+            self.lines += 1
+
+    def stop(self):
+        """Esvazia thinning e documentos dos carros de todas as sessões"""
+        for session in self.sessions.values():
+            session.stop()
+
+
+def latencias_ms(db):
+    """Latência (ms) entre a recepção de cada fix e o commit do seu documento"""
+    valores = []
+    for snap in db.collection('gps_locations').stream():
+        applied = db.applied_at.get(snap.reference.path)
+        timestamp = snap.get('timestamp')
+        if applied is not None and timestamp is not None:
+            valores.append((applied - timestamp.timestamp()) * 1000)
+    return valores
+
+
+def relatorio(engine, db, writer, ingest_s, total_s, cpu_s):
+    """Imprime o relatório de vazão e latência do replay"""
+    lines = engine.lines
+    w = writer.stats()
+    lat = latencias_ms(db)
+    parser = {'fast': 0, 'csv': 0, 'json': 0, 'errors': 0}
+    received = dropped = 0
+    for session in engine.sessions.values():
+        for k, v in session.parser.stats.items():
+            parser[k] += v
+        received += session.thinner.stats['received']
+        dropped += session.thinner.dropped()
+
+    print("\n" + "=" * 60)
+    print("  RELATÓRIO DO REPLAY")
+    print("=" * 60)
+    print(f"🚗 Veículos: {len(engine.sessions)} | Linhas: {lines}")
+    print(f"⏱️  Ingestão: {ingest_s:.2f}s ({lines / ingest_s if ingest_s else 0:,.0f} linhas/s) | "
+          f"Até o último commit: {total_s:.2f}s")
+    print(f"🧮 CPU: {cpu_s:.2f}s ({cpu_s / total_s * 100 if total_s else 0:.0f}%) | "
+          f"{cpu_s / lines * 1e6 if lines else 0:.0f} µs/linha")
+    print(f"🧾 Parser - Rápido: {parser['fast']} | CSV: {parser['csv']} | "
+          f"JSON completo: {parser['json']} | Erros: {parser['errors']}")
+    print(f"🧹 Fixes válidos: {received} | Descartados pelo thinning: {dropped} | "
+          f"gps_locations gravados: {len(lat)}")
+    print(f"📊 Fila - Gravados: {w['committed']} | Descartados: {w['dropped']} | Falhas: {w['failed']} | "
+          f"Lotes: {w['batches']} (médio {w['avg_batch_size']:.1f}, máx fila {w['max_queue_depth']})")
+    print(f"📡 Latência recepção → commit (ms): p50 {percentil(lat, 50):.1f} | p95 {percentil(lat, 95):.1f} | "
+          f"p99 {percentil(lat, 99):.1f} | máx {max(lat, default=0.0):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de capturas da serial no pipeline do gateway")
+    parser.add_argument('capture', nargs='?', help="arquivo gravado com trackcar_server.py --record")
+    parser.add_argument('--synthetic', action='store_true', help="gera um fluxo sintético em vez de ler captura")
+    parser.add_argument('--vehicles', type=int, default=1, help="(sintético) número de veículos")
+    parser.add_argument('--rate', type=float, default=10.0, help="(sintético) fixes por segundo por veículo")
+    parser.add_argument('--seconds', type=float, default=10.0, help="(sintético) duração do fluxo")
+    parser.add_argument('--framing', choices=(FRAMING_JSON, FRAMING_CSV), default=FRAMING_JSON)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="1 = tempo real, N = N vezes mais rápido, 0 = o mais rápido possível")
+    parser.add_argument('--latency', type=float, default=0.05, help="round trip simulado do Firestore (s)")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-age', type=float, default=1.0)
+    parser.add_argument('--thinning', help="JSON com os parâmetros de thinning (ex.: '{\"dead_band_m\": 0}')")
+    parser.add_argument('--spool', help="usa um spool SQLite nesse caminho (apagado antes do replay)")
+    parser.add_argument('--verbose', action='store_true', help="mostra os logs do gateway")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        events = synthetic_stream(args.vehicles, args.rate, args.seconds, framing=args.framing)
+    elif args.capture:
+        events = read_capture(args.capture)
+    else:
+        parser.error("informe um arquivo de captura ou --synthetic")
+
+    spool = None
+    if args.spool:
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(args.spool + sufixo):
+                os.remove(args.spool + sufixo)
+        spool = SqliteSpool(args.spool)
+
+    db = MemoryFirestore(latency=args.latency)
+    writer = FirestoreWriter(db, max_queue=100000, batch_size=args.batch_size, max_age=args.max_age,
+                             overflow=OVERFLOW_BLOCK, spool=spool).start()
+    engine = ReplayEngine(db, writer, thinning=json.loads(args.thinning) if args.thinning else None,
+                          framing=args.framing)
+
+    with contextlib.ExitStack() as stack:
+        if args.verbose:
+            setup_logging()  # mesma fila de logs do gateway
+            stack.callback(stop_logging)
+        else:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        cpu0, t0 = time.process_time(), time.monotonic()
+        try:
+            engine.run(events, speed=args.speed)
+        except KeyboardInterrupt:
+            pass
+        ingest_s = time.monotonic() - t0 - engine.setup_s
+        engine.stop()
+        writer.flush(120)
+        total_s = time.monotonic() - t0 - engine.setup_s
+        cpu_s = time.process_time() - cpu0
+        writer.stop()
+
+    relatorio(engine, db, writer, ingest_s, total_s, cpu_s)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# python-server/reverse_geocoder.py
+"""
+Geocodificação reversa offline no gateway.
+
+O app chamava o Nominatim a cada atualização da tela de localização: lento,
+com limite de requisições e repetindo o mesmo endereço para a mesma vaga.
+Aqui o endereço sai de um arquivo local de pontos de endereço (extrato do
+OpenStreetMap convertido para CSV) e vai junto com o fix para gps_locations.
+
+Os pontos ficam numa grade regular de lat/lon (como o GridIndex das cercas);
+a busca do mais próximo percorre anéis de células a partir da do fix até
+`max_distance_m`. Na frente da grade há um LRU por coordenada arredondada
+(4 casas ≈ 11 m): o carro parado e os trajetos de sempre não refazem a busca.
+
+Formato do CSV (cabeçalho obrigatório; colunas além de lat/lon são opcionais):
+    lat,lon,street,number,district,city,state
+
+Para gerar a partir de um extrato .osm.pbf (ferramenta osmium):
+    osmium tags-filter sudeste.osm.pbf nwr/addr:street -o enderecos.osm.pbf
+    osmium export enderecos.osm.pbf -f geojsonseq -o enderecos.geojsonseq
+    python reverse_geocoder.py enderecos.geojsonseq geodata/addresses.csv
+"""
+
+import csv
+import math
+import sys
+from functools import lru_cache
+
+from gps_thinning import EARTH_RADIUS_M
+
+DEFAULT_CELL_DEG = 0.002      # ~220 m de latitude
+DEFAULT_MAX_DISTANCE_M = 250  # mais longe que isso o fix fica sem endereço
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_PRECISION = 4         # casas decimais da chave do cache
+
+FIELDS = ('street', 'number', 'district', 'city', 'state')
+# Tags addr:* do OSM → colunas do CSV
+OSM_TAGS = {
+    'addr:street': 'street',
+    'addr:housenumber': 'number',
+    'addr:suburb': 'district',
+    'addr:city': 'city',
+    'addr:state': 'state',
+}
+
+_M_PER_DEG = math.radians(1) * EARTH_RADIUS_M
+
+
+def format_address(row):
+    """'Rua X, 123, Bairro, Cidade, UF' e a localidade 'Bairro, Cidade'"""
+    street = row.get('street') or ''
+    if street and row.get('number'):
+        street = f"{street}, {row['number']}"
+    parts = [p for p in (street, row.get('district'), row.get('city'), row.get('state')) if p]
+    locality = ', '.join(p for p in (row.get('district'), row.get('city')) if p)
+    return ', '.join(parts), locality
+
+
+class ReverseGeocoder:
+    """Endereço mais próximo de um ponto; lookup() devolve dict ou None"""
+
+    def __init__(self, rows, cell_deg=DEFAULT_CELL_DEG, max_distance_m=DEFAULT_MAX_DISTANCE_M,
+                 cache_size=DEFAULT_CACHE_SIZE, precision=DEFAULT_PRECISION):
+        self.cell_deg = cell_deg
+        self.max_distance_m = max_distance_m
+        self.precision = precision
+        self.cells = {}
+        self.places = []  # (address, locality) por ponto
+        seen = {}
+        for row in rows:
+            place = format_address(row)
+            if not place[0]:
+                continue
+            # Vários pontos do mesmo endereço (prédio, lote) compartilham a tupla
+            place = seen.setdefault(place, place)
+            lat, lon = float(row['lat']), float(row['lon'])
+            self.cells.setdefault(self._cell(lat, lon), []).append((lat, lon, len(self.places)))
+            self.places.append(place)
+        self.not_found = 0
+        self._cached = lru_cache(maxsize=cache_size)(self._nearest)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Lê o CSV de pontos de endereço (levanta OSError/ValueError)"""
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {'lat', 'lon'} <= set(reader.fieldnames):
+                raise ValueError(f"{path}: o CSV precisa das colunas lat e lon")
+            return cls(reader, **kwargs)
+
+    def __len__(self):
+        return len(self.places)
+
+    def lookup(self, lat, lon):
+        """{'address', 'locality', 'distanceM'} do ponto mais próximo, ou None"""
+        p = self.precision
+        return self._cached(round(lat, p), round(lon, p))
+
+    def stats(self):
+        info = self._cached.cache_info()
+        return {'points': len(self.places), 'hits': info.hits, 'misses': info.misses,
+                'cached': info.currsize, 'not_found': self.not_found}
+
+    # Internos ----------------------------------------------------------------
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _nearest(self, lat, lon):
+        k = math.cos(math.radians(lat))
+        cy, cx = self._cell(lat, lon)
+        # Menor largura de célula em metros: limite do anel já garantido
+        cell_m = self.cell_deg * _M_PER_DEG * min(1.0, k)
+        rings = math.ceil(self.max_distance_m / cell_m)
+        best, best_d2 = None, self.max_distance_m ** 2
+        for ring in range(rings + 1):
+            # Nenhum ponto além deste anel está mais perto que o melhor achado
+            if best is not None and ((ring - 1) * cell_m) ** 2 > best_d2:
+                break
+            for iy in range(cy - ring, cy + ring + 1):
+                edge = iy in (cy - ring, cy + ring)
+                for ix in (range(cx - ring, cx + ring + 1) if edge else (cx - ring, cx + ring)):
+                    for plat, plon, index in self.cells.get((iy, ix), ()):
+                        dy = (plat - lat) * _M_PER_DEG
+                        dx = (plon - lon) * _M_PER_DEG * k
+                        d2 = dx * dx + dy * dy
+                        if d2 <= best_d2:
+                            best, best_d2 = index, d2
+        if best is None:
+            self.not_found += 1
+            return None
+        address, locality = self.places[best]
+        return {'address': address, 'locality': locality, 'distanceM': round(math.sqrt(best_d2))}
+
+
+def convert_osm_geojsonseq(source, target):
+    """Saída do `osmium export -f geojsonseq` → CSV deste módulo; devolve quantos pontos"""
+    import json
+
+    count = 0
+    with open(source, encoding='utf-8') as src, open(target, 'w', encoding='utf-8', newline='') as dst:
+        writer = csv.writer(dst)
+        writer.writerow(('lat', 'lon') + FIELDS)
+        for line in src:
+            line = line.strip().lstrip('\x1e')  # RS do GeoJSON Text Sequences
+            if not line:
+                continue
+            feature = json.loads(line)
+            tags = feature.get('properties') or {}
+            if 'addr:street' not in tags:
+                continue
+            geometry = feature.get('geometry') or {}
+            coords = geometry.get('coordinates')
+            if geometry.get('type') == 'Point':
+                lon, lat = coords
+            elif geometry.get('type') in ('Polygon', 'MultiPolygon', 'LineString'):
+                # Prédios e lotes: média dos vértices do contorno externo
+                ring = coords
+                while isinstance(ring[0][0], list):
+                    ring = ring[0]
+                lon = sum(p[0] for p in ring) / len(ring)
+                lat = sum(p[1] for p in ring) / len(ring)
+            else:
+                continue
+            row = {column: tags.get(tag, '') for tag, column in OSM_TAGS.items()}
+            writer.writerow([f"{lat:.6f}", f"{lon:.6f}"] + [row[f] for f in FIELDS])
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("Uso: python reverse_geocoder.py enderecos.geojsonseq geodata/addresses.csv")
+    print(f"✅ {convert_osm_geojsonseq(sys.argv[1], sys.argv[2])} pontos de endereço gravados em {sys.argv[2]}")
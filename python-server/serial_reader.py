@@ -0,0 +1,260 @@
+# python-server/serial_reader.py
+"""
+Leitura orientada a eventos da serial do Arduino.
+
+Uma thread dedicada fica bloqueada em ser.readline() e entrega cada linha
+completa ao callback assim que ela chega, sem polling de in_waiting nem
+sleep fixo. Tarefas periódicas rodam em timers próprios.
+
+Se o adaptador USB cair, a leitura levanta exceção; com `reconnect` a
+thread fecha a porta e tenta reabrir com backoff exponencial (a porta
+configurada, outra com o mesmo VID:PID ou a que responder com o banner
+TRACKCAR_READY - ver find_arduino), contando quedas e tempo fora do ar.
+"""
+
+import os
+import time
+from threading import Thread, Event, Lock
+
+ARDUINO_RESET_WAIT = 2  # o Nano reinicia ao abrir a porta (DTR)
+READY_BANNER = 'TRACKCAR_READY'
+PROBE_TIMEOUT = 4  # reset + setup() do firmware até o banner
+RECONNECT_BACKOFF = (0.5, 30.0)  # primeira espera e teto entre tentativas (s)
+
+# Portas abertas por este processo: a busca não rouba o Arduino de outra sessão
+_ports_in_use = {}  # caminho real → serial
+_ports_lock = Lock()
+
+
+def open_port(port, baud, read_timeout=1, reset_wait=ARDUINO_RESET_WAIT):
+    """Abre a serial e espera o reset do Arduino (levanta exceção em caso de falha)"""
+    import serial
+
+    ser = serial.Serial(port, baud, timeout=read_timeout)
+    with _ports_lock:
+        _ports_in_use[_real_path(port)] = ser
+    time.sleep(reset_wait)
+    return ser
+
+
+def close_port(ser):
+    """Fecha a serial (mesmo já derrubada) e libera a porta para a busca"""
+    with _ports_lock:
+        for path in [p for p, s in _ports_in_use.items() if s is ser]:
+            del _ports_in_use[path]
+    try:
+        ser.close()
+    except Exception:
+        pass
+
+
+def _real_path(port):
+    # /dev/serial/by-id/... é um link para o /dev/ttyUSBn da vez
+    return os.path.realpath(port) if port and os.path.exists(port) else port
+
+
+def parse_usb_id(text):
+    """'1a86:7523' → (0x1a86, 0x7523); None se vazio"""
+    if not text:
+        return None
+    vid, pid = str(text).split(':')
+    return int(vid, 16), int(pid, 16)
+
+
+def probe_banner(port, baud, read_timeout=1, timeout=PROBE_TIMEOUT):
+    """Abre `port` e espera o TRACKCAR_READY; devolve (ser, banner) ou None"""
+    import serial
+
+    ser = serial.Serial(port, baud, timeout=0.5)
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            if line.startswith(READY_BANNER):
+                ser.timeout = read_timeout
+                with _ports_lock:
+                    _ports_in_use[_real_path(port)] = ser
+                return ser, line
+    except Exception:
+        pass
+    ser.close()
+    return None
+
+
+def find_arduino(port, baud, usb_id=None, read_timeout=1):
+    """
+    Reabre o Arduino de um veículo e devolve (ser, banner já lido ou None):
+    a porta configurada, se existir e não estiver com outra sessão; senão a
+    primeira porta USB com o VID:PID `usb_id` ou, sem ele, a primeira que
+    responder com o TRACKCAR_READY. Levanta OSError se nenhuma servir.
+    """
+    from serial.tools import list_ports
+
+    with _ports_lock:
+        in_use = set(_ports_in_use)
+    ports = list(list_ports.comports())
+
+    if port and _real_path(port) not in in_use:
+        info = next((p for p in ports if p.device == _real_path(port)), None)
+        if usb_id is None or info is None or (info.vid, info.pid) == usb_id:
+            try:
+                return open_port(port, baud, read_timeout), None
+            except Exception:
+                pass  # sumiu (ou ainda está enumerando): procura nas outras
+
+    for info in ports:
+        if info.device in in_use or info.vid is None:
+            continue  # só adaptadores USB livres
+        try:
+            if usb_id is not None:
+                if (info.vid, info.pid) == usb_id:
+                    return open_port(info.device, baud, read_timeout), None
+            else:
+                found = probe_banner(info.device, baud, read_timeout)
+                if found:
+                    return found
+        except Exception:
+            continue
+    raise OSError(f"Arduino não encontrado (porta {port}"
+                  f"{f', USB {usb_id[0]:04x}:{usb_id[1]:04x}' if usb_id else ''})")
+
+
+class SerialReader:
+    """Thread que lê linhas da serial e despacha para um callback"""
+
+    def __init__(self, ser, on_line, on_error=None, name='serial-reader',
+                 reconnect=None, on_disconnect=None, on_reconnect=None, backoff=RECONNECT_BACKOFF):
+        self.ser = ser
+        self.on_line = on_line
+        self.on_error = on_error
+        self.name = name
+        self.reconnect = reconnect          # reconnect() → nova serial (levanta se não achar)
+        self.on_disconnect = on_disconnect  # on_disconnect(erro)
+        self.on_reconnect = on_reconnect    # on_reconnect(ser, segundos fora do ar)
+        self.backoff = backoff
+        self.lines = 0
+        self.errors = 0
+        self.last_line_time = 0
+        self.connected = True
+        self.stats = {
+            'outages': 0,
+            'reconnects': 0,
+            'attempts': 0,
+            'last_outage_s': 0.0,
+            'max_outage_s': 0.0,
+            'total_outage_s': 0.0,
+        }
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia a thread de leitura"""
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """Pede para a thread parar (sai no próximo timeout do readline)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                raw = self.ser.readline()
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                self.errors += 1
+                if self.on_error:
+                    self.on_error(f"❌ Erro na leitura serial: {e}")
+                if self.reconnect is None or not self._reconnect(e):
+                    return
+                continue
+
+            if not raw:
+                continue  # timeout do readline sem dados
+
+            line = raw.decode('utf-8', errors='ignore').strip()
+            self.lines += 1
+            self.last_line_time = time.time()
+            try:
+                self.on_line(line)
+            except Exception as e:
+                self.errors += 1
+                if self.on_error:
+                    self.on_error(f"❌ Erro ao processar linha: {e}")
+
+    def _reconnect(self, error):
+        """Reabre a serial com backoff até conseguir; False se stop() chegar antes"""
+        self.connected = False
+        self.stats['outages'] += 1
+        down_at = time.monotonic()
+        close_port(self.ser)
+        if self.on_disconnect:
+            self.on_disconnect(error)
+
+        delay = self.backoff[0]
+        while not self._stop.is_set():
+            self.stats['attempts'] += 1
+            try:
+                ser = self.reconnect()
+            except Exception:
+                if self._stop.wait(delay):
+                    return False
+                delay = min(delay * 2, self.backoff[1])
+                continue
+            if self._stop.is_set():
+                close_port(ser)
+                return False
+
+            self.ser = ser
+            self.connected = True
+            down = time.monotonic() - down_at
+            self.stats['reconnects'] += 1
+            self.stats['last_outage_s'] = down
+            self.stats['max_outage_s'] = max(self.stats['max_outage_s'], down)
+            self.stats['total_outage_s'] += down
+            if self.on_reconnect:
+                try:
+                    self.on_reconnect(ser, down)
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(f"❌ Erro após reconectar a serial: {e}")
+            return True
+        return False
+
+
+class PeriodicTimer:
+    """Executa uma função a cada `interval` segundos numa thread própria"""
+
+    def __init__(self, interval, func, name='periodic-timer', on_error=None):
+        self.interval = interval
+        self.func = func
+        self.name = name
+        self.on_error = on_error
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Event.wait devolve True quando stop() é chamado
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"❌ Erro na tarefa periódica {self.name}: {e}")
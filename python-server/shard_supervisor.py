@@ -0,0 +1,367 @@
+# python-server/shard_supervisor.py
+"""
+Gateway dividido em processos: um supervisor e N workers com shards de veículos.
+
+Num processo só, parsing, filtros e o cliente do Firestore de uma frota
+grande disputam um único núcleo (GIL). Com `trackcar_server.py --workers N`
+o supervisor reparte os veículos entre N processos (shard_worker.py), cada
+um dono da serial, do parsing e do upload do seu shard. O estado e os
+contadores de cada veículo ficam numa StateTable em memória compartilhada
+(state_table.py): o supervisor serve /metrics e o estado ao vivo lendo a
+tabela, sem ida e volta aos workers.
+
+Quando um worker morre (ou para de bater na tabela por BEAT_TIMEOUT), as
+linhas dele são reparadas e os veículos vão para os workers vivos menos
+carregados; o slot é recriado após RESPAWN_DELAY (dobrando a cada morte
+precoce) e, quando fica pronto, recebe veículos dos mais carregados até
+os shards ficarem equilibrados. Mover um veículo é liberar (a sessão grava
+o pendente e fecha a serial, o arquivo local descarrega as linhas dele) e
+só então adotar no destino, porque a porta serial, as colunas do arquivo
+local e a linha da tabela têm um dono por vez. Se todos os workers morrem
+antes de ficar prontos com o mesmo erro do gateway (ex.: sem credenciais),
+o supervisor encerra com esse código em vez de recriá-los para sempre.
+"""
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import wait
+
+import shard_worker
+from gateway_log import log_info, log_warning, log_error
+from shard_worker import EVENT_READY, EVENT_ADOPTED, EVENT_RELEASED
+from state_table import StateTable, FLAG_CONNECTED, FLAG_IGNITION_ON, FLAG_RELAY_ON, FLAG_GPS_VALID
+
+RESPAWN_DELAY = 2.0    # espera antes de recriar um worker morto (s)
+RESPAWN_MAX_DELAY = 60.0
+EARLY_DEATH = 60.0     # morrer antes disso após iniciar dobra a espera
+BEAT_TIMEOUT = 30.0    # worker pronto sem batida na tabela por isso é encerrado
+STOP_TIMEOUT = 15.0    # espera pelo encerramento limpo de cada worker
+POLL_INTERVAL = 0.2
+
+
+def shard(vehicles, workers):
+    """Reparte os veículos em `workers` listas de tamanhos que diferem no máximo em 1"""
+    shards = [[] for _ in range(workers)]
+    for i, vehicle in enumerate(vehicles):
+        shards[i % workers].append(vehicle)
+    return shards
+
+
+class _Slot:
+    """Um worker: processo atual, fila de controle e veículos que ele tem"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        self.started = 0.0
+        self.ready = False
+        self.vehicles = set()   # car_ids adotados ou com adoção enviada
+        self.delay = RESPAWN_DELAY
+        self.respawn_at = None
+        self.failed = None      # código de saída se o worker morreu antes de ficar pronto
+
+
+class ShardSupervisor:
+    """Mantém `workers` processos vivos e cada veículo em exatamente um deles"""
+
+    def __init__(self, vehicles, workers, table_name=None, options=None,
+                 worker_main=shard_worker.main, worker_cls=shard_worker.ShardWorker):
+        self.vehicles = {v['carId']: v for v in vehicles}
+        self.rows = {v['carId']: row for row, v in enumerate(vehicles)}
+        self.table_name = table_name
+        self.options = options or {}
+        self.worker_main = worker_main
+        self.worker_cls = worker_cls
+        self.slots = [_Slot(i) for i in range(workers)]
+        self.orphans = []       # car_ids sem worker (todos mortos)
+        self.moving = {}        # car_id → slot de destino, esperando o 'released' da origem
+        self.table = None
+        self.stopping = False
+        self._ctx = multiprocessing.get_context('spawn')  # clientes gRPC não sobrevivem a fork
+        self._events = self._ctx.Queue()
+        self.stats = {'spawned': 0, 'deaths': 0, 'hung': 0, 'moves': 0}
+
+    def start(self):
+        self.table = StateTable.create(len(self.vehicles), len(self.slots), self.table_name)
+        for car_id, row in self.rows.items():
+            self.table.assign(row, car_id)
+        for slot, vehicles in zip(self.slots, shard(list(self.vehicles.values()), len(self.slots))):
+            self._spawn(slot, [v['carId'] for v in vehicles])
+        return self
+
+    def ready(self):
+        return all(slot.ready for slot in self.slots)
+
+    def poll(self, timeout=POLL_INTERVAL):
+        """Trata eventos dos workers, mortes, travamentos e recriações pendentes"""
+        sentinels = [s.process.sentinel for s in self.slots if s.process is not None]
+        wait(sentinels, timeout)
+        while True:
+            try:
+                event, index, data = self._events.get_nowait()
+            except queue.Empty:
+                break
+            self._evento(self.slots[index], event, data)
+        now = time.time()
+        for slot in self.slots:
+            if slot.process is not None and slot.process.exitcode is not None:
+                self._morreu(slot)
+            elif slot.process is not None and slot.ready:
+                beat = self.table.read_worker(slot.index)
+                if beat is not None and now - beat['beat_at'] > BEAT_TIMEOUT:
+                    log_error(f"❌ Worker {slot.index} sem batida há {now - beat['beat_at']:.0f}s - encerrando")
+                    self.stats['hung'] += 1
+                    slot.process.kill()
+            elif slot.process is None and slot.respawn_at is not None and time.monotonic() >= slot.respawn_at:
+                self._spawn(slot, [])
+
+    def failed(self):
+        """
+        Código de saída comum quando todos os workers morrem antes de ficar
+        prontos com um erro do gateway (credenciais, configuração): recriar
+        não adianta. None enquanto algum worker funciona.
+        """
+        codes = {slot.failed for slot in self.slots}
+        if len(codes) == 1:
+            code = codes.pop()
+            if code is not None and code > 1:
+                return code
+        return None
+
+    def stop(self):
+        """Pede a cada worker para encerrar (gravando o pendente) e apaga a tabela"""
+        self.stopping = True
+        for slot in self.slots:
+            if slot.process is not None and slot.process.exitcode is None:
+                slot.inbox.put(('stop',))
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for slot in self.slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(0.0, deadline - time.monotonic()))
+            if slot.process.exitcode is None:
+                log_warning(f"⚠️  Worker {slot.index} não encerrou em {STOP_TIMEOUT:.0f}s - terminando")
+                slot.process.terminate()
+                slot.process.join(2)
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+
+    # --------------------------------------------------------------------------
+
+    def _spawn(self, slot, car_ids):
+        slot.inbox = self._ctx.Queue()
+        slot.vehicles = set(car_ids)
+        slot.ready = False
+        slot.respawn_at = None
+        slot.started = time.monotonic()
+        self.table.repair(slot=slot.index)
+        assignments = [(self.vehicles[c], self.rows[c]) for c in car_ids]
+        slot.process = self._ctx.Process(
+            target=self.worker_main, name=f"trackcar-w{slot.index}",
+            args=(slot.index, self.table.name, slot.inbox, self._events, assignments, self.options,
+                  self.worker_cls)
+        )
+        slot.process.start()
+        self.stats['spawned'] += 1
+        log_info(f"🧩 Worker {slot.index} iniciado (pid {slot.process.pid}, {len(car_ids)} veículos)")
+
+    def _evento(self, slot, event, data):
+        if event == EVENT_READY:
+            slot.ready = True
+            slot.failed = None
+            log_info(f"🧩 Worker {slot.index} pronto (pid {data})")
+            self._distribuir()
+        elif event == EVENT_RELEASED:
+            for car_id in data:
+                slot.vehicles.discard(car_id)
+                target = self.moving.pop(car_id, None)
+                if target is not None:
+                    self._enviar(target, [car_id])
+                else:  # o destino morreu enquanto a origem liberava
+                    self.orphans.append(car_id)
+            self._distribuir()
+        elif event == EVENT_ADOPTED:
+            pass  # a sessão já publica na linha do veículo
+
+    def _morreu(self, slot):
+        code = slot.process.exitcode
+        if not slot.ready:
+            slot.failed = code
+        slot.process = None
+        slot.ready = False
+        if self.stopping:
+            return
+        self.stats['deaths'] += 1
+        # Vindo para este slot: continuam com a origem até o 'released', que os devolve como órfãos
+        incoming = {c for c, target in self.moving.items() if target is slot}
+        for car_id in incoming:
+            del self.moving[car_id]
+        lost = sorted(slot.vehicles - incoming)
+        slot.vehicles = set()
+        for car_id in lost:
+            self.table.repair(self.rows[car_id])
+            target = self.moving.pop(car_id, None)
+            if target is not None:
+                self._enviar(target, [car_id])  # saindo deste slot: o destino já o tinha reservado
+            else:
+                self.orphans.append(car_id)
+        if time.monotonic() - slot.started >= EARLY_DEATH:
+            slot.delay = RESPAWN_DELAY
+        slot.respawn_at = time.monotonic() + slot.delay
+        log_error(f"❌ Worker {slot.index} morreu (código {code}): {len(lost)} veículos realocados; "
+                  f"recriando em {slot.delay:.0f}s")
+        if time.monotonic() - slot.started < EARLY_DEATH:
+            slot.delay = min(slot.delay * 2, RESPAWN_MAX_DELAY)
+        self._distribuir()
+
+    def _distribuir(self):
+        """Órfãos para os menos carregados; depois equilibra movendo dos mais carregados"""
+        vivos = [s for s in self.slots if s.ready]
+        if not vivos:
+            return
+        while self.orphans:
+            target = min(vivos, key=lambda s: len(s.vehicles))
+            self._enviar(target, [self.orphans.pop(0)])
+        # Equilíbrio: diferença de no máximo 1 veículo entre os workers prontos
+        while True:
+            origem = max(vivos, key=lambda s: len(s.vehicles - set(self.moving)))
+            destino = min(vivos, key=lambda s: len(s.vehicles))
+            livres = sorted(origem.vehicles - set(self.moving))
+            if len(livres) - len(destino.vehicles) <= 1:
+                break
+            car_id = livres[-1]
+            self.moving[car_id] = destino
+            destino.vehicles.add(car_id)  # reservado: conta para os próximos equilíbrios
+            origem.inbox.put(('release', [car_id]))
+            self.stats['moves'] += 1
+
+    def _enviar(self, slot, car_ids):
+        slot.vehicles.update(car_ids)
+        slot.inbox.put(('adopt', [(self.vehicles[c], self.rows[c]) for c in car_ids]))
+
+
+# ==============================================================================
+# Gateway com --workers N
+# ==============================================================================
+
+def table_metrics(table):
+    """Coletor do /metrics do supervisor: lê a tabela, sem falar com os workers"""
+    def coletar():
+        for slot, w in enumerate(table.workers()):
+            if w is None or not w['pid']:
+                continue
+            labels = {'worker': str(slot)}
+            yield ('trackcar_worker_vehicles', 'gauge', "Veículos no shard do worker", labels, w['vehicles'])
+            yield ('trackcar_worker_cpu_seconds_total', 'counter', "CPU do processo do worker", labels, w['cpu_s'])
+            yield ('trackcar_worker_beat_age_seconds', 'gauge', "Segundos desde a última batida do worker",
+                   labels, time.time() - w['beat_at'])
+            yield ('trackcar_firestore_queue_depth', 'gauge', "Operações pendentes na fila/spool",
+                   labels, w['queue_depth'])
+            for result in ('committed', 'dropped', 'failed'):
+                yield ('trackcar_firestore_operations_total', 'counter', "Operações da fila do Firestore por resultado",
+                       dict(labels, result=result), w[result])
+        for car in table.cars():
+            labels = {'car': car['car_id']}
+            yield ('trackcar_lines_total', 'counter', "Linhas da serial processadas", labels, car['lines'])
+            yield ('trackcar_gps_fixes_received_total', 'counter', "Leituras gps recebidas", labels, car['gps_reads'])
+            yield ('trackcar_gps_fixes_saved_total', 'counter', "Fixes GPS enviados para gps_locations",
+                   labels, car['fixes_saved'])
+            yield ('trackcar_device_reboots_total', 'counter', "Reinícios do Arduino (uptime voltou para trás)",
+                   labels, car['reboots'])
+            yield ('trackcar_serial_connected', 'gauge', "1 se a serial está aberta",
+                   labels, int(bool(car['flags'] & FLAG_CONNECTED)))
+            yield ('trackcar_vehicle_worker', 'gauge', "Worker dono do veículo (-1 = sem dono)", labels, car['worker'])
+            if car['heartbeat_at']:
+                yield ('trackcar_heartbeat_age_seconds', 'gauge', "Segundos desde o último heartbeat",
+                       labels, time.time() - car['heartbeat_at'])
+    return coletar
+
+
+def espelhar_estado(table, live, parar, interval=0.1):
+    """Copia para o LiveState as linhas que mudaram (mantém /cars e /stream no supervisor)"""
+    vistos = {}
+    while not parar.wait(interval):
+        for car in table.cars():
+            if not car['updated_at'] or vistos.get(car['car_id']) == car['updated_at']:
+                continue
+            vistos[car['car_id']] = car['updated_at']
+            fields = {
+                'connected': bool(car['flags'] & FLAG_CONNECTED),
+                'ignition': 'on' if car['flags'] & FLAG_IGNITION_ON else 'off',
+                'relay': 'on' if car['flags'] & FLAG_RELAY_ON else 'off',
+                'gpsStatus': {'valid': bool(car['flags'] & FLAG_GPS_VALID), 'satellites': car['sats']},
+                'worker': car['worker'],
+            }
+            if car['fix_at']:
+                fields['position'] = {'lat': car['lat'], 'lon': car['lon'], 'speed': car['speed'],
+                                      'heading': car['heading'], 'quality': car['quality'],
+                                      'receivedAt': car['fix_at']}
+            if car['heartbeat_at']:
+                fields['heartbeatAt'] = car['heartbeat_at']
+            live.update(car['car_id'], fields)
+
+
+def executar(args, service):
+    """Modo --workers N do trackcar_server: supervisor até Ctrl+C/SIGTERM"""
+    import trackcar_server as gateway
+    from config import LIVE_HOST, METRICS_HOST, STATE_TABLE_NAME
+    from live_state import LiveServer, LiveState
+    from metrics import MetricsServer
+
+    vehicles = gateway.carregar_veiculos(args.config)
+    workers = max(1, min(args.workers, len(vehicles)))
+    supervisor = ShardSupervisor(vehicles, workers, STATE_TABLE_NAME,
+                                 options={'no_archive': args.no_archive}).start()
+    log_info(f"🧩 {len(vehicles)} veículos em {workers} workers | tabela de estado: {supervisor.table.name}")
+
+    metrics_server = None
+    if args.metrics_port:
+        gateway.registry.register_collector(table_metrics(supervisor.table))
+        try:
+            metrics_server = MetricsServer(gateway.registry, METRICS_HOST, args.metrics_port).start()
+            log_info(f"📈 Métricas em http://{METRICS_HOST}:{metrics_server.port}/metrics")
+        except OSError as e:
+            log_warning(f"⚠️  Endpoint de métricas indisponível: {e}")
+
+    parar = threading.Event()
+    live_server = None
+    if args.live_port:
+        live = LiveState()
+        try:
+            live_server = LiveServer(live, LIVE_HOST, args.live_port).start()
+            threading.Thread(target=espelhar_estado, args=(supervisor.table, live, parar),
+                             name='live-mirror', daemon=True).start()
+            log_info(f"📍 Estado ao vivo em http://{LIVE_HOST}:{live_server.port}/cars e /stream")
+        except OSError as e:
+            log_warning(f"⚠️  Endpoint do estado ao vivo indisponível: {e}")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: parar.set())
+    code = gateway.EXIT_OK
+    try:
+        while not parar.is_set():
+            supervisor.poll()
+            if supervisor.failed() is not None:
+                code = supervisor.failed()
+                log_error(f"❌ Todos os workers falharam ao iniciar (código {code})")
+                break
+    except KeyboardInterrupt:
+        pass
+
+    print("\n\n⏹️  Encerrando workers...")
+    parar.set()
+    if live_server:
+        live_server.stop()
+    if metrics_server:
+        metrics_server.stop()
+    supervisor.stop()
+    stats = supervisor.stats
+    log_info(f"🧩 Workers - Iniciados: {stats['spawned']} | Mortes: {stats['deaths']} (travados {stats['hung']}) | "
+             f"Veículos movidos: {stats['moves']}")
+    if code == gateway.EXIT_OK:
+        log_info("✅ Sistema encerrado com sucesso")
+    return code
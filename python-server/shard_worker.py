@@ -0,0 +1,309 @@
+# python-server/shard_worker.py
+"""
+Worker do gateway dividido em processos (veja shard_supervisor.py).
+
+Cada worker é um gateway completo para o seu shard, montado com as mesmas
+funções do trackcar_server: cliente e fila do Firestore próprios (spool
+separado por slot, retomado por quem reassume o slot), sessões, listeners
+de car_commands e avistamentos e os timers periódicos. Pela fila de
+controle o supervisor manda adotar ou liberar veículos (rebalanceamento).
+
+O estado de cada veículo vai para a linha dele na StateTable a cada
+registro, pelo mesmo caminho do LiveState (session.live), e os contadores
+e a batida do worker a cada PUBLISH_INTERVAL.
+"""
+
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import trackcar_server as gateway
+from gateway_log import log_info, log_warning, log_error, setup_logging, stop_logging
+from serial_reader import PeriodicTimer, open_port
+from state_table import (StateTable, FLAG_ASSIGNED, FLAG_CONNECTED, FLAG_IGNITION_ON, FLAG_RELAY_ON,
+                         FLAG_GPS_VALID)
+
+PUBLISH_INTERVAL = 1.0  # contadores dos veículos e batida do worker na tabela
+
+# Mensagens worker → supervisor: (evento, slot, dados)
+EVENT_READY = 'ready'
+EVENT_ADOPTED = 'adopted'
+EVENT_RELEASED = 'released'
+
+
+class TablePublisher:
+    """Faz o papel do LiveState nas sessões: grava os campos publicados na linha do veículo"""
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+        self.pid = os.getpid()
+        self.rows = {}   # car_id → linha
+        self.flags = {}  # car_id → FLAG_* atuais (só este processo escreve a linha)
+        self._lock = threading.Lock()  # thread da serial × publicação dos contadores
+
+    def claim(self, car_id, row):
+        with self._lock:
+            self.rows[car_id] = row
+            self.flags[car_id] = FLAG_ASSIGNED
+            self.table.write_car(row, worker=self.slot, pid=self.pid, flags=FLAG_ASSIGNED, updated_at=time.time())
+
+    def drop(self, car_id):
+        with self._lock:
+            row = self.rows.pop(car_id, None)
+            self.flags.pop(car_id, None)
+            if row is not None:
+                self.table.write_car(row, worker=-1, pid=0, flags=FLAG_ASSIGNED, updated_at=time.time())
+
+    def update(self, car_id, fields):
+        """Mesmos campos do LiveState.update (connected, ignition, relay, gpsStatus, position...)"""
+        row = self.rows.get(car_id)
+        if row is None:
+            return
+        values = {'updated_at': time.time()}
+        with self._lock:
+            flags = self.flags[car_id]
+            for key, flag in (('connected', FLAG_CONNECTED), ('ignition', FLAG_IGNITION_ON),
+                              ('relay', FLAG_RELAY_ON)):
+                if key in fields:
+                    on = fields[key] is True or fields[key] == 'on'
+                    flags = flags | flag if on else flags & ~flag
+            gps = fields.get('gpsStatus')
+            if gps is not None:
+                flags = flags | FLAG_GPS_VALID if gps.get('valid') else flags & ~FLAG_GPS_VALID
+                values['sats'] = min(int(gps.get('satellites') or 0), 0xFFFF)
+            position = fields.get('position')
+            if position is not None:
+                values.update(lat=position['lat'], lon=position['lon'], speed=position.get('speed') or 0.0,
+                              heading=position.get('heading') or 0.0, quality=position.get('quality') or 0.0,
+                              fix_at=position.get('receivedAt') or values['updated_at'])
+            if 'heartbeatAt' in fields:
+                values['heartbeat_at'] = fields['heartbeatAt']
+            self.flags[car_id] = values['flags'] = flags
+            self.table.write_car(row, **values)
+
+    def counters(self, session):
+        """Contadores acumulados da sessão"""
+        row = self.rows.get(session.car_id)
+        if row is None:
+            return 0
+        parsed = session.parser.stats
+        lines = parsed['fast'] + parsed['csv'] + parsed['json'] + parsed['errors']
+        thin = session.thinner.stats
+        health = session.health.stats if session.health is not None else {}
+        serial = session.reader.stats if session.reader is not None else {}
+        with self._lock:
+            self.table.write_car(
+                row, lines=lines, gps_reads=session.gps_status['total_reads'],
+                fixes_accepted=session.gps_status['accepted'], fixes_saved=thin['kept'] + thin['forced'],
+                heartbeats=health.get('heartbeats', 0), parse_errors=parsed['errors'],
+                reboots=health.get('reboots', 0), serial_outages=serial.get('outages', 0)
+            )
+        return lines
+
+
+class ShardWorker:
+    """Gateway de um shard; adotar()/liberar() mudam o shard em execução"""
+
+    def __init__(self, slot, table_name, inbox, outbox, options=None):
+        self.slot = slot
+        self.inbox = inbox
+        self.outbox = outbox
+        self.options = options or {}
+        self.table = StateTable.attach(table_name, tracked=True)
+        self.publisher = TablePublisher(self.table, slot)
+        self.started_at = time.time()
+        self.archive = None
+        self.correlator = None
+        self.command_listener = None
+        self.sighting_listener = None
+        self._stop = threading.Event()
+
+    # --------------------------------------------------------------------------
+    # Pontos de extensão (o benchmark troca Firestore e serial)
+    # --------------------------------------------------------------------------
+
+    def conectar(self):
+        """Cliente do Firestore e fila de gravação deste worker"""
+        spool = gateway.WRITER_SPOOL
+        if spool:
+            # Um SQLite por slot: o worker que reassume o slot reenvia o que ficou pendente
+            gateway.WRITER_SPOOL = spool.with_name(f"{spool.stem}-w{self.slot}{spool.suffix}")
+        gateway.init_firebase()
+        gateway.init_writer()
+        if not self.options.get('no_archive'):
+            from archive import TelemetryArchive
+
+            self.archive = TelemetryArchive(gateway.ARCHIVE_DIR)
+        threading.Thread(target=gateway.carregar_geocoder, name='geocoder', daemon=True).start()
+
+    def abrir_serial(self, pool, vehicle):
+        """Future da porta aberta (reset de ~2 s do Arduino) ou None sem serial"""
+        return pool.submit(open_port, vehicle['port'], vehicle.get('baud', gateway.SERIAL_BAUD),
+                           gateway.SERIAL_READ_TIMEOUT)
+
+    def adotados(self, sessions):
+        """Chamado após iniciar as sessões adotadas"""
+
+    # --------------------------------------------------------------------------
+
+    def adotar(self, assignments):
+        """Inicia as sessões de [(vehicle, linha)] e assume as linhas da tabela"""
+        if not assignments:
+            return []
+        vehicles = [v for v, _ in assignments]
+        with ThreadPoolExecutor(max_workers=2 * len(vehicles), thread_name_prefix='adopt') as pool:
+            aberturas = [self.abrir_serial(pool, v) for v in vehicles]
+            novas = gateway.criar_sessoes(vehicles)
+            for session, vehicle in zip(novas, vehicles):
+                # Logs de todos os workers no mesmo console: sempre com o prefixo do veículo
+                session.label = session.label or f"[{vehicle.get('name', vehicle['carId'][:8])}] "
+            list(pool.map(lambda session: session.load_initial_state(), novas))
+            for session, abertura in zip(novas, aberturas):
+                if abertura is not None:
+                    gateway.init_serial(session, abertura, service=True)
+        if self.archive is not None:
+            self.archive.claim([s.car_id for s in novas])
+        for session, (_, row) in zip(novas, assignments):
+            self.publisher.claim(session.car_id, row)
+            session.live = self.publisher
+            session.archive = self.archive
+            session.sightings = self.correlator
+            if gateway.geocoder is not None:
+                session.geocoder = gateway.geocoder
+            session.start()
+        # Lista nova em vez de append: os timers podem estar iterando a antiga
+        gateway.sessions = gateway.sessions + novas
+        self._reabrir_listeners()
+        self.adotados(novas)
+        log_info(f"🧩 Worker {self.slot}: +{len(novas)} veículos ({len(gateway.sessions)} no shard)")
+        return novas
+
+    def liberar(self, car_ids):
+        """Encerra as sessões (grava o pendente) e solta as linhas"""
+        car_ids = set(car_ids)
+        saindo = [s for s in gateway.sessions if s.car_id in car_ids]
+        gateway.sessions = [s for s in gateway.sessions if s.car_id not in car_ids]
+        for session in saindo:
+            session.stop()
+            self.publisher.drop(session.car_id)
+            if self.correlator is not None:
+                self.correlator.forget(session.car_id)
+        if self.archive is not None and saindo:
+            # Antes do 'released': o worker que adotar vai acrescentar às mesmas colunas
+            try:
+                self.archive.release([s.car_id for s in saindo])
+            except OSError as e:
+                log_error(f"❌ Erro ao gravar o arquivo local: {e}")
+        self._reabrir_listeners()
+        log_info(f"🧩 Worker {self.slot}: -{len(saindo)} veículos ({len(gateway.sessions)} no shard)")
+        return [s.car_id for s in saindo]
+
+    def _reabrir_listeners(self):
+        """car_commands e avistamentos filtram por carId: reabre com o shard atual"""
+        from car_commands import CommandQueueListener
+        from sightings import SightingListener
+
+        if self.command_listener is not None:
+            self.command_listener.stop()
+            self.command_listener = None
+        if self.sighting_listener is not None:
+            self.sighting_listener.stop()
+            self.sighting_listener = None
+        if not gateway.sessions:
+            return
+        try:
+            self.command_listener = CommandQueueListener(gateway.db, gateway.sessions, on_error=log_error).start()
+        except Exception as e:
+            log_error(f"❌ Erro ao escutar car_commands: {e}")
+        try:
+            self.sighting_listener = SightingListener(gateway.db, self.correlator, gateway.sessions,
+                                                      on_info=log_info, on_error=log_error).start()
+        except Exception as e:
+            log_error(f"❌ Erro ao escutar avistamentos: {e}")
+
+    def publicar(self):
+        """Contadores de cada veículo e do worker (a batida que o supervisor vigia)"""
+        lines = sum(self.publisher.counters(session) for session in gateway.sessions)
+        stats = gateway.writer.stats() if gateway.writer is not None else {}
+        self.table.write_worker(
+            self.slot, pid=os.getpid(), vehicles=len(gateway.sessions), started_at=self.started_at,
+            beat_at=time.time(), cpu_s=time.process_time(), lines=lines,
+            queue_depth=stats.get('queue_depth', 0), committed=stats.get('committed', 0),
+            dropped=stats.get('dropped', 0), failed=stats.get('failed', 0)
+        )
+
+    def run(self, assignments):
+        from sightings import SightingCorrelator
+
+        # Ctrl+C chega ao grupo inteiro: quem encerra os workers é o supervisor
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._stop.set())
+        self.conectar()
+        self.correlator = SightingCorrelator()
+        self.adotar(assignments)
+        self.publicar()
+        self.outbox.put((EVENT_READY, self.slot, os.getpid()))
+
+        timers = [
+            PeriodicTimer(gateway.GPS_STATUS_INTERVAL, gateway.atualizar_status_gps,
+                          name='gps-status', on_error=log_error).start(),
+            PeriodicTimer(1, gateway.flush_documentos_carros, name='car-flush', on_error=log_error).start(),
+            PeriodicTimer(gateway.HEALTH_EXPIRE_INTERVAL, gateway.expirar_saude,
+                          name='health-expire', on_error=log_error).start(),
+        ]
+        if self.archive is not None:
+            timers.append(PeriodicTimer(gateway.ARCHIVE_FLUSH_INTERVAL, self.archive.flush,
+                                        name='archive-flush', on_error=log_error).start())
+        try:
+            while not self._stop.is_set():
+                try:
+                    message = self.inbox.get(timeout=PUBLISH_INTERVAL)
+                except queue.Empty:
+                    message = None
+                if message is None:
+                    pass
+                elif message[0] == 'adopt':
+                    adotadas = self.adotar(message[1])
+                    self.outbox.put((EVENT_ADOPTED, self.slot, [s.car_id for s in adotadas]))
+                elif message[0] == 'release':
+                    self.outbox.put((EVENT_RELEASED, self.slot, self.liberar(message[1])))
+                elif message[0] == 'stop':
+                    break
+                self.publicar()
+        finally:
+            for timer in timers:
+                timer.stop()
+            self.liberar([s.car_id for s in gateway.sessions])
+            if gateway.writer is not None:
+                gateway.writer.stop()
+            if self.archive is not None:
+                try:
+                    self.archive.flush()
+                except OSError as e:
+                    log_error(f"❌ Erro ao gravar o arquivo local: {e}")
+            self.publicar()
+            self.table.close()
+
+
+def main(slot, table_name, inbox, outbox, assignments, options=None, worker_cls=ShardWorker):
+    """Alvo do multiprocessing.Process de cada worker"""
+    setup_logging()
+    code = 0
+    try:
+        worker_cls(slot, table_name, inbox, outbox, options).run(assignments)
+    except gateway.GatewayExit as e:
+        log_error(f"❌ Worker {slot}: {e}")
+        code = e.code
+    except Exception as e:
+        log_error(f"❌ Worker {slot} encerrado por erro: {e}")
+        code = 1
+    finally:
+        stop_logging()
+    if code:
+        log_warning(f"⚠️  Worker {slot} saindo com código {code}")
+        sys.exit(code)
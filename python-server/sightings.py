@@ -0,0 +1,367 @@
+# python-server/sightings.py
+"""
+Correlação de avistamentos públicos com os fixes do rastreador.
+
+Com o carro marcado como roubado, o app grava avistamentos em
+vehicle_sightings ({stolenVehicleId, location {latitude, longitude,
+accuracy?}, timestamp}, services/stolenVehicleService.ts), e nada os ligava
+aos fixes do próprio rastreador. O SightingCorrelator guarda os fixes
+recentes de cada veículo e dá a cada avistamento uma confiança de 0 a 1:
+o rastreador esteve perto daquele ponto perto daquela hora?
+
+O histórico de cada carro é uma fila de baldes de `bucket_s` segundos;
+cada balde tem uma grade de células de `cell_deg` graus com os fixes
+(t, lat, lon). Um avistamento só consulta as células vizinhas da sua
+posição nos baldes a até `max_dt_s` da sua hora, do balde da hora para
+fora, e para quando o Δt sozinho já não supera o melhor fix: bem abaixo de
+1 ms mesmo com um carro parado enchendo a célula a 1 Hz
+(benchmarks/bench_sightings.py). Baldes mais velhos que `window_s` saem da
+frente da fila. O histórico é mantido para todos os veículos, não só os roubados:
+o roubo costuma ser informado horas depois, e os fixes desse intervalo
+são justamente os que confirmam os primeiros avistamentos.
+
+Confiança do melhor fix candidato:
+    exp(-½·(d/σd)²) · exp(-½·(Δt/σt)²),  d = distância menos a precisão do avistamento
+
+Um avistamento mais novo que o último fix (o fix ainda não chegou) fica
+pendente e é reavaliado a cada fix do carro até `max_dt_s` depois da sua
+hora ou até atingir `confirm_score`.
+
+O SightingListener liga isso ao Firestore: escuta stolen_cars ativos e
+vehicle_sightings dos veículos do gateway, grava `trackerMatch` no
+avistamento e `lastConfirmedPosition` em stolen_cars (ou cars) quando a
+confiança passa de `confirm_score`. `trackerMatch.status` é 'pending'
+enquanto o avistamento espera fixes, e 'confirmed' ou 'unconfirmed' (com a
+melhor confiança) no fim; ao reiniciar, o gateway só pula os confirmados.
+Um registro ativo em stolen_cars também põe o veículo na via urgente e no
+modo 'stolen', como cars.isStolen.
+"""
+
+import math
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+
+from car_commands import MAX_IN_VALUES, where_filter
+from gps_thinning import EARTH_RADIUS_M
+
+DEFAULT_SIGHTINGS = {
+    'window_s': 6 * 3600,  # fixes mantidos por veículo
+    'bucket_s': 60,        # largura de cada balde de tempo
+    'cell_deg': 0.005,     # ~550 m: a célula cobre max_distance_m
+    'max_distance_m': 500,
+    'max_dt_s': 900,       # fixes a até 15 min do avistamento
+    'sigma_m': 150.0,
+    'sigma_s': 300.0,
+    'confirm_score': 0.5,  # acima disso vira lastConfirmedPosition
+}
+
+_M_PER_DEG = math.radians(1) * EARTH_RADIUS_M
+
+
+class FixHistory:
+    """Fixes recentes de um veículo em baldes de tempo com grade espacial"""
+
+    def __init__(self, bucket_s, cell_deg, window_s):
+        self.bucket_s = bucket_s
+        self.cell_deg = cell_deg
+        self.window_s = window_s
+        self.buckets = {}        # índice do balde → {célula: [(t, lat, lon)]}
+        self.order = deque()     # índices dos baldes, do mais velho ao mais novo
+        self.last_t = None
+        self.count = 0
+
+    def add(self, t, lat, lon):
+        index = int(t // self.bucket_s)
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = {}
+            self.order.append(index)
+            # Fixes atrasados de um balde já descartado recriam o balde: vale a janela
+            oldest = index - int(self.window_s // self.bucket_s)
+            while self.order and self.order[0] < oldest:
+                self.count -= sum(len(v) for v in self.buckets.pop(self.order.popleft()).values())
+        cell = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+        bucket.setdefault(cell, []).append((t, lat, lon))
+        self.count += 1
+        if self.last_t is None or t > self.last_t:
+            self.last_t = t
+
+    def candidates(self, t, lat, lon, max_dt):
+        """
+        (menor |Δt| possível no balde, fixes) da célula de (lat, lon) e das
+        vizinhas, balde a balde a partir da hora `t` para fora
+        """
+        cy, cx = math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+        cells = [(cy + dy, cx + dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+        buckets, width = self.buckets, self.bucket_s
+        center = int(t // width)
+        for step in range(int(max_dt // width) + 2):
+            indexes = (center,) if step == 0 else (center - step, center + step)
+            for gap, index in sorted((max(0.0, i * width - t, t - (i + 1) * width), i) for i in indexes):
+                bucket = buckets.get(index)
+                if bucket is None or gap > max_dt:
+                    continue
+                for cell in cells:
+                    fixes = bucket.get(cell)
+                    if fixes:
+                        yield gap, fixes
+
+
+class SightingCorrelator:
+    """Histórico de fixes por veículo + confiança de cada avistamento"""
+
+    def __init__(self, on_match=None, **config):
+        unknown = set(config) - set(DEFAULT_SIGHTINGS)
+        if unknown:
+            raise ValueError(f"Parâmetros de avistamento desconhecidos: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULT_SIGHTINGS, **config)
+        self.on_match = on_match  # on_match(car_id, sighting_id, match) para pendentes confirmados ou expirados
+        self.histories = {}
+        self.pending = {}  # car_id → {sighting_id: (t, lat, lon, accuracy, melhor confiança)}
+        self._lock = Lock()
+        self.stats = {'fixes': 0, 'sightings': 0, 'confirmed': 0, 'late_confirmed': 0, 'expired': 0}
+
+    def add_fix(self, car_id, t, lat, lon):
+        """Fix aceito do veículo (chamado pela sessão); reavalia os pendentes"""
+        cfg = self.config
+        decided = []
+        with self._lock:
+            history = self.histories.get(car_id)
+            if history is None:
+                history = self.histories[car_id] = FixHistory(cfg['bucket_s'], cfg['cell_deg'], cfg['window_s'])
+            history.add(t, lat, lon)
+            self.stats['fixes'] += 1
+            pending = self.pending.get(car_id)
+            if pending:
+                for sighting_id, (st, slat, slon, accuracy, best) in list(pending.items()):
+                    match = self._match(history, st, slat, slon, accuracy)
+                    if match is not None and match['confidence'] >= cfg['confirm_score']:
+                        del pending[sighting_id]
+                        self.stats['confirmed'] += 1
+                        self.stats['late_confirmed'] += 1
+                        decided.append((sighting_id, match))
+                    elif t - st > cfg['max_dt_s']:
+                        del pending[sighting_id]
+                        self.stats['expired'] += 1
+                        decided.append((sighting_id, match))
+        if self.on_match is not None:
+            for sighting_id, match in decided:
+                self.on_match(car_id, sighting_id, match)
+
+    def correlate(self, car_id, sighting_id, t, lat, lon, accuracy=0.0):
+        """
+        Confiança do avistamento: dict {confidence, distanceM, deltaS, fix
+        (t, lat, lon)} do melhor fix candidato, ou None sem fix candidato.
+        Não confirmado e ainda sem fixes posteriores à sua hora: fica pendente.
+        """
+        cfg = self.config
+        with self._lock:
+            self.stats['sightings'] += 1
+            history = self.histories.get(car_id)
+            match = self._match(history, t, lat, lon, accuracy) if history is not None else None
+            if match is not None and match['confidence'] >= cfg['confirm_score']:
+                self.stats['confirmed'] += 1
+            elif history is None or history.last_t is None or history.last_t < t + cfg['max_dt_s']:
+                best = match['confidence'] if match is not None else 0.0
+                self.pending.setdefault(car_id, {})[sighting_id] = (t, lat, lon, accuracy, best)
+        return match
+
+    def forget(self, car_id):
+        """Descarta histórico e pendentes de um veículo"""
+        with self._lock:
+            self.histories.pop(car_id, None)
+            self.pending.pop(car_id, None)
+
+    def is_pending(self, car_id, sighting_id):
+        with self._lock:
+            return sighting_id in self.pending.get(car_id, ())
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(p) for p in self.pending.values())
+
+    def _match(self, history, t, lat, lon, accuracy):
+        cfg = self.config
+        max_dt, max_d2 = cfg['max_dt_s'], cfg['max_distance_m'] ** 2
+        inv_sm, inv_ss = 1 / cfg['sigma_m'], 1 / cfg['sigma_s']
+        ky, kx = _M_PER_DEG, _M_PER_DEG * math.cos(math.radians(lat))
+        # Minimiza o expoente (d/σd)² + (Δt/σt)²; os baldes vêm do mais próximo
+        # da hora para fora, e um balde cujo Δt mínimo já perde para o melhor
+        # encerra a busca (um carro parado enche a célula de fixes iguais)
+        best, best_cost = None, math.inf
+        for gap, fixes in history.candidates(t, lat, lon, max_dt):
+            if (gap * inv_ss) ** 2 >= best_cost:
+                break
+            for fix in fixes:
+                ft, flat, flon = fix
+                dt = ft - t
+                if dt > max_dt or dt < -max_dt:
+                    continue
+                dy = (flat - lat) * ky
+                dx = (flon - lon) * kx
+                d2 = dx * dx + dy * dy
+                if d2 > max_d2:
+                    continue
+                d = math.sqrt(d2)
+                e = max(0.0, d - accuracy) * inv_sm
+                cost = e * e + (dt * inv_ss) ** 2
+                if cost < best_cost:
+                    best, best_cost = (fix, d, dt), cost
+        if best is None:
+            return None
+        fix, d, dt = best
+        return {'confidence': round(math.exp(-0.5 * best_cost), 3), 'distanceM': round(d), 'deltaS': round(dt),
+                'fix': fix}
+
+
+def _timestamp(value):
+    """Timestamp do Firestore (datetime), ms ou s → segundos unix"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    return None
+
+
+class SightingListener:
+    """Liga o SightingCorrelator a stolen_cars e vehicle_sightings"""
+
+    def __init__(self, db, correlator, sessions, on_info=None, on_error=None):
+        self.db = db
+        self.correlator = correlator
+        self.sessions = {s.car_id: s for s in sessions}
+        self.on_info = on_info
+        self.on_error = on_error
+        self.stolen_ids = {}  # id em stolen_cars → carId
+        self.stolen_watches = []
+        self.sighting_watches = []
+        self._watched = None  # IDs de stolenVehicleId escutados agora
+        self._seen = set()
+        self._lock = Lock()
+        # Um fix pode decidir o pendente logo após o correlate(): o 'pending'
+        # tem de entrar na fila antes do resultado
+        self._write_lock = Lock()
+        correlator.on_match = self._decidido
+
+    def start(self):
+        """Escuta stolen_cars ativos dos veículos; os avistamentos seguem o conjunto de IDs"""
+        car_ids = list(self.sessions)
+        for i in range(0, len(car_ids), MAX_IN_VALUES):
+            query = where_filter(self.db.collection('stolen_cars'), 'carId', 'in', car_ids[i:i + MAX_IN_VALUES])
+            query = where_filter(query, 'isActive', '==', True)
+            self.stolen_watches.append(query.on_snapshot(self._on_stolen))
+        self._escutar_avistamentos()
+        return self
+
+    def stop(self):
+        for watch in self.stolen_watches + self.sighting_watches:
+            watch.unsubscribe()
+        self.stolen_watches = []
+        self.sighting_watches = []
+
+    def _on_stolen(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    self.stolen_ids.pop(doc.id, None)
+                else:
+                    self.stolen_ids[doc.id] = (doc.to_dict() or {}).get('carId')
+            stolen = set(self.stolen_ids.values())
+        # Roubo informado basta para a via urgente, sem esperar cars.isStolen
+        for car_id, session in self.sessions.items():
+            session.marcar_roubo(car_id in stolen)
+        self._escutar_avistamentos()
+
+    def _escutar_avistamentos(self):
+        """(Re)abre os listeners de vehicle_sightings quando o conjunto de IDs muda"""
+        with self._lock:
+            # O app usa o ID de stolen_cars ou, sem ele, o próprio carId
+            ids = sorted(set(self.sessions) | set(self.stolen_ids))
+            if ids == self._watched:
+                return
+            self._watched = ids
+            old, self.sighting_watches = self.sighting_watches, []
+            # Avistamentos mais velhos que a janela não têm fixes para comparar
+            since = datetime.fromtimestamp(
+                datetime.now(timezone.utc).timestamp() - self.correlator.config['window_s'], timezone.utc)
+            for i in range(0, len(ids), MAX_IN_VALUES):
+                query = where_filter(self.db.collection('vehicle_sightings'), 'stolenVehicleId', 'in',
+                                     ids[i:i + MAX_IN_VALUES])
+                query = where_filter(query, 'timestamp', '>=', since)
+                self.sighting_watches.append(query.on_snapshot(self._on_sightings))
+        for watch in old:
+            watch.unsubscribe()
+
+    def _on_sightings(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name != 'ADDED':
+                continue  # MODIFIED: o próprio gateway gravou trackerMatch
+            doc = change.document
+            data = doc.to_dict() or {}
+            # Pendente ou não confirmado antes de reiniciar: fixes novos podem confirmar
+            confidence = (data.get('trackerMatch') or {}).get('confidence') or 0.0
+            with self._lock:
+                if doc.id in self._seen or confidence >= self.correlator.config['confirm_score']:
+                    continue
+                self._seen.add(doc.id)
+                target = data.get('stolenVehicleId')
+                car_id = self.stolen_ids.get(target, target)
+            location = data.get('location') or {}
+            t = _timestamp(data.get('timestamp'))
+            if car_id not in self.sessions or t is None or location.get('latitude') is None:
+                continue
+            try:
+                with self._write_lock:
+                    match = self.correlator.correlate(car_id, doc.id, t, float(location['latitude']),
+                                                      float(location['longitude']),
+                                                      float(location.get('accuracy') or 0))
+                    self._gravar(car_id, doc.id, match, target,
+                                 pending=self.correlator.is_pending(car_id, doc.id))
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"❌ Erro ao correlacionar avistamento {doc.id}: {e}")
+
+    def _decidido(self, car_id, sighting_id, match):
+        """Pendente confirmado ou expirado por um fix novo"""
+        with self._write_lock:
+            self._gravar(car_id, sighting_id, match)
+
+    def _gravar(self, car_id, sighting_id, match, stolen_id=None, pending=False):
+        """trackerMatch no avistamento e, se confirmado, lastConfirmedPosition no registro do roubo"""
+        session = self.sessions[car_id]
+        writer = session.writer
+        sighting = self.db.collection('vehicle_sightings').document(sighting_id)
+        if pending:
+            # Sem confiança ainda: o resultado sai quando os fixes chegarem (on_match)
+            writer.update(sighting, {'trackerMatch': {'status': 'pending',
+                                                      'evaluatedAt': datetime.now(timezone.utc)}}, urgent=True)
+            if self.on_info:
+                self.on_info(f"👀 Avistamento {sighting_id} de {car_id}: aguardando fixes")
+            return
+        confirmed = match is not None and match['confidence'] >= self.correlator.config['confirm_score']
+        fields = {'status': 'confirmed' if confirmed else 'unconfirmed', 'confidence': 0.0,
+                  'evaluatedAt': datetime.now(timezone.utc)}
+        if match is not None:
+            ft, flat, flon = match['fix']
+            fields.update(confidence=match['confidence'], distanceM=match['distanceM'], deltaS=match['deltaS'],
+                          trackerLatitude=flat, trackerLongitude=flon,
+                          trackerTimestamp=datetime.fromtimestamp(ft, timezone.utc))
+        writer.update(sighting, {'trackerMatch': fields}, urgent=True)
+        if self.on_info:
+            self.on_info(f"👀 Avistamento {sighting_id} de {car_id}: confiança {fields['confidence']:.2f}"
+                         + (f" ({match['distanceM']} m, {match['deltaS']:+d}s do fix)" if match else ''))
+        if not confirmed:
+            return
+        ft, flat, flon = match['fix']
+        position = {'latitude': flat, 'longitude': flon, 'timestamp': datetime.fromtimestamp(ft, timezone.utc),
+                    'confidence': match['confidence'], 'sightingId': sighting_id}
+        if stolen_id is None:
+            with self._lock:
+                stolen_id = next((s for s, c in self.stolen_ids.items() if c == car_id), None)
+        if stolen_id is not None and stolen_id != car_id:
+            writer.update(self.db.collection('stolen_cars').document(stolen_id),
+                          {'lastConfirmedPosition': position, 'trackerConfidence': match['confidence']},
+                          urgent=True)
+        session.car_doc.update({'lastConfirmedPosition': position})
@@ -0,0 +1,135 @@
+# python-server/spool.py
+"""
+Spool local e durável das escritas do gateway.
+
+Cada operação destinada ao Firestore é gravada primeiro num arquivo SQLite em
+modo WAL, com número de sequência crescente. O FirestoreWriter drena o spool
+em ordem e só apaga as linhas depois do commit confirmado; se o Firestore
+estiver fora do ar ou o gateway reiniciar, nada se perde.
+
+Os IDs dos documentos de `add` são gerados antes de entrar no spool, então
+reenviar um lote após uma falha sobrescreve o mesmo documento em vez de
+criar duplicatas.
+
+Os dados vão como JSON: além dos tipos do JSON, só datetime e o sentinel
+SERVER_TIMESTAMP. Qualquer outro valor (DELETE_FIELD, Increment...) é
+recusado com ValueError no append; o FirestoreWriter conta e reporta.
+"""
+
+import json
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+
+
+_JSON_TYPES = (str, int, float, bool, type(None))
+
+
+def _encode(value):
+    if isinstance(value, _JSON_TYPES):
+        return value
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if _is_server_timestamp(value):
+        return {'__sentinel__': 'SERVER_TIMESTAMP'}
+    # DELETE_FIELD, Increment, ArrayUnion...: reenviar com outro sentido seria pior que recusar
+    raise ValueError(f"Valor {type(value).__name__} não pode ir para o spool: {value!r}")
+
+
+def _is_server_timestamp(value):
+    from firebase_admin import firestore
+    return value is firestore.SERVER_TIMESTAMP
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if '__sentinel__' in value:
+            from firebase_admin import firestore
+            return firestore.SERVER_TIMESTAMP
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+class SqliteSpool:
+    """Fila FIFO persistente: append → peek → ack"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " merge INTEGER NOT NULL DEFAULT 0,"
+            " data TEXT NOT NULL)"
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._oldest = self._first_created()
+
+    def __len__(self):
+        return self._count
+
+    def oldest_created(self):
+        """Instante (time.time) da operação pendente mais antiga"""
+        return self._oldest
+
+    def append(self, kind, path, data, merge=False):
+        """Grava a operação; ValueError se `data` tem valor que o spool não sabe guardar"""
+        encoded = json.dumps(_encode(data))
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                raise ValueError("spool já fechado (gateway encerrando)")
+            self._conn.execute(
+                "INSERT INTO spool (created, kind, path, merge, data) VALUES (?, ?, ?, ?, ?)",
+                (now, kind, path, 1 if merge else 0, encoded)
+            )
+            self._count += 1
+            if self._oldest is None:
+                self._oldest = now
+
+    def peek(self, limit):
+        """Primeiras `limit` operações: lista de (seq, kind, path, data, merge)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, kind, path, data, merge FROM spool ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, kind, path, _decode(json.loads(data)), bool(merge))
+                for seq, kind, path, data, merge in rows]
+
+    def ack(self, seqs):
+        """Remove operações já confirmadas pelo Firestore"""
+        if not seqs:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cursor = self._conn.executemany("DELETE FROM spool WHERE seq = ?", [(s,) for s in seqs])
+            self._conn.execute("COMMIT")
+            self._count -= cursor.rowcount
+            self._oldest = self._first_created()
+
+    def _first_created(self):
+        row = self._conn.execute("SELECT created FROM spool ORDER BY seq LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
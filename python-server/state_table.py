@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# python-server/state_table.py
+"""
+Tabela de estado da frota em memória compartilhada, com layout fixo.
+
+Com o gateway dividido em processos (shard_supervisor.py), cada worker
+publica o último estado e os contadores dos seus veículos numa linha de
+tamanho fixo de um bloco multiprocessing.shared_memory. O supervisor, o
+/metrics e qualquer processo de relatório (`python state_table.py`) leem
+a tabela direto da memória, sem IPC e sem cópia: struct.unpack_from numa
+linha, ou um array estruturado do numpy sobre o bloco inteiro (arrays()).
+
+Layout (little-endian, campos sem alinhamento):
+
+    cabeçalho   HEADER (magic, versão, capacidade, número de slots, tamanhos)
+    workers     WORKER_FIELDS × max_workers   (um slot por worker)
+    carros      CAR_FIELDS × capacity         (uma linha por veículo)
+
+Cada linha tem um único escritor: o worker dono do veículo (ou do slot), ou
+o supervisor enquanto a linha não tem dono. O primeiro campo é um contador
+`seq` (seqlock): o escritor o torna ímpar, grava os campos e o torna par de
+novo; o leitor repete a leitura se viu `seq` ímpar ou diferente no fim,
+cedendo a CPU entre as tentativas por até READ_TIMEOUT (com um núcleo só,
+o escritor pode ter sido desescalonado no meio da linha). Um worker morto no meio de uma escrita deixa `seq` ímpar; o supervisor corrige
+com repair() antes de entregar a linha a outro worker.
+
+Uso (relatório da frota a partir de outro processo):
+    python state_table.py                 # tabela TRACKCAR_STATE
+    python state_table.py --watch 2
+"""
+
+import argparse
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = b'TRKSTATE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIIII')  # magic, versão, reservado, capacidade, slots, linha carro, linha worker
+
+CAR_FIELDS = (
+    ('seq', 'Q'),
+    ('car_id', '32s'),
+    ('worker', 'h'),          # slot do worker dono (-1 = sem dono)
+    ('pid', 'i'),
+    ('flags', 'I'),           # FLAG_*
+    ('updated_at', 'd'),      # time.time() da última escrita
+    ('heartbeat_at', 'd'),
+    ('fix_at', 'd'),          # recepção do último fix aceito
+    ('lat', 'd'),
+    ('lon', 'd'),
+    ('speed', 'f'),
+    ('heading', 'f'),
+    ('quality', 'f'),
+    ('sats', 'H'),
+    ('lines', 'Q'),           # linhas da serial processadas
+    ('gps_reads', 'Q'),
+    ('fixes_accepted', 'Q'),
+    ('fixes_saved', 'Q'),     # enviados para gps_locations
+    ('heartbeats', 'Q'),
+    ('parse_errors', 'Q'),
+    ('reboots', 'I'),
+    ('serial_outages', 'I'),
+)
+
+WORKER_FIELDS = (
+    ('seq', 'Q'),
+    ('pid', 'i'),
+    ('vehicles', 'H'),
+    ('started_at', 'd'),
+    ('beat_at', 'd'),         # o supervisor considera travado quem para de bater
+    ('cpu_s', 'd'),
+    ('lines', 'Q'),
+    ('queue_depth', 'I'),
+    ('committed', 'Q'),
+    ('dropped', 'Q'),
+    ('failed', 'Q'),
+)
+
+FLAG_ASSIGNED = 1
+FLAG_CONNECTED = 2
+FLAG_IGNITION_ON = 4
+FLAG_RELAY_ON = 8
+FLAG_GPS_VALID = 16
+
+_NUMPY_CODES = {'Q': '<u8', 'I': '<u4', 'H': '<u2', 'h': '<i2', 'i': '<i4', 'd': '<f8', 'f': '<f4'}
+_SEQ = struct.Struct('<Q')
+READ_TIMEOUT = 0.05  # s tentando ler uma linha em escrita (o escritor pode ter perdido a CPU no meio)
+
+
+class _Layout:
+    """Struct da linha inteira + (Struct, deslocamento) de cada campo"""
+
+    def __init__(self, fields):
+        self.names = tuple(name for name, _ in fields)
+        self.codes = tuple(code for _, code in fields)
+        self.row = struct.Struct('<' + ''.join(self.codes))
+        self.fields = {}
+        self._dtype = None
+        offset = 0
+        for name, code in fields:
+            field = struct.Struct('<' + code)
+            self.fields[name] = (field, offset)
+            offset += field.size
+
+    def dtype(self):
+        if self._dtype is None:
+            import numpy as np
+
+            self._dtype = np.dtype([(name, 'S32' if code == '32s' else _NUMPY_CODES[code])
+                                    for name, code in zip(self.names, self.codes)])
+        return self._dtype
+
+
+CARS = _Layout(CAR_FIELDS)
+WORKERS = _Layout(WORKER_FIELDS)
+
+
+class StateTable:
+    """Bloco de memória compartilhada com as linhas dos carros e dos workers"""
+
+    def __init__(self, shm, owner=False):
+        magic, version, _, capacity, max_workers, car_size, worker_size = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION or car_size != CARS.row.size or worker_size != WORKERS.row.size:
+            shm.close()
+            raise ValueError(f"Tabela de estado {shm.name} com layout incompatível")
+        self.shm = shm
+        self.owner = owner
+        self.capacity = capacity
+        self.max_workers = max_workers
+        self._workers_at = HEADER.size
+        self._cars_at = HEADER.size + max_workers * WORKERS.row.size
+
+    @classmethod
+    def create(cls, capacity, max_workers, name=None):
+        """Cria a tabela zerada; um bloco com o mesmo nome (processo morto) é substituído"""
+        size = HEADER.size + max_workers * WORKERS.row.size + capacity * CARS.row.size
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, 0, capacity, max_workers, CARS.row.size, WORKERS.row.size)
+        table = cls(shm, owner=True)
+        for row in range(capacity):
+            table.write_car(row, worker=-1)
+        return table
+
+    @classmethod
+    def attach(cls, name, tracked=False):
+        """
+        Abre uma tabela existente. Fora dos workers do supervisor (que
+        compartilham o resource_tracker dele), tracked=False evita que o
+        tracker do processo leitor apague o bloco quando ele sair.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if not tracked:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        """Solta o mapeamento; o dono também apaga o bloco"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    # --------------------------------------------------------------------------
+    # Escrita (um escritor por linha)
+    # --------------------------------------------------------------------------
+
+    def write_car(self, row, **fields):
+        self._write(CARS, self._car_offset(row), fields)
+
+    def write_worker(self, slot, **fields):
+        self._write(WORKERS, self._worker_offset(slot), fields)
+
+    def assign(self, row, car_id):
+        """Liga a linha a um veículo (supervisor, antes de qualquer worker)"""
+        self.write_car(row, car_id=car_id.encode('utf-8')[:32], flags=FLAG_ASSIGNED, worker=-1, pid=0)
+
+    def repair(self, row=None, slot=None):
+        """Fecha a escrita deixada pela metade por um worker morto (linha ou slot)"""
+        buf = self.shm.buf
+        offset = self._car_offset(row) if row is not None else self._worker_offset(slot)
+        seq, = _SEQ.unpack_from(buf, offset)
+        if seq & 1:
+            _SEQ.pack_into(buf, offset, seq + 1)
+
+    def _write(self, layout, offset, fields):
+        buf = self.shm.buf
+        seq, = _SEQ.unpack_from(buf, offset)
+        _SEQ.pack_into(buf, offset, seq + 1)
+        for name, value in fields.items():
+            field, at = layout.fields[name]
+            field.pack_into(buf, offset + at, value)
+        _SEQ.pack_into(buf, offset, seq + 2)
+
+    # --------------------------------------------------------------------------
+    # Leitura (qualquer processo)
+    # --------------------------------------------------------------------------
+
+    def read_car(self, row):
+        """dict da linha (car_id já decodificado) ou None se a escrita não terminou"""
+        values = self._read(CARS, self._car_offset(row))
+        if values is not None:
+            values['car_id'] = values['car_id'].rstrip(b'\0').decode('utf-8', 'replace')
+        return values
+
+    def read_worker(self, slot):
+        return self._read(WORKERS, self._worker_offset(slot))
+
+    def cars(self):
+        """Linhas em uso, na ordem da tabela"""
+        rows = (self.read_car(row) for row in range(self.capacity))
+        return [r for r in rows if r is not None and r['flags'] & FLAG_ASSIGNED]
+
+    def workers(self):
+        return [self.read_worker(slot) for slot in range(self.max_workers)]
+
+    def arrays(self):
+        """
+        (carros, workers) como arrays estruturados do numpy sobre o próprio
+        bloco, sem cópia. Leitura sem seqlock: serve para agregados da frota.
+        """
+        import numpy as np
+
+        workers = np.ndarray((self.max_workers,), dtype=WORKERS.dtype(), buffer=self.shm.buf,
+                             offset=self._workers_at)
+        cars = np.ndarray((self.capacity,), dtype=CARS.dtype(), buffer=self.shm.buf, offset=self._cars_at)
+        return cars, workers
+
+    def _read(self, layout, offset):
+        buf = self.shm.buf
+        deadline = None
+        while True:
+            before, = _SEQ.unpack_from(buf, offset)
+            if not before & 1:
+                values = layout.row.unpack_from(buf, offset)
+                after, = _SEQ.unpack_from(buf, offset)
+                if after == before:
+                    return dict(zip(layout.names, values))
+            # Escrita em andamento: cede a CPU para o escritor terminar (num núcleo
+            # só, girar não adianta); um escritor morto deixa `seq` ímpar para sempre
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + READ_TIMEOUT
+            elif now > deadline:
+                return None
+            time.sleep(0)
+
+    def _car_offset(self, row):
+        if not 0 <= row < self.capacity:
+            raise IndexError(f"Linha {row} fora da tabela ({self.capacity})")
+        return self._cars_at + row * CARS.row.size
+
+    def _worker_offset(self, slot):
+        if not 0 <= slot < self.max_workers:
+            raise IndexError(f"Slot {slot} fora da tabela ({self.max_workers})")
+        return self._workers_at + slot * WORKERS.row.size
+
+
+def main():
+    from config import STATE_TABLE_NAME
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('name', nargs='?', default=STATE_TABLE_NAME, help="nome do bloco (padrão: TRACKCAR_STATE)")
+    parser.add_argument('--watch', type=float, metavar='S', help="repete a cada S segundos")
+    args = parser.parse_args()
+
+    try:
+        table = StateTable.attach(args.name)
+    except FileNotFoundError:
+        parser.exit(1, f"Tabela {args.name} não encontrada (o gateway está rodando com --workers?)\n")
+    try:
+        while True:
+            now = time.time()
+            for slot, w in enumerate(table.workers()):
+                if w and w['pid']:
+                    print(f"worker {slot}: pid {w['pid']} | {w['vehicles']} veículos | {w['lines']} linhas | "
+                          f"fila {w['queue_depth']} | CPU {w['cpu_s']:.1f}s | batida há {now - w['beat_at']:.1f}s")
+            for car in table.cars():
+                fix = f"{car['lat']:.5f},{car['lon']:.5f} há {now - car['fix_at']:.0f}s" if car['fix_at'] else "sem fix"
+                print(f"  {car['car_id']:24s} w{car['worker']:<2d} {'serial' if car['flags'] & FLAG_CONNECTED else 'SEM SERIAL':10s} "
+                      f"{fix} | {car['sats']} sats | {car['lines']} linhas | {car['reboots']} reinícios")
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+            print()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.close()
+
+
+if __name__ == '__main__':
+    main()
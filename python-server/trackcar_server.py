@@ -5,21 +5,40 @@ Arduino Nano → Firebase + Controle Relé + GPS Debug
 Versão adaptada para Windows
 """
 
-import json
-import serial
 import time
-from datetime import datetime
-from threading import Thread, Lock
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
+
+STARTED_AT = time.monotonic()  # referência do tempo até o primeiro fix
+
+import argparse
 import platform
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from archive import TelemetryArchive
+from capture import CaptureRecorder
+from config import (load_vehicles, CREDENTIALS_DIR, FIREBASE_CREDENTIALS, SPOOL_FILE, METRICS_HOST, METRICS_PORT,
+                    GEOCODER_FILE, ARCHIVE_DIR, LIVE_HOST, LIVE_PORT, GATEWAY_WORKERS)
+from firestore_writer import FirestoreWriter
+from gateway_log import log_info, log_warning, log_error, setup_logging, stop_logging, suppressed_count
+from line_parser import FRAMING_JSON
+from live_state import LiveState, LiveServer
+from metrics import MetricsRegistry, MetricsServer
+from serial_reader import PeriodicTimer, open_port, close_port
+from spool import SqliteSpool
+
+# firebase_admin, vehicle_session, car_commands e sightings puxam o SDK do Firestore
+# (~0,5 s de import): ficam para init_firebase/criar_sessoes, que rodam
+# enquanto as portas seriais abrem
 
 # ==============================================================================
 # CONFIGURAÇÕES
 # ==============================================================================
 
 # Serial do Arduino - Configuração multiplataforma
+# (usado quando não existe vehicles.json; veja config.load_vehicles)
 if platform.system() == "Windows":
     SERIAL_PORT = 'COM8'  # Altere conforme necessário (COM3, COM4, COM5, etc.)
 elif platform.system() == "Darwin":  # macOS
@@ -28,100 +47,178 @@ else:  # Linux
     SERIAL_PORT = '/dev/ttyUSB0'
 
 SERIAL_BAUD = 9600
+SERIAL_READ_TIMEOUT = 1  # readline bloqueante; o timeout só serve para checar parada
 
 # ID do veículo
 CAR_ID = "I3d6lzJ2aMzvantGyYXz"
 USER_ID = "87If5SbgxrePsQX761VTfYBz5GF2"
 
-# Variáveis globais
-ser = None
+# Credenciais do Firebase, na ordem de busca (relativas ao script, não ao cwd)
+BASE_DIR = Path(__file__).parent
+CREDENTIAL_FILES = [
+    FIREBASE_CREDENTIALS,  # credentials/firebase-adminsdk.json ou TRACKCAR_CREDENTIALS
+    CREDENTIALS_DIR / 'trackcar-firebase-adminsdk.json',
+    BASE_DIR / 'firebase-credentials.json',  # Fallback
+    BASE_DIR / 'serviceAccountKey.json',
+    BASE_DIR / 'trackcar-firebase-key.json',
+]
+
+# Códigos de saída (modo serviço: o systemd reinicia com Restart=on-failure)
+EXIT_OK = 0
+EXIT_FIREBASE = 69  # EX_UNAVAILABLE: Firestore inacessível
+EXIT_SERIAL = 74    # EX_IOERR: nenhuma serial aberta ou todas as leituras morreram
+EXIT_CONFIG = 78    # EX_CONFIG: credenciais/vehicles.json inválidos (reiniciar não resolve)
+
+# Variáveis globais (compartilhadas por todos os veículos)
 db = None
-serial_lock = Lock()
-last_heartbeat = 0
-
-# ✅ NOVO: Controle de estado para evitar comandos repetitivos
-last_ignition_state = 'unknown'
-last_command_time = 0
-COMMAND_COOLDOWN = 5  # 5 segundos entre comandos iguais
-
-# ✅ NOVO: Status GPS para atualização na tela
-gps_status = {
-    'initialized': False,
-    'satellites': 0,
-    'last_valid': 0,
-    'total_reads': 0,
-    'valid_count': 0,
-    'last_age': 999999,
-    'fix_time': None
-}
+writer = None
+sessions = []
+command_listener = None
+geocoder = None
+live = None  # LiveState do --live-port
+sighting_listener = None
+
+# Fila de gravação no Firestore (lotes assíncronos)
+WRITER_MAX_QUEUE = 1000      # operações pendentes antes de descartar/bloquear
+WRITER_BATCH_SIZE = 100      # operações por WriteBatch
+WRITER_MAX_AGE = 1.0         # segundos máximos que uma operação espera na fila
+WRITER_OVERFLOW = 'drop_oldest'  # 'drop_oldest' ou 'block' (só sem spool)
+WRITER_SPOOL = SPOOL_FILE    # fila durável em disco; None = fila só em memória
+
+# Métricas (Prometheus) do processo
+registry = MetricsRegistry()
+FIRESTORE_COMMIT_SECONDS = registry.histogram(
+    'trackcar_firestore_commit_seconds', "Duração dos commits de WriteBatch no Firestore")
+FIRESTORE_BATCH_OPS = registry.histogram(
+    'trackcar_firestore_batch_operations', "Operações por WriteBatch",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+
+# Tarefas periódicas (segundos)
+GPS_STATUS_INTERVAL = 30
+CAR_UPDATE_INTERVAL = 2  # mínimo entre escritas no documento de cada carro
+TEST_GPS_INTERVAL = 30
+ARCHIVE_FLUSH_INTERVAL = 10  # buffers do arquivo local → colunas em disco
+HEALTH_EXPIRE_INTERVAL = 15  # baldes de saúde de veículos que pararam de mandar registros
 
 # ==============================================================================
-# FUNÇÕES DE LOG PERSONALIZADAS (sem arquivo)
+# INICIALIZAÇÃO
 # ==============================================================================
 
-def log_info(message):
-    """Log de informações (apenas console)"""
-    print(f"[INFO] {datetime.now().strftime('%H:%M:%S')} - {message}")
-
-def log_warning(message):
-    """Log de avisos (apenas console)"""
-    print(f"[WARN] {datetime.now().strftime('%H:%M:%S')} - {message}")
+class GatewayExit(Exception):
+    """Falha que encerra o gateway com um código de saída"""
 
-def log_error(message):
-    """Log de erros (apenas console)"""
-    print(f"[ERROR] {datetime.now().strftime('%H:%M:%S')} - {message}")
-
-def log_debug(message):
-    """Log de debug (apenas console)"""
-    print(f"[DEBUG] {datetime.now().strftime('%H:%M:%S')} - {message}")
-
-# ==============================================================================
-# INICIALIZAÇÃO
-# ==============================================================================
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
 
 def init_firebase():
     """Inicializa Firebase Admin SDK usando arquivo JSON"""
     global db
-    try:
-        if firebase_admin._apps:
-            db = firestore.client()
-            return db
-        
-        # ✅ ATUALIZADO: Procura na pasta credentials primeiro
-        credential_files = [
-            'credentials/firebase-adminsdk.json',  # Nova localização
-            'credentials/trackcar-firebase-adminsdk.json',
-            'firebase-credentials.json',  # Fallback
-            'serviceAccountKey.json',
-            'trackcar-firebase-key.json'
-        ]
-        
-        credential_path = None
-        for file in credential_files:
-            if os.path.exists(file):
-                credential_path = file
-                break
-        
-        if not credential_path:
-            log_error("❌ Arquivo de credenciais Firebase não encontrado!")
-            log_info("📋 Coloque o arquivo JSON na pasta 'credentials/':")
-            log_info("   credentials/firebase-adminsdk.json")
-            log_info("   Baixe do Firebase Console > Project Settings > Service accounts")
-            input("Pressione Enter para sair...")
-            exit(1)
-        
-        cred = credentials.Certificate(credential_path)
-        firebase_admin.initialize_app(cred)
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if firebase_admin._apps:
         db = firestore.client()
-        
-        log_info(f"✅ Firebase inicializado com sucesso usando {credential_path}")
         return db
-        
+
+    credential_path = next((path for path in CREDENTIAL_FILES if path.exists()), None)
+    if not credential_path:
+        log_info("📋 Coloque o arquivo JSON na pasta 'credentials/' (ou aponte TRACKCAR_CREDENTIALS):")
+        log_info("   credentials/firebase-adminsdk.json")
+        log_info("   Baixe do Firebase Console > Project Settings > Service accounts")
+        raise GatewayExit(EXIT_CONFIG, "Arquivo de credenciais Firebase não encontrado!")
+
+    try:
+        cred = credentials.Certificate(str(credential_path))
     except Exception as e:
-        log_error(f"❌ Erro ao inicializar Firebase: {e}")
         log_info("💡 Verifique se o arquivo de credenciais está correto")
-        input("Pressione Enter para sair...")
-        exit(1)
+        raise GatewayExit(EXIT_CONFIG, f"Credenciais inválidas em {credential_path}: {e}")
+
+    try:
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+    except Exception as e:
+        raise GatewayExit(EXIT_FIREBASE, f"Erro ao inicializar Firebase: {e}")
+
+    log_info(f"✅ Firebase inicializado com sucesso usando {credential_path}")
+    return db
+
+def init_writer():
+    """Inicia a fila de gravação em lotes no Firestore"""
+    global writer
+    spool = None
+    if WRITER_SPOOL:
+        spool = SqliteSpool(WRITER_SPOOL)
+        if len(spool):
+            log_info(f"💾 Spool com {len(spool)} operações pendentes - reenviando ao Firestore")
+    writer = FirestoreWriter(
+        db,
+        max_queue=WRITER_MAX_QUEUE,
+        batch_size=WRITER_BATCH_SIZE,
+        max_age=WRITER_MAX_AGE,
+        overflow=WRITER_OVERFLOW,
+        on_error=log_error,
+        spool=spool,
+        on_commit=registrar_commit
+    ).start()
+    log_info(f"✅ Fila de gravação iniciada (lote {WRITER_BATCH_SIZE}, {WRITER_MAX_AGE}s)")
+    return writer
+
+def registrar_commit(operacoes, segundos):
+    """Callback da fila: alimenta os histogramas de commit"""
+    FIRESTORE_COMMIT_SECONDS.observe(segundos)
+    FIRESTORE_BATCH_OPS.observe(operacoes)
+
+def coletar_metricas():
+    """Coletor do registro: stats da fila, dos logs e de cada veículo no scrape"""
+    for session in sessions:
+        if session.first_fix_at is not None:
+            yield ('trackcar_first_fix_seconds', 'gauge', "Segundos do início do processo ao primeiro fix enviado",
+                   {'car': session.car_id}, session.first_fix_at - STARTED_AT)
+    if writer is not None:
+        stats = writer.stats()
+        for result in ('enqueued', 'committed', 'dropped', 'failed', 'rejected'):
+            yield ('trackcar_firestore_operations_total', 'counter', "Operações da fila do Firestore por resultado",
+                   {'result': result}, stats[result])
+        yield ('trackcar_firestore_retries_total', 'counter', "Retentativas de commit", {}, stats['retries'])
+        yield ('trackcar_firestore_queue_depth', 'gauge', "Operações pendentes na fila/spool", {}, stats['queue_depth'])
+        yield ('trackcar_firestore_queue_depth_max', 'gauge', "Maior profundidade da fila", {}, stats['max_queue_depth'])
+    if command_listener is not None:
+        yield ('trackcar_app_commands_total', 'counter', "Comandos pendentes recebidos de car_commands",
+               {}, command_listener.stats['received'])
+    if geocoder is not None:
+        geo = geocoder.stats()
+        for result in ('hits', 'misses', 'not_found'):
+            yield ('trackcar_geocoder_lookups_total', 'counter', "Buscas de endereço: acertos do cache, buscas na grade e sem endereço por perto",
+                   {'result': result}, geo[result])
+    if sighting_listener is not None:
+        stats = sighting_listener.correlator.stats
+        for result in ('confirmed', 'expired'):
+            yield ('trackcar_sightings_total', 'counter', "Avistamentos confirmados pelos fixes ou expirados sem confirmação",
+                   {'result': result}, stats[result])
+        yield ('trackcar_sightings_received_total', 'counter', "Avistamentos correlacionados", {}, stats['sightings'])
+        yield ('trackcar_sightings_pending', 'gauge', "Avistamentos esperando fixes posteriores",
+               {}, sighting_listener.correlator.pending_count())
+    if live is not None:
+        yield ('trackcar_live_clients', 'gauge', "Clientes conectados ao /stream", {}, live.stats['connected'])
+        yield ('trackcar_live_updates_total', 'counter', "Atualizações do estado ao vivo", {}, live.stats['updates'])
+        yield ('trackcar_live_events_total', 'counter', "Eventos SSE enviados (após coalescência)", {}, live.stats['events'])
+        yield ('trackcar_live_clients_dropped_total', 'counter', "Streams encerrados por erro ou cliente parado",
+               {}, live.stats['dropped'])
+    yield ('trackcar_log_suppressed_total', 'counter', "Mensagens de log repetidas suprimidas", {}, suppressed_count())
+    for session in sessions:
+        yield from session.metric_samples()
+
+def log_writer_stats():
+    """Mostra os contadores da fila de gravação"""
+    if writer is None:
+        return
+    stats = writer.stats()
+    log_info(f"📊 Fila Firestore - Pendentes: {stats['queue_depth']} (máx {stats['max_queue_depth']}) | "
+             f"Gravados: {stats['committed']} | Descartados: {stats['dropped']} | Falhas: {stats['failed']} | "
+             f"Recusados: {stats['rejected']} | Retentativas: {stats['retries']}")
+    log_info(f"📊 Lotes: {stats['batches']} | Tamanho médio: {stats['avg_batch_size']:.1f} | "
+             f"Commit: {stats['last_commit_ms']:.0f}ms (médio {stats['avg_commit_ms']:.0f}ms, máx {stats['max_commit_ms']:.0f}ms)")
 
 def listar_portas_disponiveis():
     """Lista portas seriais disponíveis no Windows"""
@@ -137,447 +234,405 @@ def listar_portas_disponiveis():
         log_warning("Nenhuma porta COM encontrada")
         return []
 
-def init_serial():
-    """Inicializa conexão serial com Arduino - Versão Windows"""
-    global ser
+def init_serial(session, abertura, service=False):
+    """Liga à sessão a serial aberta em paralelo (Future de open_port)"""
     try:
-        ser = serial.Serial(SERIAL_PORT, SERIAL_BAUD, timeout=1)
-        time.sleep(2)  # Aguarda reset do Arduino
-        log_info(f"✅ Serial conectada: {SERIAL_PORT}")
-        return ser
+        session.ser = abertura.result()
+        session.log_info(f"✅ Serial conectada: {session.port}")
+        return session.ser
     except Exception as e:
-        log_error(f"❌ Erro ao conectar serial: {e}")
-        log_info(f"\n⚠️  Porta esperada: {SERIAL_PORT}")
+        session.log_error(f"❌ Erro ao conectar serial: {e}")
+        session.log_info(f"⚠️  Porta esperada: {session.port}")
         
         # Lista portas disponíveis no Windows
         portas_disponiveis = listar_portas_disponiveis()
         
         if portas_disponiveis:
-            log_info(f"\n💡 Tente alterar SERIAL_PORT para uma dessas portas:")
+            log_info(f"\n💡 Tente alterar a porta para uma dessas:")
             for porta in portas_disponiveis:
-                log_info(f"   SERIAL_PORT = '{porta}'")
+                log_info(f"   port = '{porta}'")
         
+        if service:
+            # Sem prompt: o veículo fica sem Arduino (nem GPS simulado) até o próximo início
+            session.log_warning("⚠️  Modo serviço: continuando sem este Arduino")
+            return None
         response = input("\n🤔 Continuar sem Arduino para teste? (s/N): ")
         if response.lower() == 's':
-            log_warning("⚠️  Modo teste: continuando sem Arduino")
+            session.log_warning("⚠️  Modo teste: continuando sem Arduino")
             return None
-        else:
-            input("Pressione Enter para sair...")
-            exit(1)
+        raise GatewayExit(EXIT_SERIAL, f"Serial {session.port} indisponível")
 
-# ==============================================================================
-# FUNÇÕES FIREBASE
-# ==============================================================================
+def fechar_aberturas(aberturas):
+    """Fecha as portas já abertas pelas Futures de open_port (início abortado)"""
+    for abertura in aberturas:
+        try:
+            ser = abertura.result()
+        except Exception:
+            continue
+        close_port(ser)
+
+def carregar_geocoder(path=GEOCODER_FILE):
+    """Carrega os pontos de endereço e liga o geocoder às sessões (roda em segundo plano)"""
+    global geocoder
+    if not path.exists():
+        log_info(f"🗺️  Sem {path.name}: fixes serão gravados sem endereço")
+        return None
+    from reverse_geocoder import ReverseGeocoder
 
-def save_gps_location(data):
-    """Salva localização no Firestore"""
+    t0 = time.monotonic()
     try:
-        if not data.get('valid', False):
-            # ✅ MELHORADO: Log mais detalhado
-            age = data.get('age', 999999)
-            sats = data.get('sats', 0)
-            gps_init = data.get('gpsInit', False)
-            
-            if not gps_init:
-                log_warning(f"⏳ GPS procurando satélites... ({sats} sats encontrados)")
-            elif age > 10000:
-                log_warning(f"⏰ GPS dados muito antigos - {age/1000:.1f}s ({sats} sats)")
-            else:
-                log_warning(f"❌ GPS inválido - Age: {age}ms, Sats: {sats}")
-            return False
-        
-        lat = data.get('lat', 0)
-        lon = data.get('lon', 0)
-        sats = data.get('sats', 0)
-        age = data.get('age', 0)
-        
-        if lat == 0 and lon == 0:
-            log_warning("⚠️  Coordenadas inválidas (0,0) - ignorando")
-            return False
-        
-        location_data = {
-            'carId': CAR_ID,
-            'userId': USER_ID,
-            'latitude': lat,
-            'longitude': lon,
-            'satellites': sats,
-            'accuracy': age,
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'status': 'active',
-            'source': 'arduino'
-        }
-        
-        db.collection('gps_locations').add(location_data)
-        
-        # ✅ NOVO: Atualiza carro E salva status GPS no Firebase
-        car_ref = db.collection('cars').document(CAR_ID)
-        car_ref.update({
-            'lastLatitude': lat,
-            'lastLongitude': lon,
-            'lastLocationUpdate': firestore.SERVER_TIMESTAMP,
-            'updatedAt': firestore.SERVER_TIMESTAMP,
-            # ✅ NOVO: Status GPS para o app
-            'gpsStatus': {
-                'active': True,
-                'satellites': sats,
-                'accuracy': age,
-                'lastUpdate': firestore.SERVER_TIMESTAMP
-            }
-        })
-        
-        # ✅ NOVO: Atualiza status local
-        global gps_status
-        gps_status.update({
-            'initialized': True,
-            'satellites': sats,
-            'last_valid': time.time(),
-            'last_age': age,
-            'fix_time': datetime.now().strftime('%H:%M:%S') if not gps_status['fix_time'] else gps_status['fix_time']
-        })
-        
-        log_info(f"✅ GPS salvo: {lat:.6f}, {lon:.6f} ({sats} sats, {age}ms)")
-        return True
-        
-    except Exception as e:
-        log_error(f"❌ Erro ao salvar GPS: {e}")
-        return False
+        geocoder = ReverseGeocoder.load(path)
+    except (OSError, ValueError) as e:
+        log_error(f"❌ Erro ao carregar endereços de {path}: {e}")
+        return None
+    for session in sessions:
+        session.geocoder = geocoder
+    log_info(f"🗺️  {len(geocoder)} pontos de endereço carregados em {time.monotonic() - t0:.1f}s")
+    return geocoder
 
-# ✅ NOVA: Função para atualizar status GPS na tela
-def update_gps_status_in_firebase():
-    """Atualiza status do GPS no Firebase para exibir na tela"""
+def carregar_veiculos(config_path=None):
+    """Lê o vehicles.json (ou usa o veículo das constantes acima)"""
     try:
-        car_ref = db.collection('cars').document(CAR_ID)
-        
-        # Calcula tempo sem GPS válido
-        time_without_gps = 0
-        if gps_status['last_valid'] > 0:
-            time_without_gps = int(time.time() - gps_status['last_valid'])
-        
-        status_text = "🔍 Procurando GPS..."
-        if gps_status['initialized']:
-            if time_without_gps <= 30:
-                status_text = f"🛰️ GPS OK ({gps_status['satellites']} sats)"
-            else:
-                status_text = f"⚠️ GPS sem sinal há {time_without_gps}s"
-        elif gps_status['satellites'] > 0:
-            status_text = f"⏳ Aguardando fix GPS ({gps_status['satellites']} sats)"
-        
-        car_ref.update({
-            'gpsStatusText': status_text,
-            'gpsStatusDetails': {
-                'initialized': gps_status['initialized'],
-                'satellites': gps_status['satellites'],
-                'lastValidSeconds': time_without_gps,
-                'totalReads': gps_status['total_reads'],
-                'validCount': gps_status['valid_count'],
-                'lastAge': gps_status['last_age'],
-                'fixTime': gps_status['fix_time']
-            },
-            'updatedAt': firestore.SERVER_TIMESTAMP
-        })
-        
-    except Exception as e:
-        log_debug(f"Erro ao atualizar status GPS: {e}")
+        vehicles = load_vehicles(config_path)
+    except (OSError, ValueError) as e:
+        raise GatewayExit(EXIT_CONFIG, f"Configuração de veículos inválida: {e}")
+    if not vehicles:
+        # Sem arquivo: um único veículo com as constantes acima
+        vehicles = [{'carId': CAR_ID, 'userId': USER_ID, 'port': SERIAL_PORT, 'baud': SERIAL_BAUD}]
+    return vehicles
+
+def criar_sessoes(vehicles):
+    """Cria uma VehicleSession por veículo do arquivo de configuração"""
+    from vehicle_session import VehicleSession
+
+    multi = len(vehicles) > 1
+    return [
+        VehicleSession(
+            db, writer,
+            car_id=v['carId'],
+            user_id=v.get('userId', ''),
+            port=v['port'],
+            baud=v.get('baud', SERIAL_BAUD),
+            label=f"[{v.get('name', v['carId'][:8])}] " if multi else '',
+            thinning=v.get('thinning'),
+            car_update_interval=v.get('carUpdateInterval', CAR_UPDATE_INTERVAL),
+            framing=v.get('framing', FRAMING_JSON),
+            adaptive_rate=v.get('adaptiveRate', True),
+            rate_policies=v.get('ratePolicies'),
+            geofences=v.get('geofences'),
+            trips=v.get('trips'),
+            health=v.get('health'),
+            usb_id=v.get('usb'),
+            quality=v.get('quality'),
+            geocoder=geocoder,
+            reconnect=v.get('reconnect', True)
+        )
+        for v in vehicles
+    ]
+
+def inicializar(vehicles, service=False):
+    """
+    Abre as portas seriais (reset de ~2 s do Arduino) enquanto importa o SDK,
+    conecta no Firebase e lê o documento de cada carro; devolve as sessões
+    prontas para start().
+    """
+    global db, sessions
+    aberturas = []
+    try:
+        with ThreadPoolExecutor(max_workers=2 * len(vehicles), thread_name_prefix='startup') as pool:
+            aberturas = [pool.submit(open_port, v['port'], v.get('baud', SERIAL_BAUD), SERIAL_READ_TIMEOUT)
+                         for v in vehicles]
+            db = init_firebase()
+            init_writer()
+            sessions = criar_sessoes(vehicles)
+            # Um get() por carro serve de teste de conexão e de estado inicial; todos em paralelo
+            carregados = list(pool.map(lambda session: session.load_initial_state(), sessions))
+            for session, abertura in zip(sessions, aberturas):
+                init_serial(session, abertura, service)
+
+        if service and not any(carregados):
+            raise GatewayExit(EXIT_FIREBASE, "Nenhum carro carregado do Firestore")
+        if service and not any(s.ser for s in sessions):
+            raise GatewayExit(EXIT_SERIAL, "Nenhuma serial conectada")
+    except GatewayExit:
+        # Com o serviço reiniciando o gateway, a porta não pode ficar presa até o processo sair
+        fechar_aberturas(aberturas)
+        raise
+    # Extratos grandes levam segundos para carregar: os primeiros fixes podem ir sem endereço
+    threading.Thread(target=carregar_geocoder, name='geocoder', daemon=True).start()
+    log_info(f"🚀 Gateway pronto em {time.monotonic() - STARTED_AT:.1f}s")
+    return sessions
+
+def atualizar_status_gps():
+    """Atualiza o status GPS de todos os veículos (um único timer)"""
+    for session in sessions:
+        session.update_gps_status_in_firebase()
+
+def flush_documentos_carros():
+    """Envia os campos pendentes dos documentos cars/{id} que já venceram"""
+    for session in sessions:
+        session.car_doc.flush_if_due()
+
+def expirar_saude():
+    """Grava os baldes de saúde vencidos dos veículos sem registros"""
+    for session in sessions:
+        session.expirar_saude()
+
+def simular_gps():
+    """Modo teste: fix falso para os veículos sem Arduino"""
+    for session in sessions:
+        if session.ser is None:
+            session.simular_gps()
+
+def comando_manual(cmd):
+    """Executa comando digitado: 'CMD' (todos) ou '<carId> CMD' (um veículo)"""
+    alvos = sessions
+    partes = cmd.split(maxsplit=1)
+    if len(partes) == 2:
+        alvos = [s for s in sessions if s.car_id.upper() == partes[0]]
+        if not alvos:
+            log_warning(f"⚠️  Veículo não encontrado: {partes[0]}")
+            return
+        cmd = partes[1]
+    
+    if cmd == 'STATUS':
+        log_writer_stats()
+        for session in alvos:
+            session.log_stats()
+    for session in alvos:
+        if cmd == 'GPS_RESET':
+            session.resetar_gps()
+        else:
+            session.enviar_comando_arduino(cmd)
 
 # ==============================================================================
-# CONTROLE DO RELÉ
+# MAIN LOOP
 # ==============================================================================
 
-def enviar_comando_arduino(comando):
-    """Envia comando para Arduino via Serial com retry"""
-    global ser
-    
-    if ser is None:
-        log_warning("⚠️  Modo teste: simulando comando Arduino")
-        log_info(f"🎭 SIMULADO: {comando}")
-        return True
+def main():
+    parser = argparse.ArgumentParser(description="TrackCar gateway Arduino → Firebase")
+    parser.add_argument('--config', help="arquivo JSON com o mapa porta → veículo (padrão: vehicles.json)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help=f"porta do endpoint /metrics em {METRICS_HOST} (0 = desligado)")
+    parser.add_argument('--live-port', type=int, default=LIVE_PORT,
+                        help=f"porta do estado ao vivo (/cars, /stream) em {LIVE_HOST} (0 = desligado)")
+    parser.add_argument('--record', metavar='ARQUIVO',
+                        help="grava as linhas da serial numa captura para o replay.py")
+    parser.add_argument('--no-archive', action='store_true',
+                        help=f"não grava gps/heartbeat no arquivo local ({ARCHIVE_DIR})")
+    parser.add_argument('--workers', type=int, default=GATEWAY_WORKERS,
+                        help="processos do gateway; com mais de 1 os veículos são divididos entre eles "
+                             "(ver shard_supervisor.py)")
+    parser.add_argument('--service', action='store_true',
+                        help="modo serviço (systemd): sem prompts nem comandos pelo teclado; "
+                             "padrão quando a entrada não é um terminal")
+    args = parser.parse_args()
+    setup_logging()
+    service = args.service or sys.stdin is None or not sys.stdin.isatty()
+
+    try:
+        if args.workers > 1:
+            import shard_supervisor
+
+            if args.record:
+                log_warning("⚠️  --record não é suportado com --workers: captura desligada")
+            code = shard_supervisor.executar(args, service)
+        else:
+            code = executar(args, service)
+    except GatewayExit as e:
+        log_error(f"❌ {e}")
+        code = e.code
+    stop_logging()
+    if not service:
+        input("Pressione Enter para sair...")
+    return code
+
+def executar(args, service):
+    """Inicializa, roda até Ctrl+C/SIGTERM (ou perder todas as seriais) e encerra"""
+    global command_listener, live, sighting_listener
     
-    with serial_lock:
-        for tentativa in range(3):
-            try:
-                if not ser.is_open:
-                    log_warning("⚠️  Serial não disponível")
-                    return False
-                
-                comando_completo = f"{comando}\n"
-                ser.write(comando_completo.encode())
-                ser.flush()
-                
-                log_info(f"📤 Comando enviado (tentativa {tentativa + 1}): {comando}")
-                
-                time.sleep(0.5)
-                if ser.in_waiting > 0:
-                    response = ser.readline().decode('utf-8', errors='ignore').strip()
-                    log_info(f"📥 Resposta do Arduino: {response}")
-                
-                return True
-                
-            except Exception as e:
-                log_error(f"❌ Erro ao enviar comando (tentativa {tentativa + 1}): {e}")
-                time.sleep(1)
-        
-        return False
-
-def resetar_gps():
-    """Envia comando para resetar GPS"""
-    if enviar_comando_arduino('GPS_RESET'):
-        log_info("🔄 GPS resetado - aguardando novo fix...")
-        # Reset status local
-        global gps_status
-        gps_status.update({
-            'initialized': False,
-            'fix_time': None
-        })
-    return True
-
-def processar_mudanca_ignicao(new_state):
-    """Processa mudança de ignição do app"""
-    global last_ignition_state, last_command_time
+    if not service:
+        print("\n" + "="*60)
+        print("  TRACKCAR - WINDOWS GATEWAY v2.3")
+        print("  Arduino Nano → Firebase + Controle Relé + GPS Debug")
+        print("  Versão adaptada para Windows")
+        print("="*60 + "\n")
     
-    current_time = time.time()
+    # Firebase (cliente e fila compartilhados) e seriais em paralelo
+    sessions = inicializar(carregar_veiculos(args.config), service)
     
-    # Evita comandos repetitivos
-    if (new_state == last_ignition_state and 
-        (current_time - last_command_time) < COMMAND_COOLDOWN):
-        log_debug(f"🚫 Comando {new_state} ignorado (cooldown de {COMMAND_COOLDOWN}s)")
-        return
+    recorder = None
+    if args.record:
+        recorder = CaptureRecorder(args.record)
+        for session in sessions:
+            session.recorder = recorder
+        log_info(f"⏺️  Gravando captura da serial em {args.record}")
     
-    log_info(f"\n🔔 Firebase → ignitionState = {new_state}")
+    archive = None
+    if not args.no_archive:
+        archive = TelemetryArchive(ARCHIVE_DIR)
+        for session in sessions:
+            session.archive = archive
+        log_info(f"🗄️  Arquivo local de telemetria em {ARCHIVE_DIR}")
     
-    if new_state == 'on':
-        success = enviar_comando_arduino('IGNITION_ON')
-        emoji = "🔓" if success else "❌"
-        log_info(f"{emoji} Comando LIGAR ignição - {'Enviado' if success else 'Falhou'}")
-    elif new_state == 'off':
-        success = enviar_comando_arduino('IGNITION_OFF')
-        emoji = "🔒" if success else "❌"
-        log_info(f"{emoji} Comando DESLIGAR ignição - {'Enviado' if success else 'Falhou'}")
-    else:
-        log_warning(f"⚠️  Estado desconhecido: {new_state}")
-        return
+    if not service:
+        from vehicle_session import COMMAND_COOLDOWN
+
+        print(f"\n🚗 Veículos monitorados: {', '.join(s.car_id for s in sessions)}")
+        print(f"📡 Aguardando dados do Arduino...")
+        print(f"🔔 Escutando mudanças de ignitionState...")
+        print(f"⏱️  Cooldown entre comandos: {COMMAND_COOLDOWN}s")
+        print(f"🛰️  Status GPS será atualizado na tela do app automaticamente")
+        print(f"\n💡 Comandos disponíveis:")
+        print(f"   - Ctrl+C: Sair")
+        print(f"   - Digite 'GPS_RESET' + Enter: Resetar GPS")
+        print(f"   - Digite 'STATUS' + Enter: Status manual")
+        if len(sessions) > 1:
+            print(f"   - Prefixe com o carId para um único veículo: '<carId> STATUS'")
+        print()
     
-    # Atualiza controle de estado
-    last_ignition_state = new_state
-    last_command_time = current_time
-
-def escutar_ignition_state():
-    """Thread que escuta mudanças no ignitionState do Firebase"""
+    metrics_server = None
+    if args.metrics_port:
+        registry.register_collector(coletar_metricas)
+        try:
+            metrics_server = MetricsServer(registry, METRICS_HOST, args.metrics_port).start()
+            log_info(f"📈 Métricas em http://{METRICS_HOST}:{metrics_server.port}/metrics")
+        except OSError as e:
+            log_warning(f"⚠️  Endpoint de métricas indisponível: {e}")
     
-    def on_snapshot(doc_snapshot, changes, read_time):
-        for doc in doc_snapshot:
-            data = doc.to_dict()
-            ignition_state = data.get('ignitionState', 'unknown')
-            processar_mudanca_ignicao(ignition_state)
+    live_server = None
+    if args.live_port:
+        live = LiveState()
+        try:
+            live_server = LiveServer(live, LIVE_HOST, args.live_port).start()
+            for session in sessions:
+                session.live = live
+            log_info(f"📍 Estado ao vivo em http://{LIVE_HOST}:{live_server.port}/cars e /stream")
+        except OSError as e:
+            live = None
+            log_warning(f"⚠️  Endpoint do estado ao vivo indisponível: {e}")
     
-    try:
-        car_ref = db.collection('cars').document(CAR_ID)
-        doc_watch = car_ref.on_snapshot(on_snapshot)
-        
-        log_info(f"👂 Escutando mudanças: cars/{CAR_ID}/ignitionState")
-        return doc_watch
-    except Exception as e:
-        log_error(f"❌ Erro ao configurar listener: {e}")
-        return None
-
-# ==============================================================================
-# PROCESSAMENTO DE DADOS DO ARDUINO
-# ==============================================================================
+    # Histórico de fixes para os avistamentos: ligado antes da serial para indexar desde o primeiro fix
+    from sightings import SightingCorrelator, SightingListener
 
-def processar_linha_arduino(line):
-    """Processa linha recebida do Arduino"""
-    global last_heartbeat, gps_status
+    correlator = SightingCorrelator()
+    for session in sessions:
+        session.sightings = correlator
     
-    if not line.strip():
-        return
-    
-    if line.startswith("TRACKCAR_READY"):
-        log_info("✅ Arduino pronto!\n")
-        return
+    # Inicia listeners do Firebase e leitura serial de cada veículo
+    for session in sessions:
+        session.start()
     
+    # Fila de comandos do app: um listener de car_commands pendentes para todos os veículos
     try:
-        data = json.loads(line)
-        data_type = data.get('type', 'unknown')
-        
-        if data_type == 'gps':
-            # ✅ NOVO: Atualiza estatísticas GPS
-            gps_status['total_reads'] += 1
-            gps_status['satellites'] = data.get('sats', 0)
-            gps_status['last_age'] = data.get('age', 999999)
-            
-            if data.get('valid', False):
-                gps_status['valid_count'] += 1
-            
-            save_gps_location(data)
-            
-        elif data_type == 'ack':
-            ignition_state = data.get('ignitionState', 'unknown')
-            emoji = "🔓" if ignition_state == "on" else "🔒"
-            log_info(f"{emoji} Arduino confirmou: Ignição {ignition_state.upper()}")
-            
-        elif data_type == 'heartbeat':
-            last_heartbeat = time.time()
-            uptime = data.get('uptime', 0) / 1000
-            commands = data.get('commands', 0)
-            rele = data.get('rele', 'unknown')
-            gps_status_text = data.get('gpsStatus', 'unknown')
-            valid_gps = data.get('validGPS', 0)
-            
-            log_info(f"💓 Heartbeat - Uptime: {uptime:.1f}s | Comandos: {commands} | Relé: {rele} | GPS: {gps_status_text} ({valid_gps} válidos)")
-            
-            # ✅ NOVO: Atualiza status na tela a cada heartbeat
-            update_gps_status_in_firebase()
-            
-        elif data_type == 'debug':
-            log_debug(f"🐛 Debug: {data.get('received', 'N/A')}")
-            
-        elif data_type == 'error':
-            log_error(f"❌ Arduino erro: {data.get('message', 'Erro desconhecido')}")
-            
-        elif data_type == 'system':
-            message = data.get('message', 'Mensagem do sistema')
-            log_info(f"🔧 Sistema: {message}")
-            
-            # ✅ NOVO: Detecta quando GPS consegue fix
-            if "GPS fix obtido" in message:
-                gps_status['initialized'] = True
-                gps_status['fix_time'] = datetime.now().strftime('%H:%M:%S')
-                log_info("🎉 PRIMEIRO FIX GPS OBTIDO!")
-                
-    except json.JSONDecodeError:
-        log_warning(f"⚠️  Linha não é JSON: {line}")
-    except Exception as e:
-        log_error(f"❌ Erro ao processar linha: {e}")
+        from car_commands import CommandQueueListener
 
-# ==============================================================================
-# TESTE DE FIREBASE
-# ==============================================================================
-
-def teste_firebase():
-    """Testa conexão com Firebase"""
-    try:
-        log_info("🧪 Testando conexão Firebase...")
-        
-        car_ref = db.collection('cars').document(CAR_ID)
-        car_doc = car_ref.get()
-        
-        if car_doc.exists:
-            data = car_doc.to_dict()
-            log_info(f"✅ Carro encontrado: {data.get('brand', 'N/A')} {data.get('model', 'N/A')}")
-            log_info(f"🔧 Estado ignição: {data.get('ignitionState', 'unknown')}")
-            return True
-        else:
-            log_warning(f"⚠️  Documento do carro não encontrado: {CAR_ID}")
-            log_info("💡 Verifique se o CAR_ID está correto ou crie o carro no app")
-            return False
-            
+        command_listener = CommandQueueListener(db, sessions, on_error=log_error).start()
+        log_info("👂 Escutando car_commands pendentes")
     except Exception as e:
-        log_error(f"❌ Erro no teste Firebase: {e}")
-        return False
-
-# ==============================================================================
-# MAIN LOOP
-# ==============================================================================
-
-def main():
-    global ser, db, last_heartbeat, last_ignition_state
+        log_error(f"❌ Erro ao escutar car_commands: {e}")
     
-    print("\n" + "="*60)
-    print("  TRACKCAR - WINDOWS GATEWAY v2.3")
-    print("  Arduino Nano → Firebase + Controle Relé + GPS Debug")
-    print("  Versão adaptada para Windows")
-    print("="*60 + "\n")
-    
-    # Inicializa Firebase
-    db = init_firebase()
-    
-    # Testa Firebase
-    if teste_firebase():
-        # Carrega estado inicial da ignição
-        try:
-            car_ref = db.collection('cars').document(CAR_ID)
-            car_doc = car_ref.get()
-            if car_doc.exists:
-                data = car_doc.to_dict()
-                last_ignition_state = data.get('ignitionState', 'unknown')
-                log_info(f"🔧 Estado inicial da ignição: {last_ignition_state}")
-        except:
-            pass
-    
-    # Inicializa Serial
-    ser = init_serial()
-    
-    # Inicia listener do Firebase
-    print(f"\n🚗 Veículo monitorado: {CAR_ID}")
-    print(f"📡 Aguardando dados do Arduino...")
-    print(f"🔔 Escutando mudanças de ignitionState...")
-    print(f"⏱️  Cooldown entre comandos: {COMMAND_COOLDOWN}s")
-    print(f"🛰️  Status GPS será atualizado na tela do app automaticamente")
-    print(f"\n💡 Comandos disponíveis:")
-    print(f"   - Ctrl+C: Sair")
-    print(f"   - Digite 'GPS_RESET' + Enter: Resetar GPS")
-    print(f"   - Digite 'STATUS' + Enter: Status manual\n")
-    
-    listener = escutar_ignition_state()
-    last_heartbeat = time.time()
+    # Avistamentos públicos de veículos roubados × fixes do rastreador
+    try:
+        sighting_listener = SightingListener(db, correlator, sessions, on_info=log_info, on_error=log_error).start()
+        log_info("👀 Escutando avistamentos de veículos roubados")
+    except Exception as e:
+        log_error(f"❌ Erro ao escutar avistamentos: {e}")
     
     # ✅ NOVO: Thread para comandos manuais
     def input_thread():
         while True:
             try:
                 cmd = input().strip().upper()
-                if cmd == 'GPS_RESET':
-                    resetar_gps()
-                elif cmd == 'STATUS':
-                    enviar_comando_arduino('STATUS')
-                elif cmd:
-                    enviar_comando_arduino(cmd)
+                if cmd:
+                    comando_manual(cmd)
             except:
                 break
     
-    import threading
-    threading.Thread(target=input_thread, daemon=True).start()
+    if not service:
+        threading.Thread(target=input_thread, daemon=True).start()
     
-    # Loop principal
-    try:
-        contador = 0
-        status_update_counter = 0
-        while True:
-            if ser and ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                processar_linha_arduino(line)
-            
-            elif ser is None:
-                contador += 1
-                if contador >= 300:  # 30 segundos
-                    contador = 0
-                    log_info("🎭 Modo teste: simulando dados GPS...")
-                    fake_gps = {
-                        'type': 'gps',
-                        'lat': -23.5505 + (time.time() % 100) * 0.0001,
-                        'lon': -46.6333 + (time.time() % 100) * 0.0001,
-                        'sats': 8,
-                        'age': 1000,
-                        'valid': True
-                    }
-                    save_gps_location(fake_gps)
-            
-            # ✅ NOVO: Atualiza status GPS na tela a cada 30 segundos
-            status_update_counter += 1
-            if status_update_counter >= 300:  # 30 segundos
-                status_update_counter = 0
-                update_gps_status_in_firebase()
-            
-            time.sleep(0.1)
+    # SIGTERM (systemctl stop) encerra como o Ctrl+C, gravando o que estiver pendente
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: parar.set())
     
+    # Loop principal: leitura serial e tarefas periódicas em threads próprias
+    timers = [
+        # ✅ NOVO: Atualiza status GPS na tela a cada 30 segundos
+        PeriodicTimer(GPS_STATUS_INTERVAL, atualizar_status_gps,
+                      name='gps-status', on_error=log_error).start(),
+        # Campos sujos que esperavam o intervalo mínimo do documento do carro
+        PeriodicTimer(1, flush_documentos_carros, name='car-flush', on_error=log_error).start(),
+        # Rollups de saúde: fecha o balde mesmo sem o próximo heartbeat
+        PeriodicTimer(HEALTH_EXPIRE_INTERVAL, expirar_saude, name='health-expire', on_error=log_error).start()
+    ]
+    if archive is not None:
+        timers.append(PeriodicTimer(ARCHIVE_FLUSH_INTERVAL, archive.flush,
+                                    name='archive-flush', on_error=log_error).start())
+    if not service and any(s.ser is None for s in sessions):
+        timers.append(PeriodicTimer(TEST_GPS_INTERVAL, simular_gps,
+                                    name='modo-teste', on_error=log_error).start())
+    
+    code = EXIT_OK
+    try:
+        com_serial = [s for s in sessions if s.ser]
+        avisados = set()
+        primeiro_fix = set()
+        while not parar.wait(1):
+            for session in sessions:
+                if session.first_fix_at is not None and session.car_id not in primeiro_fix:
+                    primeiro_fix.add(session.car_id)
+                    session.log_info(f"⏱️  Primeiro fix enviado {session.first_fix_at - STARTED_AT:.1f}s após o início")
+            for session in com_serial:
+                if session.reader_died() and session.car_id not in avisados:
+                    avisados.add(session.car_id)
+                    session.log_error("❌ Leitura serial encerrada")
+            if com_serial and len(avisados) == len(com_serial):
+                log_error("❌ Nenhuma serial ativa - finalizando gateway")
+                code = EXIT_SERIAL
+                break
     except KeyboardInterrupt:
-        print("\n\n⏹️  Encerrando...")
-        if listener:
-            listener.unsubscribe()
-        if ser:
-            ser.close()
-        log_info("✅ Sistema encerrado com sucesso")
+        pass
+    
+    print("\n\n⏹️  Encerrando...")
+    for timer in timers:
+        timer.stop()
+    if command_listener:
+        command_listener.stop()
+    if sighting_listener:
+        sighting_listener.stop()
+        stats = sighting_listener.correlator.stats
+        log_info(f"👀 Avistamentos - Correlacionados: {stats['sightings']} | Confirmados: {stats['confirmed']} | "
+                 f"Pendentes: {sighting_listener.correlator.pending_count()}")
+    for session in sessions:
+        session.stop()
+        session.log_stats()
+    if writer:
+        log_info("💾 Gravando dados pendentes no Firebase...")
+        writer.stop()
+        log_writer_stats()
+    if geocoder is not None:
+        geo = geocoder.stats()
+        log_info(f"🗺️  Endereços - Cache: {geo['hits']} acertos | Buscas na grade: {geo['misses']} | "
+                 f"Sem endereço por perto: {geo['not_found']}")
+    if archive is not None:
+        try:
+            archive.flush()
+        except OSError as e:
+            log_error(f"❌ Erro ao gravar o arquivo local: {e}")
+        log_info(f"🗄️  Arquivo local - GPS: {archive.stats['gps']} | Heartbeats: {archive.stats['heartbeat']} | "
+                 f"{archive.stats['bytes'] / 1e6:.1f} MB gravados")
+    if recorder:
+        recorder.close()
+        log_info(f"⏺️  Captura salva: {recorder.lines} linhas em {recorder.path}")
+    if live_server:
+        live_server.stop()
+    if metrics_server:
+        metrics_server.stop()
+    log_info("✅ Sistema encerrado com sucesso")
+    if not service:
         print("Até logo! 👋\n")
-        input("Pressione Enter para sair...")
+    return code
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# python-server/trips.py
+"""
+Segmentação do fluxo de fixes em viagens.
+
+Uma viagem começa quando a ignição liga (ack ou registro gps com
+ignitionState 'on') ou quando o carro se desloca mais que `idle_radius_m`
+com a ignição desligada, e termina quando a ignição desliga ou o carro
+fica `idle_timeout_s` sem sair de um raio de `idle_radius_m` (o trecho
+parado no fim não entra na viagem).
+
+Cada viagem vira um único documento em trips/{id}: trajeto em polyline
+(algoritmo do Google, precisão 1e-5 ≈ 1 m, pontos a cada `point_spacing_m`),
+tempos delta-codificados e o resumo (distância, duração, velocidade máxima
+e média). Ler a rota de uma viagem custa uma leitura em vez de uma por fix.
+Enquanto a viagem dura, o documento é regravado a cada `checkpoint_s`.
+"""
+
+from datetime import datetime, timezone
+
+from gps_thinning import haversine_m
+
+TRIP_ACTIVE = 'active'
+TRIP_CLOSED = 'closed'
+EVENT_CHECKPOINT = 'checkpoint'
+EVENT_CLOSED = 'closed'
+
+POLYLINE_PRECISION = 5
+
+
+def encode_signed(values):
+    """Inteiros com sinal no formato de caracteres do polyline do Google"""
+    out = []
+    for value in values:
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return ''.join(out)
+
+
+def decode_signed(text):
+    values = []
+    value = shift = 0
+    for char in text:
+        b = ord(char) - 63
+        value |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return values
+
+
+def encode_deltas(values):
+    """Sequência de inteiros como primeiro valor + diferenças"""
+    previous = 0
+    deltas = []
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return encode_signed(deltas)
+
+
+def decode_deltas(text):
+    total = 0
+    values = []
+    for delta in decode_signed(text):
+        total += delta
+        values.append(total)
+    return values
+
+
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    """[(lat, lon), ...] → polyline (lat e lon intercalados, delta a delta)"""
+    factor = 10 ** precision
+    previous_lat = previous_lon = 0
+    deltas = []
+    for lat, lon in points:
+        ilat, ilon = round(lat * factor), round(lon * factor)
+        deltas.append(ilat - previous_lat)
+        deltas.append(ilon - previous_lon)
+        previous_lat, previous_lon = ilat, ilon
+    return encode_signed(deltas)
+
+
+def decode_polyline(text, precision=POLYLINE_PRECISION):
+    factor = 10 ** precision
+    values = decode_signed(text)
+    points = []
+    lat = lon = 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lon += values[i + 1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+class Trip:
+    """Viagem em andamento: pontos do trajeto e estatísticas acumuladas"""
+
+    def __init__(self, car_id, t, reason):
+        self.id = f"{car_id}_{int(t * 1000)}"
+        self.start_t = t
+        self.end_t = t
+        self.start_reason = reason
+        self.end_reason = None
+        self.points = []          # (lat, lon, t) espaçados de point_spacing_m
+        self.distance_m = 0.0
+        self.max_speed_kmh = 0.0
+        self.last_checkpoint = t
+        self.checkpoints = 0
+
+    def add(self, lat, lon, t, spacing_m):
+        """Acrescenta o ponto se estiver a `spacing_m` do último; devolve a distância somada"""
+        self.end_t = t
+        if not self.points:
+            self.points.append((lat, lon, t))
+            return 0.0
+        plat, plon, pt = self.points[-1]
+        dist = haversine_m(plat, plon, lat, lon)
+        if dist < spacing_m:
+            return 0.0
+        if t > pt:
+            self.max_speed_kmh = max(self.max_speed_kmh, dist / (t - pt) * 3.6)
+        self.points.append((lat, lon, t))
+        self.distance_m += dist
+        return dist
+
+    def trim(self, t):
+        """Remove os pontos depois de `t` (trecho parado no fim da viagem)"""
+        while len(self.points) > 1 and self.points[-1][2] > t:
+            lat, lon, _ = self.points.pop()
+            plat, plon, _ = self.points[-1]
+            self.distance_m -= haversine_m(plat, plon, lat, lon)
+        self.end_t = t
+
+    def to_document(self, car_id, user_id, status):
+        duration = max(0.0, self.end_t - self.start_t)
+        first = self.points[0] if self.points else (None, None, self.start_t)
+        last = self.points[-1] if self.points else first
+        return {
+            'carId': car_id,
+            'userId': user_id,
+            'status': status,
+            'startReason': self.start_reason,
+            'endReason': self.end_reason,
+            'startTime': datetime.fromtimestamp(self.start_t, timezone.utc),
+            'endTime': datetime.fromtimestamp(self.end_t, timezone.utc),
+            'durationS': round(duration),
+            'distanceM': round(self.distance_m),
+            'maxSpeedKmh': round(self.max_speed_kmh, 1),
+            'avgSpeedKmh': round(self.distance_m / duration * 3.6, 1) if duration else 0.0,
+            'startLatitude': first[0],
+            'startLongitude': first[1],
+            'endLatitude': last[0],
+            'endLongitude': last[1],
+            'pointCount': len(self.points),
+            'encoding': f'polyline{POLYLINE_PRECISION}',
+            'polyline': encode_polyline((lat, lon) for lat, lon, _ in self.points),
+            # Segundos desde startTime de cada ponto, delta-codificados
+            'timeOffsets': encode_deltas([round(t - self.start_t) for _, _, t in self.points]),
+        }
+
+
+class TripSegmenter:
+    """Divide os fixes de um veículo em viagens; offer() devolve [(evento, Trip), ...]"""
+
+    def __init__(self, car_id, idle_timeout_s=300.0, idle_radius_m=50.0, point_spacing_m=10.0,
+                 min_trip_distance_m=200.0, checkpoint_s=60.0, max_points=20000):
+        self.car_id = car_id
+        self.idle_timeout_s = idle_timeout_s
+        self.idle_radius_m = idle_radius_m
+        self.point_spacing_m = point_spacing_m
+        self.min_trip_distance_m = min_trip_distance_m
+        self.checkpoint_s = checkpoint_s
+        self.max_points = max_points  # documento do Firestore tem limite de 1 MiB
+
+        self.trip = None
+        self.ignition = None
+        self.anchor = None         # (lat, lon) de onde o carro estava parado
+        self.last_move = None      # instante em que saiu do raio do anchor
+        self._start_pending = False
+        self.stats = {'trips': 0, 'discarded': 0, 'checkpoints': 0, 'fixes': 0}
+
+    def set_ignition(self, state, t):
+        """Mudança de ignição (ack do Arduino ou campo do registro gps)"""
+        if state is None or state == self.ignition:
+            return []
+        self.ignition = state
+        if state == 'on':
+            self._start_pending = self.trip is None
+            return []
+        if self.trip is not None:
+            return self._close('ignition_off', self.trip.end_t)
+        return []
+
+    def offer(self, lat, lon, t, ignition=None):
+        """Fix válido no instante `t`"""
+        self.stats['fixes'] += 1
+        events = self.set_ignition(ignition, t)
+
+        moved = self.anchor is None or haversine_m(self.anchor[0], self.anchor[1], lat, lon) > self.idle_radius_m
+        if moved:
+            if self.anchor is not None:
+                self.last_move = t
+            self.anchor = (lat, lon)
+
+        trip = self.trip
+        if trip is None:
+            if self._start_pending or (moved and self.last_move == t):
+                reason = 'ignition_on' if self._start_pending else 'motion'
+                self._start_pending = False
+                trip = self.trip = Trip(self.car_id, t, reason)
+                self.last_move = t
+            else:
+                return events
+
+        trip.add(lat, lon, t, self.point_spacing_m)
+
+        if t - self.last_move >= self.idle_timeout_s:
+            return events + self._close('idle', self.last_move)
+        if len(trip.points) >= self.max_points:
+            events += self._close('split', t)
+            self.trip = Trip(self.car_id, t, 'split')
+            self.trip.add(lat, lon, t, self.point_spacing_m)
+            return events
+        if (trip.distance_m >= self.min_trip_distance_m and
+                t - trip.last_checkpoint >= self.checkpoint_s):
+            trip.last_checkpoint = t
+            trip.checkpoints += 1
+            self.stats['checkpoints'] += 1
+            events.append((EVENT_CHECKPOINT, trip))
+        return events
+
+    def close(self, reason='gateway_stop'):
+        """Encerra a viagem em andamento (ex.: ao parar o gateway)"""
+        if self.trip is None:
+            return []
+        return self._close(reason, self.trip.end_t)
+
+    def _close(self, reason, end_t):
+        trip, self.trip = self.trip, None
+        self.anchor = None  # o próximo fix marca onde o carro ficou parado
+        trip.trim(end_t)
+        trip.end_reason = reason
+        if trip.distance_m < self.min_trip_distance_m and not trip.checkpoints:
+            # Manobra na garagem, ignição ligada sem sair do lugar...
+            self.stats['discarded'] += 1
+            return []
+        self.stats['trips'] += 1
+        return [(EVENT_CLOSED, trip)]
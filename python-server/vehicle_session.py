@@ -0,0 +1,1003 @@
+# python-server/vehicle_session.py
+"""
+Sessão por veículo do gateway.
+
+Cada VehicleSession é dona da sua porta serial, do estado da ignição, do
+listener do Firestore e das estatísticas de GPS. O cliente do Firestore e a
+fila de gravação (FirestoreWriter) são compartilhados entre todas as sessões
+do processo.
+"""
+
+import time
+from datetime import datetime, timezone
+from threading import Lock
+
+from firebase_admin import firestore
+
+from car_document import CarDocumentMirror
+from command_tracker import CommandTracker, RESULT_CONFIRMED, RESULT_SUPERSEDED
+from gateway_log import log_info, log_warning, log_error, log_debug
+from car_commands import where_filter
+from fix_quality import FixQualityFilter, REJECT_REASONS
+from geofence import GeofenceEngine, EVENT_ENTER, fence_from_app, load_fences
+from health import DeviceHealth, bucket_id, bucket_start
+from gps_thinning import GpsThinner
+from line_parser import LineParser, ParseError, GpsRecord, FRAMING_CSV, FRAMING_JSON
+from rate_control import RateController
+from serial_reader import SerialReader, open_port, close_port, find_arduino, parse_usb_id
+from trips import TripSegmenter, EVENT_CLOSED, TRIP_ACTIVE, TRIP_CLOSED
+
+COMMAND_COOLDOWN = 5  # 5 segundos entre comandos iguais
+COMMAND_ACK_TIMEOUT = 2.0  # espera pelo ack antes de reenviar
+COMMAND_MAX_ATTEMPTS = 3
+COMMAND_MAX_AGE = 60  # comandos do app mais velhos que isso não são executados
+
+# car_commands.command → (comando do Arduino, ignitionState esperado)
+APP_COMMANDS = {
+    'unlock': ('IGNITION_ON', 'on'),
+    'lock': ('IGNITION_OFF', 'off'),
+}
+
+# heartbeat.rele → estado do relé no LiveState
+_RELE = {'ligado': 'on', 'desligado': 'off'}
+
+
+class VehicleSession:
+    """Estado e E/S de um veículo (uma porta serial ↔ um documento cars/{id})"""
+
+    def __init__(self, db, writer, car_id, user_id, port=None, baud=9600, label='',
+                 thinning=None, car_update_interval=2.0, framing=FRAMING_JSON,
+                 adaptive_rate=True, rate_policies=None, geofences=None, trips=None,
+                 usb_id=None, reconnect=True, quality=None, geocoder=None, health=None):
+        self.db = db
+        self.writer = writer
+        self.car_id = car_id
+        self.user_id = user_id
+        self.port = port
+        self.baud = baud
+        self.usb_id = parse_usb_id(usb_id)  # 'vid:pid' do adaptador, para achá-lo em outra porta
+        self.reconnect = reconnect  # reabre a serial se o USB cair
+        self._banner = None  # TRACKCAR_READY lido pela busca de porta, processado após reconectar
+        self.label = label  # prefixo dos logs quando há vários veículos
+        self.framing = framing  # 'json' ou 'csv' (negociado no TRACKCAR_READY)
+        self.parser = LineParser()
+        self.recorder = None  # CaptureRecorder do modo --record
+        self.archive = None   # TelemetryArchive (gps/heartbeat em colunas locais)
+        self.live = None      # LiveState (último estado servido por HTTP/SSE)
+        self.sightings = None  # SightingCorrelator (avistamentos × fixes)
+        self.urgent = False   # gravações sem espera de lote (modo roubado)
+
+        self.car_ref = db.collection('cars').document(car_id)
+        # Todas as escritas em cars/{id} passam pelo espelho (campos sujos)
+        self.car_doc = CarDocumentMirror(self.car_ref, writer, min_interval=car_update_interval)
+        self.ser = None
+        self.serial_lock = Lock()
+        self.reader = None
+        self.listener = None
+        self.last_heartbeat = 0
+        self.first_fix_at = None  # time.monotonic() do primeiro fix enviado à fila
+
+        # ✅ NOVO: Controle de estado para evitar comandos repetitivos
+        self.last_ignition_state = 'unknown'
+        self.last_command_time = 0
+        self.is_stolen = False
+        self.stolen_report = False  # registro ativo em stolen_cars (SightingListener)
+
+        # Comandos de ignição com seq, confirmados pelo ack do Arduino
+        self.relay_state = None  # último estado confirmado ('on'/'off')
+        self.remote_state = None  # (ignitionState, isStolen) do último snapshot tratado
+        self.snapshot_stats = {'received': 0, 'ignored': 0}
+        self.commands = CommandTracker(
+            self._escrever_serial, on_result=self._resultado_comando,
+            timeout=COMMAND_ACK_TIMEOUT, max_attempts=COMMAND_MAX_ATTEMPTS,
+            on_error=self.log_error, name=f"commands-{car_id}"
+        )
+
+        # Nota do fix e rejeição de saltos (multipath); quality=False desliga
+        self.quality = FixQualityFilter(**(quality or {})) if quality is not False else None
+
+        # Filtro de fixes antes do upload (dead-band, intervalo, Douglas-Peucker)
+        self.thinner = GpsThinner(**(thinning or {}))
+        self.last_fix_ignition = None
+
+        # Modo de envio (stolen/moving/idle/parked) → intervalo do Arduino, thinning e espelho
+        # O thinning do veículo entra na tabela: a política do modo não o apaga
+        self.rate = RateController(rate_policies, thinning=thinning) if adaptive_rate else None
+
+        # Cercas virtuais: só as transições (enter/exit) vão para o Firestore
+        # (vehicles.json + coleção geofences do app); geofences=False desliga
+        self.config_fences = load_fences(geofences) if geofences is not False else []
+        self.geofences = GeofenceEngine(self.config_fences) if geofences is not False else None
+        self.geofence_watch = None
+
+        # Endereço offline dos fixes gravados (ReverseGeocoder compartilhado entre as sessões)
+        self.geocoder = geocoder
+
+        # Viagens (trips/{id}): um documento com o trajeto inteiro; trips=False desliga
+        self.trips = TripSegmenter(car_id, **(trips or {})) if trips is not False else None
+
+        # Rollups de saúde (device_health/{id}): um documento por balde; health=False desliga
+        self.health = DeviceHealth(car_id, **(health or {})) if health is not False else None
+
+        # ✅ NOVO: Status GPS para atualização na tela
+        self.gps_status = {
+            'initialized': False,
+            'satellites': 0,
+            'last_valid': 0,
+            'total_reads': 0,
+            'valid_count': 0,
+            'last_age': 999999,
+            'fix_time': None,
+            'accepted': 0,  # fixes válidos aprovados pela nota de qualidade
+            'rejected': 0
+        }
+
+    # --------------------------------------------------------------------------
+    # Logs com identificação do veículo
+    # --------------------------------------------------------------------------
+
+    def log_info(self, message):
+        log_info(f"{self.label}{message}")
+
+    def log_warning(self, message):
+        log_warning(f"{self.label}{message}")
+
+    def log_error(self, message):
+        log_error(f"{self.label}{message}")
+
+    def log_debug(self, message):
+        log_debug(f"{self.label}{message}")
+
+    # --------------------------------------------------------------------------
+    # Ciclo de vida
+    # --------------------------------------------------------------------------
+
+    def open_serial(self, read_timeout=1):
+        """Abre a porta serial do veículo (levanta exceção em caso de falha)"""
+        self.ser = open_port(self.port, self.baud, read_timeout)
+        self.log_info(f"✅ Serial conectada: {self.port}")
+        return self.ser
+
+    def start(self):
+        """Inicia o listener do Firebase e a leitura serial"""
+        self.commands.start()
+        self.listener = self.escutar_ignition_state()
+        if self.geofences is not None:
+            self.geofence_watch = self.escutar_cercas()
+        self.last_heartbeat = time.time()
+        if self.ser:
+            self.reader = SerialReader(
+                self.ser, self.processar_linha_arduino,
+                on_error=self.log_error, name=f"serial-{self.car_id}",
+                reconnect=self._reabrir_serial if self.reconnect else None,
+                on_disconnect=self._serial_caiu, on_reconnect=self._serial_reconectada
+            ).start()
+        self._publicar(connected=self.ser is not None, ignition=self.last_ignition_state)
+        return self
+
+    def stop(self):
+        """Encerra listener, leitura e porta serial"""
+        if self.listener:
+            self.listener.unsubscribe()
+            self.listener = None
+        if self.geofence_watch:
+            self.geofence_watch.unsubscribe()
+            self.geofence_watch = None
+        if self.reader:
+            self.reader.stop()
+        self.commands.stop()
+        # Grava o segmento que ainda estava no buffer do thinning
+        self._upload_fixes(self.thinner.flush())
+        if self.trips is not None:
+            self._gravar_viagens(self.trips.close())
+        if self.health is not None:
+            self._gravar_saude(self.health.close())
+        self.car_doc.flush()
+        if self.ser:
+            close_port(self.ser)
+
+    def reader_died(self):
+        """True se a serial existia e a thread de leitura morreu"""
+        return self.reader is not None and not self.reader.is_alive()
+
+    # --------------------------------------------------------------------------
+    # Reconexão serial (chamados pela thread de leitura)
+    # --------------------------------------------------------------------------
+
+    def _serial_caiu(self, error):
+        # Comandos ficam na fila em vez de gastar as tentativas com a porta fechada
+        self.commands.pause()
+        self._publicar(connected=False)
+        self.log_warning(f"🔌 Serial {self.port} desconectada - procurando o Arduino...")
+
+    def _reabrir_serial(self):
+        ser, self._banner = find_arduino(self.port, self.baud, self.usb_id, self.ser.timeout)
+        return ser
+
+    def _serial_reconectada(self, ser, down_s):
+        with self.serial_lock:
+            self.ser = ser
+        self._publicar(connected=True)
+        stats = self.reader.stats
+        where = f" em {ser.port}" if ser.port != self.port else ''
+        self.log_info(f"🔌 Serial reconectada{where} após {down_s:.1f}s "
+                      f"({stats['attempts']} tentativas, {stats['outages']} quedas)")
+        replayed = self.commands.resume()
+        if replayed:
+            self.log_info(f"📨 {replayed} comando(s) pendente(s) reenviado(s)")
+        # A busca por banner já consumiu o TRACKCAR_READY: restaura relé, framing e intervalo
+        banner, self._banner = self._banner, None
+        if banner:
+            self.processar_linha_arduino(banner)
+
+    # --------------------------------------------------------------------------
+    # Funções Firebase
+    # --------------------------------------------------------------------------
+
+    def load_initial_state(self):
+        """Testa a conexão e carrega o estado inicial da ignição"""
+        try:
+            self.log_info("🧪 Testando conexão Firebase...")
+            car_doc = self.car_ref.get()
+
+            if not car_doc.exists:
+                self.log_warning(f"⚠️  Documento do carro não encontrado: {self.car_id}")
+                self.log_info("💡 Verifique se o CAR_ID está correto ou crie o carro no app")
+                return False
+
+            data = car_doc.to_dict()
+            self.car_doc.observe(data)
+            self.last_ignition_state = data.get('ignitionState', 'unknown')
+            self.is_stolen = bool(data.get('isStolen', False))
+            if self.geofences is not None:
+                try:
+                    self._aplicar_cercas_app(self._consulta_cercas().get())
+                except Exception as e:
+                    self.log_warning(f"⚠️  Cercas do app não carregadas: {e}")
+                if 'insideGeofences' in data:
+                    self.geofences.restore(data['insideGeofences'] or [])
+            if self.health is not None:
+                self._retomar_saude()
+            self.log_info(f"✅ Carro encontrado: {data.get('brand', 'N/A')} {data.get('model', 'N/A')}")
+            self.log_info(f"🔧 Estado inicial da ignição: {self.last_ignition_state}")
+            return True
+
+        except Exception as e:
+            self.log_error(f"❌ Erro no teste Firebase: {e}")
+            return False
+
+    def save_gps_location(self, fix):
+        """Salva localização (GpsRecord) no Firestore"""
+        try:
+            if not fix.valid:
+                # ✅ MELHORADO: Log mais detalhado
+                age = fix.age
+                sats = fix.sats
+
+                if not fix.gps_init:
+                    self.log_warning(f"⏳ GPS procurando satélites... ({sats} sats encontrados)")
+                elif age > 10000:
+                    self.log_warning(f"⏰ GPS dados muito antigos - {age/1000:.1f}s ({sats} sats)")
+                else:
+                    self.log_warning(f"❌ GPS inválido - Age: {age}ms, Sats: {sats}")
+                return False
+
+            lat, lon, sats, age = fix.lat, fix.lon, fix.sats, fix.age
+
+            if lat == 0 and lon == 0:
+                self.log_warning("⚠️  Coordenadas inválidas (0,0) - ignorando")
+                return False
+
+            now = time.time()
+            fix.received_at = now
+            # Saltos de multipath e fixes ruins não chegam às cercas, viagens e thinning
+            if self.quality is not None and not self.quality.offer(fix, now):
+                self.gps_status['rejected'] += 1
+                self.log_debug(f"🎯 GPS rejeitado ({self.quality.last_reason}): {lat:.6f}, {lon:.6f} "
+                               f"({sats} sats, {age}ms, nota {fix.quality})")
+                return False
+            self.gps_status['accepted'] += 1
+            lat, lon = fix.lat, fix.lon  # suavizados pelo Kalman, se ligado
+            if self.sightings is not None:
+                self.sightings.add_fix(self.car_id, now - age / 1000, lat, lon)
+
+            # Primeiro fix, mudança de ignição e modo roubado nunca são filtrados
+            ignition = fix.ignition_state
+            force = self.is_stolen or self.stolen_report or (ignition is not None and ignition != self.last_fix_ignition)
+            self.last_fix_ignition = ignition
+
+            # Cercas antes do thinning: a transição não pode depender do fix ser gravado
+            if self.geofences is not None and self._verificar_cercas(fix, now):
+                force = True
+
+            fixes = self.thinner.offer(fix, now, force=force)
+            self._upload_fixes(fixes)
+            self._ajustar_taxa(fix.speed)
+            if self.trips is not None:
+                self._gravar_viagens(self.trips.offer(lat, lon, now, ignition))
+
+            # ✅ NOVO: Atualiza status local
+            self.gps_status.update({
+                'initialized': True,
+                'satellites': sats,
+                'last_valid': now,
+                'last_age': age,
+                'fix_time': self.gps_status['fix_time'] or datetime.now().strftime('%H:%M:%S')
+            })
+
+            if not fixes:
+                self.log_debug(f"🧹 GPS filtrado: {lat:.6f}, {lon:.6f} ({sats} sats, {age}ms)")
+            return True
+
+        except Exception as e:
+            self.log_error(f"❌ Erro ao salvar GPS: {e}")
+            return False
+
+    def _upload_fixes(self, fixes):
+        """Grava os fixes aprovados pelo thinning e atualiza o carro com o último"""
+        if not fixes:
+            return
+        if self.first_fix_at is None:
+            self.first_fix_at = time.monotonic()
+
+        for fix in fixes:
+            location_data = {
+                'carId': self.car_id,
+                'userId': self.user_id,
+                'latitude': fix.lat,
+                'longitude': fix.lon,
+                'satellites': fix.sats,
+                'accuracy': fix.age,
+                # Hora de recepção: o fix pode ter esperado no segmento do Douglas-Peucker
+                'timestamp': datetime.fromtimestamp(fix.received_at, timezone.utc),
+                'status': 'active',
+                'source': 'arduino'
+            }
+            if fix.speed is not None:
+                location_data['speed'] = fix.speed
+            if fix.heading is not None:
+                location_data['heading'] = fix.heading
+            if fix.quality is not None:
+                location_data['quality'] = fix.quality
+            place = self.geocoder.lookup(fix.lat, fix.lon) if self.geocoder is not None else None
+            if place is not None:
+                location_data['address'] = place['address']
+                location_data['locality'] = place['locality']
+
+            self.writer.add('gps_locations', location_data, urgent=self.urgent)
+            self.log_info(f"✅ GPS salvo: {fix.lat:.6f}, {fix.lon:.6f} ({fix.sats} sats, {fix.age}ms)")
+
+        # Só o fix mais recente vai para o documento do carro
+        last = fixes[-1]
+        # ✅ NOVO: Atualiza carro E salva status GPS no Firebase
+        car_fields = {
+            'lastLatitude': last.lat,
+            'lastLongitude': last.lon,
+            # ✅ NOVO: Status GPS para o app
+            'gpsStatus': {
+                'active': True,
+                'satellites': last.sats,
+                'accuracy': last.age
+            }
+        }
+        if place is not None:  # endereço do último fix do laço acima
+            car_fields['lastAddress'] = place['address']
+        self.car_doc.update(car_fields, touch=('lastLocationUpdate', 'gpsStatus.lastUpdate'))
+
+    def _consulta_cercas(self):
+        return where_filter(self.db.collection('geofences'), 'carId', '==', self.car_id)
+
+    def _aplicar_cercas_app(self, docs):
+        """Cercas do app (coleção geofences) + as do vehicles.json no motor"""
+        app_fences = [f for f in (fence_from_app(doc.id, doc.to_dict() or {}) for doc in docs) if f]
+        self.geofences.replace(self.config_fences + app_fences)
+        return len(app_fences)
+
+    def escutar_cercas(self):
+        """Listener da coleção geofences (cercas criadas/alteradas no app)"""
+
+        def on_snapshot(docs, changes, read_time):
+            if changes:
+                total = self._aplicar_cercas_app(docs)
+                self.log_info(f"🗺️  Cercas do app atualizadas: {total} ativas")
+
+        try:
+            return self._consulta_cercas().on_snapshot(on_snapshot)
+        except Exception as e:
+            self.log_error(f"❌ Erro ao escutar cercas: {e}")
+            return None
+
+    def _verificar_cercas(self, fix, now):
+        """Grava os eventos enter/exit do fix; devolve True se houve transição"""
+        events = self.geofences.check(fix.lat, fix.lon)
+        if not events:
+            return False
+
+        timestamp = datetime.fromtimestamp(now, timezone.utc)
+        for event, fence in events:
+            emoji = "📥" if event == EVENT_ENTER else "📤"
+            self.log_info(f"{emoji} Cerca {fence.name}: {'entrou' if event == EVENT_ENTER else 'saiu'}")
+            if not (fence.alert_enter if event == EVENT_ENTER else fence.alert_exit):
+                continue
+            self.writer.add('geofence_events', {
+                'carId': self.car_id,
+                'userId': self.user_id,
+                'fenceId': fence.id,
+                'fenceName': fence.name,
+                'event': event,
+                'latitude': fix.lat,
+                'longitude': fix.lon,
+                'timestamp': timestamp
+            })
+        self.car_doc.update({'insideGeofences': sorted(self.geofences.inside)})
+        return True
+
+    def _gravar_viagens(self, events):
+        """Grava trips/{id} a cada checkpoint e no encerramento da viagem"""
+        for event, trip in events:
+            closed = event == EVENT_CLOSED
+            doc = trip.to_document(self.car_id, self.user_id, TRIP_CLOSED if closed else TRIP_ACTIVE)
+            doc['updatedAt'] = firestore.SERVER_TIMESTAMP
+            self.writer.set(self.db.collection('trips').document(trip.id), doc)
+            if closed:
+                self.log_info(f"🏁 Viagem encerrada ({trip.end_reason}): {doc['distanceM'] / 1000:.1f} km em "
+                              f"{doc['durationS'] / 60:.0f} min, máx {doc['maxSpeedKmh']:.0f} km/h, "
+                              f"{doc['pointCount']} pontos")
+                self.car_doc.update({'currentTripId': None, 'lastTripId': trip.id})
+            else:
+                self.car_doc.update({'currentTripId': trip.id})
+
+    def _retomar_saude(self):
+        """Continua os baldes de saúde gravados incompletos por uma execução anterior"""
+        now = time.time()
+        for resolution in self.health.resolutions:
+            start = bucket_start(resolution, now)
+            try:
+                doc = self.db.collection('device_health').document(bucket_id(self.car_id, resolution, start)).get()
+            except Exception as e:
+                self.log_warning(f"⚠️  Saúde ({resolution}) não retomada: {e}")
+                continue
+            if doc.exists:
+                self.health.restore(resolution, start, doc.to_dict())
+
+    def _gravar_saude(self, buckets):
+        """Grava device_health/{id} de cada balde fechado (ou incompleto, ao parar)"""
+        for bucket in buckets:
+            doc = bucket.to_document(self.car_id, self.user_id, self.health.last)
+            doc['updatedAt'] = firestore.SERVER_TIMESTAMP
+            ref = self.db.collection('device_health').document(bucket_id(self.car_id, bucket.resolution, bucket.start))
+            self.writer.set(ref, doc)
+
+    def expirar_saude(self):
+        """Fecha os baldes vencidos de um veículo que parou de mandar registros"""
+        if self.health is not None:
+            self._gravar_saude(self.health.expire(time.time()))
+
+    def writes_saved(self):
+        """Escritas no Firestore evitadas pelo thinning e pelo espelho do carro"""
+        # Cada fix descartado economiza o add em gps_locations e o update do carro
+        return self.thinner.dropped() * 2 + self.car_doc.coalesced()
+
+    def log_stats(self):
+        """Mostra os contadores do thinning deste veículo"""
+        stats = self.thinner.stats
+        self.log_info(f"🧹 Thinning - Recebidos: {stats['received']} | "
+                      f"Gravados: {stats['kept'] + stats['forced']} (forçados {stats['forced']}) | "
+                      f"Descartados: dead-band {stats['dropped_dead_band']}, "
+                      f"intervalo {stats['dropped_interval']}, DP {stats['dropped_douglas_peucker']} | "
+                      f"Escritas economizadas: {self.writes_saved()}")
+        if self.quality is not None:
+            q = self.quality.stats
+            reasons = ', '.join(f"{r} {q[f'rejected_{r}']}" for r in REJECT_REASONS)
+            self.log_info(f"🎯 Qualidade - Aceitos: {q['accepted']} | Rejeitados: {q['rejected']} ({reasons}) | "
+                          f"Reancorados: {q['reanchored']} | Suavizados: {q['smoothed']}")
+        parsed = self.parser.stats
+        self.log_info(f"🧾 Parser ({self.framing}) - Rápido: {parsed['fast']} | CSV: {parsed['csv']} | "
+                      f"JSON completo: {parsed['json']} | Erros: {parsed['errors']}")
+        snaps = self.snapshot_stats
+        self.log_info(f"👂 Snapshots de cars/{self.car_id} - Recebidos: {snaps['received']} | "
+                      f"Ignorados (sem mudança de ignição/roubo): {snaps['ignored']}")
+        cmds = self.commands.stats
+        self.log_info(f"📨 Comandos - Enviados: {cmds['sent']} | Confirmados: {cmds['confirmed']} | "
+                      f"Reenvios: {cmds['retries']} | Sem ack: {cmds['timeouts']} | "
+                      f"Ida e volta: {cmds['last_rtt_ms']:.0f}ms (médio {self.commands.avg_rtt_ms():.0f}ms, "
+                      f"máx {cmds['max_rtt_ms']:.0f}ms)")
+        if self.reader is not None and self.reader.stats['outages']:
+            serial = self.reader.stats
+            self.log_info(f"🔌 Serial - Quedas: {serial['outages']} | Reconexões: {serial['reconnects']} | "
+                          f"Fora do ar: {serial['total_outage_s']:.1f}s (última {serial['last_outage_s']:.1f}s, "
+                          f"máx {serial['max_outage_s']:.1f}s)")
+        if self.rate is not None:
+            self.log_info(f"🚦 Modo de envio: {self.rate.mode} | Mudanças: {self.rate.changes}")
+        if self.trips is not None:
+            trips = self.trips.stats
+            self.log_info(f"🏁 Viagens - Gravadas: {trips['trips']} | Descartadas (curtas): {trips['discarded']} | "
+                          f"Checkpoints: {trips['checkpoints']} | Em andamento: {'sim' if self.trips.trip else 'não'}")
+        if self.geofences is not None and self.geofences.fences:
+            fence = self.geofences.stats
+            self.log_info(f"🗺️  Cercas ({len(self.geofences.fences)}) - Fixes avaliados: {fence['checks']} | "
+                          f"Testes: {fence['tests']} | Entradas: {fence['enter']} | Saídas: {fence['exit']}")
+        if self.health is not None:
+            health = self.health.stats
+            closed = ', '.join(f"{r} {health[f'closed_{r}']}" for r in self.health.resolutions)
+            self.log_info(f"🩺 Saúde - Heartbeats: {health['heartbeats']} | Reinícios: {health['reboots']} | "
+                          f"Baldes fechados: {closed} | Retomados: {health['restored']}")
+        car = self.car_doc.stats
+        self.log_info(f"📝 cars/{self.car_id} - Updates: {car['updates']} | Escritas: {car['flushes']} | "
+                      f"Campos sem mudança ignorados: {car['fields_skipped']} | Pendentes: {self.car_doc.pending()}")
+
+    def metric_samples(self):
+        """Amostras (nome, tipo, ajuda, labels, valor) para o registro de métricas"""
+        car = {'car': self.car_id}
+        for path, n in self.parser.stats.items():
+            yield ('trackcar_lines_parsed_total', 'counter', "Linhas do Arduino por caminho do parser",
+                   dict(car, path=path), n)
+        if self.reader is not None:
+            yield ('trackcar_serial_lines_total', 'counter', "Linhas lidas da serial", car, self.reader.lines)
+            yield ('trackcar_serial_errors_total', 'counter', "Erros de leitura/processamento da serial",
+                   car, self.reader.errors)
+            serial = self.reader.stats
+            yield ('trackcar_serial_connected', 'gauge', "1 se a serial está aberta", car, int(self.reader.connected))
+            yield ('trackcar_serial_outages_total', 'counter', "Quedas da serial (USB desconectado)",
+                   car, serial['outages'])
+            yield ('trackcar_serial_outage_seconds_total', 'counter', "Tempo total com a serial fora do ar",
+                   car, serial['total_outage_s'])
+            yield ('trackcar_serial_reconnect_seconds', 'gauge', "Duração da última queda até reconectar",
+                   car, serial['last_outage_s'])
+        if self.quality is not None:
+            q = self.quality.stats
+            for reason in REJECT_REASONS:
+                yield ('trackcar_gps_fixes_rejected_total', 'counter', "Fixes GPS rejeitados pela nota de qualidade",
+                       dict(car, reason=reason), q[f'rejected_{reason}'])
+            yield ('trackcar_gps_reanchors_total', 'counter', "Posições novas aceitas após saltos coerentes",
+                   car, q['reanchored'])
+        thin = self.thinner.stats
+        yield ('trackcar_gps_fixes_received_total', 'counter', "Fixes GPS válidos recebidos", car, thin['received'])
+        yield ('trackcar_gps_fixes_saved_total', 'counter', "Fixes GPS enviados para gps_locations",
+               car, thin['kept'] + thin['forced'])
+        for reason in ('dead_band', 'interval', 'douglas_peucker'):
+            yield ('trackcar_gps_fixes_dropped_total', 'counter', "Fixes GPS descartados pelo thinning",
+                   dict(car, reason=reason), thin[f'dropped_{reason}'])
+        yield ('trackcar_car_doc_writes_total', 'counter', "Escritas no documento cars/{id}",
+               car, self.car_doc.stats['flushes'])
+        yield ('trackcar_car_doc_pending_fields', 'gauge', "Campos sujos aguardando escrita",
+               car, self.car_doc.pending())
+        cmds = self.commands.stats
+        for result in ('sent', 'confirmed', 'retries', 'timeouts'):
+            yield ('trackcar_commands_total', 'counter', "Comandos de ignição por resultado",
+                   dict(car, result=result), cmds[result])
+        for kind in ('received', 'ignored'):
+            yield ('trackcar_car_snapshots_total', 'counter', "Snapshots de cars/{id} recebidos/ignorados",
+                   dict(car, kind=kind), self.snapshot_stats[kind])
+        yield ('trackcar_command_rtt_max_seconds', 'gauge', "Maior ida e volta de comando confirmado",
+               car, cmds['max_rtt_ms'] / 1000)
+        if self.rate is not None and self.rate.mode is not None:
+            yield ('trackcar_reporting_interval_seconds', 'gauge', "Intervalo de envio pedido ao Arduino",
+                   dict(car, mode=self.rate.mode), self.rate.policy()['send_interval_s'])
+            yield ('trackcar_reporting_mode_changes_total', 'counter', "Mudanças do modo de envio",
+                   car, self.rate.changes)
+        if self.trips is not None:
+            yield ('trackcar_trips_total', 'counter', "Viagens gravadas em trips", car, self.trips.stats['trips'])
+            yield ('trackcar_trip_checkpoints_total', 'counter', "Regravações de viagens em andamento",
+                   car, self.trips.stats['checkpoints'])
+        if self.geofences is not None:
+            fence = self.geofences.stats
+            for event in ('enter', 'exit'):
+                yield ('trackcar_geofence_events_total', 'counter', "Transições de cerca gravadas",
+                       dict(car, event=event), fence[event])
+            yield ('trackcar_geofence_tests_total', 'counter', "Testes ponto-em-cerca após o índice",
+                   car, fence['tests'])
+        if self.health is not None:
+            health = self.health.stats
+            yield ('trackcar_device_reboots_total', 'counter', "Reinícios do Arduino (uptime voltou para trás)",
+                   car, health['reboots'])
+            for resolution in self.health.resolutions:
+                yield ('trackcar_health_buckets_total', 'counter', "Baldes de saúde fechados e gravados",
+                       dict(car, resolution=resolution), health[f'closed_{resolution}'])
+        yield ('trackcar_heartbeat_age_seconds', 'gauge', "Segundos desde o último heartbeat",
+               car, time.time() - self.last_heartbeat if self.last_heartbeat else -1)
+
+    # ✅ NOVA: Função para atualizar status GPS na tela
+    def update_gps_status_in_firebase(self):
+        """Atualiza status do GPS no Firebase para exibir na tela"""
+        try:
+            gps_status = self.gps_status
+
+            # Calcula tempo sem GPS válido
+            time_without_gps = 0
+            if gps_status['last_valid'] > 0:
+                time_without_gps = int(time.time() - gps_status['last_valid'])
+
+            status_text = "🔍 Procurando GPS..."
+            if gps_status['initialized']:
+                if time_without_gps <= 30:
+                    status_text = f"🛰️ GPS OK ({gps_status['satellites']} sats)"
+                else:
+                    status_text = f"⚠️ GPS sem sinal há {time_without_gps}s"
+            elif gps_status['satellites'] > 0:
+                status_text = f"⏳ Aguardando fix GPS ({gps_status['satellites']} sats)"
+
+            self.car_doc.update({
+                'gpsStatusText': status_text,
+                'gpsStatusDetails': {
+                    'initialized': gps_status['initialized'],
+                    'satellites': gps_status['satellites'],
+                    'lastValidSeconds': time_without_gps,
+                    'totalReads': gps_status['total_reads'],
+                    'validCount': gps_status['valid_count'],
+                    'lastAge': gps_status['last_age'],
+                    'fixTime': gps_status['fix_time'],
+                    'acceptedCount': gps_status['accepted'],
+                    'rejectedCount': gps_status['rejected']
+                }
+            })
+
+        except Exception as e:
+            self.log_debug(f"Erro ao atualizar status GPS: {e}")
+
+    # --------------------------------------------------------------------------
+    # Controle do relé
+    # --------------------------------------------------------------------------
+
+    def _escrever_serial(self, linha):
+        """Escreve uma linha na serial (sem esperar resposta)"""
+        with self.serial_lock:
+            if self.ser is None or not self.ser.is_open:
+                self.log_warning("⚠️  Serial não disponível")
+                return False
+            try:
+                self.ser.write(f"{linha}\n".encode())
+                self.ser.flush()
+            except Exception as e:
+                self.log_error(f"❌ Erro ao escrever na serial: {e}")
+                return False
+        self.log_info(f"📤 Comando enviado: {linha}")
+        return True
+
+    def enviar_comando_arduino(self, comando):
+        """Envia comando para Arduino via Serial com retry"""
+        if self.ser is None:
+            self.log_warning("⚠️  Modo teste: simulando comando Arduino")
+            self.log_info(f"🎭 SIMULADO: {comando}")
+            return True
+
+        for tentativa in range(3):
+            if self._escrever_serial(comando):
+                # A resposta (ack) chega pela thread de leitura serial
+                return True
+            if not self.ser.is_open:
+                return False
+            time.sleep(1)
+        return False
+
+    def enviar_comando_ignicao(self, comando, estado):
+        """Envia IGNITION_ON/OFF com seq; a confirmação chega pelo ack"""
+        if self.ser is None:
+            return self.enviar_comando_arduino(comando)
+        # Um comando novo de ignição substitui o anterior ainda sem ack
+        return self.commands.submit(comando, expect=estado, key='ignition') is not None
+
+    def executar_comando_app(self, command_id, data):
+        """Executa um comando da coleção car_commands e registra o resultado nele"""
+        command_ref = self.db.collection('car_commands').document(command_id)
+        requested_ms = data.get('timestamp')
+        mapped = APP_COMMANDS.get(data.get('command'))
+
+        if mapped is None:
+            self.log_warning(f"⚠️  Comando do app desconhecido: {data.get('command')} ({command_id})")
+            self._finalizar_comando_app(command_ref, requested_ms, 'failed', error='unknown command')
+            return
+
+        age = time.time() - requested_ms / 1000 if isinstance(requested_ms, (int, float)) else 0
+        if age > COMMAND_MAX_AGE:
+            self.log_warning(f"⌛ Comando {data.get('command')} expirado ({age:.0f}s) - não executado")
+            self._finalizar_comando_app(command_ref, requested_ms, 'expired')
+            return
+
+        comando, estado = mapped
+        self.log_info(f"📲 App → {data.get('command')} ({command_id}, {age * 1000:.0f}ms de fila)")
+        # O update de cars/{id}.ignitionState que o app faz em seguida vira duplicata
+        self.last_ignition_state = estado
+        self.last_command_time = time.time()
+
+        if self.ser is None:
+            self.enviar_comando_arduino(comando)
+            self._finalizar_comando_app(command_ref, requested_ms, 'executed', simulated=True)
+            return
+        if self.relay_state == estado and not self.commands.is_pending(comando):
+            self._finalizar_comando_app(command_ref, requested_ms, 'executed', alreadyInState=True)
+            return
+
+        def concluido(cmd, status, rtt_ms):
+            final = {RESULT_CONFIRMED: 'executed', RESULT_SUPERSEDED: 'superseded'}.get(status, 'failed')
+            self._finalizar_comando_app(command_ref, requested_ms, final, cmd=cmd, rtt_ms=rtt_ms)
+
+        if self.commands.submit(comando, expect=estado, key='ignition', on_done=concluido) is None:
+            self._finalizar_comando_app(command_ref, requested_ms, 'failed', error='serial write failed')
+
+    def _finalizar_comando_app(self, command_ref, requested_ms, status, cmd=None, rtt_ms=None, **extra):
+        """Grava o resultado em car_commands/{id} (latência app → relé quando confirmado)"""
+        fields = {'status': status, 'processedAt': firestore.SERVER_TIMESTAMP, **extra}
+        if cmd is not None:
+            fields.update({'seq': cmd.seq, 'attempts': cmd.attempts})
+        if rtt_ms is not None:
+            fields['serialRttMs'] = round(rtt_ms, 1)
+        if isinstance(requested_ms, (int, float)) and status == 'executed':
+            # Relógio do celular vs. do gateway: mede a ordem de grandeza, não µs
+            fields['endToEndMs'] = round(time.time() * 1000 - requested_ms)
+        self.writer.update(command_ref, fields)
+
+    def _resultado_comando(self, cmd, status, rtt_ms):
+        """Callback do CommandTracker: registra a confirmação no documento do carro"""
+        if cmd.key != 'ignition':
+            if status not in (RESULT_CONFIRMED, RESULT_SUPERSEDED):
+                self.log_warning(f"⚠️  {cmd.command} sem confirmação após {cmd.attempts} tentativas")
+            return
+
+        if status == RESULT_SUPERSEDED:
+            self.log_debug(f"↪️  {cmd.command} (seq {cmd.seq}) substituído por um comando mais novo")
+            return
+
+        if status == RESULT_CONFIRMED:
+            self.relay_state = cmd.expect
+            self.log_info(f"✅ {cmd.command} confirmado em {rtt_ms:.0f}ms "
+                          f"(seq {cmd.seq}, tentativa {cmd.attempts})")
+        else:
+            self.log_error(f"❌ {cmd.command} sem confirmação após {cmd.attempts} tentativas (seq {cmd.seq})")
+
+        fields = {
+            'relayCommand': {
+                'command': cmd.command,
+                'seq': cmd.seq,
+                'status': status,
+                'attempts': cmd.attempts,
+                'latencyMs': round(rtt_ms, 1) if rtt_ms is not None else None
+            }
+        }
+        if status == RESULT_CONFIRMED:
+            fields['relayState'] = cmd.expect
+        self.car_doc.update(fields, touch=('relayCommand.updatedAt',))
+        # O app mostra a confirmação: não espera o intervalo mínimo do espelho
+        self.car_doc.flush()
+
+    # --------------------------------------------------------------------------
+    # Taxa de envio adaptativa
+    # --------------------------------------------------------------------------
+
+    def _ajustar_taxa(self, speed_kmh=None):
+        """Reavalia o modo de envio (fix novo, ignição ou roubo mudaram)"""
+        if self.rate is None:
+            # Sem taxa adaptativa só o roubo muda a via de gravação
+            self.urgent = self.car_doc.urgent = self.is_stolen or self.stolen_report
+            return
+        ignition = self.last_fix_ignition or self.last_ignition_state
+        mode = self.rate.update(ignition, speed_kmh, self.is_stolen or self.stolen_report, time.time())
+        if mode is not None:
+            self._aplicar_politica(mode)
+
+    def marcar_roubo(self, active):
+        """
+        Roubo informado em stolen_cars: vale como cars.isStolen para a via
+        urgente e o modo de envio, mesmo que o app não marque o carro
+        """
+        if active != self.stolen_report:
+            self.stolen_report = active
+            self._ajustar_taxa()
+
+    def _aplicar_politica(self, mode):
+        """Aplica a linha da RATE_POLICIES: thinning, espelho e intervalo do Arduino"""
+        policy = self.rate.policy(mode)
+        self.thinner.config.update(policy['thinning'])
+        self.car_doc.min_interval = policy['car_update_interval_s']
+        # Roubado: fixes e documento do carro vão para a via prioritária da fila
+        self.urgent = self.car_doc.urgent = policy.get('urgent', False)
+        interval_ms = int(policy['send_interval_s'] * 1000)
+        self.log_info(f"🚦 Modo de envio: {mode} (Arduino a cada {policy['send_interval_s']}s)")
+        self.car_doc.update({'reportingMode': mode, 'reportingIntervalS': policy['send_interval_s']})
+        if self.ser is not None:
+            # Um intervalo novo substitui o anterior ainda sem ack
+            self.commands.submit(f"SET_INTERVAL:{interval_ms}", key='interval')
+
+    def resetar_gps(self):
+        """Envia comando para resetar GPS"""
+        if self.enviar_comando_arduino('GPS_RESET'):
+            self.log_info("🔄 GPS resetado - aguardando novo fix...")
+            # Reset status local
+            self.gps_status.update({
+                'initialized': False,
+                'fix_time': None
+            })
+        return True
+
+    def processar_mudanca_ignicao(self, new_state):
+        """Processa mudança de ignição do app"""
+        current_time = time.time()
+
+        # Relé já confirmado nesse estado pelo ack do Arduino
+        if new_state == self.relay_state:
+            self.last_ignition_state = new_state
+            return
+
+        # Evita comandos repetitivos
+        if (new_state == self.last_ignition_state and
+                (current_time - self.last_command_time) < COMMAND_COOLDOWN):
+            self.log_debug(f"🚫 Comando {new_state} ignorado (cooldown de {COMMAND_COOLDOWN}s)")
+            return
+
+        self.log_info(f"🔔 Firebase → ignitionState = {new_state}")
+
+        if new_state == 'on':
+            success = self.enviar_comando_ignicao('IGNITION_ON', 'on')
+            emoji = "🔓" if success else "❌"
+            self.log_info(f"{emoji} Comando LIGAR ignição - {'Enviado' if success else 'Falhou'}")
+        elif new_state == 'off':
+            success = self.enviar_comando_ignicao('IGNITION_OFF', 'off')
+            emoji = "🔒" if success else "❌"
+            self.log_info(f"{emoji} Comando DESLIGAR ignição - {'Enviado' if success else 'Falhou'}")
+        else:
+            self.log_warning(f"⚠️  Estado desconhecido: {new_state}")
+            return
+
+        # Atualiza controle de estado
+        self.last_ignition_state = new_state
+        self.last_command_time = current_time
+
+    def escutar_ignition_state(self):
+        """Listener que escuta mudanças no ignitionState do Firebase"""
+
+        def on_snapshot(doc_snapshot, changes, read_time):
+            for doc in doc_snapshot:
+                data = doc.to_dict() or {}
+                self.car_doc.observe(data)
+                self.snapshot_stats['received'] += 1
+                state = (data.get('ignitionState', 'unknown'), bool(data.get('isStolen', False)))
+                # Snapshots das próprias escritas do gateway (GPS, status) não mudam esses campos
+                if state == self.remote_state:
+                    self.snapshot_stats['ignored'] += 1
+                    continue
+                self.remote_state = state
+                self.is_stolen = state[1]
+                self.processar_mudanca_ignicao(state[0])
+                self._ajustar_taxa()
+
+        try:
+            doc_watch = self.car_ref.on_snapshot(on_snapshot)
+
+            self.log_info(f"👂 Escutando mudanças: cars/{self.car_id}/ignitionState")
+            return doc_watch
+        except Exception as e:
+            self.log_error(f"❌ Erro ao configurar listener: {e}")
+            return None
+
+    # --------------------------------------------------------------------------
+    # Processamento de dados do Arduino
+    # --------------------------------------------------------------------------
+
+    def processar_linha_arduino(self, line):
+        """Processa linha recebida do Arduino"""
+        if not line.strip():
+            return
+
+        if self.recorder is not None:
+            self.recorder.write(self.car_id, line)
+
+        try:
+            record = self.parser.parse(line)
+        except ParseError:
+            self.log_warning(f"⚠️  Linha não reconhecida: {line}")
+            return
+
+        try:
+            self.processar_registro(record)
+        except Exception as e:
+            self.log_error(f"❌ Erro ao processar linha: {e}")
+
+    def processar_registro(self, record):
+        """Trata um registro já convertido pelo LineParser"""
+        gps_status = self.gps_status
+        data_type = record.type
+
+        if data_type == 'gps':
+            # ✅ NOVO: Atualiza estatísticas GPS
+            gps_status['total_reads'] += 1
+            gps_status['satellites'] = record.sats
+            gps_status['last_age'] = record.age
+
+            if record.valid:
+                gps_status['valid_count'] += 1
+
+            accepted = self.save_gps_location(record)
+            if self.health is not None:
+                self._gravar_saude(self.health.gps(time.time(), record.sats, record.valid, accepted))
+            if self.archive is not None:
+                self.archive.gps(self.car_id, record, accepted)
+            if self.live is not None:
+                self._publicar_gps(record, accepted)
+
+        elif data_type == 'heartbeat':
+            self.last_heartbeat = time.time()
+            if self.archive is not None:
+                self.archive.heartbeat(self.car_id, record, self.last_heartbeat)
+            self._publicar(relay=_RELE.get(record.rele, record.rele), heartbeatAt=self.last_heartbeat)
+            if self.health is not None:
+                reboots = self.health.stats['reboots']
+                self._gravar_saude(self.health.heartbeat(self.last_heartbeat, record))
+                if self.health.stats['reboots'] > reboots:
+                    self.log_warning(f"🔁 Arduino reiniciou (uptime {record.uptime / 1000:.0f}s)")
+
+            self.log_info(f"💓 Heartbeat - Uptime: {record.uptime / 1000:.1f}s | Comandos: {record.commands} | "
+                          f"Relé: {record.rele} | GPS: {record.gps_status} ({record.valid_gps} válidos)")
+
+            # ✅ NOVO: Atualiza status na tela a cada heartbeat
+            self.update_gps_status_in_firebase()
+
+        elif data_type == 'ready':
+            self.log_info("✅ Arduino pronto!")
+            # O firmware inicia com o relé desligado: restaura o estado pedido pelo app
+            self.relay_state = 'off'
+            if self.last_ignition_state == 'on' and self.ser is not None:
+                self.enviar_comando_ignicao('IGNITION_ON', 'on')
+            # O Arduino reinicia em JSON; renegocia o enquadramento compacto
+            if self.framing == FRAMING_CSV:
+                self.enviar_comando_arduino('FRAMING_CSV')
+            # ...e volta ao intervalo padrão do firmware
+            if self.rate is not None and self.rate.mode is not None:
+                self._aplicar_politica(self.rate.mode)
+
+        elif data_type == 'ack' and record.get('interval') is not None:
+            self.log_debug(f"⏱️  Arduino confirmou: intervalo de envio {record.get('interval')}ms")
+            self.commands.on_ack(record)
+
+        elif data_type == 'ack':
+            ignition_state = record.get('ignitionState', 'unknown')
+            emoji = "🔓" if ignition_state == "on" else "🔒"
+            self.log_info(f"{emoji} Arduino confirmou: Ignição {ignition_state.upper()}")
+            self.commands.on_ack(record)
+            self._publicar(ignition=ignition_state)
+            if self.trips is not None and ignition_state in ('on', 'off'):
+                self._gravar_viagens(self.trips.set_ignition(ignition_state, time.time()))
+
+        elif data_type == 'debug':
+            self.log_debug(f"🐛 Debug: {record.get('received', 'N/A')}")
+
+        elif data_type == 'error':
+            self.log_error(f"❌ Arduino erro: {record.get('message', 'Erro desconhecido')}")
+
+        elif data_type == 'system':
+            message = record.get('message', 'Mensagem do sistema')
+            self.log_info(f"🔧 Sistema: {message}")
+
+            # ✅ NOVO: Detecta quando GPS consegue fix
+            if "GPS fix obtido" in message:
+                gps_status['initialized'] = True
+                gps_status['fix_time'] = datetime.now().strftime('%H:%M:%S')
+                self.log_info("🎉 PRIMEIRO FIX GPS OBTIDO!")
+
+    def _publicar(self, **fields):
+        """Mescla campos no estado ao vivo do carro (se houver LiveState)"""
+        if self.live is not None:
+            self.live.update(self.car_id, fields)
+
+    def _publicar_gps(self, fix, accepted):
+        """gpsStatus de cada registro gps e a posição de cada fix aceito (antes do thinning)"""
+        fields = {'gpsStatus': {'valid': fix.valid, 'accepted': accepted, 'satellites': fix.sats,
+                                'age': fix.age, 'validCount': self.gps_status['valid_count']}}
+        if fix.ignition_state is not None:
+            fields['ignition'] = fix.ignition_state
+        if accepted:
+            fields['position'] = {'lat': fix.lat, 'lon': fix.lon, 'speed': fix.speed, 'heading': fix.heading,
+                                  'quality': fix.quality, 'receivedAt': fix.received_at}
+        self.live.update(self.car_id, fields)
+
+    def simular_gps(self):
+        """Modo teste: gera um fix GPS falso quando não há Arduino"""
+        self.log_info("🎭 Modo teste: simulando dados GPS...")
+        fake_gps = GpsRecord(
+            lat=-23.5505 + (time.time() % 100) * 0.0001,
+            lon=-46.6333 + (time.time() % 100) * 0.0001,
+            sats=8,
+            age=1000,
+            valid=True,
+            gps_init=True
+        )
+        self.save_gps_location(fake_gps)
@@ -24,6 +24,8 @@ export interface GPSLocation {
   speed?: number;
   heading?: number;
   accuracy?: number;
+  address?: string;   // geocodificação reversa offline do gateway
+  locality?: string;
   timestamp: Date;
   status: 'active' | 'inactive' | 'alert';
   source: 'arduino' | 'manual' | 'app';
@@ -140,6 +142,106 @@ export async function getCarLocationHistory(
   }
 }
 
+/**
+ * Viagem gravada pelo gateway (coleção trips): trajeto inteiro em um documento
+ */
+export interface Trip {
+  id: string;
+  carId: string;
+  status: 'active' | 'closed';
+  startTime: Date;
+  endTime: Date;
+  durationS: number;
+  distanceM: number;
+  maxSpeedKmh: number;
+  avgSpeedKmh: number;
+  points: { latitude: number; longitude: number; timestamp: Date }[];
+}
+
+/**
+ * Decodifica um polyline do Google (lat/lon intercalados, delta a delta)
+ */
+export function decodePolyline(encoded: string, precision: number = 5): [number, number][] {
+  const values = decodeSignedValues(encoded);
+  const factor = Math.pow(10, precision);
+  const points: [number, number][] = [];
+  let lat = 0;
+  let lon = 0;
+  for (let i = 0; i + 1 < values.length; i += 2) {
+    lat += values[i];
+    lon += values[i + 1];
+    points.push([lat / factor, lon / factor]);
+  }
+  return points;
+}
+
+function decodeSignedValues(encoded: string): number[] {
+  const values: number[] = [];
+  let value = 0;
+  let shift = 0;
+  for (let i = 0; i < encoded.length; i++) {
+    const b = encoded.charCodeAt(i) - 63;
+    value |= (b & 0x1f) << shift;
+    shift += 5;
+    if (b < 0x20) {
+      values.push(value & 1 ? ~(value >> 1) : value >> 1);
+      value = 0;
+      shift = 0;
+    }
+  }
+  return values;
+}
+
+/**
+ * Busca as últimas viagens de um carro (uma leitura por viagem)
+ */
+export async function getCarTrips(carId: string, limitCount: number = 20): Promise<Trip[]> {
+  try {
+    const currentUser = auth.currentUser;
+    if (!currentUser) {
+      throw new Error('Usuário não autenticado');
+    }
+
+    const q = query(
+      collection(db, 'trips'),
+      where('carId', '==', carId),
+      where('userId', '==', currentUser.uid),
+      orderBy('startTime', 'desc'),
+      limit(limitCount)
+    );
+
+    const querySnapshot = await getDocs(q);
+    return querySnapshot.docs.map((document) => {
+      const data = document.data();
+      const startTime: Date = data.startTime?.toDate() || new Date();
+      // timeOffsets: segundos desde startTime, delta-codificados
+      let offset = 0;
+      const offsets = decodeSignedValues(data.timeOffsets || '').map((delta) => (offset += delta));
+      const points = decodePolyline(data.polyline || '').map(([latitude, longitude], i) => ({
+        latitude,
+        longitude,
+        timestamp: new Date(startTime.getTime() + (offsets[i] || 0) * 1000),
+      }));
+
+      return {
+        id: document.id,
+        carId: data.carId,
+        status: data.status,
+        startTime,
+        endTime: data.endTime?.toDate() || startTime,
+        durationS: data.durationS || 0,
+        distanceM: data.distanceM || 0,
+        maxSpeedKmh: data.maxSpeedKmh || 0,
+        avgSpeedKmh: data.avgSpeedKmh || 0,
+        points,
+      };
+    });
+  } catch (error: any) {
+    console.error('Erro ao buscar viagens:', error);
+    throw new Error('Erro ao carregar viagens');
+  }
+}
+
 /**
  * Escuta em tempo real as atualizações de localização de um carro
  * ✅ TOTALMENTE CORRIGIDO: Gerencia corretamente o estado de autenticação e cleanup
@@ -206,6 +308,8 @@ export function subscribeToCarLocation(
         speed: data.speed,
         heading: data.heading,
         accuracy: data.accuracy,
+        address: data.address,
+        locality: data.locality,
         timestamp: data.timestamp?.toDate() || new Date(),
         status: data.status,
         source: data.source,